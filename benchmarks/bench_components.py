@@ -0,0 +1,366 @@
+"""
+Benchmark: các thành phần xử lý câu hỏi (không cần mạng)
+
+Đo từng hàm riêng lẻ với dữ liệu tổng hợp / fixture lưu sẵn:
+- StockAgent.extract_symbol, extract_symbol_from_question (danh sách mã giả)
+- ConversationMemory.add_message khi đã có 10k user
+- compute_stock_analysis và analyze_stock (phân tích + format báo cáo) trên
+  chuỗi giá OHLCV tổng hợp (đặt sẵn trong shared cache)
+- NewsAgent.get_sentiment_from_title, create_summary
+- Parse trang tìm kiếm / bài viết CafeF (benchmarks/fixtures/*.html)
+- VectorDatabase: thêm tài liệu và truy vấn ở 10k - 100k tài liệu
+  (embedding hashing, không tải model)
+
+Kết quả ghi ra JSON để so sánh giữa các lần chạy (--compare). Trường hợp
+thiếu thư viện (pandas, bs4, chromadb) được ghi "skipped" thay vì dừng.
+
+Cách chạy:
+    python benchmarks/bench_components.py --output before.json
+    python benchmarks/bench_components.py --output after.json --compare before.json
+    python benchmarks/bench_components.py --only memory sentiment --quick
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+import contextlib
+from pathlib import Path
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List
+
+os.environ.setdefault("ANONYMIZED_TELEMETRY", "false")  # ChromaDB, giống main.py
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parent / "src"))
+sys.path.insert(0, str(BENCH_DIR))
+
+FIXTURES = BENCH_DIR / "fixtures"
+SYMBOLS = ["FPT", "VCB", "VNM", "MWG", "HPG", "VIC", "TCB", "MBB", "SSI", "GAS"]
+QUESTIONS = [
+    "Giá cổ phiếu FPT hôm nay bao nhiêu?",
+    "Có nên mua VCB không?",
+    "Phân tích mã HPG giúp tôi",
+    "tin tức về MWG tuần này",
+    "What is the price of VNM today?",
+    "Thị trường hôm nay thế nào?",
+    "So sánh SSI và VND, mã nào tốt hơn để đầu tư dài hạn",
+]
+TITLES = [
+    "FPT: Lợi nhuận quý 3 tăng 21% vượt kế hoạch",
+    "HPG giam san, khoi ngoai ban rong 200 ty",
+    "VCB chốt quyền trả cổ tức",
+    "MWG lo rui ro ty gia, loi nhuan giam",
+    "SSI ky luc thanh khoan, vuot dinh",
+]
+
+
+def fake_symbols(count: int = 1600) -> set:
+    """Tập mã giả có kích thước gần bằng danh sách mã thật"""
+    rng = random.Random(1)
+    letters = "ABCDEFGHIKLMNOPQRSTUVXY"
+    symbols = set(SYMBOLS) | {"VND"}
+    while len(symbols) < count:
+        symbols.add("".join(rng.choice(letters) for _ in range(3)))
+    return symbols
+
+
+@contextlib.contextmanager
+def quiet():
+    """Bỏ output print() của code được đo"""
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def measure(fn: Callable[[int], None], number: int, repeat: int, **params) -> Dict:
+    """
+    Chạy `repeat` vòng, mỗi vòng gọi fn(i) `number` lần
+
+    Returns:
+        Thời gian mỗi lần gọi (micro giây): median / min / max / stdev giữa các vòng
+    """
+    per_op = []
+    counter = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn(counter)
+            counter += 1
+        per_op.append((time.perf_counter() - start) / number * 1e6)
+    median = statistics.median(per_op)
+    return {
+        "params": {"number": number, "repeat": repeat, **params},
+        "median_us": round(median, 3),
+        "min_us": round(min(per_op), 3),
+        "max_us": round(max(per_op), 3),
+        "stdev_us": round(statistics.stdev(per_op), 3) if len(per_op) > 1 else 0.0,
+        "ops_per_s": round(1e6 / median, 1) if median else None,
+    }
+
+
+def latency(fn: Callable[[int], None], calls: int, **params) -> Dict:
+    """Đo từng lần gọi riêng (thao tác chậm): median + p95"""
+    result = measure(fn, number=1, repeat=calls, **params)
+    samples = []
+    for i in range(min(calls, 50)):
+        start = time.perf_counter()
+        fn(i)
+        samples.append((time.perf_counter() - start) * 1e6)
+    result["p95_us"] = round(sorted(samples)[int(0.95 * (len(samples) - 1))], 3)
+    return result
+
+
+# --- Các trường hợp đo ---
+
+def bench_extract_symbol(args) -> Dict[str, Dict]:
+    from agents.stock_agent import StockAgent
+    import agents.advice_agent as advice_agent
+
+    agent = StockAgent()
+    agent._valid_symbols = fake_symbols()
+    advice_agent._valid_symbols = agent._valid_symbols
+    n = len(QUESTIONS)
+    with quiet():
+        return {
+            "stock_agent.extract_symbol": measure(
+                lambda i: agent.extract_symbol(QUESTIONS[i % n]), number=2000, repeat=args.repeat),
+            "advice_agent.extract_symbol_from_question": measure(
+                lambda i: advice_agent.extract_symbol_from_question(QUESTIONS[i % n]), number=2000, repeat=args.repeat),
+        }
+
+
+def bench_memory(args) -> Dict[str, Dict]:
+    from data.memory import ConversationMemory
+
+    users = 1000 if args.quick else 10000
+    workdir = tempfile.mkdtemp()
+    try:
+        memory = ConversationMemory(storage_path=os.path.join(workdir, "history.json"))
+        # Dựng sẵn lịch sử (không ghi file từng tin) rồi ghi 1 lần
+        for u in range(users):
+            memory._history[f"user{u}"] = [
+                {"role": role, "text": f"Tin nhắn {k} của user {u} về cổ phiếu {SYMBOLS[u % 10]}"}
+                for k, role in enumerate(["user", "assistant"] * 3)
+            ]
+        memory._save()
+        rng = random.Random(5)
+        with quiet():
+            result = latency(
+                lambda i: memory.add_message(f"user{rng.randrange(users)}", "user", "Giá FPT hôm nay?"),
+                calls=args.repeat * 4, users=users,
+            )
+        result["params"]["file_kb"] = round(os.path.getsize(memory.storage_path) / 1024, 1)
+        return {f"memory.add_message[{users}_users]": result}
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def synthetic_closes(days: int = 60, seed: int = 11) -> List[float]:
+    """Giá đóng cửa tổng hợp (random walk quanh 100.000 VND)"""
+    rng = random.Random(seed)
+    price = 100_000.0
+    closes = []
+    for _ in range(days):
+        open_price = price
+        high = open_price * (1 + rng.uniform(0, 0.03))
+        low = open_price * (1 - rng.uniform(0, 0.03))
+        price = round(rng.uniform(low, high), -2)  # close trong khoảng [low, high]
+        closes.append(price)
+    return closes
+
+
+def bench_analysis(args) -> Dict[str, Dict]:
+    import pandas  # noqa: F401 - báo skipped nếu thiếu
+    import agents.advice_agent as advice_agent
+    import data.shared_cache as shared_cache
+
+    workdir = tempfile.mkdtemp()
+    previous = shared_cache._shared_cache
+    try:
+        shared_cache._shared_cache = shared_cache.SharedCache(os.path.join(workdir, "cache.sqlite"))
+        advice_agent._valid_symbols = set(SYMBOLS)
+        end_date = datetime.now().strftime("%Y-%m-%d")
+        for k, symbol in enumerate(SYMBOLS):
+            shared_cache._shared_cache.set("history", f"{symbol}:{end_date}", synthetic_closes(seed=k), 3600)
+        with quiet():
+            analysis = measure(
+                lambda i: advice_agent.compute_stock_analysis(f"Có nên mua {SYMBOLS[i % 10]} không?"),
+                number=50, repeat=args.repeat, days=60,
+            )
+            report = measure(
+                lambda i: advice_agent.analyze_stock(f"Có nên mua {SYMBOLS[i % 10]} không?"),
+                number=50, repeat=args.repeat, days=60,
+            )
+        return {"advice_agent.compute_stock_analysis": analysis, "advice_agent.analyze_stock": report}
+    finally:
+        shared_cache._shared_cache = previous
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def bench_news(args) -> Dict[str, Dict]:
+    from agents.news_agent import NewsAgent
+
+    agent = NewsAgent()
+    articles = [{
+        "source": "CafeF",
+        "title": TITLES[i % len(TITLES)],
+        "url": f"https://cafef.vn/tin-{i}.chn",
+        "description": "Doanh thu thuần tăng, biên lợi nhuận gộp cải thiện nhờ chi phí tài chính giảm.",
+        "sentiment": agent.get_sentiment_from_title(TITLES[i % len(TITLES)]),
+    } for i in range(10)]
+    return {
+        "news_agent.get_sentiment_from_title": measure(
+            lambda i: agent.get_sentiment_from_title(TITLES[i % len(TITLES)]), number=5000, repeat=args.repeat),
+        "news_agent.create_summary[10_articles]": measure(
+            lambda i: agent.create_summary("FPT", articles), number=500, repeat=args.repeat),
+    }
+
+
+def bench_cafef_parsing(args) -> Dict[str, Dict]:
+    import bs4  # noqa: F401 - báo skipped nếu thiếu
+    from agents.news_agent import NewsAgent
+
+    agent = NewsAgent(max_articles_per_source=20)
+    search_html = (FIXTURES / "cafef_search.html").read_bytes()
+    article_html = (FIXTURES / "cafef_article.html").read_bytes()
+    found = len(agent.parse_cafef_search(search_html))
+    return {
+        "news_agent.parse_cafef_search": measure(
+            lambda i: agent.parse_cafef_search(search_html), number=20, repeat=args.repeat,
+            fixture_kb=round(len(search_html) / 1024, 1), articles=found),
+        "news_agent.extract_article_body": measure(
+            lambda i: agent.extract_article_body(article_html), number=20, repeat=args.repeat,
+            fixture_kb=round(len(article_html) / 1024, 1)),
+    }
+
+
+def bench_vector_db(args) -> Dict[str, Dict]:
+    from bench_filtered_retrieval import build_db, SYMBOLS as DOC_SYMBOLS, MAX_AGE_DAYS
+
+    results = {}
+    sizes = [min(size, 2000) for size in args.vector_sizes] if args.quick else args.vector_sizes
+    for size in sizes:
+        workdir = tempfile.mkdtemp()
+        try:
+            with quiet():
+                start = time.perf_counter()
+                db = build_db(workdir, size, "hashing")
+                insert_s = time.perf_counter() - start
+            results[f"vector_db.insert[{size}]"] = {
+                "params": {"docs": size, "embedding": "hashing"},
+                "median_us": round(insert_s / size * 1e6, 3),
+                "total_s": round(insert_s, 2),
+                "ops_per_s": round(size / insert_s, 1),
+            }
+            date_from = (datetime.now() - timedelta(days=MAX_AGE_DAYS)).strftime("%Y-%m-%d")
+            n = len(DOC_SYMBOLS)
+            with quiet():
+                results[f"vector_db.query[{size}]"] = latency(
+                    lambda i: db.query(f"Tin tức mới nhất về {DOC_SYMBOLS[i % n]} lợi nhuận", top_k=3),
+                    calls=args.repeat * 10, docs=size,
+                )
+                results[f"vector_db.query_filtered[{size}]"] = latency(
+                    lambda i: db.query(
+                        f"Tin tức mới nhất về {DOC_SYMBOLS[i % n]} lợi nhuận", top_k=3,
+                        filters={"symbol": DOC_SYMBOLS[i % n], "date_from": date_from}),
+                    calls=args.repeat * 10, docs=size, max_age_days=MAX_AGE_DAYS,
+                )
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+BENCHMARKS = {
+    "extract_symbol": bench_extract_symbol,
+    "memory": bench_memory,
+    "analysis": bench_analysis,
+    "sentiment": bench_news,
+    "cafef": bench_cafef_parsing,
+    "vector_db": bench_vector_db,
+}
+
+
+# --- Kết quả ---
+
+def environment() -> Dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR, capture_output=True, text=True
+        ).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def compare(current: Dict, baseline: Dict, threshold: float) -> int:
+    """In so sánh median với lần chạy trước, trả về số trường hợp chậm đi quá ngưỡng"""
+    print(f"\nSo sánh với {baseline['meta'].get('git_commit')} ({baseline['meta'].get('timestamp')})")
+    print(f"{'benchmark':<52}{'trước (us)':>13}{'sau (us)':>13}{'thay đổi':>10}")
+    regressions = 0
+    for name, result in current["results"].items():
+        old = baseline["results"].get(name, {})
+        if "median_us" not in result or "median_us" not in old:
+            continue
+        change = (result["median_us"] - old["median_us"]) / old["median_us"] * 100 if old["median_us"] else 0.0
+        flag = ""
+        if change > threshold:
+            flag = "  CHẬM HƠN"
+            regressions += 1
+        elif change < -threshold:
+            flag = "  nhanh hơn"
+        print(f"{name:<52}{old['median_us']:>13.1f}{result['median_us']:>13.1f}{change:>+9.1f}%{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark các thành phần (không cần mạng)")
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS), help="Chỉ chạy các nhóm này")
+    parser.add_argument("--repeat", type=int, default=7, help="Số vòng đo mỗi trường hợp")
+    parser.add_argument("--vector-sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--quick", action="store_true", help="Dữ liệu nhỏ (kiểm tra nhanh)")
+    parser.add_argument("--output", help="Ghi kết quả JSON ra file")
+    parser.add_argument("--compare", help="File JSON của lần chạy trước")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Ngưỡng chậm đi (%%) khi so sánh")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit code 1 nếu có trường hợp chậm đi")
+    args = parser.parse_args()
+
+    report = {"meta": environment(), "results": {}}
+    print(f"{'benchmark':<52}{'median (us)':>13}{'ops/s':>13}")
+    for group in args.only or BENCHMARKS:
+        try:
+            results = BENCHMARKS[group](args)
+        except ImportError as e:
+            results = {group: {"skipped": f"thiếu thư viện: {e.name}"}}
+        for name, result in results.items():
+            report["results"][name] = result
+            if "skipped" in result:
+                print(f"{name:<52}{'skipped (' + result['skipped'] + ')':>26}")
+            else:
+                print(f"{name:<52}{result['median_us']:>13.1f}{result['ops_per_s'] or 0:>13.1f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\nĐã ghi {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        if regressions and args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
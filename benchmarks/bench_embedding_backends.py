@@ -0,0 +1,126 @@
+"""
+Benchmark: so sánh các backend embedding (sentence-transformers vs ONNX)
+
+Mỗi backend chạy trong 1 process riêng để đo chính xác:
+- load time: import + load model + lần encode đầu tiên
+- RSS: bộ nhớ process sau khi load
+- latency: p50/p99 của 1 câu hỏi (batch size 1)
+- cosine: độ tương đồng với vector của backend sentence-transformers
+  (onnx-int8 cần đạt >= 1 - RAG_ONNX_COSINE_TOLERANCE)
+
+Cách chạy:
+    python benchmarks/bench_embedding_backends.py
+    python benchmarks/bench_embedding_backends.py --backends sentence-transformers onnx-int8 --queries 200
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+from pathlib import Path
+
+SRC = Path(__file__).resolve().parent.parent / "src"
+sys.path.insert(0, str(SRC))
+
+TEXTS = [
+    "Tin tức mới nhất về FPT",
+    "Giá cổ phiếu VCB hôm nay bao nhiêu?",
+    "Có nên mua HPG không?",
+    "Xu hướng thị trường chứng khoán tuần này",
+    "Lợi nhuận quý 3/2025 của MWG tăng 20% so với cùng kỳ",
+    "VNM chia cổ tức bằng tiền mặt tỷ lệ 15%",
+    "Ngân hàng nào tăng trưởng tín dụng tốt nhất năm nay?",
+    "Vingroup công bố kế hoạch phát hành trái phiếu",
+]
+
+
+def rss_mb() -> float:
+    """RSS hiện tại của process (MB)"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return usage / (1024 * 1024) if sys.platform == "darwin" else usage / 1024
+
+
+def worker(backend: str, n_queries: int, vectors_path: str):
+    """Chạy trong process con: đo 1 backend rồi in kết quả JSON"""
+    import numpy as np
+
+    rss_before = rss_mb()
+    start = time.perf_counter()
+    from data.vector_db import create_embedding_function
+    fn = create_embedding_function(backend)
+    fn(["warm up"])
+    load_s = time.perf_counter() - start
+
+    latencies = []
+    for i in range(n_queries):
+        text = TEXTS[i % len(TEXTS)]
+        t0 = time.perf_counter()
+        fn([text])
+        latencies.append((time.perf_counter() - t0) * 1000)
+
+    np.save(vectors_path, np.asarray(fn(TEXTS), dtype=np.float32))
+    print(json.dumps({
+        "backend": backend,
+        "load_s": load_s,
+        "rss_mb": rss_mb(),
+        "rss_delta_mb": rss_mb() - rss_before,
+        "p50_ms": statistics.median(latencies),
+        "p99_ms": sorted(latencies)[min(len(latencies) - 1, int(0.99 * len(latencies)))],
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark embedding backends")
+    parser.add_argument("--backends", nargs="+", default=["sentence-transformers", "onnx", "onnx-int8"])
+    parser.add_argument("--queries", type=int, default=100, help="Số câu hỏi để đo latency")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--vectors", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args.worker, args.queries, args.vectors)
+        return
+
+    import numpy as np
+    from config.settings import RAG_ONNX_COSINE_TOLERANCE
+
+    tmp = tempfile.mkdtemp()
+    results, vectors = [], {}
+    for backend in args.backends:
+        vectors_path = os.path.join(tmp, f"{backend}.npy")
+        out = subprocess.run(
+            [sys.executable, __file__, "--worker", backend, "--queries", str(args.queries), "--vectors", vectors_path],
+            capture_output=True, text=True
+        )
+        if out.returncode != 0:
+            print(f"[{backend}] failed:\n{out.stderr[-2000:]}")
+            continue
+        results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+        vectors[backend] = np.load(vectors_path)
+
+    reference = vectors.get("sentence-transformers")
+    print(f"{'backend':<22} {'load (s)':>9} {'RSS (MB)':>9} {'p50 (ms)':>9} {'p99 (ms)':>9} {'min cos':>8}")
+    for r in results:
+        cos = ""
+        if reference is not None:
+            a, b = reference, vectors[r["backend"]]
+            sims = (a * b).sum(1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1))
+            cos = f"{sims.min():.4f}"
+            if sims.min() < 1 - RAG_ONNX_COSINE_TOLERANCE:
+                cos += " !"
+        print(f"{r['backend']:<22} {r['load_s']:>9.2f} {r['rss_mb']:>9.0f} {r['p50_ms']:>9.2f} {r['p99_ms']:>9.2f} {cos:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Benchmark: micro-batched query embedding vs. one forward pass per query
+
+Đo throughput và latency (p50/p99) khi 1 / 8 / 32 caller đồng thời
+embedding câu hỏi, so sánh:
+- direct:  mỗi câu hỏi 1 lần encode trong thread pool (như trước đây)
+- batched: EmbeddingBatcher gom các câu hỏi đồng thời thành 1 batch
+
+Cách chạy:
+    python benchmarks/bench_embedding_batcher.py
+    python benchmarks/bench_embedding_batcher.py --window-ms 2 --max-batch 16
+    python benchmarks/bench_embedding_batcher.py --fake   # không cần tải model
+"""
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from data.embedding_batcher import EmbeddingBatcher  # noqa: E402
+from config.settings import RAG_EMBEDDING_MODEL  # noqa: E402
+
+QUERIES = [
+    "Tin tức mới nhất về FPT",
+    "Giá cổ phiếu VCB hôm nay bao nhiêu?",
+    "Có nên mua HPG không?",
+    "Xu hướng thị trường chứng khoán tuần này",
+    "Lợi nhuận quý 3/2025 của MWG",
+    "VNM chia cổ tức bao nhiêu?",
+    "Ngân hàng nào tăng trưởng tín dụng tốt nhất?",
+    "Phân tích kỹ thuật cổ phiếu VIC",
+]
+
+
+def load_encoder(fake: bool):
+    """Tạo hàm encode list text → list vector"""
+    if fake:
+        # Mô phỏng chi phí forward pass: phần cố định lớn + phần theo số câu
+        def encode(texts):
+            time.sleep(0.015 + 0.001 * len(texts))
+            return [[0.0] * 384 for _ in texts]
+        return encode
+
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer(RAG_EMBEDDING_MODEL)
+    return lambda texts: list(model.encode(list(texts), convert_to_numpy=True))
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+async def run(encode_one, concurrency: int, per_caller: int):
+    """Chạy `concurrency` caller, mỗi caller embedding `per_caller` câu hỏi liên tiếp"""
+    latencies = []
+
+    async def caller(cid: int):
+        for i in range(per_caller):
+            text = f"{QUERIES[(cid + i) % len(QUERIES)]} #{cid}-{i}"  # tránh trùng lặp
+            start = time.perf_counter()
+            await encode_one(text)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(caller(c) for c in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        "qps": len(latencies) / elapsed,
+        "p50_ms": statistics.median(latencies),
+        "p99_ms": percentile(latencies, 99),
+    }
+
+
+async def main_async(args):
+    encode = load_encoder(args.fake)
+    encode(["warm up"])  # load model / JIT trước khi đo
+
+    print(f"{'mode':<8} {'callers':>7} {'qps':>9} {'p50 (ms)':>9} {'p99 (ms)':>9} {'avg batch':>9}")
+    for concurrency in args.concurrency:
+        async def direct(text):
+            return (await asyncio.to_thread(encode, [text]))[0]
+
+        stats = await run(direct, concurrency, args.per_caller)
+        print(f"{'direct':<8} {concurrency:>7} {stats['qps']:>9.1f} {stats['p50_ms']:>9.1f} {stats['p99_ms']:>9.1f} {1:>9.1f}")
+
+        batcher = EmbeddingBatcher(encode, window_ms=args.window_ms, max_batch_size=args.max_batch)
+        stats = await run(batcher.embed, concurrency, args.per_caller)
+        await batcher.aclose()
+        avg_batch = batcher.items / max(1, batcher.batches)
+        print(f"{'batched':<8} {concurrency:>7} {stats['qps']:>9.1f} {stats['p50_ms']:>9.1f} {stats['p99_ms']:>9.1f} {avg_batch:>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark EmbeddingBatcher")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--per-caller", type=int, default=20, help="Số câu hỏi mỗi caller")
+    parser.add_argument("--window-ms", type=float, default=5.0)
+    parser.add_argument("--max-batch", type=int, default=32)
+    parser.add_argument("--fake", action="store_true", help="Dùng encoder giả lập thay vì model thật")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Benchmark: tìm kiếm có lọc theo mã + thời gian và xếp hạng theo độ mới
+
+Tạo collection tạm với N tin (nhiều mã, ngày rải đều trong 1 năm) rồi so sánh:
+- plain:    tìm toàn bộ collection, xếp theo similarity (như trước đây)
+- filtered: lọc symbol + 30 ngày gần nhất trong ChromaDB, over-fetch và
+            xếp hạng lại theo time-decay
+
+Đo latency (p50/p99) và relevance@3: tỉ lệ kết quả top-3 đúng mã và
+không cũ hơn 30 ngày, khi collection lớn dần.
+
+Mặc định dùng embedding hashing (không cần tải model) để đo phần ANN +
+filter; thêm --backend sentence-transformers để dùng model thật.
+
+Cách chạy:
+    python benchmarks/bench_filtered_retrieval.py --sizes 1000 10000 50000
+"""
+import sys
+import time
+import random
+import shutil
+import zlib
+import argparse
+import tempfile
+import statistics
+from pathlib import Path
+from datetime import datetime, timedelta
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+import numpy as np  # noqa: E402
+from chromadb.api.types import Documents, EmbeddingFunction, Embeddings  # noqa: E402
+from data.vector_db import VectorDatabase, create_embedding_function  # noqa: E402
+
+SYMBOLS = ["FPT", "VCB", "VNM", "MWG", "HPG", "VIC", "TCB", "MBB", "SSI", "GAS",
+           "MSN", "VHM", "CTG", "BID", "ACB", "POW", "PNJ", "REE", "DGC", "VRE"]
+EVENTS = [
+    "công bố lợi nhuận quý tăng trưởng mạnh",
+    "giảm lãi do chi phí tài chính tăng",
+    "chia cổ tức bằng tiền mặt",
+    "phát hành trái phiếu huy động vốn",
+    "khối ngoại mua ròng cổ phiếu",
+    "đại hội cổ đông thông qua kế hoạch kinh doanh",
+]
+MAX_AGE_DAYS = 30
+
+
+class HashingEmbeddingFunction(EmbeddingFunction[Documents]):
+    """Embedding giả lập: bag-of-words băm vào 256 chiều (đủ để đo ANN + filter)"""
+
+    def __call__(self, input: Documents) -> Embeddings:
+        vectors = []
+        for text in input:
+            vec = np.zeros(256, dtype=np.float32)
+            for token in text.lower().split():
+                vec[zlib.crc32(token.encode("utf-8")) % 256] += 1.0
+            vectors.append(vec / (np.linalg.norm(vec) or 1.0))
+        return vectors
+
+
+def build_db(path: str, size: int, backend: str) -> VectorDatabase:
+    db = VectorDatabase(persist_directory=path, collection_name="bench_news", use_embedding_cache=False)
+    fn = HashingEmbeddingFunction() if backend == "hashing" else create_embedding_function(backend)
+    db.embedding_fn = db.query_embedding_fn = fn
+
+    rng = random.Random(42)
+    today = datetime.now()
+    texts, metas = [], []
+    for i in range(size):
+        symbol = rng.choice(SYMBOLS)
+        date = today - timedelta(days=rng.randint(0, 365))
+        texts.append(f"{symbol} {rng.choice(EVENTS)} (bản tin {i})")
+        metas.append({"symbol": symbol, "source": "CafeF", "date": date.strftime("%Y-%m-%d")})
+
+    for start in range(0, size, 5000):
+        db.add_documents(texts[start:start + 5000], metas[start:start + 5000])
+    return db
+
+
+def relevant(result: dict, symbol: str) -> bool:
+    meta = result["metadata"]
+    age = (datetime.now() - datetime.strptime(meta["date"], "%Y-%m-%d")).days
+    return meta["symbol"] == symbol and age <= MAX_AGE_DAYS
+
+
+def measure(db: VectorDatabase, filtered: bool, n_queries: int):
+    latencies, hits = [], []
+    for i in range(n_queries):
+        symbol = SYMBOLS[i % len(SYMBOLS)]
+        query = f"Tin tức mới nhất về {symbol}"
+        start = time.perf_counter()
+        if filtered:
+            date_from = (datetime.now() - timedelta(days=MAX_AGE_DAYS)).strftime("%Y-%m-%d")
+            results = db.query(query, top_k=3, filters={"symbol": symbol, "date_from": date_from})
+        else:
+            results = db.query(query, top_k=3, recency_half_life_days=None)
+        latencies.append((time.perf_counter() - start) * 1000)
+        hits.append(sum(relevant(r, symbol) for r in results) / 3)
+    ordered = sorted(latencies)
+    return statistics.median(latencies), ordered[int(0.99 * (len(ordered) - 1))], statistics.mean(hits)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark filtered + recency-ranked retrieval")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--backend", default="hashing", help="hashing | sentence-transformers | onnx-int8")
+    args = parser.parse_args()
+
+    print(f"{'docs':>7} {'mode':<9} {'p50 (ms)':>9} {'p99 (ms)':>9} {'relevance@3':>12}")
+    for size in args.sizes:
+        path = tempfile.mkdtemp(prefix="bench_chroma_")
+        try:
+            db = build_db(path, size, args.backend)
+            for filtered in (False, True):
+                p50, p99, rel = measure(db, filtered, args.queries)
+                mode = "filtered" if filtered else "plain"
+                print(f"{size:>7} {mode:<9} {p50:>9.2f} {p99:>9.2f} {rel:>12.2f}")
+        finally:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Benchmark: chỉ mục BM25 (build time, bộ nhớ, latency truy vấn)
+
+Tạo N tin tổng hợp (tiếng Việt có dấu, nhiều mã và mốc thời gian) rồi đo:
+- build: thời gian tách từ + dựng inverted index
+- memory: dung lượng Python heap của index (tracemalloc)
+- save/load: ghi và đọc file pickle
+- query: p50/p99 cho câu "mã + từ khóa" và câu dài, có và không có filter
+
+Cách chạy:
+    python benchmarks/bench_lexical_index.py --sizes 10000 100000
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import statistics
+import tracemalloc
+from pathlib import Path
+from datetime import datetime, timedelta
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from data.lexical_index import BM25Index  # noqa: E402
+
+SYMBOLS = ["FPT", "VCB", "VNM", "MWG", "HPG", "VIC", "TCB", "MBB", "SSI", "GAS"]
+PHRASES = [
+    "công bố lợi nhuận quý {q}/{y} tăng trưởng {p}% so với cùng kỳ",
+    "doanh thu quý {q}/{y} giảm {p}% do chi phí nguyên liệu tăng",
+    "chia cổ tức bằng tiền mặt tỷ lệ {p}% cho cổ đông hiện hữu",
+    "khối ngoại mua ròng {p} tỷ đồng trong phiên giao dịch hôm nay",
+    "đại hội cổ đông thông qua kế hoạch kinh doanh năm {y}",
+]
+QUERIES = ["FPT Q3/2025", "VCB cổ tức", "Khối ngoại mua ròng cổ phiếu ngân hàng trong phiên hôm nay"]
+
+
+def make_corpus(size: int):
+    rng = random.Random(7)
+    now = datetime.now()
+    ids, texts, metas = [], [], []
+    for i in range(size):
+        symbol = rng.choice(SYMBOLS)
+        phrase = rng.choice(PHRASES).format(q=rng.randint(1, 4), y=rng.choice([2024, 2025]), p=rng.randint(1, 60))
+        date = now - timedelta(days=rng.randint(0, 365))
+        ids.append(f"doc_{i}")
+        texts.append(f"{symbol} {phrase}")
+        metas.append({"symbol": symbol, "source": "CafeF", "timestamp": int(date.timestamp())})
+    return ids, texts, metas
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark BM25Index")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'docs':>7} {'build (s)':>9} {'mem (MB)':>9} {'save (s)':>9} {'load (s)':>9} {'p50 (ms)':>9} {'p99 (ms)':>9} {'p50 filt':>9}")
+    for size in args.sizes:
+        ids, texts, metas = make_corpus(size)
+        path = os.path.join(tempfile.mkdtemp(), "bench.bm25.pkl")
+
+        start = time.perf_counter()
+        index = BM25Index(path)
+        index.add(ids, texts, metas)
+        index.search("warm up", top_k=1)  # dựng mảng numpy của document
+        build_s = time.perf_counter() - start
+
+        # Đo bộ nhớ ở lần build riêng (tracemalloc làm chậm đáng kể)
+        tracemalloc.start()
+        measured = BM25Index()
+        measured.add(ids, texts, metas)
+        measured.search("warm up", top_k=1)
+        mem_mb = tracemalloc.get_traced_memory()[0] / 1024 / 1024
+        tracemalloc.stop()
+        del measured
+
+        start = time.perf_counter()
+        index.save()
+        save_s = time.perf_counter() - start
+        start = time.perf_counter()
+        BM25Index(path)
+        load_s = time.perf_counter() - start
+
+        since = int((datetime.now() - timedelta(days=30)).timestamp())
+        plain, filtered = [], []
+        for i in range(args.queries):
+            query = QUERIES[i % len(QUERIES)]
+            t0 = time.perf_counter()
+            index.search(query, top_k=12)
+            plain.append((time.perf_counter() - t0) * 1000)
+            t0 = time.perf_counter()
+            index.search(query, top_k=12, filters={"symbol": SYMBOLS[i % len(SYMBOLS)]}, date_from=since)
+            filtered.append((time.perf_counter() - t0) * 1000)
+
+        p99 = sorted(plain)[int(0.99 * (len(plain) - 1))]
+        print(f"{size:>7} {build_s:>9.2f} {mem_mb:>9.1f} {save_s:>9.2f} {load_s:>9.2f} "
+              f"{statistics.median(plain):>9.2f} {p99:>9.2f} {statistics.median(filtered):>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Benchmark: 1 process vs. nhiều worker process (ShardedOrchestrator)
+
+Mỗi câu hỏi giả lập phần việc tốn CPU của orchestrator (embedding,
+pandas, parse HTML - giữ GIL) cộng phần chờ I/O (LLM, vnstock). Trong
+1 process, phần CPU của các câu hỏi chạy nối tiếp nhau; với N worker
+process thì chạy song song trên N core.
+
+In throughput (câu hỏi/giây) theo số worker và kiểm tra mỗi user luôn
+được xử lý bởi cùng 1 worker.
+
+Cách chạy:
+    python benchmarks/bench_sharding.py
+    python benchmarks/bench_sharding.py --workers 1 2 4 8 --requests 400 --cpu-ms 20
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from core.sharding import ShardedOrchestrator  # noqa: E402
+
+CPU_MS = float(os.getenv("BENCH_CPU_MS", "20"))
+IO_MS = float(os.getenv("BENCH_IO_MS", "50"))
+
+
+def burn_cpu(ms: float):
+    """Vòng lặp Python thuần (giữ GIL) trong khoảng `ms` mili giây"""
+    deadline = time.perf_counter() + ms / 1000
+    x = 0
+    while time.perf_counter() < deadline:
+        for i in range(1000):
+            x += i * i
+    return x
+
+
+class FakeOrchestrator:
+    """Orchestrator giả: CPU_MS ms tính toán + IO_MS ms chờ I/O"""
+
+    def __init__(self, index: int = 0):
+        self.index = index
+
+    async def handle_query(self, query: str, user_id: str = "default", on_chunk=None) -> str:
+        burn_cpu(CPU_MS)
+        await asyncio.sleep(IO_MS / 1000)
+        return f"{self.index}:{user_id}"
+
+
+def fake_worker(index: int, workers: int):
+    return FakeOrchestrator(index)
+
+
+async def run(orchestrator, requests: int, users: int, concurrency: int):
+    limit = asyncio.Semaphore(concurrency)
+    owners = {}  # user → các worker đã trả lời
+
+    async def one(i: int):
+        user_id = f"user{i % users}"
+        async with limit:
+            answer = await orchestrator.handle_query("bench", user_id=user_id)
+        owners.setdefault(user_id, set()).add(answer.split(":")[0])
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - start
+    sticky = all(len(workers) == 1 for workers in owners.values())
+    return requests / elapsed, sticky
+
+
+async def main_async(args):
+    print(f"cores={os.cpu_count()} requests={args.requests} users={args.users} "
+          f"concurrency={args.concurrency} cpu={CPU_MS}ms io={IO_MS}ms\n")
+    print(f"{'mode':<14}{'req/s':>10}{'speedup':>10}  sticky")
+
+    throughput, _ = await run(FakeOrchestrator(), args.requests, args.users, args.concurrency)
+    baseline = throughput
+    print(f"{'in-process':<14}{throughput:>10.1f}{1.0:>10.2f}  -")
+
+    for workers in args.workers:
+        orchestrator = ShardedOrchestrator(workers, worker_factory=fake_worker)
+        await orchestrator.handle_query("warmup", user_id="warmup")  # Chờ worker khởi động xong
+        throughput, sticky = await run(orchestrator, args.requests, args.users, args.concurrency)
+        orchestrator.stop()
+        print(f"{f'{workers} worker':<14}{throughput:>10.1f}{throughput / baseline:>10.2f}  "
+              f"{'OK' if sticky else 'BROKEN'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ShardedOrchestrator")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=32, help="Số câu hỏi đang chờ cùng lúc")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Benchmark: xử lý update Telegram tuần tự vs. song song theo user
+
+Mô phỏng nhiều user gửi tin nhắn (phân phối Poisson) tới bot, mỗi tin
+có thời gian xử lý giả lập theo loại câu hỏi (giá nhanh, tư vấn chậm).
+So sánh:
+- sequential: 1 update một lúc (mặc định của python-telegram-bot)
+- per-user:   PerUserUpdateProcessor (song song giữa user, tuần tự trong user)
+
+In p50/p99 thời gian từ lúc tin đến tới lúc xử lý xong, số tin bị trả
+lời "bận", và kiểm tra tin của mỗi user được xử lý đúng thứ tự.
+
+Cách chạy:
+    python benchmarks/bench_update_processing.py
+    python benchmarks/bench_update_processing.py --rate 40 --users 200 --duration 10
+"""
+import sys
+import time
+import random
+import asyncio
+import argparse
+import statistics
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from telegram import Update  # noqa: E402
+from core.update_processor import PerUserUpdateProcessor  # noqa: E402
+
+# (loại câu hỏi, tỉ lệ, thời gian xử lý giây) - gần với thời gian thực của từng intent
+WORKLOAD = [
+    ("price", 0.6, 0.4),
+    ("chat", 0.1, 0.6),
+    ("news", 0.2, 1.2),
+    ("advice", 0.1, 2.5),
+]
+
+
+class BenchProcessor(PerUserUpdateProcessor):
+    """Không gửi tin "bận" thật, chỉ đếm"""
+
+    async def _reject(self, update, coroutine):
+        self.rejected += 1
+        coroutine.close()
+
+
+def make_update(update_id: int, user_id: int) -> Update:
+    return Update.de_json({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "bench"},
+            "text": "bench",
+        },
+    }, None)
+
+
+def pick_latency(rng: random.Random) -> float:
+    r = rng.random()
+    for _, share, latency in WORKLOAD:
+        if r < share:
+            return latency
+        r -= share
+    return WORKLOAD[-1][2]
+
+
+async def run(processor, rate: float, users: int, duration: float, seed: int):
+    rng = random.Random(seed)
+    latencies = []
+    order = {}  # user → các update_id theo thứ tự xử lý xong
+    tasks = []
+
+    async def handler(update_id: int, user_id: int, arrived: float, work: float):
+        await asyncio.sleep(work)  # I/O (LLM, vnstock) - không chiếm CPU
+        latencies.append(time.perf_counter() - arrived)
+        order.setdefault(user_id, []).append(update_id)
+
+    start = time.perf_counter()
+    update_id = 0
+    while time.perf_counter() - start < duration:
+        await asyncio.sleep(rng.expovariate(rate))
+        update_id += 1
+        user_id = rng.randrange(users)
+        update = make_update(update_id, user_id)
+        coroutine = handler(update_id, user_id, time.perf_counter(), pick_latency(rng))
+        tasks.append(asyncio.create_task(processor.process_update(update, coroutine)))
+
+    await asyncio.gather(*tasks)
+    in_order = all(ids == sorted(ids) for ids in order.values())
+    return update_id, latencies, in_order
+
+
+def percentile(values, q):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q / 100 * len(values)))]
+
+
+async def main_async(args):
+    modes = {
+        "sequential": lambda: BenchProcessor(1, args.max_pending, args.max_pending_per_user),
+        "per-user": lambda: BenchProcessor(args.concurrency, args.max_pending, args.max_pending_per_user),
+    }
+    print(f"rate={args.rate}/s users={args.users} duration={args.duration}s "
+          f"concurrency={args.concurrency} max_pending={args.max_pending}\n")
+    print(f"{'mode':<12}{'sent':>6}{'done':>6}{'busy':>6}{'p50 (s)':>10}{'p99 (s)':>10}{'max q':>7}  order")
+    for name, factory in modes.items():
+        processor = factory()
+        async with processor:
+            sent, latencies, in_order = await run(processor, args.rate, args.users, args.duration, args.seed)
+        print(
+            f"{name:<12}{sent:>6}{len(latencies):>6}{processor.rejected:>6}"
+            f"{statistics.median(latencies) if latencies else float('nan'):>10.2f}"
+            f"{percentile(latencies, 99):>10.2f}{processor.max_pending_seen:>7}  "
+            f"{'OK' if in_order else 'BROKEN'}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark PerUserUpdateProcessor")
+    parser.add_argument("--rate", type=float, default=20.0, help="Số tin nhắn mỗi giây")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--duration", type=float, default=5.0, help="Thời gian gửi tin (giây)")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--max-pending", type=int, default=200)
+    parser.add_argument("--max-pending-per-user", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
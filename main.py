@@ -4,7 +4,11 @@ File chính để chạy bot - Main entry point
 Cách chạy:
 1. Chạy Telegram bot: python main.py
 2. Chạy CLI để test: python main.py --cli
-3. Xem hướng dẫn: python main.py --help
+3. Chạy Telegram bot qua webhook: python main.py --mode webhook
+4. Chạy HTTP API: python main.py --mode api
+5. Đo tải với dịch vụ giả lập: python main.py --mode loadtest
+6. Trả lời cả file câu hỏi: python main.py --batch questions.jsonl
+7. Xem hướng dẫn: python main.py --help
 """
 import os
 import sys
@@ -28,8 +32,7 @@ async def cli_mode():
     Sử dụng khi muốn test bot mà không cần Telegram
     """
     # Import các module cần thiết
-    from core.orchestrator import OrchestratorAgent
-    from config.settings import DEFAULT_MODEL
+    from core.warmup import start_orchestrator
     
     # Hiển thị thông tin chào mừng
     print("=" * 60)
@@ -39,7 +42,9 @@ async def cli_mode():
     print("Gõ 'exit' hoặc 'quit' để thoát.\n")
     
     # Khởi tạo orchestrator - thành phần chính xử lý câu hỏi
-    orchestrator = OrchestratorAgent(model_name=DEFAULT_MODEL)
+    # (warm-up: load trước danh sách mã, model embedding... trước câu hỏi đầu tiên)
+    print("Đang khởi động...")
+    orchestrator, _ = await start_orchestrator(workers=0)
     
     # Vòng lặp chính - nhận câu hỏi và trả lời
     while True:
@@ -70,13 +75,46 @@ async def cli_mode():
             print(f"\nLỗi: {e}")
 
 
+async def batch_mode(args):
+    """
+    Chế độ Batch - Trả lời cả file câu hỏi (JSONL) song song
+    
+    Kết quả ghi theo thứ tự câu hỏi, kèm thời gian từng câu; chạy lại cùng
+    lệnh sau khi bị dừng sẽ bỏ qua các câu đã có kết quả
+    """
+    from core.batch import run_batch
+    from config.settings import BATCH_CONCURRENCY
+    
+    if not os.path.exists(args.batch):
+        print(f"[ERROR] Không tìm thấy file {args.batch}")
+        sys.exit(1)
+    
+    stats = await run_batch(
+        args.batch,
+        output_path=args.batch_output,
+        concurrency=args.concurrency or BATCH_CONCURRENCY,
+    )
+    throughput = stats["processed"] / stats["elapsed_s"] if stats["elapsed_s"] else 0.0
+    print(
+        f"\n[Batch] Xong: {stats['processed']} câu ({stats['errors']} lỗi) trong {stats['elapsed_s']} s "
+        f"({throughput:.2f} câu/s), {stats['skipped']} câu dùng kết quả cũ → {stats['output']}"
+    )
+    if stats["errors"]:
+        print("[Batch] Chạy lại cùng lệnh để thử lại các câu bị lỗi")
+
+
 def main():
     """
     Hàm chính - Xử lý lựa chọn chế độ chạy
     
-    Có 2 chế độ:
-    - telegram: Chạy bot trên Telegram (mặc định)
+    Có 5 chế độ:
+    - telegram: Chạy bot trên Telegram (mặc định, long polling)
+    - webhook: Chạy bot trên Telegram qua webhook (HTTP server)
+    - api: HTTP/JSON API cho các client khác (không cần Telegram)
     - cli: Chạy bot qua terminal để test
+    - loadtest: Đo tải orchestrator với Groq / vnstock / CafeF giả lập
+    
+    --batch FILE: trả lời các câu hỏi trong file rồi thoát
     """
     # Tạo parser để đọc tham số dòng lệnh
     parser = argparse.ArgumentParser(
@@ -87,15 +125,29 @@ Ví dụ:
   python main.py              # Chạy Telegram bot (mặc định)
   python main.py --telegram   # Chạy Telegram bot
   python main.py --cli        # Chạy CLI mode để test
+  python main.py --mode webhook --port 8443 --workers 4
+                              # Chạy Telegram bot qua webhook, 4 worker
+  python main.py --mode api --port 8080
+                              # Chạy HTTP API (POST /v1/query, /v1/batch)
+  python main.py --shards 4   # Chạy Telegram bot, câu hỏi xử lý bởi 4 worker process
+  python main.py --profile-startup --cli
+                              # Đo thời gian import / khởi tạo của CLI mode
+  python main.py --batch questions.jsonl --concurrency 8
+                              # Trả lời file câu hỏi → questions.results.jsonl
+                              # (chạy lại cùng lệnh để tiếp tục sau khi bị dừng)
+  python main.py --mode loadtest --concurrency 32 --requests 500
+                              # Đo tải (không gọi Groq / vnstock / CafeF thật)
+  python main.py --mode loadtest --rate 20 --requests 1000
+                              # Đo tải với 20 câu hỏi/giây (Poisson)
         """
     )
     
     # Thêm các tham số dòng lệnh
     parser.add_argument(
         '--mode',
-        choices=['telegram', 'cli'],
+        choices=['telegram', 'webhook', 'api', 'cli', 'loadtest'],
         default='telegram',
-        help='Chế độ chạy: telegram (mặc định) hoặc cli'
+        help='Chế độ chạy: telegram (mặc định), webhook, api, cli hoặc loadtest'
     )
     
     parser.add_argument(
@@ -110,6 +162,80 @@ Ví dụ:
         help='Chạy CLI mode để test'
     )
     
+    parser.add_argument(
+        '--port',
+        type=int,
+        default=None,
+        help='Port của webhook / API server (mặc định WEBHOOK_PORT / API_PORT)'
+    )
+    
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=None,
+        help='Số worker process của webhook server (mặc định WEBHOOK_WORKERS)'
+    )
+    
+    parser.add_argument(
+        '--shards',
+        type=int,
+        default=None,
+        help='Số worker process xử lý câu hỏi, chia theo user (mặc định SHARD_WORKERS, 0 = tắt)'
+    )
+    
+    parser.add_argument(
+        '--profile-startup',
+        action='store_true',
+        help='In thời gian import và khởi tạo theo module của chế độ đã chọn rồi thoát'
+    )
+    
+    parser.add_argument(
+        '--separate-ports',
+        action='store_true',
+        help='Webhook: mỗi worker 1 port riêng (port, port+1, ...) cho load balancer'
+    )
+    
+    parser.add_argument(
+        '--batch',
+        metavar='FILE',
+        default=None,
+        help='Trả lời các câu hỏi trong file JSONL rồi thoát (chạy tiếp nếu file kết quả đã có)'
+    )
+    
+    parser.add_argument(
+        '--batch-output',
+        metavar='FILE',
+        default=None,
+        help='Batch: file JSONL kết quả (mặc định <FILE>.results.jsonl)'
+    )
+    
+    parser.add_argument(
+        '--concurrency',
+        type=int,
+        default=None,
+        help='Batch / loadtest: số câu hỏi xử lý cùng lúc tối đa (mặc định BATCH_CONCURRENCY / 16)'
+    )
+    
+    parser.add_argument(
+        '--rate',
+        type=float,
+        default=0.0,
+        help='Loadtest: số câu hỏi đến mỗi giây, phân phối Poisson (mặc định 0 = gửi liên tục)'
+    )
+    
+    parser.add_argument(
+        '--requests',
+        type=int,
+        default=200,
+        help='Loadtest: tổng số câu hỏi (mặc định 200)'
+    )
+    
+    parser.add_argument(
+        '--output',
+        default=None,
+        help='Loadtest: ghi báo cáo JSON ra file'
+    )
+    
     # Đọc tham số từ dòng lệnh
     args = parser.parse_args()
     
@@ -121,13 +247,28 @@ Ví dụ:
     else:
         mode = args.mode
     
+    # Số worker process (đọc bởi config.settings khi các module được import)
+    if args.shards is not None:
+        os.environ["SHARD_WORKERS"] = str(args.shards)
+    
     # Sửa lỗi event loop trên Windows
     if os.name == "nt":
         asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
     
     # Chạy theo chế độ đã chọn
-    if mode == 'cli':
+    if args.profile_startup:
+        from core.startup_profiler import profile_startup
+        profile_startup(mode)
+    elif args.batch:
+        asyncio.run(batch_mode(args))
+    elif mode == 'cli':
         asyncio.run(cli_mode())
+    elif mode == 'webhook':
+        webhook_mode(args)
+    elif mode == 'api':
+        api_mode(args)
+    elif mode == 'loadtest':
+        loadtest_mode(args)
     else:
         telegram_mode()
 
@@ -150,5 +291,68 @@ def telegram_mode():
         sys.exit(1)
 
 
+def webhook_mode(args):
+    """
+    Chế độ Webhook - Telegram gửi update tới HTTP server của bot
+    
+    Yêu cầu TELEGRAM_BOT_TOKEN; WEBHOOK_URL và WEBHOOK_SECRET_TOKEN
+    trong .env khi chạy thật (test local chỉ cần POST update JSON)
+    """
+    try:
+        from core.webhook import main as webhook_main
+        from config.settings import WEBHOOK_PORT, WEBHOOK_WORKERS
+    except ImportError as e:
+        print(f"[ERROR] Chế độ webhook cần package python-telegram-bot và aiohttp: {e}")
+        print(f"[ERROR] Cài đặt bằng: pip install python-telegram-bot aiohttp")
+        sys.exit(1)
+    
+    webhook_main(
+        port=args.port or WEBHOOK_PORT,
+        workers=args.workers or WEBHOOK_WORKERS,
+        separate_ports=args.separate_ports,
+    )
+
+
+def api_mode(args):
+    """
+    Chế độ API - HTTP/JSON API cho orchestrator
+    
+    Yêu cầu GROQ_API_KEY; đặt API_AUTH_TOKEN để bắt buộc header Authorization
+    """
+    try:
+        from core.api_server import main as api_main
+        from config.settings import API_PORT
+    except ImportError as e:
+        print(f"[ERROR] Chế độ API cần package aiohttp: {e}")
+        print(f"[ERROR] Cài đặt bằng: pip install aiohttp")
+        sys.exit(1)
+    
+    api_main(port=args.port or API_PORT)
+
+
+def loadtest_mode(args):
+    """
+    Chế độ Loadtest - Đo tải OrchestratorAgent.handle_query
+    
+    Groq, vnstock và CafeF được thay bằng bản giả lập tại chỗ (latency
+    cấu hình bằng LOADTEST_* trong .env), không cần API key
+    """
+    # Không cần key thật: mọi request LLM đi tới server giả lập
+    os.environ.setdefault("GROQ_API_KEY", "loadtest")
+    try:
+        from core.loadtest import main as loadtest_main
+    except ImportError as e:
+        print(f"[ERROR] Chế độ loadtest cần package aiohttp và pandas: {e}")
+        print(f"[ERROR] Cài đặt bằng: pip install aiohttp pandas")
+        sys.exit(1)
+    
+    loadtest_main(
+        concurrency=args.concurrency or 16,
+        rate=args.rate,
+        requests=args.requests,
+        output=args.output,
+    )
+
+
 if __name__ == "__main__":
     main()
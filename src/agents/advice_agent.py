@@ -1,25 +1,32 @@
-"""Advice agent for stock analysis and investment recommendations."""
-from vnstock import Vnstock, Listing
-import pandas as pd
+"""Advice agent for stock analysis and investment recommendations.
+
+vnstock and pandas are imported on first use, and the symbol list is loaded
+on the first question, so importing this module does no network I/O.
+"""
 import re
-from datetime import datetime
+from datetime import datetime, timedelta
 import unicodedata
 import traceback
+from data.shared_cache import get_shared_cache
+from services.market_data import get_market_data
+from config.settings import HISTORY_CACHE_TTL
 
+_valid_symbols = None  # Loaded on first use, see get_valid_symbols()
 
-# Load valid symbols once at module level
-VALID_SYMBOLS = []
-try:
-    listing = Listing()
-    df_listing = listing.all_symbols()
-    if isinstance(df_listing, pd.DataFrame) and 'symbol' in df_listing.columns:
-        VALID_SYMBOLS = [s.upper() for s in df_listing['symbol'].astype(str).tolist()]
-        print(f"Loaded {len(VALID_SYMBOLS)} valid stock symbols from VN exchange")
-    else:
-        print("Warning: Listing.all_symbols() did not return valid DataFrame. VALID_SYMBOLS empty.")
-except Exception as e:
-    print(f"Error loading stock symbols: {e}")
-    VALID_SYMBOLS = []
+
+def get_valid_symbols() -> set:
+    """Return the set of valid stock symbols, loading it on first call.
+    
+    Returns:
+        Upper-case symbols listed on VN exchanges (empty if unavailable)
+    """
+    global _valid_symbols
+    if _valid_symbols is None:
+        from agents.stock_agent import load_valid_symbols
+        _valid_symbols = set(load_valid_symbols())
+        if _valid_symbols:
+            print(f"Loaded {len(_valid_symbols)} valid stock symbols from VN exchange")
+    return _valid_symbols
 
 
 def normalize_text(text: str) -> str:
@@ -60,9 +67,10 @@ def extract_symbol_from_question(question: str) -> str:
         'BUY', 'SELL', 'SHOULD', 'NOT', 'PRICE', 'STOCK', 'SYMBOL'
     }
     
-    if VALID_SYMBOLS:
+    valid_symbols = get_valid_symbols()
+    if valid_symbols:
         for cand in reversed(candidates):
-            if cand not in excluded and cand in VALID_SYMBOLS:
+            if cand not in excluded and cand in valid_symbols:
                 print(f"Detected stock symbol in question: {cand}")
                 return cand
     
@@ -111,37 +119,51 @@ def explain_decision(price_ratio: float, trend_5d: float, volatility: float, pri
     return " ".join(reasons)
 
 
-def analyze_stock(user_query: str) -> str:
-    """Analyze stock and provide investment advice.
+def compute_stock_analysis(user_query: str, cached_only: bool = False, timeout: float = None) -> dict:
+    """Compute analysis metrics and decision without formatting.
     
     Args:
         user_query: User query string
+        cached_only: Use the most recent cached price history, even if
+            expired, instead of calling vnstock (when the request is out
+            of time); the result then carries `stale: True`
+        timeout: Maximum wait for the market data sources in seconds
+            (None = no limit)
         
     Returns:
-        Stock analysis report
+        Dictionary with `status` ("ok", "no_symbol", "no_data" or "error"),
+        `symbol` and, when ok: current_price, price_change,
+        price_change_percent, avg_30d, min_30d, max_30d, volatility,
+        trend_5d, price_ratio, decision ("buy", "cautious" or "neutral"),
+        analyzed_at (datetime)
     """
+    symbol = None
     try:
         symbol = extract_symbol_from_question(user_query)
         if symbol is None:
-            return (
-                "Could not find a valid stock symbol in your question.\n\n"
-                "Please try asking:\n"
-                "• 'What is the price of FPT stock today?'\n"
-                "• 'Should I buy MWG?'\n"
-                "• 'Analyze HPG stock for me.'"
-            )
+            return {"status": "no_symbol", "symbol": None}
         
         print(f"Starting stock analysis for {symbol}...")
         
-        vnstock = Vnstock()
-        stock_obj = vnstock.stock(symbol=symbol, source='VCI')
-        
         end_date = datetime.now().strftime("%Y-%m-%d")
-        start_date = (datetime.now() - pd.Timedelta(days=60)).strftime("%Y-%m-%d")
-        hist = stock_obj.quote.history(start=start_date, end=end_date, interval='1D')
+        start_date = (datetime.now() - timedelta(days=60)).strftime("%Y-%m-%d")
         
-        if hist is None or hist.empty:
-            return f"No historical data available for symbol {symbol}"
+        # Closing prices are shared across worker processes for HISTORY_CACHE_TTL seconds
+        cache = get_shared_cache()
+        cache_key = f"{symbol}:{end_date}"
+        if cached_only:
+            closes = cache.get_stale("history", f"{symbol}:", prefix=True)
+            if closes is None:
+                return {"status": "error", "symbol": symbol, "error": "no cached history"}
+        else:
+            closes = cache.get("history", cache_key)
+        if closes is None:
+            closes = get_market_data().history(symbol, start_date, end_date, timeout=timeout)
+            if not closes:
+                return {"status": "no_data", "symbol": symbol}
+            cache.set("history", cache_key, closes, HISTORY_CACHE_TTL)
+        import pandas as pd
+        hist = pd.DataFrame({"close": closes})
         
         # Calculate metrics
         current_price = float(hist.iloc[-1]['close'])
@@ -164,49 +186,111 @@ def analyze_stock(user_query: str) -> str:
         
         price_ratio = current_price / avg_30d if avg_30d != 0 else 1.0
         
-        # Build analysis report
-        result = f"STOCK ANALYSIS: {symbol}\n{'='*50}\n"
-        result += f"Current Price: {current_price:,.0f} VND\n"
-        result += f"Change: {price_change:+,.0f} VND ({price_change_percent:+.2f}%)\n"
-        result += f"30-day Average: {avg_30d:,.0f} VND\n"
-        result += f"30-day Volatility: {volatility:.1f}%\n\n"
-        
-        # Trend analysis
-        result += "TREND ANALYSIS:\n"
-        if price_ratio < 0.95:
-            result += "- Price is BELOW 30-day average\n"
-        elif price_ratio > 1.05:
-            result += "- Price is ABOVE 30-day average\n"
-        else:
-            result += "- Price is AROUND 30-day average\n"
-        
-        if trend_5d > 2:
-            result += "- 5-day trend is UPWARD\n"
-        elif trend_5d < -2:
-            result += "- 5-day trend is DOWNWARD\n"
-        else:
-            result += "- 5-day trend is SIDEWAYS\n"
-        
-        # Recommendation
-        result += "\nRECOMMENDATION:\n"
         if price_ratio < 0.90:
-            decision = "Consider BUYING - price is in lower zone"
+            decision = "buy"
         elif price_ratio > 1.10:
-            decision = "Be CAUTIOUS - price is in higher zone"
+            decision = "cautious"
         else:
-            decision = "NEUTRAL - no clear signal"
-        result += f"{decision}\n\n"
-        
-        # Explanation
-        result += "REASONING:\n"
-        result += explain_decision(price_ratio, trend_5d, volatility, price_change_percent)
-        
-        result += "\n\nDISCLAIMER: This is automated analysis, NOT investment advice.\n"
-        result += f"Analysis time: {datetime.now().strftime('%d/%m/%Y %H:%M')}"
+            decision = "neutral"
         
-        return result
+        return {
+            "status": "ok",
+            "symbol": symbol,
+            "current_price": current_price,
+            "price_change": price_change,
+            "price_change_percent": float(price_change_percent),
+            "avg_30d": float(avg_30d),
+            "min_30d": float(min_30d),
+            "max_30d": float(max_30d),
+            "volatility": float(volatility),
+            "trend_5d": float(trend_5d),
+            "price_ratio": float(price_ratio),
+            "decision": decision,
+            "analyzed_at": datetime.now(),
+            **({"stale": True} if cached_only else {}),
+        }
     
     except Exception as e:
         print(f"Error in stock analysis:\n{traceback.format_exc()}")
-        return f"Error analyzing stock: {str(e)}"
+        return {"status": "error", "symbol": symbol, "error": str(e)}
+
+
+def format_analysis(analysis: dict) -> str:
+    """Format the result of compute_stock_analysis as a text report.
+    
+    Args:
+        analysis: Result of compute_stock_analysis
+        
+    Returns:
+        Stock analysis report
+    """
+    status = analysis.get("status")
+    symbol = analysis.get("symbol")
+    if status == "no_symbol":
+        return (
+            "Could not find a valid stock symbol in your question.\n\n"
+            "Please try asking:\n"
+            "• 'What is the price of FPT stock today?'\n"
+            "• 'Should I buy MWG?'\n"
+            "• 'Analyze HPG stock for me.'"
+        )
+    if status == "no_data":
+        return f"No historical data available for symbol {symbol}"
+    if status != "ok":
+        return f"Error analyzing stock: {analysis.get('error', '')}"
+    
+    price_ratio = analysis["price_ratio"]
+    trend_5d = analysis["trend_5d"]
+    
+    # Build analysis report
+    result = f"STOCK ANALYSIS: {symbol}\n{'='*50}\n"
+    result += f"Current Price: {analysis['current_price']:,.0f} VND\n"
+    result += f"Change: {analysis['price_change']:+,.0f} VND ({analysis['price_change_percent']:+.2f}%)\n"
+    result += f"30-day Average: {analysis['avg_30d']:,.0f} VND\n"
+    result += f"30-day Volatility: {analysis['volatility']:.1f}%\n\n"
+    
+    # Trend analysis
+    result += "TREND ANALYSIS:\n"
+    if price_ratio < 0.95:
+        result += "- Price is BELOW 30-day average\n"
+    elif price_ratio > 1.05:
+        result += "- Price is ABOVE 30-day average\n"
+    else:
+        result += "- Price is AROUND 30-day average\n"
+    
+    if trend_5d > 2:
+        result += "- 5-day trend is UPWARD\n"
+    elif trend_5d < -2:
+        result += "- 5-day trend is DOWNWARD\n"
+    else:
+        result += "- 5-day trend is SIDEWAYS\n"
+    
+    # Recommendation
+    result += "\nRECOMMENDATION:\n"
+    decision = {
+        "buy": "Consider BUYING - price is in lower zone",
+        "cautious": "Be CAUTIOUS - price is in higher zone",
+        "neutral": "NEUTRAL - no clear signal",
+    }[analysis["decision"]]
+    result += f"{decision}\n\n"
+    
+    # Explanation
+    result += "REASONING:\n"
+    result += explain_decision(price_ratio, trend_5d, analysis["volatility"], analysis["price_change_percent"])
+    
+    result += "\n\nDISCLAIMER: This is automated analysis, NOT investment advice.\n"
+    result += f"Analysis time: {analysis['analyzed_at'].strftime('%d/%m/%Y %H:%M')}"
+    
+    return result
+
 
+def analyze_stock(user_query: str) -> str:
+    """Analyze stock and provide investment advice.
+    
+    Args:
+        user_query: User query string
+        
+    Returns:
+        Stock analysis report
+    """
+    return format_analysis(compute_stock_analysis(user_query))
@@ -1,12 +1,23 @@
-"""News agent for retrieving and summarizing financial news."""
-import requests
-from bs4 import BeautifulSoup
+"""News agent for retrieving and summarizing financial news.
+
+requests and BeautifulSoup are imported on first crawl (slow imports).
+"""
 from datetime import datetime
 from typing import List, Dict
 import logging
 import textwrap
+from concurrent.futures import ThreadPoolExecutor
 from tools.rag_tool import RAGTool
-from config.settings import MAX_ARTICLES_PER_SOURCE
+from config.settings import MAX_ARTICLES_PER_SOURCE, NEWS_FETCH_WORKERS, NEWS_FETCH_TIMEOUT
+
+# Vùng nội dung chính của bài báo (CafeF trước, sau đó các layout phổ biến)
+ARTICLE_BODY_SELECTORS = [
+    "div.detail-content",
+    "div.contentdetail",
+    "div#mainContent",
+    "div.content-detail",
+    "article",
+]
 
 
 class NewsAgent:
@@ -34,11 +45,13 @@ class NewsAgent:
                 self.rag_tool = False  # Mark as failed
         return self.rag_tool if self.rag_tool else None
     
-    def run(self, symbol: str) -> Dict:
+    def run(self, symbol: str, timeout: float = None) -> Dict:
         """Search news and create summary for stock symbol.
         
         Args:
             symbol: Stock symbol
+            timeout: Crawl timeout in seconds (the request's remaining
+                budget), None for the default
             
         Returns:
             Dictionary containing articles and summary
@@ -47,10 +60,13 @@ class NewsAgent:
         all_articles = []
         
         # Search multiple sources
-        all_articles.extend(self.search_cafef(symbol))
+        all_articles.extend(self.search_cafef(symbol, timeout=timeout))
         # all_articles.extend(self.search_vnexpress(symbol))
         # all_articles.extend(self.search_vietstock(symbol))
         
+        # Collapse the same story syndicated under slightly different titles
+        all_articles = self.collapse_duplicates(all_articles)
+        
         # Add sentiment analysis
         for article in all_articles:
             article["sentiment"] = self.get_sentiment_from_title(article["title"])
@@ -66,43 +82,150 @@ class NewsAgent:
         
         return self.results
     
-    def search_cafef(self, symbol: str) -> List[Dict]:
+    def collapse_duplicates(self, articles: List[Dict]) -> List[Dict]:
+        """Merge near-duplicate articles into one entry with merged sources.
+        
+        Args:
+            articles: List of article dictionaries
+            
+        Returns:
+            Deduplicated list of articles
+        """
+        if len(articles) < 2:
+            return articles
+        
+        from data.dedup import collapse_near_duplicates
+        texts = [f"{a['title']} - {a['description']}" for a in articles]
+        _, merged, _ = collapse_near_duplicates(texts, articles)
+        if len(merged) < len(articles):
+            print(f"[News] Merged {len(articles) - len(merged)} near-duplicate articles")
+        return merged
+    
+    def search_cafef(self, symbol: str, timeout: float = None) -> List[Dict]:
         """Search news from CafeF website.
         
         Args:
             symbol: Stock symbol
+            timeout: Request timeout in seconds (default 10)
             
         Returns:
             List of article dictionaries
         """
         try:
+            import requests
             url = f"https://cafef.vn/tim-kiem.chn?keywords={symbol}"
-            response = requests.get(url, headers=self.headers, timeout=10)
-            soup = BeautifulSoup(response.content, 'html.parser')
-            items = soup.find_all('div', class_='item', limit=self.max_articles_per_source)
+            response = requests.get(url, headers=self.headers, timeout=timeout or 10)
+            return self.parse_cafef_search(response.content)
+        except Exception as e:
+            logging.warning(f"[CafeF] Crawl error: {e}")
+            return []
+    
+    def parse_cafef_search(self, html) -> List[Dict]:
+        """Parse a CafeF search result page.
+        
+        Args:
+            html: Page content (bytes or str)
+            
+        Returns:
+            List of article dictionaries (at most max_articles_per_source)
+        """
+        from bs4 import BeautifulSoup
+        soup = BeautifulSoup(html, 'html.parser')
+        items = soup.find_all('div', class_='item', limit=self.max_articles_per_source)
+        
+        results = []
+        for item in items:
+            title_tag = item.find('h3')
+            link_tag = item.find('a')
+            desc_tag = item.find('p')
             
-            results = []
-            for item in items:
-                title_tag = item.find('h3')
-                link_tag = item.find('a')
-                desc_tag = item.find('p')
+            if title_tag and link_tag:
+                href = link_tag['href']
+                full_url = 'https://cafef.vn' + href if href.startswith('/') else href
                 
-                if title_tag and link_tag:
-                    href = link_tag['href']
-                    full_url = 'https://cafef.vn' + href if href.startswith('/') else href
-                    
-                    results.append({
-                        "source": "CafeF",
-                        "title": title_tag.get_text(strip=True),
-                        "url": full_url,
-                        "description": desc_tag.get_text(strip=True) if desc_tag else '',
-                        "date": datetime.now().strftime('%Y-%m-%d')
-                    })
+                results.append({
+                    "source": "CafeF",
+                    "title": title_tag.get_text(strip=True),
+                    "url": full_url,
+                    "description": desc_tag.get_text(strip=True) if desc_tag else '',
+                    "date": datetime.now().strftime('%Y-%m-%d')
+                })
+        
+        return results
+    
+    def fetch_article_bodies(self, articles: List[Dict]) -> List[Dict]:
+        """Download full article bodies concurrently.
+        
+        Sets `body` on each article (empty string when the page cannot be
+        fetched or parsed, so callers fall back to title + description).
+        
+        Args:
+            articles: List of article dictionaries with `url`
+            
+        Returns:
+            The same list of articles
+        """
+        pending = [a for a in articles if a.get("url") and "body" not in a]
+        if not pending:
+            return articles
+        
+        with ThreadPoolExecutor(max_workers=min(NEWS_FETCH_WORKERS, len(pending))) as executor:
+            bodies = list(executor.map(self.fetch_article_body, [a["url"] for a in pending]))
+        for article, body in zip(pending, bodies):
+            article["body"] = body
+        
+        fetched = sum(1 for body in bodies if body)
+        print(f"[News] Fetched {fetched}/{len(pending)} article bodies")
+        return articles
+    
+    def fetch_article_body(self, url: str) -> str:
+        """Download one article page and extract its main text.
+        
+        Args:
+            url: Article URL
             
-            return results
+        Returns:
+            Article text (paragraphs separated by newlines), or "" on error
+        """
+        try:
+            import requests
+            response = requests.get(url, headers=self.headers, timeout=NEWS_FETCH_TIMEOUT)
+            response.raise_for_status()
+            return self.extract_article_body(response.content)
         except Exception as e:
-            logging.warning(f"[CafeF] Crawl error: {e}")
-            return []
+            logging.warning(f"[News] Fetch body error ({url}): {e}")
+            return ""
+    
+    @staticmethod
+    def extract_article_body(html) -> str:
+        """Extract main article text from an HTML page.
+        
+        Args:
+            html: Page content (bytes or str)
+            
+        Returns:
+            Paragraph texts joined by newlines
+        """
+        from bs4 import BeautifulSoup
+        soup = BeautifulSoup(html, 'html.parser')
+        for tag in soup(['script', 'style', 'noscript', 'iframe', 'figure', 'figcaption']):
+            tag.decompose()
+        
+        container = None
+        for selector in ARTICLE_BODY_SELECTORS:
+            container = soup.select_one(selector)
+            if container:
+                break
+        
+        if container:
+            paragraphs = container.find_all('p') or [container]
+        else:
+            # Không nhận ra layout: lấy các đoạn văn đủ dài trên cả trang
+            paragraphs = [p for p in soup.find_all('p') if len(p.get_text(strip=True)) > 40]
+        
+        return "\n".join(
+            text for text in (p.get_text(" ", strip=True) for p in paragraphs) if text
+        )
     
     def get_sentiment_from_title(self, title: str) -> str:
         """Analyze sentiment from article title.
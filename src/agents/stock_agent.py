@@ -3,12 +3,38 @@ Stock Agent - Agent tra cứu giá cổ phiếu
 
 Nhiệm vụ:
 - Trích xuất mã cổ phiếu từ câu hỏi người dùng
-- Lấy giá cổ phiếu từ vnstock API
+- Lấy giá cổ phiếu từ vnstock API (qua MarketDataClient: nhiều nguồn, hedge, failover)
 - Trả về thông tin giá cổ phiếu theo định dạng dễ đọc
+
+vnstock chỉ được import khi cần (import chậm), danh sách mã chỉ được tải
+ở lần tra cứu đầu tiên - không gọi mạng khi import hay khởi tạo.
 """
 import re
-from vnstock import Listing, Vnstock
 from datetime import datetime, timedelta
+from data.shared_cache import get_shared_cache
+from services.market_data import get_market_data
+from config.settings import QUOTE_CACHE_TTL, SYMBOLS_CACHE_TTL
+
+
+def load_valid_symbols() -> list:
+    """
+    Danh sách mã cổ phiếu hợp lệ trên sàn VN (chữ hoa)
+    
+    Dùng chung cache giữa các agent và các worker process.
+    
+    Returns:
+        Danh sách mã (rỗng nếu không tải được)
+    """
+    def fetch():
+        try:
+            from vnstock import Listing
+            df = Listing().all_symbols()
+            return df["symbol"].dropna().astype(str).str.upper().unique().tolist()
+        except Exception as e:
+            print(f"[WARN] Không thể load danh sách mã cổ phiếu: {e}")
+            return None
+    
+    return get_shared_cache().get_or_set("symbols", "all", SYMBOLS_CACHE_TTL, fetch) or []
 
 
 class StockAgent:
@@ -23,20 +49,21 @@ class StockAgent:
     
     def __init__(self):
         """Khởi tạo StockAgent"""
-        # Load danh sách mã cổ phiếu hợp lệ từ VN exchange
-        self.valid_symbols = self._load_symbols()
+        self._valid_symbols = None  # Load khi dùng lần đầu
+    
+    @property
+    def valid_symbols(self) -> set:
+        """Tập mã cổ phiếu hợp lệ từ VN exchange (load ở lần dùng đầu tiên)"""
+        if self._valid_symbols is None:
+            self._valid_symbols = self._load_symbols()
+        return self._valid_symbols
     
-    def _load_symbols(self) -> list:
+    def _load_symbols(self) -> set:
         """Load danh sách mã cổ phiếu hợp lệ từ VN exchange"""
-        try:
-            listing = Listing()
-            df = listing.all_symbols()
-            tickers = df["symbol"].dropna().unique().tolist()
+        tickers = set(load_valid_symbols())
+        if tickers:
             print(f"[StockAgent] Đã load {len(tickers)} mã cổ phiếu hợp lệ")
-            return tickers
-        except Exception as e:
-            print(f"[WARN] Không thể load danh sách mã cổ phiếu: {e}")
-            return []
+        return tickers
     
     def extract_symbol(self, query: str) -> str:
         """
@@ -65,50 +92,101 @@ class StockAgent:
         # Nếu không tìm thấy theo context, trả về mã cuối cùng (thường là mã thực)
         return valid[-1]
     
-    def handle_request(self, query: str) -> str:
+    def get_quote(self, query: str, timeout: float = None) -> dict:
         """
-        Xử lý yêu cầu tra cứu giá cổ phiếu
+        Tra cứu giá cổ phiếu, trả về dữ liệu có cấu trúc (chưa format)
         
         Args:
             query: Câu hỏi người dùng (ví dụ: "Giá FPT hôm nay")
+            timeout: Thời gian chờ tối đa cho các nguồn giá (giây), None = không giới hạn
             
         Returns:
-            Thông tin giá cổ phiếu hoặc thông báo lỗi
+            Dictionary:
+            - status: "ok", "no_symbol", "no_data" hoặc "error"
+            - symbol: Mã cổ phiếu (None nếu không tìm thấy)
+            - price, change, change_percent: Giá hiện tại, thay đổi (VND, %)
+            - volume: Khối lượng (None nếu không có)
+            - source: Nguồn vnstock đã trả lời (vd: "VCI")
         """
         # Tìm mã cổ phiếu trong câu hỏi
         symbol = self.extract_symbol(query)
         if not symbol:
-            return "Vui lòng cung cấp mã cổ phiếu hợp lệ (ví dụ: FPT, VNM, HPG, MWG, ...)."
+            return {"status": "no_symbol", "symbol": None}
+        
+        # Giá vừa được tra (bởi worker bất kỳ) trong QUOTE_CACHE_TTL giây → dùng lại
+        cache = get_shared_cache()
+        cached = cache.get("quote", symbol)
+        if cached is not None:
+            return cached
         
         try:
-            # Khởi tạo vnstock và lấy dữ liệu
-            vnstock = Vnstock()
-            stock_obj = vnstock.stock(symbol=symbol, source='VCI')
-            
-            # Lấy giá hiện tại
-            quote = stock_obj.quote()
-            if quote is None or quote.empty:
-                return f"Không tìm thấy dữ liệu cho mã {symbol}."
-            
-            # Lấy thông tin từ quote
-            current_price = float(quote.iloc[-1]['close']) if not quote.empty else 0
-            change = float(quote.iloc[-1]['change']) if 'change' in quote.columns else 0
-            change_percent = float(quote.iloc[-1]['pctChange']) if 'pctChange' in quote.columns else 0
-            
-            # Format kết quả
-            result = f"📊 GIÁ CỔ PHIẾU {symbol}\n"
-            result += f"{'='*40}\n"
-            result += f"Giá hiện tại: {current_price:,.0f} VND\n"
-            result += f"Thay đổi: {change:+,.0f} VND ({change_percent:+.2f}%)\n"
-            
-            # Thêm thông tin volume nếu có
-            if 'volume' in quote.columns:
-                volume = float(quote.iloc[-1]['volume'])
-                result += f"Khối lượng: {volume:,.0f}\n"
+            quote = get_market_data().quote(symbol, timeout=timeout)
+            if quote is None:
+                return {"status": "no_data", "symbol": symbol}
             
+            result = {"status": "ok", "symbol": symbol, **quote}
+            cache.set("quote", symbol, result, QUOTE_CACHE_TTL)
             return result
             
         except Exception as e:
             print(f"[ERROR] Lỗi khi lấy giá cổ phiếu {symbol}: {e}")
+            return {"status": "error", "symbol": symbol}
+    
+    def get_cached_quote(self, query: str) -> dict:
+        """
+        Giá đã lưu trong cache, kể cả đã hết hạn (khi không kịp gọi vnstock)
+        
+        Returns:
+            Như get_quote, thêm "stale": True; status "error" nếu chưa từng tra mã này
+        """
+        symbol = self.extract_symbol(query)
+        if not symbol:
+            return {"status": "no_symbol", "symbol": None}
+        cached = get_shared_cache().get_stale("quote", symbol)
+        if cached is None:
+            return {"status": "error", "symbol": symbol}
+        return {**cached, "stale": True}
+    
+    @staticmethod
+    def format_quote(quote: dict) -> str:
+        """
+        Format kết quả của get_quote thành text dễ đọc
+        
+        Args:
+            quote: Kết quả từ get_quote
+            
+        Returns:
+            Thông tin giá cổ phiếu hoặc thông báo lỗi
+        """
+        symbol = quote.get("symbol")
+        status = quote.get("status")
+        if status == "no_symbol":
+            return "Vui lòng cung cấp mã cổ phiếu hợp lệ (ví dụ: FPT, VNM, HPG, MWG, ...)."
+        if status == "no_data":
+            return f"Không tìm thấy dữ liệu cho mã {symbol}."
+        if status != "ok":
             return f"Lỗi khi tra cứu giá cổ phiếu {symbol}. Vui lòng thử lại sau."
-
+        
+        # Format kết quả
+        result = f"📊 GIÁ CỔ PHIẾU {symbol}\n"
+        result += f"{'='*40}\n"
+        result += f"Giá hiện tại: {quote['price']:,.0f} VND\n"
+        result += f"Thay đổi: {quote['change']:+,.0f} VND ({quote['change_percent']:+.2f}%)\n"
+        
+        # Thêm thông tin volume nếu có
+        if quote.get("volume") is not None:
+            result += f"Khối lượng: {quote['volume']:,.0f}\n"
+        
+        return result
+    
+    def handle_request(self, query: str) -> str:
+        """
+        Xử lý yêu cầu tra cứu giá cổ phiếu
+        
+        Args:
+            query: Câu hỏi người dùng (ví dụ: "Giá FPT hôm nay")
+            
+        Returns:
+            Thông tin giá cổ phiếu hoặc thông báo lỗi
+        """
+        return self.format_quote(self.get_quote(query))
@@ -16,14 +16,193 @@ GROQ_BASE_URL = "https://api.groq.com/openai/v1"
 RAG_PERSIST_DIRECTORY = "./chroma_db"
 RAG_COLLECTION_NAME = "finance_news"
 RAG_EMBEDDING_MODEL = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+# Backend embedding: "sentence-transformers" (PyTorch), "onnx" hoặc "onnx-int8" (ONNX Runtime)
+RAG_EMBEDDING_BACKEND = os.getenv("RAG_EMBEDDING_BACKEND", "sentence-transformers")
+RAG_ONNX_MODEL_DIR = "./onnx_models"  # Model ONNX được export tự động lần đầu
+RAG_ONNX_MAX_LENGTH = 128  # Giống max_seq_length của model sentence-transformers
+RAG_ONNX_COSINE_TOLERANCE = 0.02  # onnx-int8: cosine với vector fp32 >= 0.98
+RAG_TOP_K = 3  # Số kết quả RAG dùng cho prompt context và news path
+RAG_QUERY_EMBEDDING_LRU_SIZE = 256  # Số embedding câu hỏi giữ trong RAM
+RAG_RECENCY_HALF_LIFE_DAYS = 7  # Tin cũ 7 ngày bị giảm một nửa điểm khi xếp hạng
+RAG_FILTER_OVERFETCH = 4  # Lấy dư top_k x N kết quả để lọc/xếp hạng lại
+RAG_NEWS_MAX_AGE_DAYS = 30  # News path chỉ dùng tin trong N ngày gần nhất
+RAG_HYBRID_ENABLED = True  # Kết hợp BM25 (từ khóa) với vector search bằng RRF
+RAG_RRF_K = 60  # Hằng số k của Reciprocal Rank Fusion
+RAG_LEXICAL_FAST_PATH_MAX_TOKENS = 3  # Câu chỉ gồm mã + 1-2 từ khóa → chỉ dùng BM25
+BM25_K1 = 1.5
+BM25_B = 0.75
+BM25_SAVE_EVERY = 1000  # Ghi file BM25 sau N document thay đổi...
+BM25_SAVE_INTERVAL = 60.0  # ...hoặc sau N giây kể từ lần ghi trước (và khi tắt process)
+RAG_PARTITION_BY_MONTH = True  # Mỗi tháng tin tức 1 collection (finance_news_YYYY_MM)
+RAG_RETENTION_MONTHS = 12  # Giữ N tháng gần nhất, partition cũ hơn bị xóa nguyên collection
+RAG_PARTITION_QUERY_WORKERS = 4  # Số thread tìm kiếm song song trên các partition
+RAG_CHUNK_MAX_TOKENS = 96  # Số từ tối đa mỗi chunk nội dung bài báo (trong giới hạn 128 của model)
+RAG_CHUNK_OVERLAP_TOKENS = 24  # Số từ chồng lấn giữa 2 chunk liền kề
+RAG_MAX_CHUNKS_PER_ARTICLE = 20
+RAG_INGEST_BATCH_SIZE = 256  # Số chunk mỗi lần gọi model embedding khi nạp tin
+RAG_EMBED_BATCH_WINDOW_MS = 5  # Cửa sổ gom batch embedding câu hỏi đồng thời (ms)
+RAG_EMBED_MAX_BATCH_SIZE = 32  # Số câu hỏi tối đa trong 1 batch embedding
+
+# Embedding Cache (lưu embedding ra đĩa theo model + hash nội dung)
+RAG_EMBEDDING_CACHE_ENABLED = True
+RAG_EMBEDDING_CACHE_DIR = "./embedding_cache"
+
+# Near-duplicate Detection (MinHash/LSH trước khi embedding)
+RAG_DEDUP_ENABLED = True
+RAG_DEDUP_THRESHOLD = 0.8  # Jaccard ước lượng để coi 2 bài là trùng
+RAG_DEDUP_NUM_PERM = 64
+RAG_DEDUP_BANDS = 16
+RAG_DEDUP_SHINGLE_SIZE = 5
 
 # Memory Configuration
 MEMORY_STORAGE_PATH = "conversation_history.json"
 MEMORY_MAX_TURNS = 20
+MEMORY_SUMMARY_TRIGGER = 4  # Tóm tắt khi có >= N tin nhắn cũ (ngoài cửa sổ gần đây) chưa tóm tắt
+MEMORY_SUMMARY_MAX_CHARS = 1500
+
+# Prompt Configuration (ngân sách token cho mỗi lần gọi LLM)
+PROMPT_CHARS_PER_TOKEN = 3  # Ước lượng token từ số ký tự (tiếng Việt có dấu)
+PROMPT_HISTORY_TURNS = 6  # Số tin nhắn gần nhất đưa nguyên văn vào prompt
+PROMPT_MAX_TURN_TOKENS = 150  # Cắt mỗi tin nhắn trong lịch sử (câu trả lời dài)
+PROMPT_TOKEN_BUDGET_ROUTING = 600
+PROMPT_TOKEN_BUDGET_FINAL = 2000
+PROMPT_SUMMARY_MAX_TOKENS = 200  # Độ dài tối đa của bản tóm tắt do LLM viết
+# Intent có câu trả lời viết bằng mẫu câu (không gọi LLM format); bỏ bớt để dùng lại LLM
+TEMPLATED_INTENTS = ("price_query", "advice_query")
 
 # News Agent Configuration
 DEFAULT_STOCK_SYMBOLS = ["FPT", "VCB", "VNM", "MWG", "HPG", "VIN"]
 MAX_ARTICLES_PER_SOURCE = 5
+NEWS_FETCH_BODY = True  # Tải nội dung đầy đủ của bài báo để lưu vào RAG
+NEWS_FETCH_WORKERS = 8  # Số bài tải song song
+NEWS_FETCH_TIMEOUT = 10  # Timeout mỗi request (giây)
+
+# Telegram Update Processing (xử lý đồng thời, giữ thứ tự theo user)
+BOT_MAX_CONCURRENT_UPDATES = 16  # Số tin nhắn được xử lý song song
+BOT_MAX_PENDING_UPDATES = 200  # Quá số này (đang chạy + đang chờ) → trả lời "bận"
+BOT_MAX_PENDING_PER_USER = 3  # Số tin nhắn tối đa đang chờ của 1 user
+BOT_BUSY_MESSAGE = "Hệ thống đang bận, bạn vui lòng thử lại sau ít phút nhé."
+
+# Telegram Webhook (python main.py --mode webhook)
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")  # URL public (https://.../telegram), None = không gọi setWebhook
+WEBHOOK_SECRET_TOKEN = os.getenv("WEBHOOK_SECRET_TOKEN")  # Telegram gửi lại trong header mỗi request
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "1"))  # Số worker process
+WEBHOOK_KEEPALIVE_TIMEOUT = 75  # Giữ kết nối HTTP với Telegram (giây)
+WEBHOOK_MAX_CONNECTIONS = 40  # Số kết nối song song tối đa Telegram mở tới webhook
+
+# HTTP API (python main.py --mode api)
+API_HOST = os.getenv("API_HOST", "127.0.0.1")
+API_PORT = int(os.getenv("API_PORT", "8080"))
+API_AUTH_TOKEN = os.getenv("API_AUTH_TOKEN")  # Header "Authorization: Bearer <token>", None = không kiểm tra
+API_MAX_CONCURRENT_QUERIES = 8  # Số câu hỏi được xử lý song song
+API_MAX_PENDING_QUERIES = 100  # Quá số này (đang chạy + đang chờ) → 503
+API_MAX_PENDING_PER_USER = 20  # Batch của 1 user được xếp hàng tuần tự
+API_MAX_BATCH_SIZE = 50  # Số câu hỏi tối đa mỗi request /v1/batch
+API_KEEPALIVE_TIMEOUT = 75  # Giữ kết nối HTTP (giây)
+
+# Multi-process Sharding (worker process theo user_id)
+SHARD_WORKERS = int(os.getenv("SHARD_WORKERS", "0"))  # 0 = xử lý trong process chính
+SHARD_VIRTUAL_NODES = 64  # Số điểm trên hash ring cho mỗi worker
+SHARD_MEMORY_PATH = "conversation_history.shard{index}.json"  # Lịch sử hội thoại riêng mỗi worker
+SHARD_RAG_TIMEOUT = 30  # Giây worker chờ tìm kiếm RAG qua process chính
+SHARD_RAG_INGEST_TIMEOUT = 300  # Giây worker chờ nạp tin vào RAG (embedding cả batch, lần đầu load model)
+
+# Warm-up (load trước model, danh sách mã... trước khi nhận tin nhắn)
+WARMUP_ENABLED = True
+WARMUP_TIMEOUT = 60  # Giây; quá hạn → chạy ở chế độ degraded, phần còn lại load ở nền
+WARMUP_QUERY = "tin tức cổ phiếu FPT"  # Query giả để load model embedding + collection
+
+# Market Data (nhiều nguồn vnstock, hedged request + circuit breaker - services/market_data.py)
+MARKET_DATA_SOURCES = [s.strip() for s in os.getenv("MARKET_DATA_SOURCES", "VCI,TCBS").split(",") if s.strip()]  # Thứ tự ưu tiên
+MARKET_DATA_WORKERS = 16  # Số request vnstock chạy song song tối đa (thread)
+MARKET_HEDGE_ENABLED = os.getenv("MARKET_HEDGE_ENABLED", "1") == "1"  # Gửi thêm tới nguồn thứ 2 khi nguồn đầu chậm
+MARKET_HEDGE_DEFAULT_DELAY = 1.0  # Giây chờ trước khi hedge khi chưa đủ mẫu để tính p95
+MARKET_HEDGE_MIN_DELAY = 0.2  # Giới hạn dưới / trên của độ trễ hedge (= p95 của nguồn, giây)
+MARKET_HEDGE_MAX_DELAY = 3.0
+MARKET_LATENCY_WINDOW = 200  # Số request gần nhất mỗi nguồn dùng để tính p95 / tỉ lệ lỗi
+MARKET_LATENCY_MIN_SAMPLES = 20  # Ít mẫu hơn → dùng MARKET_HEDGE_DEFAULT_DELAY, giữ thứ tự cấu hình
+MARKET_LATENCY_MAX_AGE = 300  # Giây; mẫu cũ hơn bị bỏ (nguồn ít dùng được thử lại)
+MARKET_BREAKER_FAILURES = 5  # Số lỗi liên tiếp → ngắt nguồn (circuit breaker mở)
+MARKET_BREAKER_COOLDOWN = 30  # Giây ngắt trước khi thử lại 1 request
+MARKET_SOURCE_TIMEOUT = 5.0  # Giây tối đa mỗi request HTTP của vnstock (cả khi không có deadline)
+MARKET_SOURCE_MAX_IN_FLIGHT = 8  # Số request đang chạy tối đa mỗi nguồn (nguồn treo không chiếm hết thread)
+# Rate limit mỗi nguồn, dùng chung cho mọi process (services/upstream_scheduler.py)
+MARKET_RATE_LIMITS = {  # Request/giây theo nguồn, vd: MARKET_RATE_LIMITS="VCI:5,TCBS:3"
+    name.strip(): float(rate)
+    for name, _, rate in (item.partition(":") for item in os.getenv("MARKET_RATE_LIMITS", "").split(","))
+    if name.strip() and rate.strip()
+}
+MARKET_RATE_DEFAULT = float(os.getenv("MARKET_RATE_DEFAULT", "5"))  # Nguồn không có trong MARKET_RATE_LIMITS (0 = không giới hạn)
+MARKET_RATE_BURST = 10  # Số request tối đa được gửi liền nhau mỗi nguồn
+MARKET_QUEUE_TIMEOUT = 10  # Giây chờ lượt tối đa khi không có deadline
+MARKET_RATE_SHARED = os.getenv("MARKET_RATE_SHARED", "1") == "1"  # Token bucket trong SHARED_CACHE_PATH ("0" = riêng từng process)
+MARKET_RATE_POLL = 0.1  # Giây giữa 2 lần thử lấy token dùng chung khi phải chờ
+MARKET_RATE_INTERACTIVE_TTL = 1.0  # Đánh dấu "có câu hỏi người dùng đang chờ" hết hạn sau N giây (process bị chết)
+
+# Shared Cache (SQLite, dùng chung giữa các worker)
+SHARED_CACHE_PATH = "shared_cache.sqlite"
+SHARED_CACHE_STALE_GRACE = 24 * 3600  # Giữ mục hết hạn thêm N giây (trả lời bằng dữ liệu cũ khi quá deadline)
+SHARED_CACHE_PURGE_EVERY = 500  # Dọn mục quá hạn + grace sau mỗi N lần ghi (và khi warm-up)
+QUOTE_CACHE_TTL = 15  # Giá hiện tại (giây)
+HISTORY_CACHE_TTL = 300  # Lịch sử giá dùng cho tư vấn (giây)
+SYMBOLS_CACHE_TTL = 24 * 3600  # Danh sách mã cổ phiếu (giây)
+NEWS_CACHE_TTL = 15 * 60  # Tóm tắt tin tức vừa crawl (giây) - dùng lại khi crawl quá hạn
+
+# Deadline (ngân sách thời gian mỗi câu hỏi - core/deadline.py)
+REQUEST_BUDGET = float(os.getenv("REQUEST_BUDGET", "8"))  # Giây / câu hỏi, 0 = không giới hạn
+DEADLINE_RESERVE = 0.3  # Giây giữ lại cho ghi memory + gửi câu trả lời
+DEADLINE_STAGE_LIMITS = {  # Thời gian tối đa mỗi bước (giây), không vượt quá thời gian còn lại
+    "routing_llm": 2.5,
+    "rag_retrieval": 1.5,
+    "market_data": 4.0,  # vnstock (giá, lịch sử giá)
+    "news_crawl": 5.0,  # CafeF
+    "format_llm": 5.0,
+}
+DEADLINE_STAGE_MIN = {  # Còn ít thời gian hơn → bỏ qua bước / dùng dữ liệu cũ trong cache
+    "routing_llm": 0.5,
+    "rag_retrieval": 0.2,
+    "market_data": 0.3,
+    "news_crawl": 1.0,
+    "format_llm": 1.0,
+}
+
+# Telemetry (đo thời gian từng bước, metrics Prometheus - core/telemetry.py)
+TELEMETRY_ENABLED = os.getenv("TELEMETRY_ENABLED", "1") == "1"  # "0" = tắt hoàn toàn
+TELEMETRY_LOG_PATH = os.getenv("TELEMETRY_LOG_PATH")  # File JSON lines (1 dòng / câu hỏi), None = không ghi
+TELEMETRY_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)  # Giây
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))  # /metrics cho chế độ polling, 0 = tắt
+
+# Runtime Profiler (bật/tắt khi đang chạy: lệnh /profile hoặc SIGUSR1 - core/runtime_profiler.py)
+PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "0") == "1"  # Trạng thái lúc khởi động
+PROFILER_SAMPLE_EVERY = int(os.getenv("PROFILER_SAMPLE_EVERY", "20"))  # Profile 1 trong N câu hỏi
+PROFILER_MODE = os.getenv("PROFILER_MODE", "stack")  # "stack" (lấy mẫu stack, mọi thread) | "cprofile"
+PROFILER_STACK_INTERVAL = 0.005  # Chu kỳ lấy mẫu stack (giây)
+PROFILER_OUTPUT_DIR = "profiles"  # File .collapsed (flamegraph.pl / speedscope), .prof, stall, tracemalloc
+LOOP_STALL_THRESHOLD = 0.25  # Event loop bị chặn lâu hơn (giây) → ghi lại stack
+LOOP_STALL_CHECK_INTERVAL = 0.05  # Chu kỳ kiểm tra event loop (giây)
+TRACEMALLOC_FRAMES = 15  # Số frame lưu cho mỗi vùng nhớ
+ADMIN_USER_IDS = {uid.strip() for uid in os.getenv("ADMIN_USER_IDS", "").split(",") if uid.strip()}  # Telegram user ID
+
+# Batch (python main.py --batch questions.jsonl - core/batch.py)
+BATCH_CONCURRENCY = 8  # Số câu hỏi xử lý song song
+BATCH_ITEM_TIMEOUT = 120  # Giây / câu hỏi, quá hạn ghi lỗi (chạy lại sẽ thử lại)
+
+# Load test (python main.py --mode loadtest - Groq / vnstock / CafeF giả lập tại chỗ)
+LOADTEST_QUESTIONS_PATH = "questions.txt"  # Câu hỏi mẫu (mỗi dòng 1 câu, bỏ qua dòng #)
+LOADTEST_HISTORY_PATH = MEMORY_STORAGE_PATH  # Phát lại câu hỏi của các user trong lịch sử
+LOADTEST_FIXTURES_DIR = "benchmarks/fixtures"  # HTML CafeF lưu sẵn
+LOADTEST_USERS = 50  # Số user ảo
+LOADTEST_TIMEOUT = 60  # Giây / câu hỏi, quá hạn tính là lỗi
+LOADTEST_LLM_LATENCY_MS = float(os.getenv("LOADTEST_LLM_LATENCY_MS", "400"))  # Median latency của Groq giả
+LOADTEST_LLM_JITTER = float(os.getenv("LOADTEST_LLM_JITTER", "0.4"))  # Độ lệch (log-normal sigma)
+LOADTEST_LLM_ERROR_RATE = float(os.getenv("LOADTEST_LLM_ERROR_RATE", "0"))  # Tỉ lệ trả HTTP 500
+LOADTEST_MARKET_LATENCY_MS = float(os.getenv("LOADTEST_MARKET_LATENCY_MS", "150"))  # vnstock giả
+LOADTEST_MARKET_ERROR_RATE = float(os.getenv("LOADTEST_MARKET_ERROR_RATE", "0"))  # Tỉ lệ lỗi của nguồn giá đầu tiên
+LOADTEST_NEWS_LATENCY_MS = float(os.getenv("LOADTEST_NEWS_LATENCY_MS", "300"))  # CafeF giả
 
 # Telegram Message Limits
 MAX_MESSAGE_LENGTH = 4000
@@ -0,0 +1,357 @@
+"""
+API Server - HTTP/JSON API cho orchestrator (không cần Telegram)
+
+Endpoint:
+- POST /v1/query  {"query": "...", "user_id": "..."}
+    Trả JSON {"answer", "elapsed_ms"} (+ "degraded" / "stale" khi không kịp
+    deadline REQUEST_BUDGET); thêm "stream": true (hoặc header
+    Accept: text/event-stream) để nhận câu trả lời dạng SSE theo từng đoạn
+- POST /v1/batch  {"queries": ["...", {"query": "...", "user_id": "..."}], "stream": false}
+    Trả lời nhiều câu hỏi song song, kết quả đúng thứ tự đầu vào;
+    "stream": true → NDJSON, mỗi dòng 1 kết quả ngay khi xong
+- GET /healthz, GET /readyz (trạng thái warm-up), GET /metrics (Prometheus)
+- POST /admin/profile {"action": "on|off|status|snapshot"} - runtime profiler
+    (chỉ khi đặt API_AUTH_TOKEN)
+
+Mọi request dùng chung 1 OrchestratorAgent (chung cache, RAG, memory).
+Số câu hỏi xử lý song song bị giới hạn; câu hỏi của cùng 1 user được
+xử lý tuần tự (giống bot Telegram, xem update_processor.py).
+"""
+import hmac
+import json
+import time
+import uuid
+import asyncio
+from typing import Any, Awaitable, Dict, Optional
+
+from aiohttp import web
+
+from core.update_processor import PerUserUpdateProcessor
+from core.warmup import readiness, start_orchestrator
+from core.telemetry import current_request_id, handle_metrics, request_trace
+from core.deadline import request_deadline
+from core.runtime_profiler import get_profiler
+from services.upstream_scheduler import BATCH, INTERACTIVE, upstream_caller
+from config.settings import (
+    API_HOST,
+    API_PORT,
+    API_AUTH_TOKEN,
+    API_MAX_CONCURRENT_QUERIES,
+    API_MAX_PENDING_QUERIES,
+    API_MAX_PENDING_PER_USER,
+    API_MAX_BATCH_SIZE,
+    API_KEEPALIVE_TIMEOUT,
+)
+
+DEFAULT_USER_ID = "api_user"
+
+
+class ServerBusyError(Exception):
+    """Hàng đợi câu hỏi đã đầy"""
+
+
+class QueryPool(PerUserUpdateProcessor):
+    """
+    Pool xử lý câu hỏi: song song giữa các user, tuần tự trong từng user
+
+    Dùng lại PerUserUpdateProcessor, key thứ tự là user_id thay cho Update;
+    khi quá tải raise ServerBusyError thay vì trả lời tin nhắn "bận".
+    """
+
+    @staticmethod
+    def _ordering_key(user_id: object) -> Optional[Any]:
+        return user_id
+
+    async def _reject(self, user_id: object, coroutine: Awaitable[Any]):
+        self.rejected += 1
+        if asyncio.iscoroutine(coroutine):
+            coroutine.close()
+        raise ServerBusyError("Hệ thống đang bận, vui lòng thử lại sau")
+
+
+class APIServer:
+    """
+    HTTP API bọc OrchestratorAgent.handle_query
+
+    Ví dụ:
+        server = APIServer()
+        web.run_app(server.create_app(), port=8080)
+    """
+
+    def __init__(
+        self,
+        orchestrator: Optional[object] = None,
+        auth_token: Optional[str] = API_AUTH_TOKEN,
+        max_concurrent: int = API_MAX_CONCURRENT_QUERIES,
+        max_pending: int = API_MAX_PENDING_QUERIES,
+        max_pending_per_user: int = API_MAX_PENDING_PER_USER,
+        max_batch_size: int = API_MAX_BATCH_SIZE,
+    ):
+        """
+        Khởi tạo API server
+
+        Args:
+            orchestrator: OrchestratorAgent dùng chung (None = tạo khi server khởi động)
+            auth_token: Bearer token bắt buộc (None = không kiểm tra)
+            max_concurrent: Số câu hỏi xử lý song song
+            max_pending: Số câu hỏi tối đa đang chạy + đang chờ
+            max_pending_per_user: Số câu hỏi tối đa đang chờ của 1 user
+            max_batch_size: Số câu hỏi tối đa mỗi batch
+        """
+        self.orchestrator = orchestrator
+        self.auth_token = auth_token
+        self.max_concurrent = max_concurrent
+        self.max_batch_size = max_batch_size
+        self.pool = QueryPool(max_concurrent, max_pending, max_pending_per_user)
+
+    def _get_orchestrator(self):
+        if self.orchestrator is None:
+            from core.sharding import create_orchestrator
+            self.orchestrator = create_orchestrator()
+            print("Orchestrator initialized for API server")
+        return self.orchestrator
+
+    async def answer(
+        self, query: str, user_id: str, on_chunk=None, ephemeral: bool = False, priority: str = INTERACTIVE
+    ) -> Dict:
+        """
+        Trả lời 1 câu hỏi qua pool
+
+        Args:
+            query: Câu hỏi
+            user_id: ID người dùng (lịch sử hội thoại riêng)
+            on_chunk: Callback streaming (xem OrchestratorAgent.handle_query)
+            ephemeral: Xóa lịch sử của user_id sau khi trả lời (câu hỏi độc lập trong batch)
+            priority: Mức ưu tiên khi gọi vnstock (INTERACTIVE hoặc BATCH)
+
+        Returns:
+            {"answer", "elapsed_ms"} (+ "request_id" khi bật telemetry,
+            "degraded" / "stale" khi có bước không kịp deadline)
+
+        Raises:
+            ServerBusyError: Khi hàng đợi đầy
+        """
+        orchestrator = self._get_orchestrator()
+        start = time.perf_counter()
+        result: Dict = {}
+
+        async def run():
+            try:
+                with (
+                    request_trace("api"),
+                    request_deadline() as deadline,
+                    upstream_caller(user_id=user_id, priority=priority),
+                ):
+                    if current_request_id():
+                        result["request_id"] = current_request_id()
+                    result["answer"] = await orchestrator.handle_query(query, user_id=user_id, on_chunk=on_chunk)
+                    if deadline is not None and deadline.degraded:
+                        result["degraded"] = deadline.degraded  # Bước bị bỏ qua / quá hạn
+                    if deadline is not None and deadline.stale:
+                        result["stale"] = deadline.stale  # Dữ liệu lấy từ cache cũ
+            finally:
+                if ephemeral:
+                    orchestrator.memory.clear_history(user_id)
+
+        await self.pool.process_update(user_id, run())
+        result["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        return result
+
+    def _authorized(self, request: web.Request) -> bool:
+        if not self.auth_token:
+            return True
+        header = request.headers.get("Authorization", "")
+        return hmac.compare_digest(header.encode(), f"Bearer {self.auth_token}".encode())
+
+    @staticmethod
+    async def _read_json(request: web.Request) -> Dict:
+        try:
+            body = await request.json()
+        except Exception:
+            raise web.HTTPBadRequest(text=json.dumps({"error": "invalid JSON"}), content_type="application/json")
+        if not isinstance(body, dict):
+            raise web.HTTPBadRequest(text=json.dumps({"error": "body must be an object"}), content_type="application/json")
+        return body
+
+    @staticmethod
+    def _busy_response() -> web.Response:
+        return web.json_response({"error": "server busy"}, status=503, headers={"Retry-After": "5"})
+
+    async def handle_query(self, request: web.Request) -> web.StreamResponse:
+        """POST /v1/query"""
+        if not self._authorized(request):
+            return web.json_response({"error": "unauthorized"}, status=401)
+        body = await self._read_json(request)
+        query = str(body.get("query") or "").strip()
+        if not query:
+            return web.json_response({"error": "missing query"}, status=400)
+        user_id = str(body.get("user_id") or DEFAULT_USER_ID)
+
+        stream = body.get("stream") or "text/event-stream" in request.headers.get("Accept", "")
+        if not stream:
+            try:
+                return web.json_response(await self.answer(query, user_id))
+            except ServerBusyError:
+                return self._busy_response()
+            except Exception as e:
+                print(f"[WARN] API query failed: {e}")
+                return web.json_response({"error": str(e)}, status=500)
+
+        # SSE: quá tải thì trả 503 trước khi mở stream
+        if self.pool.is_overloaded(user_id):
+            return self._busy_response()
+        response = web.StreamResponse(headers={
+            "Content-Type": "text/event-stream",
+            "Cache-Control": "no-cache",
+        })
+        await response.prepare(request)
+
+        async def send(event: str, data: Dict):
+            await response.write(f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode())
+
+        async def on_chunk(text: str):
+            await send("chunk", {"text": text})
+
+        try:
+            result = await self.answer(query, user_id, on_chunk=on_chunk)
+            await send("done", result)
+        except ServerBusyError:
+            await send("error", {"error": "server busy"})
+        except ConnectionResetError:
+            return response  # Client đã ngắt kết nối
+        except Exception as e:
+            print(f"[WARN] API stream failed: {e}")
+            await send("error", {"error": str(e)})
+        await response.write_eof()
+        return response
+
+    async def handle_batch(self, request: web.Request) -> web.StreamResponse:
+        """POST /v1/batch"""
+        if not self._authorized(request):
+            return web.json_response({"error": "unauthorized"}, status=401)
+        body = await self._read_json(request)
+        queries = body.get("queries")
+        if not isinstance(queries, list) or not queries:
+            return web.json_response({"error": "missing queries"}, status=400)
+        if len(queries) > self.max_batch_size:
+            return web.json_response({"error": f"batch larger than {self.max_batch_size}"}, status=413)
+
+        # Câu hỏi không có user_id được coi là độc lập: user tạm, xóa lịch sử sau khi trả lời
+        batch_id = uuid.uuid4().hex[:8]
+        items = []
+        for i, item in enumerate(queries):
+            if isinstance(item, str):
+                item = {"query": item}
+            user_id = item.get("user_id") if isinstance(item, dict) else None
+            items.append({
+                "query": str(item.get("query") or "").strip() if isinstance(item, dict) else "",
+                "user_id": str(user_id) if user_id else f"api_batch_{batch_id}_{i}",
+                "ephemeral": not user_id,
+            })
+
+        # 1 batch chiếm tối đa max_concurrent chỗ trong pool, phần còn lại chờ
+        # ở đây → batch lớn không làm đầy hàng đợi của các request khác
+        limit = asyncio.Semaphore(self.max_concurrent)
+
+        async def run(index: int, item: Dict) -> Dict:
+            if not item["query"]:
+                return {"index": index, "error": "missing query"}
+            try:
+                async with limit:
+                    result = await self.answer(
+                        item["query"], item["user_id"], ephemeral=item["ephemeral"], priority=BATCH
+                    )
+                return {"index": index, **result}
+            except ServerBusyError:
+                return {"index": index, "error": "server busy"}
+            except Exception as e:
+                print(f"[WARN] API batch item {index} failed: {e}")
+                return {"index": index, "error": str(e)}
+
+        tasks = [asyncio.create_task(run(i, item)) for i, item in enumerate(items)]
+
+        if not body.get("stream"):
+            return web.json_response({"results": await asyncio.gather(*tasks)})
+
+        # NDJSON: ghi mỗi kết quả ngay khi xong (kèm "index" để ghép lại thứ tự)
+        response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        await response.prepare(request)
+        try:
+            for task in asyncio.as_completed(tasks):
+                result = await task
+                await response.write((json.dumps(result, ensure_ascii=False) + "\n").encode())
+        except ConnectionResetError:
+            return response
+        await response.write_eof()
+        return response
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        """GET /healthz"""
+        return web.json_response({
+            "status": "ok",
+            "pending": self.pool.pending,
+            "processed": self.pool.processed,
+            "rejected": self.pool.rejected,
+        })
+
+    async def handle_ready(self, request: web.Request) -> web.Response:
+        """GET /readyz"""
+        is_ready, detail = readiness(self.orchestrator)
+        return web.json_response(detail, status=200 if is_ready else 503)
+
+    async def handle_profile(self, request: web.Request) -> web.Response:
+        """POST /admin/profile - bật/tắt runtime profiler, snapshot tracemalloc"""
+        if not self.auth_token:
+            return web.json_response({"error": "admin endpoints require API_AUTH_TOKEN"}, status=403)
+        if not self._authorized(request):
+            return web.json_response({"error": "unauthorized"}, status=401)
+        body = await self._read_json(request)
+        profiler = get_profiler()
+        action = body.get("action", "status")
+        if action == "on":
+            profiler.enable()
+        elif action == "off":
+            profiler.disable()
+        elif action == "snapshot":
+            return web.json_response({"snapshot": profiler.snapshot()})
+        elif action != "status":
+            return web.json_response({"error": "action must be on, off, status or snapshot"}, status=400)
+        return web.json_response(profiler.status())
+
+    async def _on_startup(self, app: web.Application):
+        get_profiler().install()
+        # Khởi tạo + warm-up orchestrator trước khi nhận request đầu tiên
+        if self.orchestrator is None:
+            self.orchestrator, _ = await start_orchestrator()
+
+    def create_app(self) -> web.Application:
+        """Tạo aiohttp app với các route của API"""
+        app = web.Application()
+        app.router.add_post("/v1/query", self.handle_query)
+        app.router.add_post("/v1/batch", self.handle_batch)
+        app.router.add_get("/healthz", self.handle_health)
+        app.router.add_get("/readyz", self.handle_ready)
+        app.router.add_get("/metrics", handle_metrics)
+        app.router.add_post("/admin/profile", self.handle_profile)
+        app.on_startup.append(self._on_startup)
+        return app
+
+
+def main(host: str = API_HOST, port: int = API_PORT):
+    """
+    Chạy API server tới khi bị dừng (Ctrl+C)
+
+    Args:
+        host: Địa chỉ lắng nghe
+        port: Port lắng nghe
+    """
+    server = APIServer()
+    print(f"[API] Đang lắng nghe http://{host}:{port} (POST /v1/query, /v1/batch)")
+    web.run_app(
+        server.create_app(),
+        host=host,
+        port=port,
+        keepalive_timeout=API_KEEPALIVE_TIMEOUT,
+        access_log=None,
+        print=None,
+    )
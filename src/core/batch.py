@@ -0,0 +1,283 @@
+"""
+Batch - Trả lời cả file câu hỏi (python main.py --batch questions.jsonl)
+
+File vào: JSONL, mỗi dòng là chuỗi JSON ("Giá FPT?") hoặc object
+{"id": ..., "query": "...", "user_id": "..."} (id, user_id không bắt buộc).
+- Không có id: dùng số dòng làm id
+- Không có user_id: câu hỏi độc lập (lịch sử bị xóa sau khi trả lời)
+- Cùng user_id: xử lý tuần tự theo thứ tự trong file (có ngữ cảnh hội thoại)
+
+File ra: JSONL theo đúng thứ tự file vào, mỗi dòng gồm câu trả lời hoặc lỗi,
+intent, thời gian chờ / xử lý, thời gian từng bước (telemetry) và các bước
+không kịp deadline (degraded / stale). Request tới vnstock chạy với mức ưu
+tiên BATCH: câu hỏi của người dùng thật được phục vụ trước. Mỗi kết quả
+được ghi ngay khi các câu trước nó đã xong → chạy lại sau khi bị dừng giữa
+chừng chỉ xử lý các câu chưa có kết quả (hoặc bị lỗi).
+"""
+import os
+import json
+import time
+import asyncio
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from core.telemetry import request_trace
+from core.deadline import request_deadline
+from services.upstream_scheduler import BATCH, upstream_caller
+from config.settings import BATCH_CONCURRENCY, BATCH_ITEM_TIMEOUT
+
+
+def default_output_path(input_path: str) -> str:
+    """questions.jsonl → questions.results.jsonl"""
+    root, _ = os.path.splitext(input_path)
+    return f"{root}.results.jsonl"
+
+
+def load_items(path: str) -> List[Dict]:
+    """
+    Đọc file câu hỏi
+
+    Dòng không đọc được vẫn được giữ (kèm "error") để file ra đủ dòng.
+    """
+    items = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            item = {"index": len(items), "id": line_number, "query": "", "user_id": None}
+            try:
+                data = json.loads(line)
+            except json.JSONDecodeError:
+                item["error"] = "invalid JSON"
+                items.append(item)
+                continue
+            if isinstance(data, dict):
+                item["id"] = data.get("id", line_number)
+                item["query"] = str(data.get("query") or "").strip()
+                item["user_id"] = str(data["user_id"]) if data.get("user_id") else None
+            else:
+                item["query"] = str(data).strip()
+            if not item["query"]:
+                item["error"] = "missing query"
+            items.append(item)
+    return items
+
+
+def load_results(path: str) -> Dict:
+    """
+    Đọc kết quả của lần chạy trước
+
+    Returns:
+        {id: kết quả} - chỉ giữ câu trả lời thành công (dòng ghi dở bị bỏ qua)
+    """
+    results = {}
+    if not os.path.exists(path):
+        return results
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # Dòng cuối ghi dở khi bị dừng
+            if isinstance(record, dict) and "id" in record and not record.get("error"):
+                results[json.dumps(record["id"])] = record
+    return results
+
+
+class BatchRunner:
+    """Chạy danh sách câu hỏi qua orchestrator, ghi kết quả theo thứ tự"""
+
+    def __init__(self, orchestrator, concurrency: int = BATCH_CONCURRENCY, timeout: float = BATCH_ITEM_TIMEOUT):
+        """
+        Args:
+            orchestrator: OrchestratorAgent hoặc ShardedOrchestrator
+            concurrency: Số câu hỏi xử lý song song
+            timeout: Thời gian tối đa mỗi câu hỏi (giây)
+        """
+        self.orchestrator = orchestrator
+        self.concurrency = max(1, concurrency)
+        self.timeout = timeout
+
+    async def _answer(self, item: Dict, user_lock: asyncio.Lock, limit: asyncio.Semaphore) -> Dict:
+        record = {"index": item["index"], "id": item["id"], "query": item["query"]}
+        if item["user_id"]:
+            record["user_id"] = item["user_id"]
+        if item.get("error"):
+            record["error"] = item["error"]
+            return record
+
+        user_id = item["user_id"] or f"batch_{item['id']}"
+        queued = time.perf_counter()
+        async with user_lock, limit:  # Lock lấy theo thứ tự tạo task → giữ thứ tự câu hỏi của 1 user
+            start = time.perf_counter()
+            try:
+                with (
+                    request_trace("batch") as trace,
+                    request_deadline() as deadline,
+                    upstream_caller(user_id=item["user_id"] or "batch", priority=BATCH),
+                ):
+                    record["answer"] = await asyncio.wait_for(
+                        self.orchestrator.handle_query(item["query"], user_id=user_id), self.timeout
+                    )
+                if deadline is not None and (deadline.degraded or deadline.stale):
+                    record["degraded"] = deadline.degraded
+                    record["stale"] = deadline.stale
+                if trace is not None:
+                    record["request_id"] = trace.request_id
+                    record["intent"] = trace.attributes.get("intent")
+                    stages = defaultdict(float)
+                    for span in trace.spans:
+                        stages[span["stage"]] += span["ms"]
+                    record["stages_ms"] = {stage: round(ms, 1) for stage, ms in stages.items()}
+            except asyncio.TimeoutError:
+                record["error"] = f"timeout after {self.timeout}s"
+            except Exception as e:
+                print(f"[WARN] Batch item {item['id']} failed: {e}")
+                record["error"] = f"{type(e).__name__}: {e}"
+            finally:
+                if not item["user_id"]:
+                    try:
+                        self.orchestrator.memory.clear_history(user_id)
+                    except Exception as e:
+                        print(f"[WARN] Batch: không xóa được lịch sử {user_id}: {e}")
+        record["queued_ms"] = round((start - queued) * 1000, 1)
+        record["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        return record
+
+    async def run(self, items: List[Dict], out) -> Tuple[int, int]:
+        """
+        Xử lý các câu hỏi, ghi từng kết quả vào `out` theo thứ tự của items
+
+        Tối đa 4 × concurrency câu đang chạy hoặc chờ ghi: 1 câu chậm không
+        làm các câu sau dồn lại trong bộ nhớ.
+
+        Returns:
+            (số câu đã xử lý, số câu lỗi)
+        """
+        user_locks: Dict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+        limit = asyncio.Semaphore(self.concurrency)
+        window = asyncio.Semaphore(self.concurrency * 4)
+        # Task được tạo dần theo window → writer chờ task thứ i qua slots[i]
+        slots: List[asyncio.Future] = [asyncio.get_running_loop().create_future() for _ in items]
+        written = errors = 0
+        start = time.perf_counter()
+
+        async def write_in_order():
+            nonlocal written, errors
+            for slot in slots:
+                record = await (await slot)
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+                window.release()
+                written += 1
+                errors += bool(record.get("error"))
+                if written % 10 == 0 or written == len(items):
+                    elapsed = time.perf_counter() - start
+                    print(f"[Batch] {written}/{len(items)} ({errors} lỗi, {written / elapsed:.2f} câu/s)")
+
+        writer = asyncio.create_task(write_in_order())
+        try:
+            for item, slot in zip(items, slots):
+                await window.acquire()
+                lock = user_locks[item["user_id"] or f"batch_{item['id']}"]
+                slot.set_result(asyncio.create_task(self._answer(item, lock, limit)))
+            await writer
+        finally:
+            for slot in slots:
+                if slot.done():
+                    slot.result().cancel()
+            writer.cancel()
+        return written, errors
+
+
+def compact(items: List[Dict], output_path: str):
+    """
+    Sắp xếp lại file kết quả theo thứ tự file vào (sau khi chạy tiếp)
+
+    Mỗi id giữ kết quả mới nhất; ghi ra file tạm rồi thay thế.
+    """
+    latest = {}
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(record, dict) and "id" in record:
+                latest[json.dumps(record["id"])] = record
+    tmp_path = f"{output_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for item in items:
+            record = latest.get(json.dumps(item["id"]))
+            if record is not None:
+                record["index"] = item["index"]
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    os.replace(tmp_path, output_path)
+
+
+async def run_batch(
+    input_path: str,
+    output_path: Optional[str] = None,
+    concurrency: int = BATCH_CONCURRENCY,
+    timeout: float = BATCH_ITEM_TIMEOUT,
+    orchestrator=None,
+) -> Dict:
+    """
+    Trả lời file câu hỏi, chạy tiếp nếu file kết quả đã có
+
+    Args:
+        input_path: File JSONL câu hỏi
+        output_path: File JSONL kết quả (None = <input>.results.jsonl)
+        concurrency: Số câu hỏi xử lý song song
+        timeout: Thời gian tối đa mỗi câu hỏi (giây)
+        orchestrator: Dùng orchestrator có sẵn (None = tạo mới + warm-up)
+
+    Returns:
+        Thống kê {"total", "skipped", "processed", "errors", "elapsed_s", "output"}
+    """
+    output_path = output_path or default_output_path(input_path)
+    items = load_items(input_path)
+    finished = load_results(output_path)
+    pending = [
+        item for item in items
+        if finished.get(json.dumps(item["id"]), {}).get("query") != item["query"]
+    ]
+    skipped = len(items) - len(pending)
+    if len({json.dumps(item["id"]) for item in items}) < len(items):
+        print("[WARN] File câu hỏi có id trùng nhau: kết quả chạy tiếp có thể bị lẫn")
+    print(f"[Batch] {len(items)} câu hỏi, {skipped} đã có kết quả trong {output_path}, còn {len(pending)}")
+
+    stats = {"total": len(items), "skipped": skipped, "processed": 0, "errors": 0, "elapsed_s": 0.0, "output": output_path}
+    if not pending:
+        return stats
+
+    owned = orchestrator is None
+    if owned:
+        from core.warmup import start_orchestrator
+        orchestrator, _ = await start_orchestrator()
+
+    # Dòng cuối ghi dở (bị dừng giữa chừng) → xuống dòng trước khi ghi tiếp
+    resumed = os.path.exists(output_path) and os.path.getsize(output_path) > 0
+    needs_newline = False
+    if resumed:
+        with open(output_path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            needs_newline = f.read(1) != b"\n"
+
+    start = time.perf_counter()
+    try:
+        with open(output_path, "a", encoding="utf-8") as out:
+            if needs_newline:
+                out.write("\n")
+            runner = BatchRunner(orchestrator, concurrency=concurrency, timeout=timeout)
+            stats["processed"], stats["errors"] = await runner.run(pending, out)
+    finally:
+        if owned and hasattr(orchestrator, "stop"):
+            orchestrator.stop()
+    stats["elapsed_s"] = round(time.perf_counter() - start, 2)
+
+    if resumed:  # Kết quả cũ + mới (kể cả câu lỗi được thử lại) → ghép lại theo thứ tự
+        compact(items, output_path)
+    return stats
+
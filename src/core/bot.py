@@ -3,7 +3,7 @@ Telegram Bot Handler - Xử lý bot Telegram
 
 Nhiệm vụ:
 - Khởi tạo bot Telegram
-- Xử lý các lệnh (/start)
+- Xử lý các lệnh (/start, /profile cho admin)
 - Xử lý tin nhắn từ người dùng
 - Gửi câu trả lời về Telegram
 """
@@ -17,22 +17,47 @@ from telegram.ext import (
     filters,
     ContextTypes,
 )
-from core.orchestrator import OrchestratorAgent
-from config.settings import TELEGRAM_BOT_TOKEN, DEFAULT_MODEL, MAX_MESSAGE_LENGTH
+from core.sharding import create_orchestrator
+from core.warmup import start_orchestrator
+from core.update_processor import PerUserUpdateProcessor
+from core.telemetry import request_trace, span, start_metrics_server
+from core.runtime_profiler import get_profiler
+from config.settings import (
+    TELEGRAM_BOT_TOKEN,
+    DEFAULT_MODEL,
+    MAX_MESSAGE_LENGTH,
+    METRICS_HOST,
+    METRICS_PORT,
+    ADMIN_USER_IDS,
+)
 
 
-def get_orchestrator(context: ContextTypes.DEFAULT_TYPE) -> OrchestratorAgent:
+def get_orchestrator(context: ContextTypes.DEFAULT_TYPE):
     """
     Lấy OrchestratorAgent từ context (khởi tạo nếu chưa có)
     
     Lưu trong bot_data để dùng lại giữa các tin nhắn
+    (SHARD_WORKERS > 0: chuyển câu hỏi tới các worker process theo user)
     """
     if "orchestrator" not in context.bot_data:
-        context.bot_data["orchestrator"] = OrchestratorAgent(model_name=DEFAULT_MODEL)
+        context.bot_data["orchestrator"] = create_orchestrator()
         print("OrchestratorAgent initialized in bot_data")
     return context.bot_data["orchestrator"]
 
 
+async def post_init(application):
+    """
+    Warm-up trước khi bot nhận tin nhắn (gọi bởi Application sau initialize)
+    
+    Tạo orchestrator và load trước danh sách mã, model embedding, ...
+    để người dùng đầu tiên không phải chờ
+    """
+    get_profiler().install()  # Bật/tắt bằng /profile hoặc SIGUSR1
+    orchestrator, report = await start_orchestrator()
+    application.bot_data["orchestrator"] = orchestrator
+    application.bot_data["warmup"] = report
+
+
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     Xử lý lệnh /start - Khi người dùng bắt đầu chat với bot
@@ -43,6 +68,32 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
 
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Xử lý lệnh /profile on|off|status|snapshot - Runtime profiler (chỉ admin)
+    
+    Kết quả profile được ghi vào PROFILER_OUTPUT_DIR trên server
+    """
+    if str(update.effective_user.id) not in ADMIN_USER_IDS:
+        return  # Không trả lời user thường (lệnh không công khai)
+    
+    profiler = get_profiler()
+    action = context.args[0].lower() if context.args else "status"
+    if action == "on":
+        profiler.enable()
+    elif action == "off":
+        profiler.disable()
+    elif action == "snapshot":
+        await update.message.reply_text(profiler.snapshot())
+        return
+    elif action != "status":
+        await update.message.reply_text("Dùng: /profile on|off|status|snapshot")
+        return
+    
+    status = profiler.status()
+    await update.message.reply_text("\n".join(f"{key}: {value}" for key, value in status.items()))
+
+
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     Xử lý tin nhắn từ người dùng - Hàm chính
@@ -58,15 +109,18 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = str(update.effective_user.id)  # ID của user trên Telegram
     
     try:
-        # Xử lý câu hỏi và lấy câu trả lời
-        response = await orchestrator.handle_query(user_message, user_id=user_id)
-        
-        # Cắt ngắn nếu vượt quá giới hạn của Telegram (4096 ký tự)
-        if len(response) > MAX_MESSAGE_LENGTH:
-            response = response[:MAX_MESSAGE_LENGTH] + "\n\n[Tin nhắn bị cắt do giới hạn Telegram]"
-        
-        # Gửi câu trả lời về Telegram
-        await update.message.reply_text(response)
+        # Trace gồm cả bước gửi tin (orchestrator dùng lại trace này)
+        with request_trace("telegram"):
+            # Xử lý câu hỏi và lấy câu trả lời
+            response = await orchestrator.handle_query(user_message, user_id=user_id)
+            
+            # Cắt ngắn nếu vượt quá giới hạn của Telegram (4096 ký tự)
+            if len(response) > MAX_MESSAGE_LENGTH:
+                response = response[:MAX_MESSAGE_LENGTH] + "\n\n[Tin nhắn bị cắt do giới hạn Telegram]"
+            
+            # Gửi câu trả lời về Telegram
+            with span("telegram_send"):
+                await update.message.reply_text(response)
     
     except Exception as e:
         # Xử lý lỗi nếu có
@@ -74,10 +128,14 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         print(f"Error in handle_message: {e}")
 
 
-def create_bot():
+def create_bot(use_updater: bool = True):
     """
     Tạo và cấu hình Telegram bot application
     
+    Args:
+        use_updater: True = nhận update bằng long polling,
+            False = update được đưa vào từ webhook server (core/webhook.py)
+    
     Returns:
         Application instance đã được cấu hình
     """
@@ -92,10 +150,20 @@ def create_bot():
     print(f"Bot đang khởi động (Groq model: {DEFAULT_MODEL})...")
     
     # Tạo bot application
-    app = ApplicationBuilder().token(TELEGRAM_BOT_TOKEN).build()
+    # Xử lý nhiều user song song, tin nhắn của cùng 1 user vẫn theo thứ tự
+    builder = (
+        ApplicationBuilder()
+        .token(TELEGRAM_BOT_TOKEN)
+        .concurrent_updates(PerUserUpdateProcessor())
+        .post_init(post_init)  # Warm-up trước khi nhận tin nhắn
+    )
+    if not use_updater:
+        builder = builder.updater(None)
+    app = builder.build()
     
     # Thêm các handler
     app.add_handler(CommandHandler("start", start_command))  # Xử lý lệnh /start
+    app.add_handler(CommandHandler("profile", profile_command))  # Runtime profiler (admin)
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))  # Xử lý tin nhắn text
     
     return app
@@ -108,6 +176,8 @@ def main():
     Bot sẽ chạy và lắng nghe tin nhắn từ Telegram
     """
     app = create_bot()
+    if METRICS_PORT:
+        start_metrics_server(METRICS_HOST, METRICS_PORT)  # Polling không có HTTP server → mở riêng /metrics
     app.run_polling(stop_signals=None)  # Chạy bot và chờ tin nhắn
 
 
@@ -0,0 +1,159 @@
+"""
+Deadline - Ngân sách thời gian cho mỗi câu hỏi
+
+Mỗi câu hỏi có 1 deadline (REQUEST_BUDGET giây). Trước mỗi bước chậm (LLM,
+RAG, vnstock, crawl CafeF) orchestrator hỏi deadline còn bao nhiêu thời gian:
+- Đủ thời gian: bước chạy với timeout = min(giới hạn của bước, thời gian còn
+  lại - DEADLINE_RESERVE); timeout cũng được truyền xuống LLM client /
+  requests để request thật sự dừng
+- Không đủ (hoặc quá hạn giữa chừng): bỏ qua bước hoặc dùng dữ liệu cũ trong
+  cache; ghi vào deadline.degraded và metric bot_deadline_overruns_total
+
+Deadline nằm trong contextvar giống trace của telemetry: API / batch mở
+deadline trước khi gọi orchestrator để đọc lại các bước bị bỏ qua.
+
+Ví dụ:
+    with request_deadline(5.0) as deadline:
+        try:
+            text = await within_budget("routing_llm", lambda timeout: llm.complete(prompt, timeout=timeout))
+        except DeadlineExceeded:
+            text = ""
+"""
+import time
+import asyncio
+import contextvars
+from contextlib import contextmanager, nullcontext
+from typing import Awaitable, Callable, Dict, Iterator, List, Optional
+
+from core.telemetry import DEADLINE_OVERRUNS, STALE_RESPONSES, set_attribute
+from config.settings import (
+    REQUEST_BUDGET,
+    DEADLINE_RESERVE,
+    DEADLINE_STAGE_LIMITS,
+    DEADLINE_STAGE_MIN,
+)
+
+_current_deadline: contextvars.ContextVar = contextvars.ContextVar("request_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """Bước xử lý bị bỏ qua hoặc quá hạn theo ngân sách thời gian"""
+
+    def __init__(self, stage: str, action: str):
+        super().__init__(f"{stage}: {action}")
+        self.stage = stage
+        self.action = action
+
+
+class Deadline:
+    """Thời điểm hết hạn của 1 câu hỏi và các bước đã bị cắt bớt"""
+
+    def __init__(self, budget: float):
+        """
+        Args:
+            budget: Ngân sách thời gian (giây)
+        """
+        self.budget = budget
+        self.expires_at = time.monotonic() + budget
+        self.degraded: List[Dict] = []  # {"stage", "action"}: bước bị bỏ qua / quá hạn
+        self.stale: List[str] = []  # Dữ liệu được lấy từ cache cũ (vd: "quote", "news")
+
+    def remaining(self) -> float:
+        """Số giây còn lại (âm nếu đã quá hạn)"""
+        return self.expires_at - time.monotonic()
+
+    def timeout(self, stage: str) -> Optional[float]:
+        """
+        Timeout cho 1 bước
+
+        Returns:
+            Số giây bước được phép chạy, hoặc None nếu không đủ thời gian
+            tối thiểu (DEADLINE_STAGE_MIN) → nên bỏ qua bước
+        """
+        available = self.remaining() - DEADLINE_RESERVE
+        limit = DEADLINE_STAGE_LIMITS.get(stage)
+        timeout = min(available, limit) if limit is not None else available
+        return timeout if timeout >= DEADLINE_STAGE_MIN.get(stage, 0.0) else None
+
+    def overrun(self, stage: str, action: str):
+        """Ghi nhận bước bị bỏ qua ("skipped") hoặc quá hạn ("timeout")"""
+        self.degraded.append({"stage": stage, "action": action})
+        DEADLINE_OVERRUNS.inc(stage=stage, action=action)
+        set_attribute("degraded", self.degraded)
+
+    def served_stale(self, data: str):
+        """Ghi nhận câu trả lời dùng dữ liệu cũ trong cache (vd: "quote")"""
+        self.stale.append(data)
+        STALE_RESPONSES.inc(data=data)
+        set_attribute("stale", self.stale)
+
+    def merge(self, degraded: List[Dict], stale: List[str]):
+        """Gộp các bước bị cắt bớt ở process khác (worker shard đã ghi metrics của nó)"""
+        self.degraded.extend(degraded)
+        self.stale.extend(stale)
+        if degraded:
+            set_attribute("degraded", self.degraded)
+        if stale:
+            set_attribute("stale", self.stale)
+
+
+@contextmanager
+def _request_deadline(budget: float) -> Iterator[Deadline]:
+    deadline = Deadline(budget)
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
+
+
+def request_deadline(budget: Optional[float] = None):
+    """
+    Bắt đầu deadline cho 1 câu hỏi (context manager, trả về Deadline)
+
+    Nếu đã có deadline đang chạy (vd: API đã mở trước khi gọi orchestrator)
+    thì dùng lại deadline đó.
+
+    Args:
+        budget: Ngân sách (giây), None = REQUEST_BUDGET; <= 0 → không giới
+            hạn (trả về None)
+    """
+    current = _current_deadline.get()
+    budget = REQUEST_BUDGET if budget is None else budget
+    if current is not None or budget <= 0:
+        return nullcontext(current)
+    return _request_deadline(budget)
+
+
+def current_deadline() -> Optional[Deadline]:
+    """Deadline của câu hỏi hiện tại (None nếu không giới hạn)"""
+    return _current_deadline.get()
+
+
+async def within_budget(stage: str, call: Callable[[Optional[float]], Awaitable]):
+    """
+    Chạy 1 bước trong thời gian còn lại của deadline hiện tại
+
+    Args:
+        stage: Tên bước (khóa trong DEADLINE_STAGE_LIMITS)
+        call: Hàm nhận timeout (giây, None = không giới hạn) và trả về awaitable
+
+    Returns:
+        Kết quả của bước
+
+    Raises:
+        DeadlineExceeded: Không đủ thời gian để bắt đầu, hoặc quá hạn giữa chừng
+            (bước bị hủy; đã ghi nhận vào deadline và metrics)
+    """
+    deadline = _current_deadline.get()
+    if deadline is None:
+        return await call(None)
+    timeout = deadline.timeout(stage)
+    if timeout is None:
+        deadline.overrun(stage, "skipped")
+        raise DeadlineExceeded(stage, "skipped")
+    try:
+        return await asyncio.wait_for(call(timeout), timeout)
+    except asyncio.TimeoutError:
+        deadline.overrun(stage, "timeout")
+        raise DeadlineExceeded(stage, "timeout") from None
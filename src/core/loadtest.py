@@ -0,0 +1,569 @@
+"""
+Load Test - Đo tải OrchestratorAgent.handle_query với dịch vụ ngoài giả lập
+
+Không gọi dịch vụ thật:
+- Groq: HTTP server tại chỗ tương thích OpenAI (/v1/chat/completions, cả
+  streaming), latency log-normal và tỉ lệ lỗi cấu hình được
+- vnstock: module giả (Vnstock, Listing) trả giá / lịch sử giá tổng hợp
+- CafeF: trang tìm kiếm / bài viết HTML lưu sẵn (LOADTEST_FIXTURES_DIR)
+- Lịch sử hội thoại, shared cache: file tạm (không đụng dữ liệu thật);
+  RAG tắt
+
+Traffic: câu hỏi trong questions.txt và câu hỏi của các user trong
+conversation_history.json (phát lại theo thứ tự), chia cho LOADTEST_USERS
+user ảo; tin nhắn của cùng 1 user được xử lý tuần tự như bot Telegram.
+- rate > 0: câu hỏi đến theo phân phối Poisson (open loop), tối đa
+  `concurrency` câu đang xử lý, latency tính từ lúc câu hỏi đến
+- rate = 0: `concurrency` client gửi liên tục (closed loop)
+
+Báo cáo throughput, tỉ lệ lỗi, p50/p95/p99 theo intent và thời gian trung
+bình từng bước (từ telemetry).
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import shutil
+import asyncio
+import tempfile
+import threading
+import contextlib
+import types
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from config.settings import (
+    DEFAULT_MODEL,
+    LOADTEST_QUESTIONS_PATH,
+    LOADTEST_HISTORY_PATH,
+    LOADTEST_FIXTURES_DIR,
+    LOADTEST_USERS,
+    LOADTEST_TIMEOUT,
+    LOADTEST_LLM_LATENCY_MS,
+    LOADTEST_LLM_JITTER,
+    LOADTEST_LLM_ERROR_RATE,
+    LOADTEST_MARKET_LATENCY_MS,
+    LOADTEST_MARKET_ERROR_RATE,
+    LOADTEST_NEWS_LATENCY_MS,
+    MARKET_DATA_SOURCES,
+)
+
+# Mã giả lập: đủ cho câu hỏi mẫu + 1 danh sách cỡ thật
+FAKE_SYMBOLS = ["FPT", "VCB", "MWG", "HPG", "VNM", "VIN", "VIC", "TCB", "MBB", "SSI", "GAS", "ACB", "VHM", "MSN"]
+
+
+def _lognormal_delay(median_ms: float, sigma: float, rng: random.Random) -> float:
+    return median_ms / 1000 * rng.lognormvariate(0, sigma) if median_ms > 0 else 0.0
+
+
+# --- Groq giả lập ---
+
+def _classify(question: str) -> str:
+    """Trả lời câu phân loại giống LLM thật (theo từ khóa)"""
+    from agents.advice_agent import normalize_text
+    text = normalize_text(question)
+    if any(k in text for k in ("NEN MUA", "PHAN TICH", "KHUYEN NGHI", "DAU TU", "DANH GIA", "SHOULD", "ANALYZE")):
+        return "advice"
+    if any(k in text for k in ("TIN TUC", "THI TRUONG", "XU HUONG", "BAO CAO", "NEWS")):
+        return "news"
+    if any(k in text for k in ("GIA", "PRICE", "HOM NAY", "HIEN TAI")):
+        return "price"
+    return "chat"
+
+
+def _fake_completion(prompt: str) -> str:
+    if "Xác định loại câu hỏi" in prompt:
+        match = re.search(r"Câu hỏi mới:\s*(.*?)\s*Xác định loại câu hỏi", prompt, re.S)
+        return _classify(match.group(1) if match else prompt)
+    if "Viết lại bản tóm tắt" in prompt:
+        return "Người dùng hỏi về giá và tin tức một số mã cổ phiếu (FPT, VCB)."
+    return (
+        "Dựa trên thông tin hiện có, đây là câu trả lời ngắn gọn cho câu hỏi của bạn. "
+        "Giá và tin tức được cập nhật theo phiên giao dịch gần nhất; bạn nên theo dõi thêm "
+        "báo cáo tài chính và diễn biến thị trường trước khi ra quyết định đầu tư."
+    )
+
+
+class StubLLMServer:
+    """
+    Server tương thích OpenAI Chat Completions chạy trong thread riêng
+
+    Chạy event loop riêng để thời gian xử lý của server giả không lẫn vào
+    event loop đang được đo.
+    """
+
+    def __init__(
+        self,
+        latency_ms: float = LOADTEST_LLM_LATENCY_MS,
+        jitter: float = LOADTEST_LLM_JITTER,
+        error_rate: float = LOADTEST_LLM_ERROR_RATE,
+        seed: int = 1,
+    ):
+        self.latency_ms = latency_ms
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.requests = 0
+        self.errors = 0
+        self.base_url: Optional[str] = None
+        self._rng = random.Random(seed)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._runner = None
+        self._ready = threading.Event()
+
+    async def _handle(self, request):
+        from aiohttp import web
+        body = await request.json()
+        self.requests += 1
+        prompt = "\n".join(str(m.get("content", "")) for m in body.get("messages", []))
+        await asyncio.sleep(_lognormal_delay(self.latency_ms, self.jitter, self._rng))
+        if self._rng.random() < self.error_rate:
+            self.errors += 1
+            return web.json_response({"error": {"message": "injected error", "type": "server_error"}}, status=500)
+
+        content = _fake_completion(prompt)
+        prompt_tokens, completion_tokens = len(prompt) // 4 + 1, len(content) // 4 + 1
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                 "total_tokens": prompt_tokens + completion_tokens}
+        base = {"id": f"stub-{self.requests}", "created": int(time.time()), "model": body.get("model", DEFAULT_MODEL)}
+
+        if not body.get("stream"):
+            return web.json_response({
+                **base,
+                "object": "chat.completion",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        words = content.split(" ")
+        for i, word in enumerate(words):
+            chunk = {**base, "object": "chat.completion.chunk", "choices": [
+                {"index": 0, "delta": {"content": word + (" " if i < len(words) - 1 else "")}, "finish_reason": None}
+            ]}
+            await response.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode())
+        last = {**base, "object": "chat.completion.chunk",
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}], "x_groq": {"usage": usage}}
+        await response.write(f"data: {json.dumps(last)}\n\ndata: [DONE]\n\n".encode())
+        await response.write_eof()
+        return response
+
+    def _run(self):
+        from aiohttp import web
+
+        async def start():
+            app = web.Application()
+            app.router.add_post("/v1/chat/completions", self._handle)
+            self._runner = web.AppRunner(app, access_log=None)
+            await self._runner.setup()
+            site = web.TCPSite(self._runner, "127.0.0.1", 0)
+            await site.start()
+            port = site._server.sockets[0].getsockname()[1]
+            self.base_url = f"http://127.0.0.1:{port}/v1"
+
+        self._loop = asyncio.new_event_loop()
+        self._loop.run_until_complete(start())
+        self._ready.set()
+        self._loop.run_forever()
+        self._loop.run_until_complete(self._runner.cleanup())
+        self._loop.close()
+
+    def start(self) -> str:
+        """Chạy server, trả về base_url cho OpenAI client"""
+        threading.Thread(target=self._run, name="stub-llm", daemon=True).start()
+        self._ready.wait(10)
+        return self.base_url
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+# --- vnstock giả lập ---
+
+def make_fake_vnstock(
+    latency_ms: float = LOADTEST_MARKET_LATENCY_MS,
+    error_rate: float = LOADTEST_MARKET_ERROR_RATE,
+    failing_source: Optional[str] = MARKET_DATA_SOURCES[0],
+    seed: int = 2,
+) -> types.ModuleType:
+    """
+    Module thay cho vnstock: Vnstock().stock(...).quote() / .quote.history(...)
+    và Listing().all_symbols(), dữ liệu tổng hợp, có độ trễ
+
+    Nguồn `failing_source` lỗi với xác suất `error_rate` (kiểm tra failover /
+    circuit breaker của MarketDataClient).
+    """
+    import pandas as pd
+    rng = random.Random(seed)
+    lock = threading.Lock()
+
+    def delay(source: Optional[str] = None):
+        with lock:
+            seconds = _lognormal_delay(latency_ms, 0.3, rng)
+            failed = source == failing_source and rng.random() < error_rate
+        time.sleep(seconds)
+        if failed:
+            raise ConnectionError(f"{source}: injected error")
+
+    def closes(symbol: str, days: int) -> List[float]:
+        walk = random.Random(symbol)
+        price = walk.uniform(15_000, 150_000)
+        values = []
+        for _ in range(days):
+            price = max(1000.0, round(price * (1 + walk.gauss(0, 0.02)), -2))
+            values.append(price)
+        return values
+
+    class _Quote:
+        def __init__(self, symbol: str, source: str):
+            self.symbol = symbol
+            self.source = source
+
+        def __call__(self):
+            delay(self.source)
+            history = closes(self.symbol, 2)
+            change = history[-1] - history[-2]
+            return pd.DataFrame([{
+                "close": history[-1], "change": change,
+                "pctChange": change / history[-2] * 100, "volume": float(random.Random(self.symbol).randint(10**5, 10**7)),
+            }])
+
+        def history(self, start: str, end: str, interval: str = "1D"):
+            delay(self.source)
+            return pd.DataFrame({"close": closes(self.symbol, 42)})
+
+    class _Stock:
+        def __init__(self, symbol: str, source: str):
+            self.quote = _Quote(symbol, source)
+
+    class Vnstock:
+        def stock(self, symbol: str, source: str = "VCI"):
+            return _Stock(symbol, source)
+
+    class Listing:
+        def all_symbols(self):
+            delay()
+            return pd.DataFrame({"symbol": FAKE_SYMBOLS})
+
+    module = types.ModuleType("vnstock")
+    module.Vnstock = Vnstock
+    module.Listing = Listing
+    module.__loadtest_fake__ = True
+    return module
+
+
+# --- CafeF giả lập ---
+
+def install_fake_cafef(news_agent, fixtures_dir: str = LOADTEST_FIXTURES_DIR,
+                       latency_ms: float = LOADTEST_NEWS_LATENCY_MS, seed: int = 3):
+    """Thay request tới CafeF của news_agent bằng HTML lưu sẵn (vẫn parse bằng BeautifulSoup)"""
+    with open(os.path.join(fixtures_dir, "cafef_search.html"), "rb") as f:
+        search_html = f.read()
+    with open(os.path.join(fixtures_dir, "cafef_article.html"), "rb") as f:
+        article_html = f.read()
+    rng = random.Random(seed)
+    lock = threading.Lock()
+
+    def delay():
+        with lock:
+            seconds = _lognormal_delay(latency_ms, 0.3, rng)
+        time.sleep(seconds)
+
+    def search_cafef(symbol: str, timeout: float = None):
+        delay()
+        return news_agent.parse_cafef_search(search_html)
+
+    def fetch_article_body(url: str) -> str:
+        delay()
+        return news_agent.extract_article_body(article_html)
+
+    news_agent.search_cafef = search_cafef
+    news_agent.fetch_article_body = fetch_article_body
+
+
+# --- Traffic ---
+
+def load_questions(questions_path: str = LOADTEST_QUESTIONS_PATH,
+                   history_path: str = LOADTEST_HISTORY_PATH) -> Tuple[List[str], List[List[str]]]:
+    """
+    Đọc câu hỏi mẫu
+
+    Returns:
+        (câu hỏi trong questions.txt, chuỗi câu hỏi của từng user trong lịch sử)
+    """
+    questions = []
+    if os.path.exists(questions_path):
+        with open(questions_path, "r", encoding="utf-8") as f:
+            questions = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    sessions = []
+    if os.path.exists(history_path):
+        from data.memory import load_memory_file
+        history, _ = load_memory_file(history_path)
+        for messages in history.values():
+            texts = [m["text"] for m in messages if m.get("role") == "user" and m.get("text")]
+            if texts:
+                sessions.append(texts)
+    if not questions and not sessions:
+        raise ValueError(f"Không có câu hỏi trong {questions_path} hoặc {history_path}")
+    return questions, sessions
+
+
+def build_workload(requests: int, users: int, questions: List[str], sessions: List[List[str]],
+                   seed: int = 4) -> List[Tuple[str, str]]:
+    """
+    Tạo danh sách (user_id, câu hỏi)
+
+    User ảo thứ k phát lại lịch sử thứ k % len(sessions) (nếu có) xen với
+    câu hỏi ngẫu nhiên trong questions.txt.
+    """
+    rng = random.Random(seed)
+    cursors = [0] * users
+    workload = []
+    for _ in range(requests):
+        user = rng.randrange(users)
+        if sessions and (not questions or rng.random() < 0.5):
+            session = sessions[user % len(sessions)]
+            question = session[cursors[user] % len(session)]
+            cursors[user] += 1
+        else:
+            question = rng.choice(questions)
+        workload.append((f"loadtest_{user}", question))
+    return workload
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))] if ordered else 0.0
+
+
+def summarize(records: List[Dict], elapsed: float) -> Dict:
+    """Tổng hợp kết quả theo intent"""
+    by_intent = defaultdict(list)
+    stage_totals = defaultdict(float)
+    for record in records:
+        by_intent[record["intent"]].append(record)
+        by_intent["all"].append(record)
+        for stage, ms in record.get("stages", {}).items():
+            stage_totals[stage] += ms
+
+    intents = {}
+    for intent, items in sorted(by_intent.items()):
+        latencies = [r["latency_ms"] for r in items if not r["error"]]
+        intents[intent] = {
+            "requests": len(items),
+            "errors": sum(1 for r in items if r["error"]),
+            "error_rate": round(sum(1 for r in items if r["error"]) / len(items), 4),
+            "p50_ms": round(_percentile(latencies, 0.50), 1),
+            "p95_ms": round(_percentile(latencies, 0.95), 1),
+            "p99_ms": round(_percentile(latencies, 0.99), 1),
+            "max_ms": round(max(latencies), 1) if latencies else 0.0,
+        }
+    total = len(records)
+    return {
+        "requests": total,
+        "elapsed_s": round(elapsed, 2),
+        "throughput_rps": round(total / elapsed, 2) if elapsed else 0.0,
+        "error_rate": intents.get("all", {}).get("error_rate", 0.0),
+        "intents": intents,
+        "stage_mean_ms": {stage: round(ms / total, 1) for stage, ms in sorted(stage_totals.items())} if total else {},
+    }
+
+
+def print_report(report: Dict):
+    config = report["config"]
+    rate = f"{config['rate']}/s" if config["rate"] else "closed loop"
+    print("=" * 72)
+    print(f"Load test: {report['requests']} câu hỏi, concurrency {config['concurrency']}, {rate}, "
+          f"{config['users']} user")
+    print(f"LLM giả: {config['llm_latency_ms']:.0f} ms (lỗi {config['llm_error_rate']:.0%}), "
+          f"vnstock giả: {config['market_latency_ms']:.0f} ms (lỗi {config['market_error_rate']:.0%} ở {MARKET_DATA_SOURCES[0]}), CafeF giả: {config['news_latency_ms']:.0f} ms")
+    print("=" * 72)
+    print(f"Thời gian: {report['elapsed_s']} s - throughput {report['throughput_rps']} câu/s - "
+          f"lỗi {report['error_rate']:.2%}")
+    print(f"\n{'intent':<14}{'n':>6}{'lỗi':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    # Dòng "all" in cuối
+    for intent, stats in sorted(report["intents"].items(), key=lambda item: item[0] == "all"):
+        print(f"{intent:<14}{stats['requests']:>6}{stats['errors']:>6}{stats['p50_ms']:>10.0f}"
+              f"{stats['p95_ms']:>10.0f}{stats['p99_ms']:>10.0f}{stats['max_ms']:>10.0f}")
+    print(f"\nLLM giả: {report['llm_requests']} request, {report['llm_injected_errors']} lỗi giả lập "
+          f"(orchestrator có fallback nên không nhất thiết thành lỗi của câu hỏi)")
+    if report.get("market_sources"):
+        print(f"\n{'nguồn giá':<14}{'request':>8}{'lỗi':>6}{'thắng':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}  breaker")
+        for name, stats in report["market_sources"].items():
+            print(f"{name:<14}{stats['requests']:>8}{stats['errors']:>6}{stats['wins']:>7}"
+                  f"{stats['p50_ms'] or 0:>10.0f}{stats['p95_ms'] or 0:>10.0f}{stats['p99_ms'] or 0:>10.0f}  {stats['breaker']}")
+    if report["stage_mean_ms"]:
+        stages = ", ".join(f"{stage} {ms:.0f}" for stage, ms in report["stage_mean_ms"].items())
+        print(f"\nTrung bình mỗi câu hỏi (ms): {stages}")
+
+
+# --- Chạy ---
+
+class LoadTest:
+    """Dựng orchestrator với dịch vụ giả lập và phát traffic"""
+
+    def __init__(
+        self,
+        concurrency: int = 16,
+        rate: float = 0.0,
+        requests: int = 200,
+        users: int = LOADTEST_USERS,
+        timeout: float = LOADTEST_TIMEOUT,
+    ):
+        """
+        Args:
+            concurrency: Số câu hỏi xử lý cùng lúc tối đa
+            rate: Số câu hỏi đến mỗi giây (0 = closed loop)
+            requests: Tổng số câu hỏi
+            users: Số user ảo
+            timeout: Thời gian tối đa mỗi câu hỏi (giây)
+        """
+        self.concurrency = max(1, concurrency)
+        self.rate = rate
+        self.requests = requests
+        self.users = max(1, users)
+        self.timeout = timeout
+
+    def _create_orchestrator(self, workdir: str, base_url: str):
+        from openai import AsyncOpenAI
+        import data.shared_cache as shared_cache
+        import services.market_data as market_data
+        from data.memory import ConversationMemory
+        from core.orchestrator import OrchestratorAgent
+
+        sys.modules["vnstock"] = make_fake_vnstock()
+        shared_cache._shared_cache = shared_cache.SharedCache(os.path.join(workdir, "shared_cache.sqlite"))
+        # Client mới → thống kê nguồn chỉ gồm request của load test
+        market_data._market_data = market_data.MarketDataClient(
+            [market_data.VnstockSource(name) for name in MARKET_DATA_SOURCES]
+        )
+        memory = ConversationMemory(storage_path=os.path.join(workdir, "conversation_history.json"))
+
+        orchestrator = OrchestratorAgent(model_name=DEFAULT_MODEL, rag_tool=False, memory=memory)
+        orchestrator.llm_service._client = AsyncOpenAI(api_key="loadtest", base_url=base_url, timeout=self.timeout)
+        install_fake_cafef(orchestrator.news_agent)
+        return orchestrator
+
+    async def _one(self, orchestrator, user_id: str, question: str, arrived: float, lock: asyncio.Lock) -> Dict:
+        from core.telemetry import request_trace
+        record = {"user_id": user_id, "intent": "unknown", "error": None}
+        async with lock:  # Tuần tự trong từng user (giống bot)
+            try:
+                with request_trace("loadtest") as trace:
+                    await asyncio.wait_for(orchestrator.handle_query(question, user_id=user_id), self.timeout)
+                if trace is not None:
+                    record["intent"] = trace.attributes.get("intent", "unknown")
+                    stages = defaultdict(float)
+                    for span in trace.spans:
+                        stages[span["stage"]] += span["ms"]
+                    record["stages"] = dict(stages)
+            except asyncio.TimeoutError:
+                record["error"] = "timeout"
+            except Exception as e:
+                record["error"] = f"{type(e).__name__}: {e}"
+        record["latency_ms"] = (time.perf_counter() - arrived) * 1000
+        return record
+
+    async def _drive(self, orchestrator, workload: List[Tuple[str, str]]) -> List[Dict]:
+        user_locks: Dict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+        limit = asyncio.Semaphore(self.concurrency)
+
+        async def limited(user_id: str, question: str, arrived: float) -> Dict:
+            async with limit:
+                return await self._one(orchestrator, user_id, question, arrived, user_locks[user_id])
+
+        if self.rate > 0:
+            # Open loop: câu hỏi đến theo Poisson, không chờ câu trước xong
+            rng = random.Random(5)
+            tasks = []
+            for user_id, question in workload:
+                tasks.append(asyncio.create_task(limited(user_id, question, time.perf_counter())))
+                await asyncio.sleep(rng.expovariate(self.rate))
+            return list(await asyncio.gather(*tasks))
+
+        # Closed loop: mỗi client gửi câu tiếp theo ngay khi câu trước xong
+        queue = list(reversed(workload))
+        records = []
+
+        async def client():
+            while queue:
+                user_id, question = queue.pop()
+                records.append(await self._one(orchestrator, user_id, question, time.perf_counter(), user_locks[user_id]))
+
+        await asyncio.gather(*(client() for _ in range(self.concurrency)))
+        return records
+
+    async def run(self) -> Dict:
+        """
+        Chạy load test
+
+        Returns:
+            Báo cáo (xem summarize) kèm cấu hình và số request tới LLM giả
+        """
+        questions, sessions = load_questions()
+        workload = build_workload(self.requests, self.users, questions, sessions)
+        stub = StubLLMServer()
+        workdir = tempfile.mkdtemp(prefix="loadtest_")
+        previous_vnstock = sys.modules.get("vnstock")
+        try:
+            base_url = stub.start()
+            orchestrator = self._create_orchestrator(workdir, base_url)
+            # Log của từng câu hỏi không in ra (làm chậm và che báo cáo)
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                start = time.perf_counter()
+                records = await self._drive(orchestrator, workload)
+                elapsed = time.perf_counter() - start
+        finally:
+            stub.stop()
+            if previous_vnstock is not None:
+                sys.modules["vnstock"] = previous_vnstock
+            else:
+                sys.modules.pop("vnstock", None)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        report = summarize(records, elapsed)
+        report["config"] = {
+            "concurrency": self.concurrency,
+            "rate": self.rate,
+            "users": self.users,
+            "llm_latency_ms": stub.latency_ms,
+            "llm_error_rate": stub.error_rate,
+            "market_latency_ms": LOADTEST_MARKET_LATENCY_MS,
+            "market_error_rate": LOADTEST_MARKET_ERROR_RATE,
+            "news_latency_ms": LOADTEST_NEWS_LATENCY_MS,
+        }
+        report["llm_requests"] = stub.requests
+        report["llm_injected_errors"] = stub.errors
+        from services.market_data import get_market_data
+        report["market_sources"] = get_market_data().stats()
+        errors = defaultdict(int)
+        for record in records:
+            if record["error"]:
+                errors[record["error"][:120]] += 1
+        report["errors"] = dict(errors)
+        return report
+
+
+def main(concurrency: int = 16, rate: float = 0.0, requests: int = 200, output: Optional[str] = None):
+    """
+    Chạy load test và in báo cáo
+
+    Args:
+        concurrency: Số câu hỏi xử lý cùng lúc tối đa
+        rate: Câu hỏi / giây (0 = closed loop)
+        requests: Tổng số câu hỏi
+        output: Ghi báo cáo JSON ra file (None = không ghi)
+    """
+    report = asyncio.run(LoadTest(concurrency=concurrency, rate=rate, requests=requests).run())
+    print_report(report)
+    if report["errors"]:
+        print("\nLỗi:")
+        for error, count in sorted(report["errors"].items(), key=lambda item: -item[1]):
+            print(f"  {count:>5} × {error}")
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\nĐã ghi {output}")
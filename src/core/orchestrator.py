@@ -7,13 +7,105 @@ Nhiệm vụ:
 - Gửi đến agent phù hợp để xử lý
 - Trả về câu trả lời đã được format
 """
-from typing import Optional
+import re
+import asyncio
+from typing import Awaitable, Callable, Dict, Optional
+from datetime import datetime, timedelta
 from services.llm_service import LLMService
 from agents.stock_agent import StockAgent
 from agents.news_agent import NewsAgent
-from agents.advice_agent import analyze_stock
+from agents.advice_agent import compute_stock_analysis, format_analysis, normalize_text
 from data.memory import ConversationMemory
-from config.settings import DEFAULT_MODEL, RAG_PERSIST_DIRECTORY, RAG_COLLECTION_NAME
+from core.prompt_builder import PromptBuilder, truncate_to_tokens
+from core.renderer import ResponseRenderer
+from core.telemetry import request_trace, span, set_attribute
+from core.deadline import request_deadline, current_deadline, within_budget, DeadlineExceeded
+from core.runtime_profiler import profile_query
+from services.upstream_scheduler import upstream_caller
+from data.shared_cache import get_shared_cache
+from config.settings import (
+    DEFAULT_MODEL,
+    RAG_PERSIST_DIRECTORY,
+    RAG_COLLECTION_NAME,
+    RAG_TOP_K,
+    RAG_NEWS_MAX_AGE_DAYS,
+    NEWS_FETCH_BODY,
+    NEWS_CACHE_TTL,
+    TEMPLATED_INTENTS,
+    MEMORY_SUMMARY_TRIGGER,
+    PROMPT_HISTORY_TURNS,
+    PROMPT_MAX_TURN_TOKENS,
+    PROMPT_TOKEN_BUDGET_ROUTING,
+    PROMPT_TOKEN_BUDGET_FINAL,
+    PROMPT_SUMMARY_MAX_TOKENS
+)
+
+# Phân loại bằng từ khóa khi LLM không trả lời: so nguyên từ trên câu hỏi đã bỏ dấu.
+# Từ ngắn dễ trùng sau khi bỏ dấu ("bán"/"bạn" → "ban", "giá"/"gia đình" → "gia",
+# "tăng"/"giảm") chỉ được tính trong cụm từ rõ nghĩa; "hôm nay" / "today" một mình
+# không đủ để coi là hỏi giá.
+FALLBACK_INTENT_PATTERNS = [
+    ("advice_query", re.compile(
+        r"\b(?:nen mua|nen ban|co nen|mua vao|ban ra|mua hay ban|phan tich|khuyen nghi|dau tu"
+        r"|buy|sell|analy[sz]e|advice)\b"
+    )),
+    ("price_query", re.compile(
+        r"\b(?:gia (?:co phieu|ma|hien tai|dong cua|hom nay|bao nhieu)|bao nhieu|tang hay giam"
+        r"|tang bao nhieu|giam bao nhieu|price|how much)\b"
+    )),
+    ("news_query", re.compile(r"\b(?:tin tuc|thi truong|vi mo|xu huong|bao cao|news|market|trend)\b")),
+]
+PRICE_TICKER_PATTERN = re.compile(r"\b(?i:gi[aá])\s+[A-Z]{3}\b")  # "Giá FPT": mã viết hoa ngay sau "giá"
+
+# Khung prompt - mỗi {phần} được PromptBuilder điền trong ngân sách token
+ROUTING_PROMPT_TEMPLATE = """
+Tóm tắt hội thoại trước đó:
+{summary}
+
+Lịch sử hội thoại gần đây:
+{history}
+
+Câu hỏi mới:
+{query}
+
+Xác định loại câu hỏi:
+- Hỏi về giá cổ phiếu → "price"
+- Hỏi tư vấn đầu tư hoặc phân tích cổ phiếu → "advice"
+- Hỏi về tin tức hoặc xu hướng thị trường → "news"
+- Chào hỏi hoặc chat chung → "chat"
+Trả về đúng 1 từ trong các loại trên.
+"""
+
+FINAL_PROMPT_TEMPLATE = """
+RAG context (nếu có):
+{context}
+
+Tóm tắt hội thoại trước đó:
+{summary}
+
+Lịch sử hội thoại gần đây:
+{history}
+
+Câu hỏi của người dùng:
+{query}
+
+Câu trả lời từ system:
+{response}
+
+Vui lòng trả lời bằng tiếng Việt, ngắn gọn, tự nhiên và thân thiện.
+"""
+
+SUMMARY_PROMPT_TEMPLATE = """
+Tóm tắt hiện tại của cuộc hội thoại:
+{summary}
+
+Các tin nhắn tiếp theo:
+{messages}
+
+Viết lại bản tóm tắt ngắn gọn (tối đa 5 câu, tiếng Việt) gộp cả tóm tắt hiện tại
+và các tin nhắn trên. Giữ lại mã cổ phiếu, con số và ý định của người dùng.
+Chỉ trả về bản tóm tắt.
+"""
 
 
 class OrchestratorAgent:
@@ -47,12 +139,21 @@ class OrchestratorAgent:
         self.stock_agent = StockAgent()  # Tra cứu giá cổ phiếu
         self.news_agent = NewsAgent()   # Tìm tin tức
         
+        # Câu hỏi giá / tư vấn: viết câu trả lời bằng mẫu câu, không gọi LLM lần 2
+        self.renderer = ResponseRenderer()
+        
         # Lazy load RAG tool - chỉ load khi cần (vì load chậm)
         self._rag_tool = rag_tool
         self._rag_tool_init_error = None
+        self.rag_ready = True  # False trong lúc warm-up đang load model embedding
+        self.warmup_report = None  # Báo cáo warm-up (xem core/warmup.py)
         
         # Bộ nhớ lưu lịch sử hội thoại của từng user
         self.memory = memory or ConversationMemory()
+        
+        # Task chạy nền: nạp tin tức, tóm tắt hội thoại (giữ reference để không bị garbage collect)
+        self._background_tasks = set()
+        self._summarizing = set()  # user_id đang được tóm tắt
     
     def _get_rag_tool(self):
         """
@@ -79,19 +180,148 @@ class OrchestratorAgent:
         
         return self._rag_tool
     
-    async def _call_llm(self, prompt: str) -> str:
+    def _ingest_articles(self, rag_tool, symbol: str, articles: list):
+        """
+        Tải nội dung đầy đủ, chia chunk và lưu tin tức vào RAG (chạy trong thread)
+        
+        Args:
+            rag_tool: RAG tool để lưu
+            symbol: Mã cổ phiếu
+            articles: Danh sách bài báo từ NewsAgent
+        """
+        try:
+            if NEWS_FETCH_BODY:
+                self.news_agent.fetch_article_bodies(articles)
+            rag_tool.add_articles(articles, symbol)
+            print(f"Saved {len(articles)} new articles for {symbol} to RAG")
+        except Exception as e:
+            print(f"[WARN] Failed to save to RAG: {e}")
+    
+    def _run_in_background(self, coro):
+        """Chạy coroutine nền, không chờ kết quả"""
+        task = asyncio.create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+    
+    def _history_items(self, user_id: str) -> list:
+        """Các tin nhắn gần đây (trừ câu hỏi hiện tại), mới nhất trước, cho PromptBuilder"""
+        recent = self.memory.get_recent(user_id, n=PROMPT_HISTORY_TURNS + 1)[:-1]
+        return [f"{m['role']}: {m['text']}" for m in reversed(recent)]
+    
+    def _build_routing_prompt(self, query: str, user_id: str) -> str:
+        """Prompt phân loại câu hỏi (trong ngân sách PROMPT_TOKEN_BUDGET_ROUTING)"""
+        builder = PromptBuilder(PROMPT_TOKEN_BUDGET_ROUTING, ROUTING_PROMPT_TEMPLATE)
+        builder.add("query", query, required=True)
+        builder.add_items("history", self._history_items(user_id), priority=2,
+                          max_item_tokens=PROMPT_MAX_TURN_TOKENS, newest_first=True)
+        builder.add("summary", self.memory.get_summary(user_id), priority=1)
+        return builder.build()
+    
+    def _build_final_prompt(self, query: str, user_id: str, response: str, context_items: list) -> str:
+        """
+        Prompt format câu trả lời (trong ngân sách PROMPT_TOKEN_BUDGET_FINAL)
+        
+        Thứ tự ưu tiên: câu hỏi + câu trả lời của agent (bắt buộc) → RAG context
+        liên quan nhất → lịch sử gần nhất → tóm tắt hội thoại cũ
+        """
+        builder = PromptBuilder(PROMPT_TOKEN_BUDGET_FINAL, FINAL_PROMPT_TEMPLATE)
+        builder.add("query", query, required=True)
+        builder.add("response", response, required=True)
+        builder.add_items("context", context_items, priority=3)
+        builder.add_items("history", self._history_items(user_id), priority=2,
+                          max_item_tokens=PROMPT_MAX_TURN_TOKENS, newest_first=True)
+        builder.add("summary", self.memory.get_summary(user_id), priority=1)
+        return builder.build()
+    
+    def _schedule_summary(self, user_id: str):
+        """Gộp các tin nhắn cũ vào tóm tắt hội thoại (chạy nền) khi đủ MEMORY_SUMMARY_TRIGGER tin"""
+        if user_id in self._summarizing:
+            return
+        messages, upto = self.memory.get_unsummarized(user_id, keep_recent=PROMPT_HISTORY_TURNS)
+        if len(messages) < MEMORY_SUMMARY_TRIGGER:
+            return
+        self._summarizing.add(user_id)
+        self._run_in_background(self._update_summary(user_id, messages, upto))
+    
+    async def _update_summary(self, user_id: str, messages: list, upto: int):
+        """Gọi LLM viết lại tóm tắt = tóm tắt cũ + các tin nhắn mới bị đẩy ra khỏi cửa sổ gần đây"""
+        try:
+            prompt = SUMMARY_PROMPT_TEMPLATE.format(
+                summary=self.memory.get_summary(user_id) or "(chưa có)",
+                messages="\n".join(
+                    f"{m['role']}: {truncate_to_tokens(m['text'], PROMPT_MAX_TURN_TOKENS)}" for m in messages
+                )
+            )
+            summary = await self.llm_service.complete(
+                prompt, temperature=0.2, max_tokens=PROMPT_SUMMARY_MAX_TOKENS
+            )
+            if summary:
+                self.memory.update_summary(user_id, summary, upto)
+        except Exception as e:
+            print(f"[WARN] Conversation summary failed: {e}")
+        finally:
+            self._summarizing.discard(user_id)
+    
+    async def _call_llm(self, prompt: str, timeout: Optional[float] = None) -> str:
         """
         Gọi LLM API để xử lý prompt
         
         Args:
             prompt: Câu hỏi hoặc prompt cần xử lý
+            timeout: Thời gian tối đa (giây, theo deadline), None = không giới hạn
             
         Returns:
             Câu trả lời từ LLM
         """
-        return await self.llm_service.complete(prompt)
+        return await self.llm_service.complete(prompt, timeout=timeout)
+    
+    async def _stream_llm(
+        self,
+        prompt: str,
+        on_chunk: Callable[[str], Awaitable[None]],
+        parts: list,
+        timeout: Optional[float] = None,
+    ) -> str:
+        """
+        Gọi LLM ở chế độ streaming, chuyển từng đoạn cho `on_chunk`
+        
+        Args:
+            parts: Nhận các đoạn đã gửi (vẫn còn khi bị hủy giữa chừng do hết thời gian)
+        
+        Returns:
+            Toàn bộ câu trả lời đã ghép
+        """
+        async for chunk in self.llm_service.stream(prompt, timeout=timeout):
+            parts.append(chunk)
+            await on_chunk(chunk)
+        return "".join(parts).strip()
     
-    async def handle_query(self, query: str, user_id: str = "default") -> str:
+    @staticmethod
+    def _keyword_intent(query: str) -> str:
+        """Phân loại bằng từ khóa khi LLM không trả lời (lỗi / hết thời gian)"""
+        text = normalize_text(query).lower().replace("đ", "d")
+        for intent, pattern in FALLBACK_INTENT_PATTERNS:
+            if pattern.search(text):
+                return intent
+        if PRICE_TICKER_PATTERN.search(query):  # Xét trên câu gốc để giữ chữ hoa của mã
+            return "price_query"
+        return "chat"
+    
+    @staticmethod
+    def _mark_stale(result: dict, data: str) -> dict:
+        """Ghi nhận kết quả lấy từ cache cũ (xem core/deadline.py)"""
+        deadline = current_deadline()
+        if result.get("stale") and deadline is not None:
+            deadline.served_stale(data)
+        return result
+    
+    async def handle_query(
+        self,
+        query: str,
+        user_id: str = "default",
+        on_chunk: Optional[Callable[[str], Awaitable[None]]] = None,
+        budget: Optional[float] = None,
+    ) -> str:
         """
         Xử lý câu hỏi từ người dùng - Hàm chính
         
@@ -105,45 +335,51 @@ class OrchestratorAgent:
         Args:
             query: Câu hỏi từ người dùng
             user_id: ID người dùng (để lưu lịch sử)
+            on_chunk: Callback nhận câu trả lời theo từng đoạn (streaming);
+                câu trả lời không qua LLM được gửi 1 lần
+            budget: Ngân sách thời gian (giây), None = REQUEST_BUDGET; bước nào
+                không kịp thì bị bỏ qua hoặc dùng dữ liệu cũ trong cache
             
         Returns:
             Câu trả lời đã được format
         """
+        # Bot / API đã mở trace (kèm bước gửi tin) thì request_trace dùng lại trace đó
+        # (deadline cũng vậy); upstream_caller: user chia lượt gọi vnstock (batch đã đặt
+        # mức ưu tiên thấp ở ngoài); profile_query: 1 trong N câu hỏi khi runtime profiler đang bật
+        with request_trace("query"), request_deadline(budget), upstream_caller(user_id=user_id), profile_query():
+            return await self._handle_query(query, user_id, on_chunk)
+    
+    async def _handle_query(
+        self,
+        query: str,
+        user_id: str,
+        on_chunk: Optional[Callable[[str], Awaitable[None]]],
+    ) -> str:
+        streamed = False  # Đã gửi đoạn nào qua on_chunk chưa
+        
         # Bước 1: Lưu câu hỏi vào memory
-        self.memory.add_message(user_id, "user", query)
-        
-        # Bước 2: Lấy lịch sử hội thoại gần đây
-        recent_history = self.memory.get_recent(user_id, n=6)
-        conversation_context = "\n".join([
-            f"{m['role']}: {m['text']}" for m in recent_history
-        ])
-        
-        # Bước 3: Phân loại câu hỏi bằng LLM
-        routing_prompt = f"""
-        Lịch sử hội thoại gần đây:
-        {conversation_context}
-
-        Câu hỏi mới:
-        {query}
-
-        Xác định loại câu hỏi:
-        - Hỏi về giá cổ phiếu → "price"
-        - Hỏi tư vấn đầu tư hoặc phân tích cổ phiếu → "advice"
-        - Hỏi về tin tức hoặc xu hướng thị trường → "news"
-        - Chào hỏi hoặc chat chung → "chat"
-        Trả về đúng 1 từ trong các loại trên.
-        """
+        with span("memory_write"):
+            self.memory.add_message(user_id, "user", query)
+        
+        # Bước 2 + 3: Phân loại câu hỏi bằng LLM
+        # (tóm tắt + lịch sử gần đây + câu hỏi, trong ngân sách token)
+        routing_prompt = self._build_routing_prompt(query, user_id)
         
         try:
-            routing_text = await self._call_llm(routing_prompt)
-        except Exception:
+            with span("routing_llm"):
+                routing_text = await within_budget(
+                    "routing_llm", lambda timeout: self._call_llm(routing_prompt, timeout)
+                )
+        except Exception:  # Kể cả hết thời gian (DeadlineExceeded) → phân loại bằng từ khóa
             routing_text = ""
         
         routing_decision = (routing_text or "").lower().strip()
         query_lower = query.lower()
         
         # Bước 4: Xác định intent với logic fallback (nếu LLM không trả lời)
-        if "advice" in routing_decision or any(k in query_lower for k in ["mua", "ban", "phan tich", "khuyen nghi", "dau tu", "buy", "sell", "analyze", "advice"]):
+        if not routing_decision:
+            intent = self._keyword_intent(query)
+        elif "advice" in routing_decision or any(k in query_lower for k in ["mua", "ban", "phan tich", "khuyen nghi", "dau tu", "buy", "sell", "analyze", "advice"]):
             intent = "advice_query"
         elif "price" in routing_decision or any(k in query_lower for k in ["gia", "bao nhieu", "tang", "giam", "hom nay", "hom qua", "price", "how much", "today", "yesterday"]):
             intent = "price_query"
@@ -151,107 +387,196 @@ class OrchestratorAgent:
             intent = "news_query"
         else:
             intent = "chat"
+        set_attribute("intent", intent)
+        
+        # Với câu hỏi tin tức: xác định mã cổ phiếu trước để lọc RAG theo mã + thời gian
+        symbol = None
+        rag_filters = None
+        if intent == "news_query":
+            symbol = await asyncio.to_thread(self.stock_agent.extract_symbol, query)  # Có thể tải danh sách mã
+            if symbol:
+                date_from = datetime.now() - timedelta(days=RAG_NEWS_MAX_AGE_DAYS)
+                rag_filters = {"symbol": symbol, "date_from": date_from.strftime("%Y-%m-%d")}
         
         # Bước 5: Lấy context từ RAG nếu có (để bổ sung thông tin)
+        # Chỉ embedding + tìm kiếm 1 lần, dùng chung cho context và news path
         context_text = ""
-        rag_tool = self._get_rag_tool()
+        context_items = []
+        retrieval = None
+        # (câu trả lời dạng mẫu câu không dùng RAG context → bỏ qua)
+        # Model embedding chưa load xong (warm-up) → bỏ qua RAG, không bắt user chờ
+        rag_tool = self._get_rag_tool() if intent not in TEMPLATED_INTENTS and self.rag_ready else None
         if rag_tool:
+            retrieval = rag_tool.retrieval(query, top_k=RAG_TOP_K, filters=rag_filters)
             try:
-                context_text = rag_tool.retrieve_context(query)
+                with span("rag_retrieval"):
+                    await within_budget("rag_retrieval", lambda timeout: retrieval.fetch())
+                context_items = retrieval.context_items()
+                context_text = "\n".join(context_items)
                 if context_text:
                     print(f"RAG context length: {len(context_text)} chars")
+            except DeadlineExceeded:
+                retrieval = None  # Không kịp tìm → trả lời không có RAG context
             except Exception as e:
                 print(f"[WARN] RAG retrieval failed: {e}")
                 context_text = ""
+                context_items = []
         
         # Bước 6: Gửi đến agent phù hợp để xử lý
+        # (agent gọi vnstock / crawl web đồng bộ → chạy trong thread để không chặn các user khác)
+        # rendered: câu trả lời đã hoàn chỉnh (không cần LLM format)
+        with span("agent"):
+            response, rendered = await self._run_agent(intent, query, symbol, retrieval, rag_tool)
+        
+        # Bước 7: Format câu trả lời bằng LLM để tự nhiên hơn
+        # (giá / tư vấn đã được viết bằng mẫu câu tiếng Việt → bỏ qua LLM)
+        if rendered is not None:
+            final_text = rendered
+        else:
+            response_text = response if isinstance(response, str) else str(response)
+            final_prompt = self._build_final_prompt(query, user_id, response_text, context_items)
+            
+            parts = []
+            try:
+                with span("format_llm"):
+                    if on_chunk is not None:
+                        final_text = await within_budget(
+                            "format_llm", lambda timeout: self._stream_llm(final_prompt, on_chunk, parts, timeout)
+                        )
+                        streamed = bool(final_text)
+                    else:
+                        final_text = await within_budget(
+                            "format_llm", lambda timeout: self._call_llm(final_prompt, timeout)
+                        )
+            except Exception as e:
+                print(f"[WARN] LLM formatting failed: {e}")
+                # Hết thời gian giữa lúc stream → giữ phần đã gửi cho người dùng
+                final_text = "".join(parts).strip()
+                streamed = bool(final_text)
+        
+        # Fallback nếu LLM không trả lời
+        if not final_text:
+            final_text = response if isinstance(response, str) else str(response)
+        
+        # Dữ liệu lấy từ cache cũ (nguồn chậm, hết thời gian) → báo cho người dùng
+        deadline = current_deadline()
+        if deadline is not None and deadline.stale:
+            note = self.renderer.render_stale_note(deadline.stale)
+            final_text = f"{final_text}\n\n{note}"
+            if streamed:
+                await on_chunk(f"\n\n{note}")
+        if on_chunk is not None and not streamed:
+            await on_chunk(final_text)
+        
+        # Bước 8: Lưu câu trả lời vào memory
+        with span("memory_write"):
+            self.memory.add_message(user_id, "assistant", final_text)
+        self._schedule_summary(user_id)
+        
+        return final_text
+    
+    async def _run_agent(self, intent: str, query: str, symbol: Optional[str], retrieval, rag_tool):
+        """
+        Bước 6: Gửi câu hỏi đến agent phù hợp
+        
+        vnstock / CafeF chạy trong thời gian còn lại của deadline; quá hạn thì
+        dùng dữ liệu cũ trong cache (thread vẫn chạy tiếp và cập nhật cache
+        cho câu hỏi sau). Mọi nguồn giá đều lỗi cũng dùng giá cũ nếu có. Đọc
+        cache cũ cũng chạy trong thread: tìm mã có thể phải tải danh sách mã
+        (vnstock Listing) khi cache lạnh.
+        
+        Returns:
+            (kết quả của agent, câu trả lời dạng mẫu câu hoặc None nếu cần LLM format)
+        """
+        rendered = None
         if intent == "price_query":
             # Hỏi về giá cổ phiếu → dùng StockAgent
-            response = self.stock_agent.handle_request(query)
+            try:
+                quote = await within_budget(
+                    "market_data", lambda timeout: asyncio.to_thread(self.stock_agent.get_quote, query, timeout)
+                )
+            except DeadlineExceeded:
+                quote = {"status": "error"}
+            if quote.get("status") == "error":
+                cached = await asyncio.to_thread(self.stock_agent.get_cached_quote, query)
+                quote = self._mark_stale(cached, "quote") if cached.get("status") == "ok" else {**cached, **quote}
+            response = self.stock_agent.format_quote(quote)
+            if intent in TEMPLATED_INTENTS:
+                rendered = self.renderer.render_price(quote)
         
         elif intent == "advice_query":
             # Hỏi tư vấn đầu tư → dùng AdviceAgent
-            response = analyze_stock(query)
+            try:
+                analysis = await within_budget(
+                    "market_data", lambda timeout: asyncio.to_thread(compute_stock_analysis, query, False, timeout)
+                )
+            except DeadlineExceeded:
+                analysis = {"status": "error"}
+            if analysis.get("status") == "error":
+                cached = await asyncio.to_thread(compute_stock_analysis, query, True)
+                analysis = self._mark_stale(cached, "history") if cached.get("status") == "ok" else {**cached, **analysis}
+            response = format_analysis(analysis)
+            if intent in TEMPLATED_INTENTS:
+                rendered = self.renderer.render_advice(analysis)
         
         elif intent == "news_query":
-            # Hỏi về tin tức → dùng NewsAgent
-            symbol = self.stock_agent.extract_symbol(query)
+            # Hỏi về tin tức → dùng NewsAgent (mã cổ phiếu đã xác định ở trên)
             if not symbol:
                 response = "Không tìm thấy mã cổ phiếu hợp lệ trong câu hỏi. Ví dụ: 'tin tức về FPT'."
             else:
-                # Thử tìm trong RAG database trước
+                # Thử tìm trong RAG database trước (dùng lại kết quả ở bước 5)
                 rag_results = []
-                if rag_tool:
+                if retrieval:
                     try:
-                        rag_results = rag_tool.query(query)
+                        rag_results = retrieval.results(RAG_TOP_K)
                     except Exception as e:
                         print(f"[WARN] RAG query failed: {e}")
                 
                 if rag_results:
                     # Tìm thấy trong database → trả về kết quả
                     print(f"Found {len(rag_results)} results from local RAG database")
+                    # Các chunk của cùng 1 bài được gộp thành 1 đoạn trích
                     response = "\n".join([
                         f"- {r['text']} ({r['metadata'].get('source')}, {r['metadata'].get('date')})"
-                        for r in rag_results[:3]
+                        for r in rag_tool.merge_chunks(rag_results)[:3]
                     ])
                 else:
                     # Không tìm thấy → crawl tin tức mới từ web
                     print("No local data found → crawling news...")
-                    data = self.news_agent.run(symbol)
-                    if data and "articles" in data:
-                        # Lưu vào RAG database để dùng sau
-                        if rag_tool:
-                            try:
-                                texts = [f"{a['title']} - {a['description']}" for a in data["articles"]]
-                                metas = [
-                                    {
-                                        "symbol": symbol,
-                                        "source": a["source"],
-                                        "url": a["url"],
-                                        "date": a["date"],
-                                        "sentiment": a["sentiment"]
-                                    }
-                                    for a in data["articles"]
-                                ]
-                                rag_tool.add_documents(texts, metas)
-                                print(f"Saved {len(texts)} new articles for {symbol} to RAG")
-                            except Exception as e:
-                                print(f"[WARN] Failed to save to RAG: {e}")
+                    try:
+                        data = await within_budget(
+                            "news_crawl", lambda timeout: asyncio.to_thread(self._crawl_news, symbol, timeout)
+                        )
+                    except DeadlineExceeded:
+                        return await asyncio.to_thread(self._stale_news, symbol), rendered
+                    if data and "articles" in data and rag_tool:
+                        # Lưu vào RAG database để dùng sau - tải nội dung bài + embedding
+                        # chạy nền, không làm chậm câu trả lời hiện tại
+                        self._run_in_background(asyncio.to_thread(
+                            self._ingest_articles, rag_tool, symbol, list(data["articles"])
+                        ))
                     
                     response = data.get("summary", "No new news found.")
         else:
             # Chat chung
             response = "Xin chào! Tôi là trợ lý tài chính. Bạn có thể hỏi tôi về giá cổ phiếu, tư vấn đầu tư, hoặc tin tức thị trường."
         
-        # Bước 7: Format câu trả lời bằng LLM để tự nhiên hơn
-        recent = self.memory.get_recent(user_id, n=6)
-        recent_text = "\n".join([f"{m['role']}: {m['text']}" for m in recent])
-        
-        final_prompt = f"""
-        RAG context (nếu có):
-        {context_text}
-
-        Lịch sử hội thoại gần đây:
-        {recent_text}
-
-        Câu trả lời từ system:
-        {response}
-
-        Vui lòng trả lời bằng tiếng Việt, ngắn gọn, tự nhiên và thân thiện.
-        """
-        
-        try:
-            final_text = await self._call_llm(final_prompt)
-        except Exception as e:
-            print(f"[WARN] LLM formatting failed: {e}")
-            final_text = ""
-        
-        # Fallback nếu LLM không trả lời
-        if not final_text:
-            final_text = response if isinstance(response, str) else str(response)
-        
-        # Bước 8: Lưu câu trả lời vào memory
-        self.memory.add_message(user_id, "assistant", final_text)
-        
-        return final_text
-
+        return response, rendered
+    
+    def _crawl_news(self, symbol: str, timeout: Optional[float]) -> Dict:
+        """Crawl tin tức và lưu tóm tắt vào cache dùng chung (chạy trong thread)"""
+        data = self.news_agent.run(symbol, timeout)
+        if data.get("articles"):
+            # Dùng lại khi lần crawl sau không kịp (deadline)
+            get_shared_cache().set("news", symbol, data["summary"], NEWS_CACHE_TTL)
+        return data
+    
+    def _stale_news(self, symbol: str) -> str:
+        """Tóm tắt tin tức của lần crawl trước (khi crawl không kịp deadline)"""
+        summary = get_shared_cache().get_stale("news", symbol)
+        if summary is None:
+            return f"Nguồn tin đang phản hồi chậm nên chưa lấy được tin tức mới về {symbol}, bạn thử lại sau ít phút nhé."
+        deadline = current_deadline()
+        if deadline is not None:
+            deadline.served_stale("news")
+        return summary
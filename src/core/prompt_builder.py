@@ -0,0 +1,156 @@
+"""
+Prompt Builder - Ghép prompt cho LLM trong giới hạn token
+
+Chức năng:
+- Ước lượng số token của text (không cần tokenizer của model)
+- Mỗi phần của prompt có độ ưu tiên: phần bắt buộc (câu hỏi, câu trả lời
+  từ agent) luôn có mặt, sau đó tới RAG context (theo độ liên quan),
+  lịch sử gần đây (mới nhất trước), cuối cùng là tóm tắt hội thoại cũ
+- Phần không vừa ngân sách bị cắt bớt hoặc bỏ qua
+
+Nhờ vậy kích thước prompt không tăng theo độ dài hội thoại hay số
+kết quả RAG, mỗi lần gọi LLM có chi phí gần như cố định.
+"""
+import math
+from typing import Dict, List, Optional
+
+from config.settings import PROMPT_CHARS_PER_TOKEN
+
+_MIN_TRUNCATED_TOKENS = 24  # Phần còn ít hơn N token thì bỏ luôn thay vì cắt
+
+
+def estimate_tokens(text: str) -> int:
+    """Ước lượng số token (tiếng Việt có dấu ~3 ký tự / token với tokenizer của Llama)"""
+    return math.ceil(len(text or "") / PROMPT_CHARS_PER_TOKEN)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cắt text cho vừa `max_tokens` (cắt ở khoảng trắng, thêm "...")"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    limit = max(0, max_tokens * PROMPT_CHARS_PER_TOKEN - 3)
+    cut = text[:limit]
+    if " " in cut:
+        cut = cut[:cut.rfind(" ")]
+    return cut + "..."
+
+
+class PromptBuilder:
+    """
+    Ghép các phần của prompt theo độ ưu tiên trong một ngân sách token
+
+    Ví dụ:
+        builder = PromptBuilder(budget=2000, template=FINAL_TEMPLATE)
+        builder.add("response", response, required=True)
+        builder.add_items("context", context_items, priority=3)
+        builder.add_items("history", turns, priority=2, newest_first=True)
+        builder.add("summary", summary, priority=1)
+        prompt = builder.build()
+    """
+
+    def __init__(self, budget: int, template: str):
+        """
+        Khởi tạo builder
+
+        Args:
+            budget: Số token tối đa của cả prompt
+            template: Khung prompt, mỗi phần là 1 placeholder {tên}
+        """
+        self.budget = budget
+        self.template = template
+        self._sections: List[Dict] = []
+
+    def add(
+        self,
+        name: str,
+        text: str,
+        priority: int = 0,
+        required: bool = False,
+        max_tokens: Optional[int] = None,
+    ):
+        """
+        Thêm 1 phần dạng text
+
+        Args:
+            name: Tên placeholder trong template
+            text: Nội dung
+            priority: Độ ưu tiên (cao hơn được xếp chỗ trước)
+            required: Luôn giữ (chỉ bị cắt nếu riêng nó đã vượt ngân sách)
+            max_tokens: Giới hạn riêng cho phần này
+        """
+        self.add_items(name, [text] if text else [], priority, required, max_item_tokens=max_tokens)
+
+    def add_items(
+        self,
+        name: str,
+        items: List[str],
+        priority: int = 0,
+        required: bool = False,
+        max_item_tokens: Optional[int] = None,
+        newest_first: bool = False,
+        separator: str = "\n",
+    ):
+        """
+        Thêm 1 phần gồm nhiều mục, xếp theo mức quan trọng giảm dần
+
+        Mục được thêm lần lượt tới khi hết ngân sách.
+
+        Args:
+            name: Tên placeholder trong template
+            items: Các mục (mục quan trọng nhất trước)
+            priority: Độ ưu tiên so với các phần khác
+            required: Luôn giữ ít nhất mục đầu tiên
+            max_item_tokens: Cắt mỗi mục dài hơn N token (vd: câu trả lời dài trong lịch sử)
+            newest_first: `items` là mới nhất trước nhưng prompt in theo thứ tự thời gian
+            separator: Chuỗi nối các mục
+        """
+        if max_item_tokens:
+            items = [truncate_to_tokens(item, max_item_tokens) for item in items]
+        self._sections.append({
+            "name": name,
+            "items": [item for item in items if item],
+            "priority": priority,
+            "required": required,
+            "newest_first": newest_first,
+            "separator": separator,
+        })
+
+    def fit(self) -> Dict[str, str]:
+        """
+        Chọn nội dung mỗi phần cho vừa ngân sách
+
+        Returns:
+            Dictionary {tên phần: text đã chọn}
+        """
+        remaining = self.budget - estimate_tokens(self.template.format(**{
+            s["name"]: "" for s in self._sections
+        }))
+        chosen: Dict[str, List[str]] = {s["name"]: [] for s in self._sections}
+
+        # Phần bắt buộc trước, sau đó theo độ ưu tiên giảm dần
+        order = sorted(self._sections, key=lambda s: (not s["required"], -s["priority"]))
+        for section in order:
+            separator_tokens = estimate_tokens(section["separator"])
+            for i, item in enumerate(section["items"]):
+                cost = estimate_tokens(item) + (separator_tokens if chosen[section["name"]] else 0)
+                if cost <= remaining:
+                    chosen[section["name"]].append(item)
+                    remaining -= cost
+                elif (section["required"] and i == 0) or remaining >= _MIN_TRUNCATED_TOKENS:
+                    # Cắt mục đầu tiên không vừa rồi dừng phần này
+                    chosen[section["name"]].append(truncate_to_tokens(item, max(remaining, 1)))
+                    remaining = 0
+                    break
+                else:
+                    break
+
+        return {
+            s["name"]: s["separator"].join(
+                reversed(chosen[s["name"]]) if s["newest_first"] else chosen[s["name"]]
+            )
+            for s in self._sections
+        }
+
+    def build(self) -> str:
+        """Ghép prompt hoàn chỉnh trong ngân sách token"""
+        return self.template.format(**self.fit())
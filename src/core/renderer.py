@@ -0,0 +1,272 @@
+"""
+Response Renderer - Viết câu trả lời tiếng Việt từ kết quả có cấu trúc
+
+Nhiệm vụ:
+- Nhận kết quả dạng dictionary từ StockAgent.get_quote và
+  compute_stock_analysis (chưa format)
+- Ghép câu trả lời bằng các mẫu câu tiếng Việt, chọn ngẫu nhiên giữa
+  nhiều biến thể để câu trả lời không lặp lại máy móc
+- Số liệu luôn lấy nguyên từ kết quả (không qua LLM nên không bị "bịa")
+
+Dùng cho câu hỏi giá và tư vấn: bỏ được 1 lần gọi LLM chỉ để diễn đạt lại.
+Câu hỏi tin tức và chat vẫn dùng LLM.
+"""
+import random
+from typing import Dict, Optional
+
+
+def format_vnd(value: float) -> str:
+    """Định dạng số tiền kiểu Việt Nam: 123456 → '123.456'"""
+    return f"{value:,.0f}".replace(",", ".")
+
+
+def format_percent(value: float, signed: bool = True) -> str:
+    """Định dạng phần trăm kiểu Việt Nam: 1.5 → '+1,50%'"""
+    text = f"{value:+.2f}" if signed else f"{value:.2f}"
+    return text.replace(".", ",") + "%"
+
+
+PRICE_OPENINGS = [
+    "📊 Giá cổ phiếu {symbol} hiện là {price} đồng.",
+    "📊 {symbol} đang giao dịch ở mức {price} đồng.",
+    "📊 Hiện tại {symbol} có giá {price} đồng.",
+]
+
+PRICE_UP = [
+    "Mã này tăng {change} đồng ({percent}) so với phiên trước.",
+    "So với phiên trước, {symbol} đã tăng {change} đồng ({percent}).",
+    "Giá đang đi lên, tăng {change} đồng ({percent}).",
+]
+
+PRICE_DOWN = [
+    "Mã này giảm {change} đồng ({percent}) so với phiên trước.",
+    "So với phiên trước, {symbol} đã giảm {change} đồng ({percent}).",
+    "Giá đang điều chỉnh, giảm {change} đồng ({percent}).",
+]
+
+PRICE_FLAT = [
+    "Giá gần như không đổi so với phiên trước.",
+    "{symbol} đứng giá so với phiên trước.",
+]
+
+VOLUME_LINES = [
+    "Khối lượng giao dịch: {volume} cổ phiếu.",
+    "Đã có {volume} cổ phiếu được khớp lệnh.",
+]
+
+NO_SYMBOL = [
+    "Bạn vui lòng cho mình biết mã cổ phiếu cụ thể nhé (ví dụ: FPT, VNM, HPG, MWG).",
+    "Mình chưa nhận ra mã cổ phiếu trong câu hỏi. Bạn thử ghi rõ mã, ví dụ: 'Giá FPT hôm nay'.",
+]
+
+NO_DATA = [
+    "Hiện chưa có dữ liệu cho mã {symbol}. Bạn kiểm tra lại mã giúp mình nhé.",
+    "Mình không tìm thấy dữ liệu giao dịch của {symbol} lúc này.",
+]
+
+ERROR = [
+    "Xin lỗi, hệ thống đang gặp sự cố khi lấy dữ liệu {symbol}. Bạn thử lại sau ít phút nhé.",
+    "Không lấy được dữ liệu {symbol} lúc này, bạn vui lòng thử lại sau.",
+]
+
+ADVICE_OPENINGS = [
+    "📈 Phân tích nhanh {symbol}: giá hiện tại {price} đồng ({percent} phiên gần nhất).",
+    "📈 {symbol} đang ở mức {price} đồng, thay đổi {percent} trong phiên gần nhất.",
+    "📈 Về {symbol}: giá đóng cửa gần nhất là {price} đồng ({percent}).",
+]
+
+ADVICE_AVERAGE = {
+    "below": [
+        "Giá đang thấp hơn trung bình 30 ngày ({avg} đồng).",
+        "So với mức trung bình 30 ngày ({avg} đồng), giá hiện tại thấp hơn.",
+    ],
+    "above": [
+        "Giá đang cao hơn trung bình 30 ngày ({avg} đồng).",
+        "So với mức trung bình 30 ngày ({avg} đồng), giá hiện tại cao hơn.",
+    ],
+    "around": [
+        "Giá dao động quanh mức trung bình 30 ngày ({avg} đồng).",
+        "Giá đang sát mức trung bình 30 ngày ({avg} đồng).",
+    ],
+}
+
+ADVICE_TREND = {
+    "up": [
+        "Xu hướng 5 phiên gần đây là tăng ({trend}).",
+        "5 phiên gần nhất cổ phiếu đi lên ({trend}).",
+    ],
+    "down": [
+        "Xu hướng 5 phiên gần đây là giảm ({trend}).",
+        "5 phiên gần nhất cổ phiếu đi xuống ({trend}).",
+    ],
+    "sideways": [
+        "5 phiên gần đây giá đi ngang ({trend}).",
+        "Giá khá ổn định trong 5 phiên gần nhất ({trend}).",
+    ],
+}
+
+ADVICE_VOLATILITY = {
+    "high": [
+        "Biên độ dao động 30 ngày khá lớn ({volatility}), rủi ro cao hơn bình thường.",
+        "Độ biến động 30 ngày cao ({volatility}), cần quản lý rủi ro cẩn thận.",
+    ],
+    "low": [
+        "Biên độ dao động 30 ngày thấp ({volatility}).",
+        "Độ biến động 30 ngày ở mức thấp ({volatility}).",
+    ],
+}
+
+ADVICE_DECISION = {
+    "buy": [
+        "👉 Nhận định: giá đang ở vùng thấp, có thể cân nhắc tích lũy.",
+        "👉 Nhận định: vùng giá hiện tại có thể phù hợp để cân nhắc mua dần.",
+    ],
+    "cautious": [
+        "👉 Nhận định: giá đang ở vùng cao, nên thận trọng khi mua mới.",
+        "👉 Nhận định: cổ phiếu có dấu hiệu nóng, nên cẩn trọng.",
+    ],
+    "neutral": [
+        "👉 Nhận định: chưa có tín hiệu rõ ràng, có thể tiếp tục theo dõi.",
+        "👉 Nhận định: trung tính, nên chờ thêm tín hiệu.",
+    ],
+}
+
+DISCLAIMERS = [
+    "⚠️ Đây là phân tích tự động, không phải khuyến nghị đầu tư.",
+    "⚠️ Thông tin chỉ mang tính tham khảo, không phải lời khuyên đầu tư.",
+]
+
+# Dữ liệu lấy từ cache cũ khi hết thời gian (xem core/deadline.py)
+STALE_DATA_NAMES = {"quote": "giá", "history": "lịch sử giá", "news": "tin tức"}
+STALE_NOTES = [
+    "⏱ Nguồn dữ liệu đang phản hồi chậm: {data} ở trên lấy từ lần cập nhật trước, có thể chưa mới nhất.",
+    "⏱ Hệ thống đang chậm nên {data} được lấy từ dữ liệu đã lưu trước đó, có thể chưa cập nhật.",
+]
+
+
+class ResponseRenderer:
+    """
+    Viết câu trả lời tiếng Việt cho câu hỏi giá và tư vấn từ kết quả có cấu trúc
+
+    Số liệu và nhận định là cố định theo dữ liệu; chỉ cách diễn đạt được
+    chọn ngẫu nhiên (truyền `seed` để có kết quả lặp lại được khi test).
+    """
+
+    def __init__(self, seed: Optional[int] = None):
+        """
+        Khởi tạo renderer
+
+        Args:
+            seed: Seed cho việc chọn mẫu câu (None = ngẫu nhiên)
+        """
+        self._random = random.Random(seed)
+
+    def _pick(self, templates, **values) -> str:
+        return self._random.choice(templates).format(**values)
+
+    def _render_status(self, result: Dict) -> Optional[str]:
+        """Câu trả lời cho kết quả lỗi (None nếu status là ok)"""
+        status = result.get("status")
+        symbol = result.get("symbol") or ""
+        if status == "no_symbol":
+            return self._pick(NO_SYMBOL)
+        if status == "no_data":
+            return self._pick(NO_DATA, symbol=symbol)
+        if status != "ok":
+            return self._pick(ERROR, symbol=symbol)
+        return None
+
+    def render_price(self, quote: Dict) -> str:
+        """
+        Câu trả lời cho câu hỏi giá
+
+        Args:
+            quote: Kết quả từ StockAgent.get_quote
+
+        Returns:
+            Câu trả lời tiếng Việt
+        """
+        message = self._render_status(quote)
+        if message is not None:
+            return message
+
+        symbol = quote["symbol"]
+        lines = [self._pick(PRICE_OPENINGS, symbol=symbol, price=format_vnd(quote["price"]))]
+
+        change = quote.get("change") or 0.0
+        values = {
+            "symbol": symbol,
+            "change": format_vnd(abs(change)),
+            "percent": format_percent(quote.get("change_percent") or 0.0),
+        }
+        if change > 0:
+            lines.append(self._pick(PRICE_UP, **values))
+        elif change < 0:
+            lines.append(self._pick(PRICE_DOWN, **values))
+        else:
+            lines.append(self._pick(PRICE_FLAT, **values))
+
+        if quote.get("volume") is not None:
+            lines.append(self._pick(VOLUME_LINES, volume=format_vnd(quote["volume"])))
+        return "\n".join(lines)
+
+    def render_advice(self, analysis: Dict) -> str:
+        """
+        Câu trả lời cho câu hỏi tư vấn
+
+        Args:
+            analysis: Kết quả từ compute_stock_analysis
+
+        Returns:
+            Câu trả lời tiếng Việt
+        """
+        message = self._render_status(analysis)
+        if message is not None:
+            return message
+
+        price_ratio = analysis["price_ratio"]
+        trend_5d = analysis["trend_5d"]
+        volatility = analysis["volatility"]
+
+        # Ngưỡng giống format_analysis / explain_decision của advice_agent
+        if price_ratio < 0.95:
+            average = "below"
+        elif price_ratio > 1.05:
+            average = "above"
+        else:
+            average = "around"
+
+        if trend_5d > 2:
+            trend = "up"
+        elif trend_5d < -2:
+            trend = "down"
+        else:
+            trend = "sideways"
+
+        lines = [
+            self._pick(
+                ADVICE_OPENINGS,
+                symbol=analysis["symbol"],
+                price=format_vnd(analysis["current_price"]),
+                percent=format_percent(analysis["price_change_percent"]),
+            ),
+            self._pick(ADVICE_AVERAGE[average], avg=format_vnd(analysis["avg_30d"])),
+            self._pick(ADVICE_TREND[trend], trend=format_percent(trend_5d)),
+            self._pick(
+                ADVICE_VOLATILITY["high" if volatility > 10 else "low"],
+                volatility=format_percent(volatility, signed=False),
+            ),
+            self._pick(ADVICE_DECISION[analysis["decision"]]),
+            self._pick(DISCLAIMERS),
+        ]
+        return "\n".join(lines)
+
+    def render_stale_note(self, stale) -> str:
+        """
+        Ghi chú cuối câu trả lời khi dùng dữ liệu cũ
+
+        Args:
+            stale: Loại dữ liệu lấy từ cache cũ (vd: ["quote"])
+        """
+        names = [STALE_DATA_NAMES.get(data, data) for data in dict.fromkeys(stale)]
+        return self._pick(STALE_NOTES, data=", ".join(names))
@@ -0,0 +1,362 @@
+"""
+Runtime Profiler - Profile process đang chạy khi latency tăng đột biến
+
+Chức năng (bật/tắt khi đang chạy, không cần restart):
+- Profile 1 trong N câu hỏi (handle_query):
+    - "stack": thread nền lấy mẫu stack của mọi thread (event loop + thread
+      chạy pandas / BeautifulSoup / embedding) → file .collapsed dùng được
+      với flamegraph.pl, speedscope, inferno
+    - "cprofile": cProfile trên thread event loop → file .prof (pstats,
+      snakeviz, flameprof)
+- Phát hiện event loop bị chặn quá LOOP_STALL_THRESHOLD: ghi lại stack của
+  thread event loop tại thời điểm bị chặn
+- Snapshot tracemalloc: snapshot đầu tiên bật tracemalloc (làm chậm code
+  cấp phát nhiều, nên chỉ bật khi cần) và làm mốc; các snapshot sau so
+  sánh với mốc để tìm chỗ RSS tăng
+
+Cách bật/tắt:
+- Lệnh Telegram /profile on|off|status|snapshot (ADMIN_USER_IDS)
+- POST /admin/profile {"action": ...} của API server
+- Signal: SIGUSR1 = bật/tắt, SIGUSR2 = snapshot tracemalloc
+
+Mỗi process có profiler riêng (worker shard / webhook: gửi signal tới pid
+của worker). Khi tắt, profile_query() chỉ trả về context manager rỗng.
+"""
+import os
+import sys
+import time
+import signal
+import asyncio
+import threading
+import itertools
+from collections import Counter as _Counter
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Iterator, Optional
+
+from config.settings import (
+    PROFILER_ENABLED,
+    PROFILER_SAMPLE_EVERY,
+    PROFILER_MODE,
+    PROFILER_STACK_INTERVAL,
+    PROFILER_OUTPUT_DIR,
+    LOOP_STALL_THRESHOLD,
+    LOOP_STALL_CHECK_INTERVAL,
+    TRACEMALLOC_FRAMES,
+)
+from core.telemetry import LOOP_STALLS, current_request_id
+
+_NULL_CONTEXT = nullcontext()
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+def _collapse(frame) -> str:
+    """Stack dạng "gốc;...;lá" (định dạng collapsed của flamegraph)"""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame).replace(";", ":"))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+def _format_stack(frame) -> str:
+    import traceback
+    return "".join(traceback.format_stack(frame))
+
+
+def _rss_mb() -> Optional[float]:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import resource
+        usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return usage / (1024 * 1024 if sys.platform == "darwin" else 1024)
+    except Exception:
+        return None
+
+
+class _StackSampler(threading.Thread):
+    """Lấy mẫu stack của mọi thread (trừ chính nó) cho tới khi stop()"""
+
+    def __init__(self, interval: float):
+        super().__init__(name="profiler-sampler", daemon=True)
+        self.interval = interval
+        self.samples: _Counter = _Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        names = {}
+        while not self._stop_event.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == self.ident:
+                    continue
+                if thread_id not in names:
+                    names.update((t.ident, t.name) for t in threading.enumerate())
+                self.samples[f"{names.get(thread_id, thread_id)};{_collapse(frame)}"] += 1
+
+    def stop(self) -> _Counter:
+        self._stop_event.set()
+        self.join()
+        return self.samples
+
+
+class _LoopWatchdog:
+    """Phát hiện event loop bị chặn: loop cập nhật heartbeat, thread nền kiểm tra"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, loop_thread_id: int, profiler: "RuntimeProfiler"):
+        self.loop = loop
+        self.loop_thread_id = loop_thread_id
+        self.profiler = profiler
+        self._last_beat = time.monotonic()
+        self._stall_start: Optional[float] = None
+        self._stop_event = threading.Event()
+        self._handle = None
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+
+    def start(self):
+        self.loop.call_soon_threadsafe(self._beat)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._handle is not None:
+            self.loop.call_soon_threadsafe(self._handle.cancel)
+
+    def _beat(self):
+        self._last_beat = time.monotonic()
+        if not self._stop_event.is_set():
+            self._handle = self.loop.call_later(LOOP_STALL_CHECK_INTERVAL, self._beat)
+
+    def _watch(self):
+        while not self._stop_event.wait(LOOP_STALL_CHECK_INTERVAL):
+            if self.loop.is_closed():
+                return
+            lag = time.monotonic() - self._last_beat - LOOP_STALL_CHECK_INTERVAL
+            if lag > LOOP_STALL_THRESHOLD and self._stall_start is None:
+                self._stall_start = self._last_beat
+                frame = sys._current_frames().get(self.loop_thread_id)
+                stack = _format_stack(frame) if frame is not None else "(không lấy được stack)\n"
+                LOOP_STALLS.inc()
+                self.profiler._on_stall(lag, stack)
+            elif lag <= LOOP_STALL_THRESHOLD and self._stall_start is not None:
+                duration = time.monotonic() - self._stall_start - LOOP_STALL_CHECK_INTERVAL
+                print(f"[Profiler] Event loop hoạt động lại sau {duration * 1000:.0f} ms")
+                self._stall_start = None
+
+
+class RuntimeProfiler:
+    """Profiler bật/tắt khi đang chạy (1 instance mỗi process, xem get_profiler)"""
+
+    def __init__(
+        self,
+        sample_every: int = PROFILER_SAMPLE_EVERY,
+        mode: str = PROFILER_MODE,
+        output_dir: str = PROFILER_OUTPUT_DIR,
+    ):
+        """
+        Khởi tạo profiler (ở trạng thái tắt)
+
+        Args:
+            sample_every: Profile 1 trong N câu hỏi
+            mode: "stack" hoặc "cprofile"
+            output_dir: Thư mục ghi kết quả
+        """
+        self.sample_every = max(1, sample_every)
+        self.mode = mode
+        self.output_dir = output_dir
+        self.enabled = False
+        self.profiled = 0
+        self.stalls = 0
+        self._counter = itertools.count()
+        self._busy = threading.Lock()  # Mỗi lúc chỉ profile 1 câu hỏi
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._watchdog: Optional[_LoopWatchdog] = None
+        self._baseline = None  # Snapshot tracemalloc đầu tiên
+
+    # --- Bật / tắt ---
+
+    def install(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        """
+        Gắn profiler vào event loop đang chạy và đăng ký signal
+
+        Gọi từ trong event loop (post_init của bot, on_startup của API,
+        worker shard). Không dùng cho CLI: input() chặn loop.
+        """
+        self._loop = loop or asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        if hasattr(signal, "SIGUSR1") and threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGUSR1, lambda *_: self._loop.call_soon_threadsafe(self.toggle))
+            signal.signal(signal.SIGUSR2, lambda *_: self._loop.call_soon_threadsafe(self._signal_snapshot))
+        if PROFILER_ENABLED:
+            self.enable()
+
+    def enable(self):
+        """Bật lấy mẫu câu hỏi và theo dõi event loop"""
+        if self.enabled:
+            return
+        self.enabled = True
+        if self._loop is not None and not self._loop.is_closed():
+            self._watchdog = _LoopWatchdog(self._loop, self._loop_thread_id, self)
+            self._watchdog.start()
+        print(f"[Profiler] Bật (1/{self.sample_every} câu hỏi, mode {self.mode}) → {self.output_dir}/")
+
+    def disable(self):
+        """Tắt profiler (dừng watchdog và tracemalloc)"""
+        import tracemalloc
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+            self._baseline = None
+        if not self.enabled:
+            return
+        self.enabled = False
+        if self._watchdog is not None:
+            self._watchdog.stop()
+            self._watchdog = None
+        print("[Profiler] Tắt")
+
+    def toggle(self) -> bool:
+        """Đảo trạng thái bật/tắt, trả về trạng thái mới"""
+        if self.enabled:
+            self.disable()
+        else:
+            self.enable()
+        return self.enabled
+
+    def status(self) -> Dict:
+        """Trạng thái hiện tại (cho lệnh /profile status)"""
+        return {
+            "enabled": self.enabled,
+            "pid": os.getpid(),
+            "mode": self.mode,
+            "sample_every": self.sample_every,
+            "profiled": self.profiled,
+            "loop_stalls": self.stalls,
+            "tracemalloc": self._baseline is not None,
+            "rss_mb": round(_rss_mb() or 0, 1),
+            "output_dir": os.path.abspath(self.output_dir),
+        }
+
+    # --- Profile câu hỏi ---
+
+    def profile_query(self):
+        """
+        Context manager bao quanh handle_query: profile 1 trong N lần gọi
+
+        Câu hỏi khác chạy xen kẽ trên event loop cũng nằm trong kết quả.
+        """
+        if not self.enabled or next(self._counter) % self.sample_every:
+            return _NULL_CONTEXT
+        if not self._busy.acquire(blocking=False):
+            return _NULL_CONTEXT
+        return self._profile()
+
+    @contextmanager
+    def _profile(self) -> Iterator[None]:
+        start = time.perf_counter()
+        name = f"query-{time.strftime('%Y%m%d-%H%M%S')}-{current_request_id() or os.getpid()}"
+        try:
+            if self.mode == "cprofile":
+                import cProfile
+                profile = cProfile.Profile()
+                profile.enable()
+                try:
+                    yield
+                finally:
+                    profile.disable()
+                    path = self._path(f"{name}.prof")
+                    profile.dump_stats(path)
+            else:
+                sampler = _StackSampler(PROFILER_STACK_INTERVAL)
+                sampler.start()
+                try:
+                    yield
+                finally:
+                    samples = sampler.stop()
+                    path = self._path(f"{name}.collapsed")
+                    with open(path, "w", encoding="utf-8") as f:
+                        for stack, count in samples.most_common():
+                            f.write(f"{stack} {count}\n")
+            self.profiled += 1
+            print(f"[Profiler] {(time.perf_counter() - start) * 1000:.0f} ms → {path}")
+        finally:
+            self._busy.release()
+
+    # --- Event loop bị chặn ---
+
+    def _on_stall(self, lag: float, stack: str):
+        """Gọi từ thread watchdog khi event loop bị chặn quá ngưỡng"""
+        self.stalls += 1
+        path = self._path(f"stall-{time.strftime('%Y%m%d-%H%M%S')}-{self.stalls}.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(f"Event loop bị chặn > {lag * 1000:.0f} ms (pid {os.getpid()})\n\n{stack}")
+        last_line = stack.strip().splitlines()[-2:] if stack.strip() else []
+        print(f"[WARN] Event loop bị chặn > {lag * 1000:.0f} ms tại: {' | '.join(s.strip() for s in last_line)} → {path}")
+
+    # --- tracemalloc ---
+
+    def snapshot(self, top: int = 25) -> str:
+        """
+        Chụp snapshot tracemalloc, so sánh với snapshot đầu tiên
+
+        Lần gọi đầu bật tracemalloc và lấy mốc; "off" tắt tracemalloc.
+
+        Returns:
+            Tóm tắt (RSS, top chỗ cấp phát tăng nhiều nhất) - đầy đủ trong file
+        """
+        import tracemalloc
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            self._baseline = None
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+        if self._baseline is None:
+            self._baseline = snapshot
+            stats = snapshot.statistics("lineno")
+            title = "Snapshot đầu tiên (baseline) - top cấp phát"
+        else:
+            stats = snapshot.compare_to(self._baseline, "lineno")
+            title = "Thay đổi so với baseline"
+
+        rss = _rss_mb()
+        lines = [f"{title} - RSS {rss:.1f} MB" if rss else title]
+        lines.extend(str(stat) for stat in stats[:top])
+        path = self._path(f"tracemalloc-{time.strftime('%Y%m%d-%H%M%S')}.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        return "\n".join(lines[:6]) + f"\n→ {path}"
+
+    def _signal_snapshot(self):
+        print(f"[Profiler] {self.snapshot()}")
+
+    def _path(self, filename: str) -> str:
+        os.makedirs(self.output_dir, exist_ok=True)
+        return os.path.join(self.output_dir, filename)
+
+
+_profiler: Optional[RuntimeProfiler] = None
+
+
+def get_profiler() -> RuntimeProfiler:
+    """Profiler của process hiện tại"""
+    global _profiler
+    if _profiler is None:
+        _profiler = RuntimeProfiler()
+    return _profiler
+
+
+def profile_query():
+    """Xem RuntimeProfiler.profile_query (context manager rỗng nếu chưa tạo profiler)"""
+    if _profiler is None or not _profiler.enabled:
+        return _NULL_CONTEXT
+    return _profiler.profile_query()
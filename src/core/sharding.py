@@ -0,0 +1,604 @@
+"""
+Sharding - Chia câu hỏi cho nhiều worker process theo user_id
+
+Nhiệm vụ:
+- Process chính (bot Telegram / API) chỉ nhận tin nhắn và chuyển đi
+- Mỗi worker process có 1 OrchestratorAgent riêng (embedding, pandas...
+  chạy song song trên nhiều core thay vì tranh nhau 1 GIL)
+- User được gán cố định cho 1 worker bằng consistent hashing → lịch sử
+  hội thoại của user nằm trong worker đó (file lịch sử riêng mỗi worker);
+  thêm/bớt worker chỉ làm ~1/N user đổi worker
+- Cache dùng chung giữa các worker: giá, lịch sử giá, danh sách mã
+  (data/shared_cache.py) và embedding (data/embedding_cache.py)
+- RAG chỉ có 1 chủ: process chính mở Chroma + BM25 (khi được gọi lần đầu),
+  worker tìm kiếm / nạp tin qua hàng đợi (_RemoteRAGTool). Chroma không hỗ
+  trợ nhiều process cùng ghi 1 thư mục, index trong RAM của mỗi worker sẽ
+  lệch nhau.
+- Nhiều process front-end (worker webhook) dùng chung 1 bộ shard:
+  FrontendOrchestrator gửi câu hỏi tới process chủ (serve_frontends), chỉ
+  process chủ chạy worker shard và giữ RAG
+- Mỗi câu hỏi gửi kèm request ID, thời gian còn lại của deadline và người
+  gọi vnstock; worker trả về các bước bị cắt bớt và span để process chính
+  gộp vào deadline / trace của nó.
+
+Module này không import orchestrator/vnstock/pandas: process chính nhẹ
+(model embedding chỉ được load khi worker cần RAG).
+"""
+import os
+import queue
+import atexit
+import bisect
+import asyncio
+import hashlib
+import itertools
+import threading
+import multiprocessing
+from concurrent.futures import Future, InvalidStateError
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from config.settings import (
+    DEFAULT_MODEL,
+    MEMORY_STORAGE_PATH,
+    SHARD_WORKERS,
+    SHARD_VIRTUAL_NODES,
+    SHARD_MEMORY_PATH,
+    SHARD_RAG_TIMEOUT,
+    SHARD_RAG_INGEST_TIMEOUT,
+    WARMUP_ENABLED,
+)
+from tools.rag_tool import RAGTool
+from services.upstream_scheduler import current_caller, upstream_caller
+from core.telemetry import (
+    request_trace,
+    current_request_id,
+    current_trace_report,
+    merge_trace,
+    collect_metric_deltas,
+    apply_metric_deltas,
+)
+from core.deadline import request_deadline
+from data.memory import load_memory_file, save_memory_file
+
+
+class HashRing:
+    """
+    Consistent hashing: key → node
+
+    Mỗi node có nhiều điểm (virtual node) trên vòng hash để chia đều tải.
+    """
+
+    def __init__(self, nodes: Sequence[int], virtual_nodes: int = SHARD_VIRTUAL_NODES):
+        """
+        Khởi tạo hash ring
+
+        Args:
+            nodes: Danh sách node (index của worker)
+            virtual_nodes: Số điểm trên vòng cho mỗi node
+        """
+        points = sorted(
+            (self._hash(f"{node}#{i}"), node)
+            for node in nodes
+            for i in range(virtual_nodes)
+        )
+        self._keys = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int.from_bytes(hashlib.md5(value.encode("utf-8")).digest()[:8], "big")
+
+    def node_for(self, key: str) -> int:
+        """Node phụ trách `key` (điểm đầu tiên theo chiều kim đồng hồ)"""
+        index = bisect.bisect(self._keys, self._hash(key)) % len(self._keys)
+        return self._nodes[index]
+
+
+def _seed_shard_memory(path: str, index: int, workers: int):
+    """
+    Tạo file lịch sử của worker từ file lịch sử chung (lần đầu bật sharding)
+
+    Chỉ giữ các user được gán cho worker này.
+    """
+    if os.path.exists(path) or not os.path.exists(MEMORY_STORAGE_PATH):
+        return
+    try:
+        history, summaries = load_memory_file(MEMORY_STORAGE_PATH)
+        ring = HashRing(range(workers))
+        owned = {user: messages for user, messages in history.items() if ring.node_for(user) == index}
+        save_memory_file(path, owned, {user: state for user, state in summaries.items() if user in owned})
+        print(f"[Shard {index}] Đã chuyển lịch sử của {len(owned)} user từ {MEMORY_STORAGE_PATH}")
+    except Exception as e:
+        print(f"[WARN] Không thể tạo lịch sử cho shard {index}: {e}")
+
+
+class _RAGClient:
+    """Gửi lệnh RAG từ worker tới process chính, nhận kết quả qua hàng đợi riêng của worker"""
+
+    def __init__(self, index: int, requests, responses):
+        self._index = index
+        self._requests = requests
+        self._responses = responses
+        self._pending: Dict[Tuple, Future] = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        threading.Thread(target=self._read, name="rag-client", daemon=True).start()
+
+    def submit(self, method: str, *args) -> Future:
+        future = Future()
+        call_id = (os.getpid(), next(self._ids))  # Kết quả gửi cho worker cũ (đã chết) bị bỏ qua
+        with self._lock:
+            self._pending[call_id] = future
+        self._requests.put((self._index, call_id, method, args))
+        return future
+
+    def _read(self):
+        while True:
+            try:
+                call_id, result, error = self._responses.get()
+            except (EOFError, OSError):
+                break
+            with self._lock:
+                future = self._pending.pop(call_id, None)
+            if future is None:
+                continue
+            try:
+                if error is not None:
+                    future.set_exception(RuntimeError(error))
+                else:
+                    future.set_result(result)
+            except InvalidStateError:
+                pass  # Người gọi đã hủy (vd: hết deadline)
+
+
+class _RemoteRAGTool(RAGTool):
+    """RAGTool của worker: tìm kiếm / lưu tài liệu ở process chính, chia chunk tại chỗ"""
+
+    def __init__(self, client: _RAGClient):
+        super().__init__()
+        self._client = client
+
+    def query(self, query_text: str, top_k: int = 3, filters: Optional[Dict] = None) -> List[Dict]:
+        try:
+            return self._client.submit("query", query_text, top_k, filters).result(SHARD_RAG_TIMEOUT)
+        except Exception as e:
+            print(f"[WARN] RAG query failed: {type(e).__name__}: {e}")
+            return []
+
+    async def aquery(self, query_text: str, top_k: int = 3, filters: Optional[Dict] = None) -> List[Dict]:
+        try:
+            future = asyncio.wrap_future(self._client.submit("query", query_text, top_k, filters))
+            return await asyncio.wait_for(future, SHARD_RAG_TIMEOUT)
+        except Exception as e:
+            print(f"[WARN] RAG query failed: {type(e).__name__}: {e}")
+            return []
+
+    def add_documents(self, texts: List[str], metadatas: List[Dict]):
+        try:
+            self._client.submit("add_documents", texts, metadatas).result(SHARD_RAG_INGEST_TIMEOUT)
+        except Exception as e:
+            print(f"[WARN] RAG add_documents failed: {type(e).__name__}: {e}")
+
+
+_rag_client: Optional[_RAGClient] = None  # Đặt trong worker process (_worker_main)
+
+
+def default_worker_orchestrator(index: int, workers: int):
+    """Tạo OrchestratorAgent cho worker `index` (lịch sử hội thoại riêng, RAG qua process chính)"""
+    from core.orchestrator import OrchestratorAgent
+    from data.memory import ConversationMemory
+
+    path = SHARD_MEMORY_PATH.format(index=index)
+    _seed_shard_memory(path, index, workers)
+    return OrchestratorAgent(
+        model_name=DEFAULT_MODEL,
+        memory=ConversationMemory(storage_path=path),
+        rag_tool=_RemoteRAGTool(_rag_client) if _rag_client is not None else None,
+    )
+
+
+async def _worker_loop(orchestrator, requests, responses):
+    """Nhận câu hỏi từ hàng đợi, xử lý song song, tuần tự trong từng user"""
+    loop = asyncio.get_running_loop()
+    tasks = set()
+    user_locks: Dict[str, asyncio.Lock] = {}
+    user_pending: Dict[str, int] = {}
+
+    async def handle(item: Tuple):
+        kind, request_id, user_id = item[:3]
+        lock = user_locks.setdefault(user_id, asyncio.Lock())
+        user_pending[user_id] = user_pending.get(user_id, 0) + 1
+        try:
+            async with lock:
+                if kind == "clear":
+                    orchestrator.memory.clear_history(user_id)
+                    return
+                # Context của process chính: request ID (trace), thời gian còn lại
+                # (deadline), người gọi vnstock (upstream_caller)
+                context = item[4]
+                priority, caller_id = context["caller"]
+                report = {}
+                try:
+                    with request_trace("shard", request_id=context["request_id"], record=False), \
+                            request_deadline(context["budget"]) as deadline, \
+                            upstream_caller(user_id=caller_id or None, priority=priority):
+                        try:
+                            answer = await orchestrator.handle_query(item[3], user_id=user_id)
+                        finally:
+                            report = {
+                                "degraded": list(deadline.degraded) if deadline else [],
+                                "stale": list(deadline.stale) if deadline else [],
+                                "trace": current_trace_report(),
+                            }
+                    error = None
+                except Exception as e:
+                    print(f"[WARN] Worker xử lý câu hỏi thất bại: {e}")
+                    answer, error = None, str(e)
+                # Metrics đo trong process này (kể cả việc chạy nền) được ghi ở process nhận câu hỏi
+                report["metrics"] = collect_metric_deltas()
+                responses.put((request_id, answer, error, report))
+        finally:
+            user_pending[user_id] -= 1
+            if not user_pending[user_id]:
+                del user_pending[user_id]
+                del user_locks[user_id]
+
+    while True:
+        item = await loop.run_in_executor(None, requests.get)
+        if item is None:  # Tín hiệu dừng
+            break
+        task = asyncio.create_task(handle(item))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    if tasks:
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def _worker_main(index: int, workers: int, requests, responses, worker_factory: Callable, rag_requests, rag_responses):
+    """Hàm chạy trong worker process"""
+    global _rag_client
+    _rag_client = _RAGClient(index, rag_requests, rag_responses)
+
+    async def run():
+        from core.runtime_profiler import get_profiler
+        get_profiler().install()  # SIGUSR1 / SIGUSR2 tới pid của worker
+        orchestrator = worker_factory(index, workers)
+        if WARMUP_ENABLED and hasattr(orchestrator, "stock_agent"):
+            # Câu hỏi đến trong lúc warm-up nằm chờ trong hàng đợi
+            from core.warmup import warm_up
+            await warm_up(orchestrator)
+        print(f"[Shard {index}] Worker {os.getpid()} sẵn sàng")
+        await _worker_loop(orchestrator, requests, responses)
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+class _ShardMemoryProxy:
+    """Thay cho `orchestrator.memory` ở process chính: chuyển lệnh tới worker của user"""
+
+    def __init__(self, client: "_ShardClient"):
+        self._client = client
+
+    def clear_history(self, user_id: str):
+        self._client._send(("clear", None, str(user_id)))
+
+
+class _ShardClient:
+    """
+    Phía gửi câu hỏi: đưa câu hỏi (kèm context) vào hàng đợi, 1 thread đọc
+    kết quả và trả về cho coroutine đang chờ
+    """
+
+    def __init__(self, responses):
+        self.memory = _ShardMemoryProxy(self)
+        self._responses = responses
+        self._pending: Dict[object, Tuple[asyncio.Future, int, Dict]] = {}
+        self._ids = itertools.count()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._reader: Optional[threading.Thread] = None
+        self._stopping = False
+
+    def _worker_for(self, user_id: str) -> int:
+        raise NotImplementedError
+
+    def _send(self, item: Tuple):
+        raise NotImplementedError
+
+    def _next_id(self):
+        return next(self._ids)
+
+    def _check_workers(self):
+        """Gọi định kỳ trong thread đọc kết quả"""
+
+    def _ensure_reader(self):
+        loop = asyncio.get_running_loop()
+        if self._reader is None or self._loop is not loop:
+            self._loop = loop
+            self._reader = threading.Thread(target=self._read_responses, name="shard-reader", daemon=True)
+            self._reader.start()
+
+    def _read_responses(self):
+        """Thread đọc kết quả từ worker, đồng thời theo dõi worker bị chết"""
+        while not self._stopping:
+            try:
+                request_id, answer, error, report = self._responses.get(timeout=1)
+                apply_metric_deltas(report.pop("metrics", {}))
+                self._loop.call_soon_threadsafe(self._resolve, request_id, answer, error, report)
+            except queue.Empty:
+                pass
+            except (EOFError, OSError, RuntimeError):
+                break  # Queue đã đóng hoặc event loop đã dừng
+            self._check_workers()
+
+    def _resolve(self, request_id, answer: Optional[str], error: Optional[str], report: Optional[Dict]):
+        entry = self._pending.pop(request_id, None)
+        if entry is None or entry[0].done():
+            return
+        entry[2].update(report or {})
+        if error is not None:
+            entry[0].set_exception(RuntimeError(error))
+        else:
+            entry[0].set_result(answer)
+
+    def _fail_worker(self, index: int):
+        for request_id, (future, worker, _) in list(self._pending.items()):
+            if worker == index:
+                del self._pending[request_id]
+                if not future.done():
+                    future.set_exception(RuntimeError(f"Shard worker {index} bị dừng"))
+
+    async def handle_query(
+        self, query: str, user_id: str = "default", on_chunk=None, budget: Optional[float] = None
+    ) -> str:
+        """
+        Gửi câu hỏi tới worker của user và chờ câu trả lời
+
+        Worker nhận kèm request ID, thời gian còn lại của deadline và người gọi
+        vnstock; các bước bị cắt bớt / dữ liệu cũ và span của worker được gộp
+        lại vào deadline / trace ở process chính.
+
+        Args:
+            query: Câu hỏi
+            user_id: ID người dùng (quyết định worker)
+            on_chunk: Nhận cả câu trả lời 1 lần (worker không stream)
+            budget: Ngân sách thời gian (giây), None = REQUEST_BUDGET
+
+        Returns:
+            Câu trả lời
+        """
+        self._ensure_reader()
+        user_id = str(user_id)
+        with request_trace("query"), request_deadline(budget) as deadline, upstream_caller(user_id=user_id):
+            request_id = self._next_id()
+            future = self._loop.create_future()
+            report: Dict = {}
+            self._pending[request_id] = (future, self._worker_for(user_id), report)
+            context = {
+                "request_id": current_request_id(),
+                # <= 0 → worker không giới hạn; đã quá hạn vẫn gửi số dương nhỏ
+                "budget": max(deadline.remaining(), 0.001) if deadline else 0,
+                "caller": current_caller(),
+            }
+            self._send(("query", request_id, user_id, query, context))
+            try:
+                answer = await future
+            finally:
+                if deadline and report:
+                    deadline.merge(report["degraded"], report["stale"])
+                merge_trace(report.get("trace"))
+        if on_chunk is not None:
+            await on_chunk(answer)
+        return answer
+
+
+class ShardedOrchestrator(_ShardClient):
+    """
+    Thay thế OrchestratorAgent: chuyển câu hỏi tới worker process theo user_id
+
+    Cùng interface `await handle_query(query, user_id)` nên bot Telegram
+    và API server dùng được mà không cần sửa. Worker bị chết được khởi
+    động lại, các câu hỏi đang chờ của worker đó trả về lỗi.
+    """
+
+    def __init__(self, workers: int = SHARD_WORKERS, worker_factory: Callable = default_worker_orchestrator):
+        """
+        Khởi tạo và chạy các worker
+
+        Args:
+            workers: Số worker process
+            worker_factory: Hàm (index, workers) → orchestrator, chạy trong worker
+                (phải import được ở module level để dùng với spawn)
+        """
+        # spawn: worker không thừa hưởng thread / event loop của process chính
+        self._context = multiprocessing.get_context("spawn")
+        super().__init__(self._context.Queue())
+        self.workers = max(1, workers)
+        self.worker_factory = worker_factory
+        self.ring = HashRing(range(self.workers))
+
+        self._requests = [None] * self.workers
+        self._rag_requests = self._context.Queue()  # Lệnh RAG của mọi worker → process chính
+        self._rag_responses = [None] * self.workers
+        self._rag_tool = None  # RAGTool duy nhất (mở khi worker cần lần đầu)
+        self._rag_lock = threading.Lock()
+        self._rag_server: Optional[threading.Thread] = None
+        self._processes = [None] * self.workers
+
+        for index in range(self.workers):
+            self._start_worker(index)
+        self._rag_server = threading.Thread(target=self._serve_rag, name="shard-rag", daemon=True)
+        self._rag_server.start()
+        atexit.register(self.stop)
+        print(f"ShardedOrchestrator: {self.workers} worker process")
+
+    def _start_worker(self, index: int):
+        self._requests[index] = self._context.Queue()
+        self._rag_responses[index] = self._context.Queue()
+        process = self._context.Process(
+            target=_worker_main,
+            args=(
+                index, self.workers, self._requests[index], self._responses, self.worker_factory,
+                self._rag_requests, self._rag_responses[index],
+            ),
+            name=f"shard-worker-{index}",
+            daemon=True,
+        )
+        process.start()
+        self._processes[index] = process
+
+    def _get_rag_tool(self):
+        """RAGTool của process chính - chủ duy nhất của Chroma / BM25 (None nếu lỗi)"""
+        with self._rag_lock:  # Các worker warm-up cùng lúc
+            if self._rag_tool is None:
+                try:
+                    from tools.rag_tool import RAGTool
+                    self._rag_tool = RAGTool()
+                except Exception as e:
+                    print(f"[WARN] Không thể khởi tạo RAG tool: {e}")
+                    self._rag_tool = False
+            return self._rag_tool or None
+
+    def _serve_rag(self):
+        """Thread xử lý lệnh RAG của worker (tìm kiếm song song để gom batch embedding)"""
+        async def handle(item: Tuple):
+            index, call_id, method, args = item
+            result, error = None, None
+            try:
+                rag_tool = await asyncio.to_thread(self._get_rag_tool)
+                if method == "query":
+                    result = await rag_tool.aquery(*args) if rag_tool else []
+                elif method == "add_documents" and rag_tool:
+                    await asyncio.to_thread(rag_tool.add_documents, *args)
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            try:
+                self._rag_responses[index].put((call_id, result, error))
+            except (OSError, ValueError):
+                pass  # Worker đang khởi động lại
+
+        async def serve():
+            loop = asyncio.get_running_loop()
+            tasks = set()
+            while True:
+                item = await loop.run_in_executor(None, self._rag_requests.get)
+                if item is None:  # Tín hiệu dừng
+                    break
+                task = asyncio.create_task(handle(item))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+
+        asyncio.run(serve())
+
+    def _worker_for(self, user_id: str) -> int:
+        return self.ring.node_for(user_id)
+
+    def _send(self, item: Tuple):
+        self._requests[self._worker_for(item[2])].put(item)
+
+    def _check_workers(self):
+        for index, process in enumerate(self._processes):
+            if not self._stopping and process is not None and not process.is_alive():
+                print(f"[WARN] Shard worker {index} đã dừng (exit code {process.exitcode}), khởi động lại")
+                self._start_worker(index)
+                self._loop.call_soon_threadsafe(self._fail_worker, index)
+
+    def stop(self, timeout: float = 5.0):
+        """Dừng các worker (chờ câu hỏi đang xử lý xong trong `timeout` giây)"""
+        if self._stopping:
+            return
+        self._stopping = True
+        for requests in self._requests:
+            requests.put(None)
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+        self._rag_requests.put(None)
+
+
+class FrontendOrchestrator(_ShardClient):
+    """
+    Orchestrator của process front-end (worker webhook): không giữ state
+
+    Câu hỏi được chuyển tới process chủ (serve_frontends), nơi có bộ shard
+    duy nhất giữ lịch sử hội thoại và RAG.
+    """
+
+    def __init__(self, index: int, requests, responses):
+        """
+        Args:
+            index: Số thứ tự của front-end (kết quả được gửi về đúng hàng đợi)
+            requests: Hàng đợi câu hỏi chung của các front-end
+            responses: Hàng đợi kết quả riêng của front-end này
+        """
+        super().__init__(responses)
+        self.index = index
+        self._requests = requests
+
+    def _worker_for(self, user_id: str) -> int:
+        return 0
+
+    def _next_id(self):
+        return (self.index, next(self._ids))
+
+    def _send(self, item: Tuple):
+        self._requests.put(item)
+
+
+class _ReplyRouter:
+    """Trả kết quả về hàng đợi của front-end đã gửi câu hỏi (request_id = (index, n))"""
+
+    def __init__(self, responses: List):
+        self._responses = responses
+
+    def put(self, item: Tuple):
+        self._responses[item[0][0]].put(item)
+
+
+def serve_frontends(orchestrator: ShardedOrchestrator, requests, responses: List) -> threading.Thread:
+    """
+    Phục vụ câu hỏi của các FrontendOrchestrator bằng bộ shard của process chủ
+
+    Chạy `_worker_loop` trong 1 thread riêng (giống worker shard: context của
+    câu hỏi được khôi phục, kết quả kèm báo cáo deadline / trace).
+
+    Args:
+        orchestrator: Bộ shard duy nhất
+        requests: Hàng đợi câu hỏi chung của các front-end (None = dừng)
+        responses: Hàng đợi kết quả của từng front-end
+    """
+    thread = threading.Thread(
+        target=lambda: asyncio.run(_worker_loop(orchestrator, requests, _ReplyRouter(responses))),
+        name="shard-frontends",
+        daemon=True,
+    )
+    thread.start()
+    return thread
+
+
+_frontend: Optional[Tuple] = None  # (index, requests, responses) trong process front-end
+
+
+def use_frontend(index: int, requests, responses):
+    """Đánh dấu process hiện tại là front-end: create_orchestrator trả về FrontendOrchestrator"""
+    global _frontend
+    _frontend = (index, requests, responses)
+
+
+def create_orchestrator(workers: int = SHARD_WORKERS):
+    """
+    Tạo orchestrator theo cấu hình
+
+    Args:
+        workers: Số worker process (0 = OrchestratorAgent trong process hiện tại;
+            bỏ qua trong process front-end)
+    """
+    if _frontend is not None:
+        return FrontendOrchestrator(*_frontend)
+    if workers > 0:
+        return ShardedOrchestrator(workers)
+    from core.orchestrator import OrchestratorAgent
+    return OrchestratorAgent(model_name=DEFAULT_MODEL)
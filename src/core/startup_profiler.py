@@ -0,0 +1,138 @@
+"""
+Startup Profiler - Đo thời gian import và khởi tạo (python main.py --profile-startup)
+
+Báo cáo:
+- Thời gian import theo package (đo bằng `python -X importtime` trong
+  process riêng, nên module đã import trước đó không làm sai kết quả)
+- Các module import chậm nhất (thời gian tích lũy)
+- Thời gian từng bước khởi tạo: import, tạo orchestrator, và các phần
+  chỉ được load ở lần dùng đầu (danh sách mã, LLM client, RAG)
+"""
+import os
+import sys
+import time
+import subprocess
+from collections import defaultdict
+from typing import Callable, Dict, List
+
+# Module gốc cần import cho từng chế độ chạy
+MODE_MODULES = {
+    "cli": ["core.orchestrator"],
+    "telegram": ["core.bot"],
+    "webhook": ["core.webhook"],
+    "api": ["core.api_server"],
+}
+
+
+def measure_imports(modules: List[str]) -> List[Dict]:
+    """
+    Đo thời gian import bằng `-X importtime` trong process mới
+
+    Args:
+        modules: Các module cần import (như khi chạy thật)
+
+    Returns:
+        Danh sách {"module", "self_ms", "cumulative_ms", "depth"} theo thứ tự import
+    """
+    src_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    code = f"import sys; sys.path.insert(0, {src_path!r})\n" + "\n".join(f"import {m}" for m in modules)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        env=os.environ.copy(),
+    )
+    if result.returncode != 0:
+        print(f"[WARN] Import thất bại:\n{result.stderr.splitlines()[-1] if result.stderr else ''}")
+
+    entries = []
+    for line in result.stderr.splitlines():
+        # "import time:   self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|")
+            entries.append({
+                "module": name.strip(),
+                "self_ms": int(self_us) / 1000,
+                "cumulative_ms": int(cumulative_us) / 1000,
+                "depth": (len(name) - len(name.lstrip())) // 2,
+            })
+        except ValueError:
+            continue
+    return entries
+
+
+def _time_step(name: str, step: Callable, results: List[Dict]):
+    start = time.perf_counter()
+    error = None
+    value = None
+    try:
+        value = step()
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    results.append({"step": name, "ms": (time.perf_counter() - start) * 1000, "error": error})
+    return value
+
+
+def measure_initialization() -> List[Dict]:
+    """
+    Đo thời gian các bước khởi tạo trong process hiện tại
+
+    Các bước "lần dùng đầu" có thể gọi mạng (danh sách mã) hoặc load
+    model; lỗi được ghi lại thay vì dừng báo cáo.
+    """
+    results: List[Dict] = []
+
+    def import_orchestrator():
+        from core.orchestrator import OrchestratorAgent
+        return OrchestratorAgent
+
+    orchestrator_cls = _time_step("import core.orchestrator", import_orchestrator, results)
+    if orchestrator_cls is None:
+        return results
+    orchestrator = _time_step("OrchestratorAgent()", orchestrator_cls, results)
+    if orchestrator is None:
+        return results
+
+    _time_step("lần dùng đầu: LLM client", lambda: orchestrator.llm_service.client, results)
+    _time_step("lần dùng đầu: danh sách mã (StockAgent)", lambda: orchestrator.stock_agent.valid_symbols, results)
+    _time_step("lần dùng đầu: RAG tool", orchestrator._get_rag_tool, results)
+    return results
+
+
+def profile_startup(mode: str = "cli", top: int = 15):
+    """
+    In báo cáo thời gian khởi động
+
+    Args:
+        mode: Chế độ chạy (cli, telegram, webhook, api)
+        top: Số module chậm nhất được in
+    """
+    modules = MODE_MODULES.get(mode, MODE_MODULES["cli"])
+    print("=" * 60)
+    print(f"Startup profile - mode {mode} ({', '.join(modules)})")
+    print("=" * 60)
+
+    entries = measure_imports(modules)
+    total_ms = sum(e["self_ms"] for e in entries)
+
+    by_package = defaultdict(float)
+    for entry in entries:
+        by_package[entry["module"].split(".")[0]] += entry["self_ms"]
+
+    print(f"\nImport: {total_ms:.0f} ms, {len(entries)} module")
+    print(f"\n{'package':<30}{'ms':>10}{'%':>7}")
+    for package, ms in sorted(by_package.items(), key=lambda item: -item[1])[:top]:
+        print(f"{package:<30}{ms:>10.1f}{ms / total_ms * 100 if total_ms else 0:>7.1f}")
+
+    print(f"\n{'module (tích lũy)':<50}{'ms':>10}")
+    for entry in sorted(entries, key=lambda e: -e["cumulative_ms"])[:top]:
+        print(f"{entry['module']:<50}{entry['cumulative_ms']:>10.1f}")
+
+    print(f"\n{'bước khởi tạo':<50}{'ms':>10}")
+    for step in measure_initialization():
+        line = f"{step['step']:<50}{step['ms']:>10.1f}"
+        if step["error"]:
+            line += f"  [lỗi: {step['error'][:60]}]"
+        print(line)
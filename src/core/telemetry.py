@@ -0,0 +1,435 @@
+"""
+Telemetry - Đo thời gian từng bước xử lý câu hỏi và xuất metrics
+
+Chức năng:
+- Mỗi câu hỏi có 1 trace với request ID; các bước (ghi memory, LLM phân
+  loại, RAG, agent, LLM format, gửi Telegram) là các span đo thời gian
+- Metrics dạng Prometheus: histogram thời gian theo bước / theo intent,
+  counter số request, số token LLM (từ response.usage)
+- Mỗi trace hoàn tất được ghi 1 dòng JSON vào TELEMETRY_LOG_PATH
+- Endpoint /metrics: route của API / webhook server, hoặc HTTP server
+  riêng (start_metrics_server) cho chế độ polling
+- Worker shard không có /metrics: phần tăng thêm của metrics
+  (collect_metric_deltas) được gửi kèm kết quả về process nhận câu hỏi
+  và cộng vào metrics ở đó (apply_metric_deltas)
+
+Khi TELEMETRY_ENABLED = False, span() chỉ trả về 1 context manager rỗng
+dùng chung (không đo thời gian, không cấp phát).
+
+Ví dụ:
+    with request_trace("telegram", user_id=user_id):
+        with span("routing_llm"):
+            ...
+"""
+import json
+import time
+import uuid
+import bisect
+import threading
+import contextvars
+from types import SimpleNamespace
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from config.settings import (
+    TELEMETRY_ENABLED,
+    TELEMETRY_LOG_PATH,
+    TELEMETRY_LATENCY_BUCKETS,
+)
+
+_NULL_CONTEXT = nullcontext()
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("telemetry_trace", default=None)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+class Counter:
+    """Counter có label (chỉ tăng)"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values: Dict[Tuple, float] = {}
+        self._sent: Dict[Tuple, float] = {}  # Giá trị ở lần take_delta trước
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def take_delta(self) -> Dict[Tuple, float]:
+        """Phần thay đổi kể từ lần gọi trước"""
+        with self._lock:
+            delta = {
+                key: value - self._sent.get(key, 0.0)
+                for key, value in self._values.items()
+                if value != self._sent.get(key, 0.0)
+            }
+            self._sent = dict(self._values)
+        return delta
+
+    def apply_delta(self, delta: Dict[Tuple, float]):
+        """Cộng phần thay đổi từ process khác"""
+        with self._lock:
+            for key, amount in delta.items():
+                self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, key)} {value:g}")
+        return lines
+
+
+class Gauge(Counter):
+    """Gauge có label (tăng / giảm, vd: số request đang chờ)"""
+
+    kind = "gauge"
+
+
+class Histogram:
+    """Histogram có label, bucket cố định (giây)"""
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labels: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = TELEMETRY_LATENCY_BUCKETS,
+    ):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple, List] = {}  # key → [đếm theo bucket..., sum, count]
+        self._sent: Dict[Tuple, List] = {}  # Giá trị ở lần take_delta trước
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def take_delta(self) -> Dict[Tuple, List]:
+        """Phần thay đổi kể từ lần gọi trước"""
+        with self._lock:
+            delta = {}
+            for key, series in self._series.items():
+                sent = self._sent.get(key)
+                if sent is None or sent[-1] != series[-1]:
+                    delta[key] = list(series) if sent is None else [a - b for a, b in zip(series, sent)]
+            self._sent = {key: list(series) for key, series in self._series.items()}
+        return delta
+
+    def apply_delta(self, delta: Dict[Tuple, List]):
+        """Cộng phần thay đổi từ process khác"""
+        with self._lock:
+            for key, values in delta.items():
+                series = self._series.get(key)
+                if series is None:
+                    series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+                for i, value in enumerate(values):
+                    series[i] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        label_names = self.labels + ("le",)
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), series):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                    lines.append(f"{self.name}_bucket{_format_labels(label_names, key + (le,))} {cumulative}")
+                labels = _format_labels(self.labels, key)
+                lines.append(f"{self.name}_sum{labels} {series[-2]:.6f}")
+                lines.append(f"{self.name}_count{labels} {series[-1]}")
+        return lines
+
+
+# Metrics của bot
+REQUESTS = Counter("bot_requests_total", "Số câu hỏi đã xử lý", ("source", "intent", "status"))
+REQUEST_DURATION = Histogram("bot_request_duration_seconds", "Thời gian xử lý 1 câu hỏi", ("source", "intent"))
+STAGE_DURATION = Histogram("bot_stage_duration_seconds", "Thời gian từng bước xử lý", ("stage",))
+STAGE_ERRORS = Counter("bot_stage_errors_total", "Số bước xử lý bị lỗi", ("stage",))
+LLM_REQUESTS = Counter("llm_requests_total", "Số lần gọi LLM", ("model", "status"))
+LLM_TOKENS = Counter("llm_tokens_total", "Số token LLM (theo response.usage)", ("model", "type"))
+LOOP_STALLS = Counter("event_loop_stalls_total", "Số lần event loop bị chặn quá ngưỡng (runtime_profiler)")
+DEADLINE_OVERRUNS = Counter(
+    "bot_deadline_overruns_total", "Số bước bị bỏ qua / quá hạn theo ngân sách thời gian (deadline)", ("stage", "action")
+)
+STALE_RESPONSES = Counter("bot_stale_responses_total", "Số lần trả lời bằng dữ liệu cũ do hết thời gian", ("data",))
+MARKET_DATA_DURATION = Histogram(
+    "market_data_request_duration_seconds", "Thời gian gọi nguồn dữ liệu giá (vnstock)", ("source", "kind", "status")
+)
+MARKET_DATA_HEDGES = Counter("market_data_hedges_total", "Số request được gửi thêm tới nguồn khác (hedge)", ("source", "kind"))
+MARKET_BREAKER_TRANSITIONS = Counter(
+    "market_data_breaker_transitions_total", "Số lần circuit breaker của nguồn đổi trạng thái", ("source", "state")
+)
+MARKET_QUEUE_DEPTH = Gauge(
+    "market_data_queue_depth", "Số request đang chờ lượt gọi nguồn giá (rate limit)", ("source", "priority")
+)
+MARKET_QUEUE_WAIT = Histogram(
+    "market_data_queue_wait_seconds", "Thời gian chờ lượt gọi nguồn giá", ("source", "priority")
+)
+MARKET_RATE_LIMITED = Counter(
+    "market_data_rate_limited_total", "Số request không tới lượt gọi nguồn giá trong thời gian cho phép", ("source", "priority")
+)
+
+METRICS = [
+    REQUESTS, REQUEST_DURATION, STAGE_DURATION, STAGE_ERRORS, LLM_REQUESTS, LLM_TOKENS, LOOP_STALLS,
+    DEADLINE_OVERRUNS, STALE_RESPONSES, MARKET_DATA_DURATION, MARKET_DATA_HEDGES, MARKET_BREAKER_TRANSITIONS,
+    MARKET_QUEUE_DEPTH, MARKET_QUEUE_WAIT, MARKET_RATE_LIMITED,
+]
+
+
+def collect_metric_deltas() -> Dict[str, Dict]:
+    """Phần thay đổi của mọi metric kể từ lần gọi trước ({tên metric: delta})"""
+    deltas = {}
+    for metric in METRICS:
+        delta = metric.take_delta()
+        if delta:
+            deltas[metric.name] = delta
+    return deltas
+
+
+def apply_metric_deltas(deltas: Dict[str, Dict]):
+    """Cộng metrics do process khác đo (collect_metric_deltas) vào process hiện tại"""
+    by_name = {metric.name: metric for metric in METRICS}
+    for name, delta in deltas.items():
+        if name in by_name:
+            by_name[name].apply_delta(delta)
+
+
+def render_metrics() -> str:
+    """Toàn bộ metrics theo định dạng text của Prometheus"""
+    lines: List[str] = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class Trace:
+    """Trace của 1 câu hỏi: request ID, thuộc tính và các span"""
+
+    __slots__ = ("request_id", "source", "attributes", "spans", "start")
+
+    def __init__(self, source: str, request_id: Optional[str] = None, **attributes):
+        self.request_id = request_id or uuid.uuid4().hex[:12]
+        self.source = source
+        self.attributes = attributes
+        self.spans: List[Dict] = []
+        self.start = time.perf_counter()
+
+
+def current_request_id() -> Optional[str]:
+    """Request ID của trace hiện tại (None nếu không có / telemetry tắt)"""
+    trace = _current_trace.get()
+    return trace.request_id if trace is not None else None
+
+
+def set_attribute(name: str, value):
+    """Gắn thuộc tính (vd: intent) cho trace hiện tại"""
+    if TELEMETRY_ENABLED:
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.attributes[name] = value
+
+
+@contextmanager
+def _span(stage: str, trace: Optional[Trace]) -> Iterator[None]:
+    start = time.perf_counter()
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        STAGE_DURATION.observe(duration, stage=stage)
+        if error is not None:
+            STAGE_ERRORS.inc(stage=stage)
+        if trace is not None:
+            trace.spans.append({
+                "stage": stage,
+                "start_ms": round((start - trace.start) * 1000, 2),
+                "ms": round(duration * 1000, 2),
+                **({"error": error} if error else {}),
+            })
+
+
+def span(stage: str):
+    """
+    Đo thời gian 1 bước xử lý (context manager)
+
+    Args:
+        stage: Tên bước (memory_write, routing_llm, rag_retrieval, agent, format_llm, telegram_send)
+    """
+    if not TELEMETRY_ENABLED:
+        return _NULL_CONTEXT
+    return _span(stage, _current_trace.get())
+
+
+@contextmanager
+def _request_trace(source: str, request_id: Optional[str], record: bool, attributes: Dict) -> Iterator[Trace]:
+    trace = Trace(source, request_id, **attributes)
+    token = _current_trace.set(trace)
+    status = "ok"
+    try:
+        yield trace
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        _current_trace.reset(token)
+        if not record:
+            return
+        duration = time.perf_counter() - trace.start
+        intent = trace.attributes.get("intent", "unknown")
+        REQUESTS.inc(source=source, intent=intent, status=status)
+        REQUEST_DURATION.observe(duration, source=source, intent=intent)
+        _write_log({
+            "request_id": trace.request_id,
+            "source": source,
+            "status": status,
+            "ms": round(duration * 1000, 2),
+            **trace.attributes,
+            "spans": trace.spans,
+        })
+
+
+def request_trace(source: str, request_id: Optional[str] = None, record: bool = True, **attributes):
+    """
+    Bắt đầu trace cho 1 câu hỏi (context manager)
+
+    Nếu đã có trace đang chạy (vd: bot đã mở trace trước khi gọi
+    orchestrator) thì dùng lại trace đó.
+
+    Args:
+        source: Nơi nhận câu hỏi (telegram, api, cli, ...)
+        request_id: Dùng request ID có sẵn (vd: của process chính khi chạy
+            trong worker shard), None = tạo mới
+        record: False = phần tiếp nối của trace ở process khác (worker shard):
+            không ghi log / metrics của request, process nhận câu hỏi ghi
+        attributes: Thuộc tính ghi vào log (không ghi nội dung câu hỏi)
+    """
+    if not TELEMETRY_ENABLED or _current_trace.get() is not None:
+        return _NULL_CONTEXT
+    return _request_trace(source, request_id, record, attributes)
+
+
+def current_trace_report() -> Optional[Dict]:
+    """Thuộc tính và span của trace hiện tại (gửi từ worker shard về process chính)"""
+    trace = _current_trace.get()
+    if trace is None:
+        return None
+    return {"attributes": dict(trace.attributes), "spans": list(trace.spans)}
+
+
+def merge_trace(report: Optional[Dict]):
+    """Gộp thuộc tính và span do process khác đo (current_trace_report) vào trace hiện tại"""
+    trace = _current_trace.get()
+    if trace is None or not report:
+        return
+    trace.attributes.update(report["attributes"])
+    trace.spans.extend(report["spans"])
+
+
+def record_llm_usage(model: str, usage, status: str = "ok"):
+    """
+    Ghi lại 1 lần gọi LLM và số token (response.usage của OpenAI client)
+
+    Args:
+        model: Tên model
+        usage: Object / dict usage (prompt_tokens, completion_tokens) hoặc None
+        status: "ok" hoặc "error"
+    """
+    if not TELEMETRY_ENABLED:
+        return
+    LLM_REQUESTS.inc(model=model, status=status)
+    if usage is None:
+        return
+    if isinstance(usage, dict):  # Trường mở rộng (vd: x_groq.usage) không được parse thành object
+        usage = SimpleNamespace(**usage)
+    for token_type in ("prompt_tokens", "completion_tokens"):
+        count = getattr(usage, token_type, None)
+        if count:
+            LLM_TOKENS.inc(count, model=model, type=token_type.split("_")[0])
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.attributes["llm_tokens"] = trace.attributes.get("llm_tokens", 0) + (
+            getattr(usage, "total_tokens", None) or 0
+        )
+
+
+_log_lock = threading.Lock()
+
+
+def _write_log(record: Dict):
+    if not TELEMETRY_LOG_PATH:
+        return
+    line = json.dumps(record, ensure_ascii=False) + "\n"
+    try:
+        with _log_lock, open(TELEMETRY_LOG_PATH, "a", encoding="utf-8") as f:
+            f.write(line)
+    except Exception as e:
+        print(f"[WARN] Không ghi được telemetry log: {e}")
+
+
+async def handle_metrics(request):
+    """Route GET /metrics cho aiohttp server (API, webhook)"""
+    from aiohttp import web
+    return web.Response(text=render_metrics(), content_type="text/plain", headers={"X-Metrics-Format": "0.0.4"})
+
+
+def start_metrics_server(host: str, port: int):
+    """
+    Chạy HTTP server nhỏ (thread nền) phục vụ GET /metrics
+
+    Dùng cho chế độ không có HTTP server sẵn (Telegram polling).
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render_metrics().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    try:
+        server = ThreadingHTTPServer((host, port), Handler)
+    except OSError as e:
+        print(f"[WARN] Không mở được metrics server {host}:{port}: {e}")
+        return None
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    print(f"[Telemetry] Metrics: http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,142 @@
+"""
+Update Processor - Xử lý đồng thời các update Telegram
+
+Nhiệm vụ:
+- Xử lý nhiều update cùng lúc (tối đa N handler chạy song song)
+- Tin nhắn của cùng 1 user vẫn được xử lý đúng thứ tự (hàng đợi riêng mỗi user)
+- Quá tải: trả lời nhanh "bot đang bận" thay vì để hàng đợi dài vô hạn
+
+Mặc định python-telegram-bot xử lý từng update một, nên 1 câu hỏi tư vấn
+chậm làm mọi user khác phải chờ.
+"""
+import asyncio
+from typing import Any, Awaitable, Dict, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from config.settings import (
+    BOT_MAX_CONCURRENT_UPDATES,
+    BOT_MAX_PENDING_UPDATES,
+    BOT_MAX_PENDING_PER_USER,
+    BOT_BUSY_MESSAGE,
+)
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """
+    Update processor: song song giữa các user, tuần tự trong từng user
+
+    - Mỗi user có 1 asyncio.Lock (hàng đợi FIFO): update sau chỉ chạy khi
+      update trước của user đó đã xong
+    - Semaphore toàn cục giới hạn số handler đang chạy; user chờ lượt
+      của chính mình không chiếm chỗ của user khác
+    - Khi số update đang chờ vượt giới hạn (toàn cục hoặc của 1 user),
+      update mới được trả lời "bận" ngay và bỏ qua
+    """
+
+    def __init__(
+        self,
+        max_concurrent_updates: int = BOT_MAX_CONCURRENT_UPDATES,
+        max_pending_updates: int = BOT_MAX_PENDING_UPDATES,
+        max_pending_per_user: int = BOT_MAX_PENDING_PER_USER,
+        busy_message: str = BOT_BUSY_MESSAGE,
+    ):
+        """
+        Khởi tạo processor
+
+        Args:
+            max_concurrent_updates: Số handler chạy song song tối đa
+            max_pending_updates: Số update tối đa trong hệ thống (đang chạy + đang chờ)
+            max_pending_per_user: Số update tối đa đang chờ của 1 user
+            busy_message: Câu trả lời khi quá tải
+        """
+        # Semaphore của lớp cha chỉ là giới hạn an toàn, giới hạn thực sự ở dưới
+        # (rộng gấp đôi để update vượt ngưỡng vẫn vào được tới bước trả lời "bận")
+        super().__init__(max_concurrent_updates=2 * max(max_pending_updates, max_concurrent_updates))
+        self._running = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self.max_pending_updates = max_pending_updates
+        self.max_pending_per_user = max_pending_per_user
+        self.busy_message = busy_message
+
+        self._user_locks: Dict[Any, asyncio.Lock] = {}
+        self._user_pending: Dict[Any, int] = {}
+        self.pending = 0
+
+        # Thống kê
+        self.processed = 0
+        self.rejected = 0
+        self.max_pending_seen = 0
+
+    @staticmethod
+    def _ordering_key(update: object) -> Optional[Any]:
+        """Key để giữ thứ tự: user ID (hoặc chat ID), None nếu không xác định được"""
+        if isinstance(update, Update):
+            if update.effective_user is not None:
+                return update.effective_user.id
+            if update.effective_chat is not None:
+                return update.effective_chat.id
+        return None
+
+    def _is_overloaded(self, key: Optional[Any]) -> bool:
+        if self.pending >= self.max_pending_updates:
+            return True
+        return key is not None and self._user_pending.get(key, 0) >= self.max_pending_per_user
+
+    def is_overloaded(self, update: object) -> bool:
+        """
+        Update này có bị từ chối nếu gửi vào bây giờ không (hàng đợi chung
+        hoặc hàng đợi của user đã đầy)
+
+        Dùng để kiểm tra trước khi bắt đầu trả lời (vd: mở stream SSE).
+        """
+        return self._is_overloaded(self._ordering_key(update))
+
+    async def _reject(self, update: object, coroutine: Awaitable[Any]):
+        """Bỏ qua update khi quá tải và trả lời nhanh cho user"""
+        self.rejected += 1
+        if asyncio.iscoroutine(coroutine):
+            coroutine.close()  # Không chạy handler
+        message = update.effective_message if isinstance(update, Update) else None
+        if message is not None:
+            try:
+                await message.reply_text(self.busy_message)
+            except Exception as e:
+                print(f"[WARN] Không gửi được thông báo bận: {e}")
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        key = self._ordering_key(update)
+        if self._is_overloaded(key):
+            await self._reject(update, coroutine)
+            return
+
+        self.pending += 1
+        self.max_pending_seen = max(self.max_pending_seen, self.pending)
+        lock = None
+        if key is not None:
+            lock = self._user_locks.setdefault(key, asyncio.Lock())
+            self._user_pending[key] = self._user_pending.get(key, 0) + 1
+
+        try:
+            if lock is not None:
+                async with lock:
+                    async with self._running:
+                        await coroutine
+            else:
+                async with self._running:
+                    await coroutine
+            self.processed += 1
+        finally:
+            self.pending -= 1
+            if key is not None:
+                self._user_pending[key] -= 1
+                if not self._user_pending[key]:
+                    # User không còn update nào → giải phóng hàng đợi
+                    del self._user_pending[key]
+                    del self._user_locks[key]
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
@@ -0,0 +1,161 @@
+"""
+Warm-up - Khởi động trước các thành phần chậm trước khi nhận tin nhắn
+
+Nhiệm vụ:
+- Tạo orchestrator và load song song những gì người dùng đầu tiên phải
+  chờ: import vnstock/pandas/bs4, danh sách mã cổ phiếu, LLM client,
+  model embedding + collection ChromaDB (kèm 1 câu query giả)
+- Giới hạn thời gian (WARMUP_TIMEOUT): bước chưa xong vẫn chạy tiếp ở
+  nền, bot bắt đầu nhận tin ở chế độ "degraded" - RAG bị bỏ qua cho tới
+  khi model embedding load xong, các phần khác load khi dùng lần đầu
+- Báo cáo trạng thái sẵn sàng (in log, /readyz của API và webhook)
+"""
+import time
+import asyncio
+import importlib
+from typing import Callable, Dict, Optional, Tuple
+
+from config.settings import WARMUP_ENABLED, WARMUP_TIMEOUT, WARMUP_QUERY, SHARD_WORKERS
+
+# Module import chậm, được import trễ (xem agents/*) → import trước ở đây
+WARMUP_IMPORTS = ("pandas", "vnstock", "requests", "bs4")
+
+
+def _import_modules():
+    failed = []
+    for name in WARMUP_IMPORTS:
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            failed.append(f"{name} ({e})")
+    if failed:
+        raise ImportError(", ".join(failed))
+
+
+def _load_symbols(orchestrator):
+    from agents.advice_agent import get_valid_symbols
+    symbols = orchestrator.stock_agent.valid_symbols
+    get_valid_symbols()
+    if not symbols:
+        raise RuntimeError("không tải được danh sách mã")
+
+
+def _warm_rag(orchestrator):
+    """Load model embedding, mở collection và chạy 1 query giả"""
+    try:
+        rag_tool = orchestrator._get_rag_tool()
+        if rag_tool is None:
+            raise RuntimeError("RAG tool không khởi tạo được")
+        rag_tool.query(WARMUP_QUERY, top_k=1)
+    finally:
+        # Xong (kể cả lỗi - khi đó _get_rag_tool tự trả về None) → bật lại RAG
+        orchestrator.rag_ready = True
+
+
+def _purge_shared_cache():
+    from data.shared_cache import get_shared_cache
+    get_shared_cache().purge_expired()
+
+
+def _warmup_steps(orchestrator) -> Dict[str, Callable]:
+    steps = {"imports": _import_modules, "shared_cache": _purge_shared_cache}
+    if hasattr(orchestrator, "llm_service"):
+        steps["llm_client"] = lambda: orchestrator.llm_service.client
+    if hasattr(orchestrator, "stock_agent"):
+        steps["symbols"] = lambda: _load_symbols(orchestrator)
+    if hasattr(orchestrator, "_get_rag_tool"):
+        steps["rag"] = lambda: _warm_rag(orchestrator)
+    return steps
+
+
+async def warm_up(orchestrator, timeout: float = WARMUP_TIMEOUT) -> Dict:
+    """
+    Chạy song song các bước warm-up (mỗi bước 1 thread)
+
+    Args:
+        orchestrator: OrchestratorAgent cần warm-up
+        timeout: Thời gian tối đa (giây); bước chưa xong được đánh dấu "timeout"
+
+    Returns:
+        Báo cáo {"ready", "degraded": [bước lỗi/quá hạn], "steps": {...}, "elapsed_ms"}
+        (cũng được lưu vào orchestrator.warmup_report)
+    """
+    start = time.perf_counter()
+    steps = _warmup_steps(orchestrator)
+    results: Dict[str, Dict] = {name: {"status": "timeout"} for name in steps}
+
+    async def run(name: str, step: Callable):
+        step_start = time.perf_counter()
+        try:
+            await asyncio.to_thread(step)
+            results[name] = {"status": "ok"}
+        except Exception as e:
+            results[name] = {"status": "failed", "error": str(e)}
+        results[name]["ms"] = round((time.perf_counter() - step_start) * 1000, 1)
+
+    if "rag" in steps:
+        orchestrator.rag_ready = False  # Không để user chờ load model embedding
+    tasks = [asyncio.create_task(run(name, step)) for name, step in steps.items()]
+    # Không hủy task quá hạn: thread vẫn chạy tiếp và hoàn tất ở nền
+    await asyncio.wait(tasks, timeout=timeout)
+
+    degraded = [name for name, result in results.items() if result["status"] != "ok"]
+    report = {
+        "ready": not degraded,
+        "degraded": degraded,
+        "steps": results,
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 1),
+    }
+    orchestrator.warmup_report = report
+
+    for name, result in results.items():
+        detail = f" ({result['error'][:80]})" if result.get("error") else ""
+        ms = f"{result['ms']:.0f} ms" if "ms" in result else f"> {timeout:.0f} s"
+        print(f"[Warmup] {name}: {result['status']} - {ms}{detail}")
+    state = "sẵn sàng" if report["ready"] else f"degraded ({', '.join(degraded)})"
+    print(f"[Warmup] Xong sau {report['elapsed_ms']:.0f} ms - {state}")
+    return report
+
+
+async def start_orchestrator(
+    workers: int = SHARD_WORKERS,
+    warmup: bool = WARMUP_ENABLED,
+    timeout: float = WARMUP_TIMEOUT,
+) -> Tuple[object, Optional[Dict]]:
+    """
+    Tạo orchestrator (trong thread) rồi warm-up
+
+    Với ShardedOrchestrator, mỗi worker tự warm-up trước khi nhận câu hỏi.
+
+    Returns:
+        (orchestrator, báo cáo warm-up hoặc None nếu không warm-up)
+    """
+    from core.sharding import create_orchestrator
+
+    start = time.perf_counter()
+    orchestrator = await asyncio.to_thread(create_orchestrator, workers)
+    print(f"[Warmup] Orchestrator: {(time.perf_counter() - start) * 1000:.0f} ms")
+    if not warmup or not hasattr(orchestrator, "stock_agent"):
+        return orchestrator, None
+    return orchestrator, await warm_up(orchestrator, timeout)
+
+
+def readiness(orchestrator: Optional[object], warming: bool = False) -> Tuple[bool, Dict]:
+    """
+    Trạng thái sẵn sàng cho endpoint /readyz
+
+    Returns:
+        (nhận traffic được chưa, chi tiết) - degraded vẫn nhận traffic
+    """
+    if warming or orchestrator is None:
+        return False, {"status": "starting"}
+    report = getattr(orchestrator, "warmup_report", None)
+    if report is None:
+        return True, {"status": "ready"}
+    # Tính lại: bước quá hạn có thể đã hoàn tất ở nền
+    degraded = [name for name, result in report["steps"].items() if result["status"] != "ok"]
+    return True, {
+        "status": "degraded" if degraded else "ready",
+        "degraded": degraded,
+        "steps": report["steps"],
+    }
@@ -0,0 +1,231 @@
+"""
+Webhook Server - Nhận update Telegram qua HTTP (thay cho long polling)
+
+Nhiệm vụ:
+- Chạy HTTP server async (aiohttp) nhận update Telegram POST tới WEBHOOK_PATH
+- Kiểm tra header X-Telegram-Bot-Api-Secret-Token (chống request giả mạo)
+- Đưa update vào hàng đợi của Application (xử lý đồng thời theo user,
+  xem update_processor.py) và trả lời 200 ngay cho Telegram
+- Chạy nhiều worker process trên cùng 1 port (SO_REUSEPORT) hoặc mỗi
+  worker 1 port phía sau load balancer. Worker chỉ là front-end (nhận HTTP,
+  gửi tin Telegram): câu hỏi được chuyển tới 1 bộ shard duy nhất ở process
+  chính (core/sharding.py), nơi giữ lịch sử hội thoại và RAG; nhiều process
+  cùng ghi 1 file lịch sử / thư mục Chroma sẽ ghi đè lên nhau
+
+Test local không cần Telegram:
+    curl -X POST http://localhost:8443/telegram \\
+         -H "Content-Type: application/json" \\
+         -H "X-Telegram-Bot-Api-Secret-Token: $WEBHOOK_SECRET_TOKEN" \\
+         -d @deployment/webhook_update.example.json
+"""
+import os
+import re
+import hmac
+import asyncio
+import multiprocessing
+from typing import Optional
+
+from aiohttp import web
+from telegram import Update
+from telegram.ext import Application
+
+from core.warmup import readiness
+from core.telemetry import handle_metrics
+from config.settings import (
+    SHARD_WORKERS,
+    WEBHOOK_HOST,
+    WEBHOOK_PORT,
+    WEBHOOK_PATH,
+    WEBHOOK_URL,
+    WEBHOOK_SECRET_TOKEN,
+    WEBHOOK_KEEPALIVE_TIMEOUT,
+    WEBHOOK_MAX_CONNECTIONS,
+)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+# Telegram chỉ chấp nhận secret gồm A-Z, a-z, 0-9, _ và -, dài 1-256 ký tự
+_SECRET_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,256}$")
+
+
+def create_webhook_app(
+    application: Application,
+    secret_token: Optional[str] = WEBHOOK_SECRET_TOKEN,
+    path: str = WEBHOOK_PATH,
+) -> web.Application:
+    """
+    Tạo aiohttp app nhận update Telegram
+
+    Args:
+        application: Telegram Application (đã initialize + start, không có updater)
+        secret_token: Secret đã đăng ký với setWebhook (None = không kiểm tra)
+        path: Đường dẫn nhận update
+
+    Returns:
+        aiohttp Application với POST <path>, GET /healthz (còn sống),
+        GET /readyz (đã warm-up xong) và GET /metrics (của process này)
+    """
+    async def handle_update(request: web.Request) -> web.Response:
+        if secret_token:
+            received = request.headers.get(SECRET_HEADER, "")
+            if not hmac.compare_digest(received.encode(), secret_token.encode()):
+                return web.Response(status=403, text="invalid secret token")
+
+        try:
+            data = await request.json()
+            update = Update.de_json(data, application.bot)
+        except Exception as e:
+            print(f"[WARN] Webhook nhận update không hợp lệ: {e}")
+            return web.Response(status=400, text="invalid update")
+
+        # Trả lời Telegram ngay, update được xử lý bất đồng bộ
+        await application.update_queue.put(update)
+        return web.Response(text="ok")
+
+    async def health(request: web.Request) -> web.Response:
+        return web.json_response({"status": "ok", "pid": os.getpid()})
+
+    async def ready(request: web.Request) -> web.Response:
+        orchestrator = application.bot_data.get("orchestrator")
+        is_ready, detail = readiness(orchestrator, warming=orchestrator is None)
+        return web.json_response(detail, status=200 if is_ready else 503)
+
+    app = web.Application()
+    app.router.add_post(path, handle_update)
+    app.router.add_get("/healthz", health)
+    app.router.add_get("/readyz", ready)
+    app.router.add_get("/metrics", handle_metrics)
+    return app
+
+
+async def serve(
+    host: str = WEBHOOK_HOST,
+    port: int = WEBHOOK_PORT,
+    reuse_port: bool = False,
+    secret_token: Optional[str] = WEBHOOK_SECRET_TOKEN,
+):
+    """
+    Chạy bot + HTTP server trong event loop hiện tại tới khi bị dừng
+
+    Args:
+        host: Địa chỉ lắng nghe
+        port: Port lắng nghe
+        reuse_port: Cho phép nhiều process cùng lắng nghe 1 port (Linux)
+        secret_token: Secret token của webhook
+    """
+    from core.bot import create_bot
+
+    application = create_bot(use_updater=False)
+    runner = None
+    async with application:  # initialize / shutdown
+        try:
+            runner = web.AppRunner(
+                create_webhook_app(application, secret_token),
+                keepalive_timeout=WEBHOOK_KEEPALIVE_TIMEOUT,
+                access_log=None,
+            )
+            await runner.setup()
+            site = web.TCPSite(runner, host, port, reuse_port=reuse_port or None)
+            await site.start()
+            print(f"[Webhook] Worker {os.getpid()} đang lắng nghe http://{host}:{port}{WEBHOOK_PATH}")
+
+            # post_init chỉ được PTB tự gọi trong run_polling/run_webhook → gọi ở đây.
+            # Update đến trong lúc warm-up nằm chờ trong update_queue.
+            if application.post_init is not None:
+                await application.post_init(application)
+            await application.start()  # Bắt đầu lấy update từ update_queue
+            await asyncio.Event().wait()  # Chạy tới khi bị hủy (Ctrl+C / SIGTERM)
+        finally:
+            if runner is not None:
+                await runner.cleanup()
+            if application.running:
+                await application.stop()
+
+
+async def register_webhook(
+    url: str = WEBHOOK_URL,
+    secret_token: Optional[str] = WEBHOOK_SECRET_TOKEN,
+):
+    """Đăng ký URL webhook với Telegram (chỉ cần gọi 1 lần, không phải mỗi worker)"""
+    from core.bot import create_bot
+
+    application = create_bot(use_updater=False)
+    async with application:
+        await application.bot.set_webhook(
+            url=url,
+            secret_token=secret_token,
+            allowed_updates=Update.ALL_TYPES,
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+            drop_pending_updates=False,
+        )
+    print(f"[Webhook] Đã đăng ký webhook: {url}")
+
+
+def _run_worker(host: str, port: int, reuse_port: bool, frontend: Optional[tuple] = None):
+    if frontend is not None:
+        from core.sharding import use_frontend
+        use_frontend(*frontend)
+    try:
+        asyncio.run(serve(host, port, reuse_port=reuse_port))
+    except KeyboardInterrupt:
+        pass
+
+
+def main(
+    host: str = WEBHOOK_HOST,
+    port: int = WEBHOOK_PORT,
+    workers: int = 1,
+    separate_ports: bool = False,
+):
+    """
+    Chạy bot ở chế độ webhook
+
+    Args:
+        host: Địa chỉ lắng nghe
+        port: Port (worker thứ i dùng port + i nếu separate_ports)
+        workers: Số worker process (> 1: worker là front-end, câu hỏi được xử lý
+            bởi max(1, SHARD_WORKERS) worker shard của process này)
+        separate_ports: Mỗi worker 1 port riêng (cho load balancer) thay vì
+            dùng chung 1 port bằng SO_REUSEPORT
+    """
+    if WEBHOOK_SECRET_TOKEN and not _SECRET_PATTERN.match(WEBHOOK_SECRET_TOKEN):
+        raise ValueError("WEBHOOK_SECRET_TOKEN chỉ được gồm A-Z, a-z, 0-9, _ và - (tối đa 256 ký tự)")
+    if not WEBHOOK_SECRET_TOKEN:
+        print("[WARN] WEBHOOK_SECRET_TOKEN chưa được đặt - mọi request tới webhook đều được chấp nhận")
+
+    if WEBHOOK_URL:
+        asyncio.run(register_webhook())
+    else:
+        print("[INFO] WEBHOOK_URL chưa đặt - bỏ qua setWebhook (dùng khi test local)")
+
+    if workers <= 1:
+        _run_worker(host, port, reuse_port=False)
+        return
+
+    from core.sharding import ShardedOrchestrator, serve_frontends
+
+    # Lưu ý: tin nhắn của cùng 1 user chỉ giữ thứ tự trong 1 worker
+    # spawn: front-end không thừa hưởng thread của bộ shard
+    context = multiprocessing.get_context("spawn")
+    sharded = ShardedOrchestrator(max(1, SHARD_WORKERS))
+    requests = context.Queue()
+    responses = [context.Queue() for _ in range(workers)]
+    serve_frontends(sharded, requests, responses)
+    processes = [
+        context.Process(
+            target=_run_worker,
+            args=(host, port + i if separate_ports else port, not separate_ports, (i, requests, responses[i])),
+            name=f"webhook-worker-{i}",
+        )
+        for i in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+    finally:
+        requests.put(None)
+        sharded.stop()
@@ -0,0 +1,160 @@
+"""
+Chunking - Chia nội dung bài báo thành các đoạn nhỏ để embedding
+
+Chức năng:
+- Làm sạch text bài báo (khoảng trắng, dòng rác như "Xem thêm", "Tin liên quan")
+- Chia thành các chunk chồng lấn, mỗi chunk tối đa N token
+- Mỗi chunk giữ metadata của bài gốc + vị trí chunk trong bài
+- Khi truy vấn: gộp các chunk liền kề của cùng bài thành 1 đoạn trích
+
+Token ở đây là từ (âm tiết) tách theo khoảng trắng. Với tiếng Việt,
+1 âm tiết ≈ 1 sub-word của MiniLM đa ngôn ngữ nên giới hạn mặc định
+vẫn nằm trong max_seq_length 128 của model (phần thừa sẽ bị cắt mất).
+"""
+import re
+import hashlib
+from typing import Dict, List, Optional, Tuple
+
+from config.settings import (
+    RAG_CHUNK_MAX_TOKENS,
+    RAG_CHUNK_OVERLAP_TOKENS,
+    RAG_MAX_CHUNKS_PER_ARTICLE,
+)
+
+# Dòng điều hướng / quảng cáo hay lẫn trong nội dung bài báo
+_BOILERPLATE = re.compile(
+    r"^(xem thêm|tin liên quan|đọc thêm|theo dõi|chia sẻ|bình luận|quảng cáo)\b",
+    re.IGNORECASE,
+)
+
+
+def clean_article_text(text: str) -> str:
+    """Chuẩn hóa khoảng trắng và bỏ các dòng rác trong nội dung bài báo"""
+    lines = []
+    for line in (text or "").splitlines():
+        line = " ".join(line.split())
+        if line and not _BOILERPLATE.match(line):
+            lines.append(line)
+    return "\n".join(lines)
+
+
+def split_into_chunks(
+    text: str,
+    max_tokens: int = RAG_CHUNK_MAX_TOKENS,
+    overlap: int = RAG_CHUNK_OVERLAP_TOKENS,
+    max_chunks: Optional[int] = RAG_MAX_CHUNKS_PER_ARTICLE,
+) -> List[str]:
+    """
+    Chia text thành các cửa sổ `max_tokens` từ, 2 chunk liền kề chung `overlap` từ
+
+    Chunk i bắt đầu ở từ thứ i * (max_tokens - overlap), nhờ vậy khi gộp
+    lại chỉ cần bỏ `overlap` từ đầu của chunk sau (xem `merge_chunk_texts`).
+
+    Returns:
+        Danh sách chunk (ít nhất 1 nếu text không rỗng)
+    """
+    words = text.split()
+    if not words:
+        return []
+    overlap = min(overlap, max_tokens - 1)
+    stride = max_tokens - overlap
+
+    chunks = []
+    for start in range(0, len(words), stride):
+        chunks.append(" ".join(words[start:start + max_tokens]))
+        if start + max_tokens >= len(words) or (max_chunks and len(chunks) >= max_chunks):
+            break
+    return chunks
+
+
+def parent_id_for(url: str, title: str = "") -> str:
+    """ID ổn định của bài gốc (theo URL, hoặc tiêu đề nếu không có URL)"""
+    return hashlib.sha1((url or title).encode("utf-8")).hexdigest()[:16]
+
+
+def chunk_article(
+    title: str,
+    body: str,
+    metadata: Dict,
+    max_tokens: int = RAG_CHUNK_MAX_TOKENS,
+    overlap: int = RAG_CHUNK_OVERLAP_TOKENS,
+) -> Tuple[List[str], List[Dict]]:
+    """
+    Chia 1 bài báo thành các chunk kèm metadata
+
+    Tiêu đề được đặt ở đầu chunk đầu tiên. Metadata của mỗi chunk gồm
+    metadata bài gốc + parent_id, title, chunk_index, chunk_count, chunk_overlap.
+
+    Returns:
+        (danh sách text chunk, danh sách metadata tương ứng)
+    """
+    text = clean_article_text(body)
+    full_text = f"{title}. {text}" if title and text else (title or text)
+    chunks = split_into_chunks(full_text, max_tokens=max_tokens, overlap=overlap)
+
+    parent_id = parent_id_for(metadata.get("url", ""), title)
+    metas = [
+        {
+            **metadata,
+            "parent_id": parent_id,
+            "title": title,
+            "chunk_index": i,
+            "chunk_count": len(chunks),
+            "chunk_overlap": overlap,
+        }
+        for i in range(len(chunks))
+    ]
+    return chunks, metas
+
+
+def merge_chunk_texts(chunks: List[Tuple[int, str]], overlap: int) -> str:
+    """
+    Gộp các chunk (chunk_index, text) của cùng một bài
+
+    Chunk liền kề được nối và bỏ phần chồng lấn, chunk cách xa được
+    ngăn bằng " … ".
+    """
+    parts: List[str] = []
+    previous = None
+    for index, text in sorted(chunks):
+        if index == previous:
+            continue
+        if previous is not None and index == previous + 1:
+            parts.append(" ".join(text.split()[overlap:]))
+        else:
+            if parts:
+                parts.append("…")
+            parts.append(text)
+        previous = index
+    return " ".join(part for part in parts if part)
+
+
+def merge_chunk_results(results: List[Dict]) -> List[Dict]:
+    """
+    Gộp kết quả tìm kiếm là các chunk của cùng một bài thành 1 kết quả
+
+    Thứ tự theo kết quả tốt nhất của từng bài. Kết quả không phải chunk
+    (document cũ chỉ có tiêu đề + mô tả) được giữ nguyên.
+
+    Returns:
+        Danh sách kết quả, `text` là đoạn trích đã gộp
+    """
+    merged: List[Dict] = []
+    groups: Dict[str, Dict] = {}
+    for r in results:
+        meta = r.get("metadata") or {}
+        parent_id = meta.get("parent_id")
+        if not parent_id or meta.get("chunk_index") is None:
+            merged.append(r)
+            continue
+        group = groups.get(parent_id)
+        if group is None:
+            group = {**r, "chunks": []}
+            groups[parent_id] = group
+            merged.append(group)
+        group["chunks"].append((int(meta["chunk_index"]), r.get("text", "")))
+
+    for group in groups.values():
+        overlap = int((group.get("metadata") or {}).get("chunk_overlap") or 0)
+        group["text"] = merge_chunk_texts(group.pop("chunks"), overlap)
+    return merged
@@ -0,0 +1,251 @@
+"""
+Near-duplicate Detection - Lọc tin tức trùng lặp bằng MinHash/LSH
+
+Chức năng:
+- Chuẩn hóa text (bỏ dấu tiếng Việt) trước khi so sánh
+- Tạo chữ ký MinHash từ các shingle ký tự
+- Dùng LSH (chia band) để tìm nhanh các bài gần giống nhau
+- Gộp các bài trùng thành 1 document, giữ metadata của tất cả nguồn
+
+Chi phí chỉ là vài phép hash trên numpy cho mỗi bài, rẻ hơn nhiều
+so với 1 lần chạy model embedding MiniLM.
+"""
+import re
+import zlib
+import unicodedata
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config.settings import (
+    RAG_DEDUP_THRESHOLD,
+    RAG_DEDUP_NUM_PERM,
+    RAG_DEDUP_BANDS,
+    RAG_DEDUP_SHINGLE_SIZE,
+)
+
+# Số nguyên tố Mersenne 2^31 - 1: a * h + b vẫn nằm trong uint64
+_MERSENNE_PRIME = np.uint64((1 << 31) - 1)
+_MAX_HASH = np.uint64((1 << 31) - 1)
+
+# Dấu thanh / dấu phụ tiếng Việt sau khi tách NFD (thay cho vòng lặp theo category 'Mn')
+_COMBINING_MARKS = re.compile(r"[\u0300-\u036f]")
+_NON_ALNUM = re.compile(r"[^0-9a-z]+")
+
+# Các trường metadata được gộp khi nhiều nguồn đăng cùng một tin
+MERGED_METADATA_FIELDS = ("source",)
+# `url` giữ nguyên URL của bài gốc (dùng để tải nội dung bài, tính parent_id),
+# URL của các bài đăng lại nằm ở trường này, cách nhau bởi dấu cách
+# (URL có thể chứa dấu phẩy, không chứa dấu cách)
+DUPLICATE_URLS_FIELD = "duplicate_urls"
+
+
+def normalize_for_dedup(text: str) -> str:
+    """
+    Chuẩn hóa text để so sánh: bỏ dấu, chữ thường, bỏ ký tự đặc biệt
+
+    Ví dụ: "FPT lãi kỷ lục, vượt kế hoạch!" → "fpt lai ky luc vuot ke hoach"
+    """
+    if not text:
+        return ""
+    text = text.replace("đ", "d").replace("Đ", "D")
+    text = _COMBINING_MARKS.sub("", unicodedata.normalize("NFD", text))
+    return _NON_ALNUM.sub(" ", text.lower()).strip()
+
+
+class MinHashDeduplicator:
+    """
+    Bộ lọc tin gần trùng lặp dựa trên MinHash + LSH
+
+    Mỗi document được gán một key (id trong ChromaDB hoặc chỉ số trong batch).
+    `find` trả về key của document đã thấy có độ tương đồng Jaccard ước lượng
+    lớn hơn ngưỡng, hoặc None nếu không có.
+    """
+
+    def __init__(
+        self,
+        threshold: float = RAG_DEDUP_THRESHOLD,
+        num_perm: int = RAG_DEDUP_NUM_PERM,
+        bands: int = RAG_DEDUP_BANDS,
+        shingle_size: int = RAG_DEDUP_SHINGLE_SIZE,
+        seed: int = 1,
+    ):
+        """
+        Khởi tạo bộ lọc
+
+        Args:
+            threshold: Ngưỡng Jaccard để coi là trùng (0.0-1.0)
+            num_perm: Số hàm hash trong chữ ký MinHash
+            bands: Số band LSH (num_perm phải chia hết cho bands)
+            shingle_size: Độ dài shingle ký tự
+            seed: Seed cố định để chữ ký ổn định giữa các lần chạy
+        """
+        if num_perm % bands != 0:
+            raise ValueError("num_perm phải chia hết cho bands")
+
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, int(_MERSENNE_PRIME), size=num_perm).astype(np.uint64)
+        self._b = rng.randint(0, int(_MERSENNE_PRIME), size=num_perm).astype(np.uint64)
+
+        self._signatures: Dict[str, np.ndarray] = {}
+        self._buckets: List[Dict[bytes, List[str]]] = [{} for _ in range(bands)]
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    def _shingles(self, text: str) -> set:
+        """Tách text đã chuẩn hóa thành tập shingle ký tự"""
+        norm = normalize_for_dedup(text)
+        k = self.shingle_size
+        if len(norm) <= k:
+            return {norm} if norm else set()
+        return {norm[i:i + k] for i in range(len(norm) - k + 1)}
+
+    def signature(self, text: str) -> np.ndarray:
+        """
+        Tính chữ ký MinHash cho text
+
+        Returns:
+            Mảng uint64 độ dài num_perm
+        """
+        shingles = self._shingles(text)
+        if not shingles:
+            return np.full(self.num_perm, _MAX_HASH, dtype=np.uint64)
+
+        hashes = np.fromiter(
+            (zlib.crc32(s.encode("utf-8")) & 0x7FFFFFFF for s in shingles),
+            dtype=np.uint64,
+            count=len(shingles),
+        )
+        # (a * h + b) mod p cho mọi cặp (hàm hash, shingle), lấy min theo shingle
+        permuted = (self._a[:, None] * hashes[None, :] + self._b[:, None]) % _MERSENNE_PRIME
+        return permuted.min(axis=1)
+
+    @staticmethod
+    def similarity(sig_a: np.ndarray, sig_b: np.ndarray) -> float:
+        """Ước lượng độ tương đồng Jaccard từ 2 chữ ký"""
+        return float(np.mean(sig_a == sig_b))
+
+    def _band_keys(self, sig: np.ndarray) -> List[bytes]:
+        return [
+            sig[i * self.rows:(i + 1) * self.rows].tobytes()
+            for i in range(self.bands)
+        ]
+
+    def find(self, text: str, sig: Optional[np.ndarray] = None) -> Optional[str]:
+        """
+        Tìm document đã thấy gần giống với text
+
+        Args:
+            text: Text cần kiểm tra
+            sig: Chữ ký đã tính sẵn (nếu có)
+
+        Returns:
+            Key của document trùng tốt nhất, hoặc None
+        """
+        if sig is None:
+            sig = self.signature(text)
+
+        candidates = set()
+        for band, key in zip(self._buckets, self._band_keys(sig)):
+            candidates.update(band.get(key, ()))
+
+        best_key, best_score = None, self.threshold
+        for cand in candidates:
+            score = self.similarity(sig, self._signatures[cand])
+            if score >= best_score:
+                best_key, best_score = cand, score
+        return best_key
+
+    def add(self, key: str, text: str, sig: Optional[np.ndarray] = None):
+        """Thêm document vào chỉ mục LSH"""
+        if sig is None:
+            sig = self.signature(text)
+        self._signatures[key] = sig
+        for band, band_key in zip(self._buckets, self._band_keys(sig)):
+            band.setdefault(band_key, []).append(key)
+
+
+def merge_metadata(base: Dict, other: Dict) -> Dict:
+    """
+    Gộp metadata của bài trùng vào bài gốc
+
+    ChromaDB chỉ nhận giá trị scalar nên các nguồn được nối bằng dấu phẩy,
+    URL của bài trùng nằm trong `duplicate_urls`, kèm trường `duplicate_count`
+    đếm số lần tin được đăng lại.
+    """
+    merged = dict(base)
+    for field in MERGED_METADATA_FIELDS:
+        values = [v.strip() for v in str(merged.get(field, "")).split(",") if v.strip()]
+        for value in str(other.get(field) or "").split(","):
+            if value.strip() and value.strip() not in values:
+                values.append(value.strip())
+        if values:
+            merged[field] = ", ".join(values)
+
+    urls = str(merged.get(DUPLICATE_URLS_FIELD, "")).split()
+    for url in [other.get("url") or ""] + str(other.get(DUPLICATE_URLS_FIELD, "")).split():
+        if url and url != merged.get("url") and url not in urls:
+            urls.append(url)
+    if urls:
+        merged[DUPLICATE_URLS_FIELD] = " ".join(urls)
+    merged["duplicate_count"] = int(base.get("duplicate_count", 1)) + int(other.get("duplicate_count", 1))
+    return merged
+
+
+def collapse_near_duplicates(
+    texts: List[str],
+    metadatas: List[Dict],
+    deduplicator: Optional[MinHashDeduplicator] = None,
+) -> Tuple[List[str], List[Dict], Dict[str, List[Dict]]]:
+    """
+    Gộp các bài gần trùng trong một batch và so với chỉ mục đã có
+
+    Args:
+        texts: Danh sách text cần lưu
+        metadatas: Metadata tương ứng
+        deduplicator: Chỉ mục chứa các document đã lưu trước đó (có thể None)
+
+    Returns:
+        (texts mới, metadatas mới, {key document cũ: [metadata của các bài
+        trùng với nó]} để cập nhật nguồn)
+    """
+    existing = deduplicator if deduplicator is not None else MinHashDeduplicator()
+    batch = MinHashDeduplicator(
+        threshold=existing.threshold,
+        num_perm=existing.num_perm,
+        bands=existing.bands,
+        shingle_size=existing.shingle_size,
+    )
+
+    kept_texts: List[str] = []
+    kept_metas: List[Dict] = []
+    existing_matches: Dict[str, List[Dict]] = {}
+
+    for text, meta in zip(texts, metadatas):
+        sig = batch.signature(text)
+
+        # Trùng với bài đã có trong database → chỉ gộp metadata
+        match = existing.find(text, sig=sig) if len(existing) else None
+        if match is not None:
+            existing_matches.setdefault(match, []).append(meta)
+            continue
+
+        # Trùng với bài khác trong cùng batch → gộp vào bài đó
+        match = batch.find(text, sig=sig)
+        if match is not None:
+            idx = int(match)
+            kept_metas[idx] = merge_metadata(kept_metas[idx], meta)
+            continue
+
+        batch.add(str(len(kept_texts)), text, sig=sig)
+        kept_texts.append(text)
+        kept_metas.append(dict(meta))
+
+    return kept_texts, kept_metas, existing_matches
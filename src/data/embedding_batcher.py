@@ -0,0 +1,157 @@
+"""
+Embedding Batcher - Gom nhiều câu hỏi đồng thời thành 1 batch embedding
+
+Chức năng:
+- Thu thập các text cần embedding trong một cửa sổ thời gian ngắn
+  (vài ms) hoặc tới khi đủ N text
+- Chạy model 1 lần cho cả batch (trong thread pool, không chặn event loop)
+- Trả vector về đúng cho từng caller đang chờ
+
+Khi nhiều user hỏi cùng lúc, 1 lần forward pass cho cả batch tận dụng
+SIMD và đa luồng của CPU tốt hơn nhiều so với từng câu một.
+"""
+import asyncio
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from config.settings import RAG_EMBED_BATCH_WINDOW_MS, RAG_EMBED_MAX_BATCH_SIZE
+
+
+class EmbeddingBatcher:
+    """
+    Gom các yêu cầu embedding đồng thời thành micro-batch
+
+    Ví dụ:
+        batcher = EmbeddingBatcher(embedding_fn)
+        vector = await batcher.embed("Tin tức FPT")
+    """
+
+    def __init__(
+        self,
+        embed_fn: Callable[[List[str]], Sequence],
+        window_ms: float = RAG_EMBED_BATCH_WINDOW_MS,
+        max_batch_size: int = RAG_EMBED_MAX_BATCH_SIZE,
+    ):
+        """
+        Khởi tạo batcher
+
+        Args:
+            embed_fn: Hàm embedding nhận list text, trả list vector
+            window_ms: Thời gian chờ tối đa để gom batch (ms)
+            max_batch_size: Số text tối đa trong 1 batch
+        """
+        self.embed_fn = embed_fn
+        self.window_ms = window_ms
+        self.max_batch_size = max(1, max_batch_size)
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+        # Thống kê để benchmark / debug
+        self.batches = 0
+        self.items = 0
+
+    def _ensure_worker(self):
+        """Khởi động worker gom batch trên event loop hiện tại"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            if self._loop is not None and self._loop is not loop:
+                self._detach(RuntimeError("EmbeddingBatcher chuyển sang event loop khác"))
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run())
+
+    def _detach(self, error: Exception):
+        """Dừng worker trên event loop cũ, báo lỗi cho các caller còn nằm trong queue"""
+        old_loop, old_queue, old_worker = self._loop, self._queue, self._worker
+
+        def stop():
+            if old_worker is not None:
+                old_worker.cancel()
+            self._fail_queued(old_queue, error)
+
+        if old_loop.is_running() and not old_loop.is_closed():
+            old_loop.call_soon_threadsafe(stop)  # Future của loop cũ chỉ được đụng tới từ loop đó
+        else:
+            try:
+                stop()
+            except RuntimeError:
+                pass  # Loop cũ đã đóng: không còn ai chờ các future này
+
+    @staticmethod
+    def _fail_queued(queue: Optional[asyncio.Queue], error: Exception):
+        while queue is not None and not queue.empty():
+            _, fut = queue.get_nowait()
+            if not fut.done():
+                fut.set_exception(error)
+
+    async def aclose(self):
+        """Dừng worker gom batch (gọi khi tắt ứng dụng / kết thúc benchmark)"""
+        worker, self._worker = self._worker, None
+        if worker is not None and not worker.done():
+            worker.cancel()
+            try:
+                await worker
+            except asyncio.CancelledError:
+                pass
+        self._fail_queued(self._queue, RuntimeError("EmbeddingBatcher đã đóng"))
+
+    async def embed(self, text: str):
+        """
+        Embedding 1 text (được gom chung batch với các caller khác)
+
+        Returns:
+            Vector embedding của text
+        """
+        self._ensure_worker()
+        future = self._loop.create_future()
+        await self._queue.put((text, future))
+        return await future
+
+    async def _collect(self) -> List[Tuple[str, asyncio.Future]]:
+        """Chờ item đầu tiên rồi gom thêm cho tới khi hết cửa sổ hoặc đủ batch"""
+        batch = [await self._queue.get()]
+        deadline = self._loop.time() + self.window_ms / 1000
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - self._loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+
+        # Lấy nốt các item đã nằm sẵn trong queue (không chờ thêm)
+        while len(batch) < self.max_batch_size and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _run(self):
+        """Vòng lặp worker: gom batch → embedding → trả kết quả"""
+        while True:
+            batch = await self._collect()
+            # Bỏ các caller đã hủy (timeout) để không tốn công embedding
+            batch = [(text, fut) for text, fut in batch if not fut.done()]
+            if not batch:
+                continue
+
+            texts = [text for text, _ in batch]
+            try:
+                vectors = await self._loop.run_in_executor(None, self.embed_fn, texts)
+            except asyncio.CancelledError:
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(RuntimeError("EmbeddingBatcher đã dừng"))
+                raise
+            except Exception as e:
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.items += len(batch)
+            for (_, fut), vector in zip(batch, vectors):
+                if not fut.done():
+                    fut.set_result(vector)
@@ -0,0 +1,220 @@
+"""
+Embedding Cache - Lưu embedding ra đĩa để không phải tính lại
+
+Chức năng:
+- Key theo (tên model, hash nội dung text)
+- Vector lưu dạng float32 liên tục trong 1 file, đọc bằng memory-map
+- File index lưu hash của từng dòng vector (append-only)
+- Bọc embedding function của ChromaDB: chỉ gọi model cho text chưa có trong cache
+
+Khi rebuild collection hoặc ingest lại tin cũ, chi phí chỉ còn là I/O.
+Nhiều process (worker shard) dùng chung 1 cache: ghi được khóa bằng
+file lock, mỗi process tự đọc thêm các dòng do process khác ghi.
+"""
+import os
+import re
+import json
+import hashlib
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence
+
+try:
+    import fcntl  # Khóa file giữa các process (không có trên Windows)
+except ImportError:
+    fcntl = None
+
+import numpy as np
+from chromadb.api.types import Documents, EmbeddingFunction, Embeddings
+
+from config.settings import RAG_EMBEDDING_CACHE_DIR
+
+_DIGEST_SIZE = 20  # sha1
+
+
+def text_hash(text: str) -> bytes:
+    """Hash nội dung text (sha1, 20 bytes)"""
+    return hashlib.sha1(text.encode("utf-8")).digest()
+
+
+class EmbeddingCache:
+    """
+    Cache embedding trên đĩa cho một model
+
+    Cấu trúc thư mục:
+        <cache_dir>/<model>/meta.json    - tên model và số chiều vector
+        <cache_dir>/<model>/vectors.f32  - các vector float32 nối tiếp nhau
+        <cache_dir>/<model>/index.bin    - sha1 của text, dòng i ↔ vector i
+    """
+
+    def __init__(self, model_name: str, cache_dir: str = RAG_EMBEDDING_CACHE_DIR):
+        """
+        Khởi tạo cache
+
+        Args:
+            model_name: Tên model embedding (mỗi model một thư mục riêng)
+            cache_dir: Thư mục gốc của cache
+        """
+        self.model_name = model_name
+        safe_name = re.sub(r"[^0-9A-Za-z._-]+", "_", model_name)
+        self.directory = os.path.join(cache_dir, safe_name)
+        os.makedirs(self.directory, exist_ok=True)
+
+        self._meta_path = os.path.join(self.directory, "meta.json")
+        self._vectors_path = os.path.join(self.directory, "vectors.f32")
+        self._index_path = os.path.join(self.directory, "index.bin")
+        self._lock_path = os.path.join(self.directory, ".lock")
+
+        self._lock = threading.Lock()
+        self._rows: Dict[bytes, int] = {}
+        self._n_rows = 0
+        self._dim: Optional[int] = None
+        self._mmap: Optional[np.memmap] = None
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def _load(self):
+        """Đọc meta và index từ đĩa"""
+        try:
+            self._refresh()
+        except Exception as e:
+            print(f"[WARN] Không thể load embedding cache: {e}")
+            self._rows = {}
+            self._n_rows = 0
+
+    def _refresh(self):
+        """Đọc thêm các dòng mới (do process khác ghi) từ cuối index"""
+        if self._dim is None:
+            if not os.path.exists(self._meta_path):
+                return
+            with open(self._meta_path, "r", encoding="utf-8") as f:
+                self._dim = int(json.load(f)["dim"])
+        if not os.path.exists(self._index_path) or not os.path.exists(self._vectors_path):
+            return
+
+        index_rows = os.path.getsize(self._index_path) // _DIGEST_SIZE
+        if index_rows <= self._n_rows:
+            return
+        with open(self._index_path, "rb") as f:
+            f.seek(self._n_rows * _DIGEST_SIZE)
+            raw = f.read((index_rows - self._n_rows) * _DIGEST_SIZE)
+
+        # Chỉ tin các dòng có đủ cả hash lẫn vector (phòng trường hợp ghi dở)
+        vector_rows = os.path.getsize(self._vectors_path) // (4 * self._dim)
+        n_rows = min(index_rows, vector_rows)
+        for row in range(self._n_rows, n_rows):
+            offset = (row - self._n_rows) * _DIGEST_SIZE
+            self._rows.setdefault(raw[offset:offset + _DIGEST_SIZE], row)
+        self._n_rows = n_rows
+
+    @contextmanager
+    def _file_lock(self):
+        """Khóa ghi giữa các process dùng chung thư mục cache"""
+        if fcntl is None:
+            yield
+            return
+        with open(self._lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _vectors(self) -> np.ndarray:
+        """Memory-map file vector (map lại khi file lớn thêm)"""
+        if self._mmap is None or self._mmap.shape[0] < self._n_rows:
+            self._mmap = np.memmap(
+                self._vectors_path, dtype=np.float32, mode="r", shape=(self._n_rows, self._dim)
+            )
+        return self._mmap
+
+    def get_many(self, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """
+        Lấy embedding đã cache
+
+        Returns:
+            Danh sách vector (hoặc None nếu text chưa có trong cache)
+        """
+        with self._lock:
+            try:
+                self._refresh()
+            except Exception as e:
+                print(f"[WARN] Không thể đọc thêm embedding cache: {e}")
+            if not self._rows:
+                return [None] * len(texts)
+            vectors = self._vectors()
+            result = []
+            for text in texts:
+                row = self._rows.get(text_hash(text))
+                result.append(np.array(vectors[row]) if row is not None else None)
+            return result
+
+    def put_many(self, texts: Sequence[str], embeddings: Sequence[Sequence[float]]):
+        """Ghi thêm embedding mới vào cuối file"""
+        if not texts:
+            return
+        matrix = np.asarray(embeddings, dtype=np.float32)
+
+        with self._lock, self._file_lock():
+            self._refresh()
+            if self._dim is None:
+                self._dim = int(matrix.shape[1])
+                with open(self._meta_path, "w", encoding="utf-8") as f:
+                    json.dump({"model": self.model_name, "dim": self._dim}, f)
+            elif matrix.shape[1] != self._dim:
+                raise ValueError(
+                    f"Embedding dimension {matrix.shape[1]} khác với cache ({self._dim})"
+                )
+
+            new_digests, new_rows, seen = [], [], set()
+            for text, vector in zip(texts, matrix):
+                digest = text_hash(text)
+                if digest in self._rows or digest in seen:
+                    continue
+                seen.add(digest)
+                new_digests.append(digest)
+                new_rows.append(vector)
+            if not new_rows:
+                return
+
+            # Ghi vector trước, index sau: index không bao giờ trỏ tới vector chưa ghi
+            # (bỏ phần vector thừa do lần ghi trước bị dừng giữa chừng)
+            start = self._n_rows
+            with open(self._vectors_path, "ab") as f:
+                f.truncate(start * 4 * self._dim)
+                f.write(np.stack(new_rows).tobytes())
+            with open(self._index_path, "ab") as f:
+                f.truncate(start * _DIGEST_SIZE)
+                f.write(b"".join(new_digests))
+
+            for offset, digest in enumerate(new_digests):
+                self._rows[digest] = start + offset
+            self._n_rows = start + len(new_digests)
+
+
+class CachedEmbeddingFunction(EmbeddingFunction[Documents]):
+    """
+    Embedding function của ChromaDB có cache
+
+    Text đã có trong cache được đọc từ đĩa, chỉ text mới được gửi
+    tới embedding function gốc (theo 1 batch).
+    """
+
+    def __init__(self, embedding_fn: EmbeddingFunction[Documents], cache: EmbeddingCache):
+        self.embedding_fn = embedding_fn
+        self.cache = cache
+
+    def __call__(self, input: Documents) -> Embeddings:
+        texts = list(input)
+        cached = self.cache.get_many(texts)
+        missing = [i for i, vec in enumerate(cached) if vec is None]
+
+        if missing:
+            computed = self.embedding_fn([texts[i] for i in missing])
+            self.cache.put_many([texts[i] for i in missing], computed)
+            for i, vec in zip(missing, computed):
+                cached[i] = np.asarray(vec, dtype=np.float32)
+
+        return cached
@@ -0,0 +1,330 @@
+"""
+Lexical Index - Chỉ mục BM25 cho tìm kiếm theo từ khóa
+
+Chức năng:
+- Tách từ trên text đã bỏ dấu tiếng Việt (giống bộ lọc trùng lặp)
+- Inverted index: từ → {document: số lần xuất hiện}
+- Chấm điểm BM25 bằng numpy, lọc theo symbol / khoảng thời gian / nguồn
+- Lưu ra file cạnh ChromaDB, đồng bộ với collection: ghi theo lô
+  (BM25_SAVE_EVERY thay đổi / BM25_SAVE_INTERVAL giây) và khi tắt process,
+  không ghi lại cả index sau mỗi lần nạp tin. Process bị kill trước khi ghi
+  → lần mở sau số document lệch với collection → index được dựng lại.
+
+Bổ sung cho semantic search: bắt đúng mã cổ phiếu và con số ("FPT",
+"Q3/2025") mà MiniLM hay bỏ sót, và không cần chạy model.
+"""
+import os
+import math
+import time
+import atexit
+import pickle
+import threading
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from data.dedup import normalize_for_dedup
+from config.settings import BM25_K1, BM25_B, BM25_SAVE_EVERY, BM25_SAVE_INTERVAL
+
+
+def tokenize(text: str) -> List[str]:
+    """Tách text thành các từ đã chuẩn hóa (bỏ dấu, chữ thường)"""
+    return normalize_for_dedup(text).split()
+
+
+class BM25Index:
+    """
+    Inverted index + BM25 trong bộ nhớ
+
+    Mỗi document được gán một slot (số nguyên). Posting list được dựng
+    bằng dict khi thêm document, và được "biên dịch" thành mảng numpy
+    (slot, tf) ở lần tìm kiếm đầu tiên sau khi thay đổi, nên chấm điểm
+    chỉ là vài phép cộng vector.
+
+    Mỗi document lưu kèm symbol, timestamp, source để lọc giống
+    `where` của ChromaDB mà không phải đọc lại collection.
+    """
+
+    def __init__(self, path: Optional[str] = None, k1: float = BM25_K1, b: float = BM25_B):
+        """
+        Khởi tạo index
+
+        Args:
+            path: File pickle để lưu/đọc index (None = chỉ trong RAM)
+            k1: Tham số bão hòa tần suất từ của BM25
+            b: Tham số chuẩn hóa độ dài document của BM25
+        """
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._reset()
+        self._unsaved = 0  # Số document thay đổi chưa ghi ra file
+        self._saved_at = time.monotonic()
+
+        if path and os.path.exists(path):
+            self._load()
+        if path:
+            atexit.register(self.flush)
+
+    def _reset(self):
+        self._postings: Dict[str, Dict[int, int]] = {}  # token → {slot: tf}
+        self._compiled: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}  # token → (slots, tf)
+        self._slots: Dict[str, int] = {}  # doc_id → slot
+        self._doc_ids: List[Optional[str]] = []  # slot → doc_id (None = đã xóa)
+        self._doc_tokens: List[Tuple[str, ...]] = []  # slot → các token (để xóa nhanh)
+        self._lengths: List[int] = []
+        self._symbols: List[str] = []
+        self._timestamps: List[float] = []  # NaN nếu không có ngày
+        self._sources: List[str] = []
+        self._total_length = 0
+        self._arrays = None  # (lengths, symbols, timestamps, alive) dạng numpy, dựng lại khi đổi
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def _load(self):
+        try:
+            with open(self.path, "rb") as f:
+                state = pickle.load(f)
+            self._reset()
+            with self._lock:
+                self._add(state["doc_ids"], state["tokens"], state["metadatas"])
+        except Exception as e:
+            print(f"[WARN] Không thể load BM25 index: {e}")
+            self._reset()
+
+    def _live_state(self) -> Dict:
+        live = [slot for slot, doc_id in enumerate(self._doc_ids) if doc_id is not None]
+        return {
+            "doc_ids": [self._doc_ids[s] for s in live],
+            "tokens": [self._doc_tokens[s] for s in live],
+            "metadatas": [
+                {
+                    "symbol": self._symbols[s],
+                    "timestamp": None if math.isnan(self._timestamps[s]) else self._timestamps[s],
+                    "source": self._sources[s],
+                }
+                for s in live
+            ],
+        }
+
+    def save(self):
+        """
+        Ghi index ra file (ghi file tạm rồi đổi tên để không hỏng index cũ)
+
+        Đồng thời dồn slot: bỏ các slot của document đã xóa / bị ghi đè.
+        """
+        if not self.path:
+            return
+        with self._save_lock:
+            with self._lock:
+                state = self._live_state()
+                if len(state["doc_ids"]) < len(self._doc_ids):
+                    self._reset()
+                    self._add(state["doc_ids"], state["tokens"], state["metadatas"])
+                self._unsaved = 0
+                self._saved_at = time.monotonic()
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.path)
+
+    def save_if_due(self):
+        """Ghi index nếu đủ BM25_SAVE_EVERY thay đổi hoặc đã quá BM25_SAVE_INTERVAL giây"""
+        if self._unsaved >= BM25_SAVE_EVERY or (
+            self._unsaved and time.monotonic() - self._saved_at >= BM25_SAVE_INTERVAL
+        ):
+            self.save()
+
+    def flush(self):
+        """Ghi các thay đổi chưa lưu (gọi khi tắt process)"""
+        if self._unsaved:
+            self.save()
+
+    def add(
+        self,
+        doc_ids: List[str],
+        texts: Optional[List[str]],
+        metadatas: List[Dict],
+        token_lists: Optional[List[Tuple[str, ...]]] = None,
+    ):
+        """Thêm (hoặc ghi đè) các document vào index"""
+        if token_lists is None:
+            token_lists = [tuple(tokenize(text)) for text in texts]
+
+        with self._lock:
+            self._add(doc_ids, token_lists, metadatas)
+            self._unsaved += len(doc_ids)
+
+    def _add(self, doc_ids: List[str], token_lists: List[Tuple[str, ...]], metadatas: List[Dict]):
+        for doc_id, tokens, meta in zip(doc_ids, token_lists, metadatas):
+            if doc_id in self._slots:
+                self._remove(doc_id)
+
+            slot = len(self._doc_ids)
+            self._slots[doc_id] = slot
+            self._doc_ids.append(doc_id)
+            self._doc_tokens.append(tuple(tokens))
+
+            for token, tf in Counter(tokens).items():
+                self._postings.setdefault(token, {})[slot] = tf
+                self._compiled.pop(token, None)
+
+            self._lengths.append(len(tokens))
+            self._total_length += len(tokens)
+            self._append_filters(meta or {})
+        self._arrays = None
+
+    def _append_filters(self, meta: Dict):
+        timestamp = meta.get("timestamp")
+        self._symbols.append(str(meta.get("symbol") or "").upper())
+        self._timestamps.append(float(timestamp) if timestamp is not None else math.nan)
+        self._sources.append(str(meta.get("source") or "").lower())
+
+    def update_filters(self, doc_ids: List[str], metadatas: List[Dict]):
+        """Cập nhật symbol / timestamp / source khi metadata thay đổi (text giữ nguyên)"""
+        with self._lock:
+            for doc_id, meta in zip(doc_ids, metadatas):
+                slot = self._slots.get(doc_id)
+                if slot is None:
+                    continue
+                meta = meta or {}
+                timestamp = meta.get("timestamp")
+                self._symbols[slot] = str(meta.get("symbol") or "").upper()
+                self._timestamps[slot] = float(timestamp) if timestamp is not None else math.nan
+                self._sources[slot] = str(meta.get("source") or "").lower()
+                self._unsaved += 1
+            self._arrays = None
+
+    def _remove(self, doc_id: str):
+        slot = self._slots.pop(doc_id)
+        for token in set(self._doc_tokens[slot]):
+            postings = self._postings.get(token)
+            if postings is not None:
+                postings.pop(slot, None)
+                self._compiled.pop(token, None)
+                if not postings:
+                    del self._postings[token]
+        self._total_length -= self._lengths[slot]
+        self._doc_ids[slot] = None
+        self._doc_tokens[slot] = ()
+        self._arrays = None
+
+    def remove(self, doc_ids: List[str]):
+        """Xóa document khỏi index"""
+        with self._lock:
+            for doc_id in doc_ids:
+                if doc_id in self._slots:
+                    self._remove(doc_id)
+                    self._unsaved += 1
+
+    def clear(self):
+        """Xóa toàn bộ index"""
+        with self._lock:
+            self._unsaved += len(self._slots) or 1
+            self._reset()
+
+    def _posting_arrays(self, token: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        compiled = self._compiled.get(token)
+        if compiled is None:
+            postings = self._postings.get(token)
+            if not postings:
+                return None
+            compiled = (
+                np.fromiter(postings.keys(), dtype=np.int64, count=len(postings)),
+                np.fromiter(postings.values(), dtype=np.float32, count=len(postings)),
+            )
+            self._compiled[token] = compiled
+        return compiled
+
+    def _doc_arrays(self):
+        if self._arrays is None:
+            self._arrays = (
+                np.array(self._lengths, dtype=np.float32),
+                np.array(self._symbols, dtype=object),
+                np.array(self._timestamps, dtype=np.float64),
+                np.array([doc_id is not None for doc_id in self._doc_ids], dtype=bool),
+            )
+        return self._arrays
+
+    def search(
+        self,
+        query_text: str,
+        top_k: int = 10,
+        filters: Optional[Dict] = None,
+        date_from: Optional[int] = None,
+        date_to: Optional[int] = None,
+    ) -> List[Tuple[str, float]]:
+        """
+        Tìm document theo BM25
+
+        Args:
+            query_text: Câu truy vấn
+            top_k: Số kết quả tối đa
+            filters: Bộ lọc symbol / source
+            date_from: Timestamp nhỏ nhất (bao gồm)
+            date_to: Timestamp lớn nhất (không bao gồm)
+
+        Returns:
+            Danh sách (doc_id, điểm BM25) giảm dần theo điểm
+        """
+        tokens = set(tokenize(query_text))
+        filters = filters or {}
+        with self._lock:
+            n_docs = len(self._slots)
+            if not tokens or not n_docs:
+                return []
+            lengths, symbols, timestamps, alive = self._doc_arrays()
+            avg_length = self._total_length / n_docs
+
+            scores = np.zeros(len(self._doc_ids), dtype=np.float32)
+            for token in tokens:
+                arrays = self._posting_arrays(token)
+                if arrays is None:
+                    continue
+                slots, tf = arrays
+                idf = math.log(1 + (n_docs - len(slots) + 0.5) / (len(slots) + 0.5))
+                norm = self.k1 * (1 - self.b + self.b * lengths[slots] / avg_length)
+                scores[slots] += idf * tf * (self.k1 + 1) / (tf + norm)
+
+            mask = (scores > 0) & alive
+            if filters.get("symbol"):
+                mask &= symbols == filters["symbol"].upper()
+            if date_from is not None:
+                mask &= timestamps >= date_from  # NaN (không có ngày) luôn bị loại
+            if date_to is not None:
+                mask &= timestamps < date_to
+            candidates = np.nonzero(mask)[0]
+
+            source = (filters.get("source") or "").lower()
+            if source:
+                candidates = np.array(
+                    [s for s in candidates if source in self._sources[s]], dtype=np.int64
+                )
+            if not len(candidates):
+                return []
+
+            if len(candidates) > top_k:
+                top = np.argpartition(-scores[candidates], top_k - 1)[:top_k]
+                candidates = candidates[top]
+            order = candidates[np.argsort(-scores[candidates], kind="stable")]
+            return [(self._doc_ids[s], float(scores[s])) for s in order]
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> Dict[str, float]:
+    """
+    Gộp nhiều bảng xếp hạng bằng Reciprocal Rank Fusion
+
+    score(d) = Σ 1 / (k + rank(d)), rank tính từ 1
+
+    Returns:
+        Dictionary {doc_id: điểm RRF}
+    """
+    fused: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, 1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return fused
@@ -5,18 +5,54 @@ Chức năng:
 - Lưu lịch sử chat của từng user
 - Lấy lịch sử gần đây để tạo context
 - Tự động giới hạn số lượng tin nhắn để tránh quá tải
+- Tóm tắt dần các tin nhắn cũ (rolling summary) để prompt không phình to
 """
 import os
 import json
-from typing import List, Dict
-from config.settings import MEMORY_STORAGE_PATH, MEMORY_MAX_TURNS
+from typing import List, Dict, Tuple
+from config.settings import MEMORY_STORAGE_PATH, MEMORY_MAX_TURNS, MEMORY_SUMMARY_MAX_CHARS
+
+# File JSON: {"format": MEMORY_FORMAT, "users": {user_id: [messages]},
+# "summaries": {user_id: {...}}} → user_id nào cũng hợp lệ, không có key dành riêng
+MEMORY_FORMAT = "conversation_memory/2"
+# Định dạng cũ: {user_id: [messages], "_summaries": {...}} (vẫn đọc được)
+_LEGACY_SUMMARIES_KEY = "_summaries"
+
+
+def load_memory_file(path: str) -> Tuple[Dict, Dict]:
+    """
+    Đọc file lịch sử hội thoại (định dạng mới hoặc cũ)
+
+    Returns:
+        ({user_id: [messages]}, {user_id: trạng thái tóm tắt})
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if data.get("format") == MEMORY_FORMAT:
+        return data.get("users", {}), data.get("summaries", {})
+    summaries = data.pop(_LEGACY_SUMMARIES_KEY, {})
+    if not isinstance(summaries, dict):  # 1 user tên "_summaries" trong file cũ
+        data[_LEGACY_SUMMARIES_KEY], summaries = summaries, {}
+    return data, summaries
+
+
+def save_memory_file(path: str, history: Dict, summaries: Dict):
+    """Ghi file lịch sử hội thoại (định dạng MEMORY_FORMAT)"""
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(
+            {"format": MEMORY_FORMAT, "users": history, "summaries": summaries},
+            f, ensure_ascii=False, indent=2,
+        )
 
 
 class ConversationMemory:
     """
     Quản lý lịch sử hội thoại - lưu vào file JSON
     
-    Mỗi user có một lịch sử riêng để bot nhớ context
+    Mỗi user có một lịch sử riêng để bot nhớ context.
+    Tin nhắn cũ được gộp dần vào bản tóm tắt của user: các tin nhắn có số
+    thứ tự < `upto` đã nằm trong tóm tắt (`offset`: số thứ tự của tin nhắn
+    đầu danh sách).
     """
     
     def __init__(self, storage_path: str = MEMORY_STORAGE_PATH, max_turns: int = MEMORY_MAX_TURNS):
@@ -30,23 +66,23 @@ class ConversationMemory:
         self.storage_path = storage_path
         self.max_turns = max_turns
         self._history = {}  # Dictionary: {user_id: [messages]}
+        self._summaries = {}  # Dictionary: {user_id: {"text": ..., "offset": n, "upto": n}}
         self._load()  # Load lịch sử từ file
     
     def _load(self):
         """Load lịch sử từ file JSON"""
         if os.path.exists(self.storage_path):
             try:
-                with open(self.storage_path, "r", encoding="utf-8") as f:
-                    self._history = json.load(f)
+                self._history, self._summaries = load_memory_file(self.storage_path)
             except Exception as e:
                 print(f"[WARN] Không thể load lịch sử hội thoại: {e}")
                 self._history = {}
+                self._summaries = {}
     
     def _save(self):
         """Lưu lịch sử vào file JSON"""
         try:
-            with open(self.storage_path, "w", encoding="utf-8") as f:
-                json.dump(self._history, f, ensure_ascii=False, indent=2)
+            save_memory_file(self.storage_path, self._history, self._summaries)
         except Exception as e:
             print(f"[WARN] Không thể lưu lịch sử hội thoại: {e}")
     
@@ -67,6 +103,8 @@ class ConversationMemory:
         
         # Giữ chỉ N tin nhắn gần nhất (tránh file quá lớn)
         if len(self._history[user_id]) > self.max_turns:
+            dropped = len(self._history[user_id]) - self.max_turns
+            self._forget_oldest(user_id, dropped)
             self._history[user_id] = self._history[user_id][-self.max_turns:]
         
         self._save()  # Lưu vào file
@@ -86,10 +124,67 @@ class ConversationMemory:
             return []
         return self._history[user_id][-n:]
     
+    def _summary_state(self, user_id: str) -> Dict:
+        # offset: số thứ tự (tuyệt đối) của tin nhắn đầu danh sách
+        # upto: các tin nhắn có số thứ tự < upto đã nằm trong tóm tắt
+        return self._summaries.setdefault(user_id, {"text": "", "offset": 0, "upto": 0})
+    
+    def _forget_oldest(self, user_id: str, count: int):
+        """
+        Bỏ `count` tin nhắn cũ nhất khỏi lịch sử
+
+        Tin nhắn chưa kịp được LLM tóm tắt được thêm vào tóm tắt dưới dạng
+        rút gọn (không gọi LLM) để không mất hẳn context.
+        """
+        state = self._summary_state(user_id)
+        lost = self._history[user_id][max(0, state["upto"] - state["offset"]):count]
+        if lost:
+            extract = " | ".join(f"{m['role']}: {m['text'][:80]}" for m in lost)
+            state["text"] = f"{state['text']}\n{extract}".strip()[-MEMORY_SUMMARY_MAX_CHARS:]
+        state["offset"] += count
+        state["upto"] = max(state["upto"], state["offset"])
+    
+    def get_summary(self, user_id: str) -> str:
+        """Lấy bản tóm tắt các tin nhắn cũ của user (chuỗi rỗng nếu chưa có)"""
+        return self._summaries.get(user_id, {}).get("text", "")
+    
+    def get_unsummarized(self, user_id: str, keep_recent: int) -> Tuple[List[Dict], int]:
+        """
+        Lấy các tin nhắn cũ chưa được tóm tắt
+
+        Args:
+            user_id: ID của user
+            keep_recent: Số tin nhắn gần nhất luôn giữ nguyên văn (không tóm tắt)
+
+        Returns:
+            (tin nhắn cần gộp vào tóm tắt theo thứ tự thời gian,
+             mốc `upto` truyền lại cho update_summary)
+        """
+        messages = self._history.get(user_id, [])
+        state = self._summaries.get(user_id, {"offset": 0, "upto": 0})
+        start = max(0, state["upto"] - state["offset"])
+        end = max(start, len(messages) - keep_recent)
+        return messages[start:end], state["offset"] + end
+    
+    def update_summary(self, user_id: str, text: str, upto: int):
+        """
+        Cập nhật tóm tắt sau khi gộp thêm các tin nhắn cũ
+
+        Args:
+            user_id: ID của user
+            text: Bản tóm tắt mới (đã bao gồm tóm tắt cũ)
+            upto: Mốc trả về từ get_unsummarized
+        """
+        state = self._summary_state(user_id)
+        state["text"] = text[:MEMORY_SUMMARY_MAX_CHARS]
+        state["upto"] = max(state["upto"], upto)
+        self._save()
+    
     def clear_history(self, user_id: str):
         """Xóa lịch sử của một user"""
         if user_id in self._history:
             del self._history[user_id]
+            self._summaries.pop(user_id, None)
             self._save()
     
     def get_all(self) -> Dict:
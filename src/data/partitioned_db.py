@@ -0,0 +1,411 @@
+"""
+Partitioned Vector Database - Chia tin tức thành collection theo tháng
+
+Chức năng:
+- Mỗi tháng một collection ChromaDB: finance_news_2025_10, finance_news_2025_11, ...
+- Tin được ghi vào partition theo ngày đăng (metadata `date`)
+- Câu hỏi chỉ tìm trên các partition giao với khoảng thời gian của bộ lọc,
+  các partition được tìm song song rồi gộp kết quả và xếp hạng chung
+- Hết hạn lưu trữ: xóa nguyên collection của tháng cũ (O(1)), không phải
+  xóa từng document nên HNSW index không phình to và không bị phân mảnh
+
+Collection cũ không chia tháng (finance_news) được chuyển sang các partition
+một lần lúc khởi động, dùng lại embedding đã lưu (không chạy lại model).
+"""
+import re
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from data.vector_db import VectorDatabase, rank_results
+from config.settings import (
+    RAG_PERSIST_DIRECTORY,
+    RAG_COLLECTION_NAME,
+    RAG_RECENCY_HALF_LIFE_DAYS,
+    RAG_FILTER_OVERFETCH,
+    RAG_RETENTION_MONTHS,
+    RAG_PARTITION_QUERY_WORKERS,
+)
+
+_MIGRATION_BATCH_SIZE = 1000
+
+
+def month_key(date: Optional[str] = None) -> str:
+    """Key partition 'YYYY_MM' của một ngày 'YYYY-MM-DD' (mặc định: tháng hiện tại)"""
+    if date:
+        match = re.match(r"(\d{4})-(\d{2})", str(date))
+        if match:
+            return f"{match.group(1)}_{match.group(2)}"
+    return datetime.now().strftime("%Y_%m")
+
+
+def _month_index(key: str) -> int:
+    """Số thứ tự tháng (year * 12 + month - 1) để so sánh / trừ tháng"""
+    year, month = key.split("_")
+    return int(year) * 12 + int(month) - 1
+
+
+class PartitionedVectorDatabase:
+    """
+    Vector database chia partition theo tháng
+
+    Cùng interface với VectorDatabase (query, aquery, add_documents,
+    get_documents, update_metadatas, clear_collection) nên RAGTool dùng
+    được cả hai. Các partition dùng chung client, model embedding và
+    LRU embedding câu hỏi: câu hỏi chỉ embedding 1 lần cho mọi partition.
+    """
+
+    def __init__(
+        self,
+        persist_directory: str = RAG_PERSIST_DIRECTORY,
+        collection_name: str = RAG_COLLECTION_NAME,
+        retention_months: int = RAG_RETENTION_MONTHS,
+        max_workers: int = RAG_PARTITION_QUERY_WORKERS,
+        **kwargs,
+    ):
+        """
+        Khởi tạo database chia partition
+
+        Args:
+            persist_directory: Thư mục lưu ChromaDB
+            collection_name: Tên gốc, partition có tên '<tên gốc>_YYYY_MM'
+            retention_months: Số tháng giữ lại (tính cả tháng hiện tại)
+            max_workers: Số thread tìm kiếm song song trên các partition
+            **kwargs: Tham số khác của VectorDatabase (embedding_model, use_hybrid, ...)
+        """
+        # Bản "gốc" giữ client + model, không tự mở collection nào
+        self._base = VectorDatabase(persist_directory, collection_name, **kwargs)
+        self.collection_name = collection_name
+        self.retention_months = retention_months
+        self._pattern = re.compile(rf"^{re.escape(collection_name)}_(\d{{4}}_\d{{2}})$")
+        self._partitions: Dict[str, VectorDatabase] = {}  # {'YYYY_MM': VectorDatabase}
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, max_workers), thread_name_prefix="rag-partition"
+        )
+
+    # ------------------------------------------------------------------
+    # Quản lý partition
+    # ------------------------------------------------------------------
+
+    def _partition_name(self, key: str) -> str:
+        return f"{self.collection_name}_{key}"
+
+    def _ensure_partitions(self):
+        """Tìm các partition đã có, xóa partition hết hạn, chuyển collection cũ (lần đầu)"""
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            names = [c.name for c in self._base.client.list_collections()]
+            for name in names:
+                match = self._pattern.match(name)
+                if match:
+                    self._partitions[match.group(1)] = self._base.partition(name)
+            self._loaded = True
+            self.drop_expired_partitions()
+            if self.collection_name in names:
+                self._migrate_unpartitioned()
+            print(f"Loaded {len(self._partitions)} monthly partitions of '{self.collection_name}'")
+
+    def _oldest_kept_index(self, now: Optional[datetime] = None) -> int:
+        return _month_index(month_key((now or datetime.now()).strftime("%Y-%m-%d"))) - (self.retention_months - 1)
+
+    def _is_expired(self, key: str, now: Optional[datetime] = None) -> bool:
+        return bool(self.retention_months) and _month_index(key) < self._oldest_kept_index(now)
+
+    def _get_partition(self, key: str) -> VectorDatabase:
+        """Lấy (hoặc tạo) partition của tháng `key`"""
+        with self._lock:
+            partition = self._partitions.get(key)
+            if partition is None:
+                partition = self._base.partition(self._partition_name(key))
+                self._partitions[key] = partition
+            return partition
+
+    def drop_expired_partitions(self, now: Optional[datetime] = None) -> List[str]:
+        """
+        Xóa các partition cũ hơn thời hạn lưu trữ
+
+        Mỗi partition bị xóa nguyên collection (kèm file BM25), chi phí
+        không phụ thuộc số document.
+
+        Returns:
+            Danh sách key 'YYYY_MM' đã bị xóa
+        """
+        self._ensure_partitions()
+        with self._lock:
+            expired = [key for key in self._partitions if self._is_expired(key, now)]
+            for key in expired:
+                self._partitions.pop(key).drop_collection()
+        if expired:
+            print(f"Dropped {len(expired)} expired partitions: {', '.join(sorted(expired))}")
+        return expired
+
+    def _migrate_unpartitioned(self):
+        """Chuyển collection cũ (không chia tháng) sang các partition, dùng lại embedding đã lưu"""
+        legacy = self._base.partition(self.collection_name)
+        collection = self._base.client.get_collection(
+            name=self.collection_name, embedding_function=self._base.embedding_fn
+        )
+        results = collection.get(include=["documents", "metadatas", "embeddings"])
+        ids = results.get("ids", [])
+
+        groups: Dict[str, List[int]] = {}
+        for i, meta in enumerate(results.get("metadatas", [])):
+            key = month_key((meta or {}).get("date"))
+            if not self._is_expired(key):
+                groups.setdefault(key, []).append(i)
+
+        for key, rows in groups.items():
+            partition = self._get_partition(key)
+            for start in range(0, len(rows), _MIGRATION_BATCH_SIZE):
+                batch = rows[start:start + _MIGRATION_BATCH_SIZE]
+                partition.add_documents(
+                    [results["documents"][i] for i in batch],
+                    [results["metadatas"][i] or {} for i in batch],
+                    ids=[ids[i] for i in batch],
+                    embeddings=[results["embeddings"][i] for i in batch],
+                )
+
+        legacy.drop_collection()
+        print(f"Migrated {len(ids)} documents from '{self.collection_name}' into {len(groups)} monthly partitions")
+
+    def _partitions_for(self, filters: Optional[Dict]) -> List[VectorDatabase]:
+        """Các partition giao với khoảng date_from / date_to của bộ lọc (mới nhất trước)"""
+        self._ensure_partitions()
+        filters = filters or {}
+        low = month_key(filters["date_from"]) if filters.get("date_from") else None
+        high = month_key(filters["date_to"]) if filters.get("date_to") else None
+
+        with self._lock:
+            keys = sorted(self._partitions, reverse=True)
+            selected = [
+                self._partitions[key] for key in keys
+                if (low is None or key >= low) and (high is None or key <= high)
+                and not self._is_expired(key)
+            ]
+        for partition in selected:
+            partition._ensure_collection()
+        return selected
+
+    def _map(self, fn: Callable, partitions: List[VectorDatabase]) -> List:
+        """Chạy `fn(partition)` song song trên các partition"""
+        if len(partitions) == 1:
+            return [fn(partitions[0])]
+        return list(self._executor.map(fn, partitions))
+
+    # ------------------------------------------------------------------
+    # Ghi dữ liệu
+    # ------------------------------------------------------------------
+
+    def _group_by_month(self, metadatas: List[Dict]) -> Dict[str, List[int]]:
+        groups: Dict[str, List[int]] = {}
+        for i, meta in enumerate(metadatas):
+            groups.setdefault(month_key((meta or {}).get("date")), []).append(i)
+        return groups
+
+    def add_documents(
+        self,
+        texts: List[str],
+        metadatas: Optional[List[Dict]] = None,
+        ids: Optional[List[str]] = None,
+    ) -> List[Optional[str]]:
+        """
+        Thêm document vào partition theo tháng của `date`
+
+        Tin không có ngày vào partition tháng hiện tại, tin cũ hơn thời hạn
+        lưu trữ bị bỏ qua.
+
+        Returns:
+            ID của từng document theo thứ tự đầu vào (None nếu bị bỏ qua)
+        """
+        if not texts:
+            return []
+        self._ensure_partitions()
+        if metadatas is None:
+            metadatas = [{} for _ in texts]
+
+        result: List[Optional[str]] = [None] * len(texts)
+        skipped = 0
+        for key, rows in self._group_by_month(metadatas).items():
+            if self._is_expired(key):
+                skipped += len(rows)
+                continue
+            added = self._get_partition(key).add_documents(
+                [texts[i] for i in rows],
+                [metadatas[i] for i in rows],
+                ids=[ids[i] for i in rows] if ids else None,
+            )
+            for i, doc_id in zip(rows, added):
+                result[i] = doc_id
+        if skipped:
+            print(f"Skipped {skipped} documents older than {self.retention_months} months")
+        return result
+
+    def update_metadatas(self, ids: List[str], metadatas: List[Dict]):
+        """Cập nhật metadata (document nằm ở partition theo tháng của `date`, không đổi khi merge)"""
+        self._ensure_partitions()
+        for key, rows in self._group_by_month(metadatas).items():
+            with self._lock:
+                partition = self._partitions.get(key)
+            if partition is None:
+                continue  # Partition đã hết hạn
+            partition.update_metadatas([ids[i] for i in rows], [metadatas[i] for i in rows])
+
+    def get_documents(self) -> Dict[str, Dict]:
+        """Lấy toàn bộ document của mọi partition còn hạn"""
+        documents: Dict[str, Dict] = {}
+        for partition_docs in self._map(lambda p: p.get_documents(), self._partitions_for(None)):
+            documents.update(partition_docs)
+        return documents
+
+    def clear_collection(self):
+        """Xóa toàn bộ partition"""
+        self._ensure_partitions()
+        with self._lock:
+            for partition in self._partitions.values():
+                partition.drop_collection()
+            self._partitions.clear()
+        print("Collection cleared")
+
+    # ------------------------------------------------------------------
+    # Tìm kiếm
+    # ------------------------------------------------------------------
+
+    def _lexical_fast_path(
+        self,
+        partitions: List[VectorDatabase],
+        query_text: str,
+        top_k: int,
+        filters: Optional[Dict],
+        recency_half_life_days: Optional[float],
+    ) -> List[Dict]:
+        """Câu hỏi dạng mã + từ khóa: chỉ dùng BM25 trên các partition (không chạy model)"""
+        if not self._base.use_hybrid or not VectorDatabase._is_keyword_query(query_text):
+            return []
+        n_results = top_k * RAG_FILTER_OVERFETCH
+        per_partition = self._map(lambda p: p._lexical_hits(query_text, n_results, filters), partitions)
+        hits = sorted(
+            ((score, doc_id, p) for p, p_hits in zip(partitions, per_partition) for doc_id, score in p_hits),
+            key=lambda hit: hit[0], reverse=True,
+        )[:n_results]
+        if len(hits) < top_k:
+            return []
+        lexical_ids = [doc_id for _, doc_id, _ in hits]
+        documents = self._fetch(hits)
+        return rank_results(documents, top_k, filters, recency_half_life_days, lexical_ids)
+
+    def _fetch(self, hits: List[tuple]) -> List[Dict]:
+        """Đọc document của các hit (score, doc_id, partition) từ đúng partition"""
+        by_partition: Dict[int, tuple] = {}
+        for _, doc_id, partition in hits:
+            by_partition.setdefault(id(partition), (partition, []))[1].append(doc_id)
+        documents = []
+        for partition, doc_ids in by_partition.values():
+            documents.extend(partition._fetch_documents(doc_ids))
+        return documents
+
+    def _search(
+        self,
+        partitions: List[VectorDatabase],
+        query_text: str,
+        embedding,
+        top_k: int,
+        filters: Optional[Dict],
+        recency_half_life_days: Optional[float],
+    ) -> List[Dict]:
+        """
+        Tìm song song trên các partition rồi gộp
+
+        Kết quả vector được gộp theo khoảng cách, kết quả BM25 theo điểm
+        (idf tính riêng từng partition nên chỉ xấp xỉ), sau đó xếp hạng
+        chung bằng `rank_results` như khi chỉ có 1 collection.
+        """
+        rerank = partitions[0]._needs_rerank(filters, recency_half_life_days)
+        n_results = top_k * RAG_FILTER_OVERFETCH if rerank else top_k
+        hybrid = partitions[0].lexical_index is not None
+
+        def search_partition(partition: VectorDatabase):
+            count = partition.collection.count()
+            vector = partition._vector_candidates(embedding, min(n_results, count), filters) if count else []
+            lexical = partition._lexical_hits(query_text, n_results, filters) if hybrid and rerank else []
+            return vector, [(score, doc_id, partition) for doc_id, score in lexical]
+
+        per_partition = self._map(search_partition, partitions)
+        candidates = sorted(
+            (c for vector, _ in per_partition for c in vector), key=lambda c: c["distance"]
+        )[:n_results]
+        if not rerank:
+            return candidates[:top_k]
+
+        lexical_ids = None
+        if hybrid:
+            hits = sorted(
+                (hit for _, lexical in per_partition for hit in lexical),
+                key=lambda hit: hit[0], reverse=True,
+            )[:n_results]
+            lexical_ids = [doc_id for _, doc_id, _ in hits]
+            known = {c["id"] for c in candidates}
+            candidates = candidates + self._fetch([hit for hit in hits if hit[1] not in known])
+        return rank_results(candidates, top_k, filters, recency_half_life_days, lexical_ids)
+
+    def query(
+        self,
+        query_text: str,
+        top_k: int = 3,
+        filters: Optional[Dict] = None,
+        recency_half_life_days: Optional[float] = RAG_RECENCY_HALF_LIFE_DAYS,
+    ) -> List[Dict]:
+        """
+        Tìm kiếm trên các partition liên quan (cùng tham số với VectorDatabase.query)
+
+        Returns:
+            Danh sách kết quả gồm text, metadata, score
+        """
+        if not query_text:
+            return []
+        partitions = self._partitions_for(filters)
+        if not partitions:
+            return []
+
+        fast_results = self._lexical_fast_path(partitions, query_text, top_k, filters, recency_half_life_days)
+        if fast_results:
+            return fast_results
+
+        embedding = self._base.embed_query(query_text)
+        return self._search(partitions, query_text, embedding, top_k, filters, recency_half_life_days)
+
+    async def aquery(
+        self,
+        query_text: str,
+        top_k: int = 3,
+        filters: Optional[Dict] = None,
+        recency_half_life_days: Optional[float] = RAG_RECENCY_HALF_LIFE_DAYS,
+    ) -> List[Dict]:
+        """
+        Tìm kiếm không chặn event loop (embedding câu hỏi được gom batch)
+
+        Returns:
+            Danh sách kết quả gồm text, metadata, score
+        """
+        if not query_text:
+            return []
+        partitions = await asyncio.to_thread(self._partitions_for, filters)
+        if not partitions:
+            return []
+
+        fast_results = await asyncio.to_thread(
+            self._lexical_fast_path, partitions, query_text, top_k, filters, recency_half_life_days
+        )
+        if fast_results:
+            return fast_results
+
+        embedding = await self._base.aembed_query(query_text)
+        return await asyncio.to_thread(
+            self._search, partitions, query_text, embedding, top_k, filters, recency_half_life_days
+        )
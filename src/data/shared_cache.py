@@ -0,0 +1,172 @@
+"""
+Shared Cache - Cache dùng chung giữa các process (SQLite)
+
+Chức năng:
+- Lưu kết quả gọi API tốn thời gian (giá, lịch sử giá, danh sách mã)
+  kèm thời hạn (TTL), theo namespace
+- Nhiều worker process cùng đọc/ghi 1 file (SQLite WAL): kết quả do
+  worker này lấy về được worker khác dùng lại
+- Giá trị lưu dạng JSON; lỗi cache chỉ in cảnh báo và coi như cache miss
+- Mục hết hạn được giữ thêm SHARED_CACHE_STALE_GRACE giây cho get_stale,
+  sau đó bị xóa (purge_expired: khi warm-up và sau mỗi
+  SHARED_CACHE_PURGE_EVERY lần ghi) để file không lớn mãi
+"""
+import json
+import time
+import sqlite3
+import threading
+from typing import Any, Callable, Optional
+
+from config.settings import SHARED_CACHE_PATH, SHARED_CACHE_STALE_GRACE, SHARED_CACHE_PURGE_EVERY
+
+_MISSING = object()
+
+
+class SharedCache:
+    """
+    Cache key-value có TTL trên 1 file SQLite, an toàn giữa thread và process
+
+    Ví dụ:
+        cache = SharedCache()
+        quote = cache.get_or_set("quote", "FPT", ttl=15, compute=lambda: fetch("FPT"))
+    """
+
+    def __init__(self, path: str = SHARED_CACHE_PATH):
+        """
+        Khởi tạo cache
+
+        Args:
+            path: Đường dẫn file SQLite (dùng chung cho mọi worker)
+        """
+        self.path = path
+        self._local = threading.local()  # Mỗi thread 1 connection
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0  # Số lần ghi từ lần dọn trước (trong process này)
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+                "expires_at REAL NOT NULL, PRIMARY KEY (namespace, key))"
+            )
+            self._local.conn = conn
+        return conn
+
+    def get(self, namespace: str, key: str, default: Any = None) -> Any:
+        """
+        Đọc giá trị còn hạn
+
+        Returns:
+            Giá trị đã lưu, hoặc `default` nếu không có / hết hạn / lỗi
+        """
+        try:
+            row = self._connection().execute(
+                "SELECT value FROM cache WHERE namespace = ? AND key = ? AND expires_at > ?",
+                (namespace, key, time.time()),
+            ).fetchone()
+        except Exception as e:
+            print(f"[WARN] Không đọc được shared cache: {e}")
+            row = None
+        if row is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return json.loads(row[0])
+
+    def get_stale(self, namespace: str, key: str, default: Any = None, prefix: bool = False) -> Any:
+        """
+        Đọc giá trị kể cả đã hết hạn (khi không kịp lấy dữ liệu mới)
+
+        Mục hết hạn vẫn nằm trong file thêm SHARED_CACHE_STALE_GRACE giây
+        (tới khi purge_expired xóa).
+
+        Args:
+            prefix: True = lấy mục hết hạn muộn nhất có key bắt đầu bằng `key`
+
+        Returns:
+            Giá trị đã lưu, hoặc `default` nếu không có / lỗi
+        """
+        try:
+            if prefix:
+                escaped = key.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+                row = self._connection().execute(
+                    "SELECT value FROM cache WHERE namespace = ? AND key LIKE ? ESCAPE '\\' "
+                    "ORDER BY expires_at DESC LIMIT 1",
+                    (namespace, escaped + "%"),
+                ).fetchone()
+            else:
+                row = self._connection().execute(
+                    "SELECT value FROM cache WHERE namespace = ? AND key = ?", (namespace, key)
+                ).fetchone()
+        except Exception as e:
+            print(f"[WARN] Không đọc được shared cache: {e}")
+            row = None
+        return json.loads(row[0]) if row is not None else default
+
+    def set(self, namespace: str, key: str, value: Any, ttl: float):
+        """
+        Ghi giá trị (ghi đè nếu đã có)
+
+        Args:
+            namespace: Nhóm dữ liệu (vd: "quote", "history")
+            key: Key trong nhóm
+            value: Giá trị (phải serialize được bằng JSON)
+            ttl: Thời hạn (giây)
+        """
+        try:
+            self._connection().execute(
+                "INSERT OR REPLACE INTO cache (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                (namespace, key, json.dumps(value, ensure_ascii=False), time.time() + ttl),
+            )
+        except Exception as e:
+            print(f"[WARN] Không ghi được shared cache: {e}")
+            return
+        self._writes += 1
+        if self._writes >= SHARED_CACHE_PURGE_EVERY:
+            self._writes = 0
+            self.purge_expired()
+
+    def get_or_set(self, namespace: str, key: str, ttl: float, compute: Callable[[], Any]) -> Any:
+        """
+        Đọc từ cache, nếu không có thì gọi `compute` và lưu kết quả
+
+        Kết quả None không được lưu (thường là lỗi khi gọi API).
+        """
+        value = self.get(namespace, key, _MISSING)
+        if value is not _MISSING:
+            return value
+        value = compute()
+        if value is not None:
+            self.set(namespace, key, value, ttl)
+        return value
+
+    def purge_expired(self, grace: float = SHARED_CACHE_STALE_GRACE) -> int:
+        """
+        Xóa các mục đã hết hạn quá `grace` giây
+
+        Returns:
+            Số mục đã xóa
+        """
+        try:
+            cursor = self._connection().execute("DELETE FROM cache WHERE expires_at <= ?", (time.time() - grace,))
+            return cursor.rowcount
+        except Exception as e:
+            print(f"[WARN] Không dọn được shared cache: {e}")
+            return 0
+
+
+_shared_cache: Optional[SharedCache] = None
+
+
+def get_shared_cache() -> SharedCache:
+    """Cache dùng chung của process hiện tại (tạo khi gọi lần đầu)"""
+    global _shared_cache
+    if _shared_cache is None:
+        _shared_cache = SharedCache()
+    return _shared_cache
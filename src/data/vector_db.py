@@ -15,17 +15,279 @@ os.environ["ANONYMIZED_TELEMETRY"] = "false"
 import warnings
 warnings.filterwarnings("ignore", category=UserWarning, module="chromadb")
 
+import re
+import copy
+import json
+import time
 import uuid
+import asyncio
+import threading
+from collections import OrderedDict
+from datetime import datetime
 from typing import List, Dict, Optional
+import numpy as np
 from chromadb import PersistentClient
+from chromadb.api.types import Documents, EmbeddingFunction, Embeddings
 from chromadb.utils import embedding_functions
 from chromadb.config import Settings
 from config.settings import (
     RAG_PERSIST_DIRECTORY,
     RAG_COLLECTION_NAME,
-    RAG_EMBEDDING_MODEL
+    RAG_EMBEDDING_MODEL,
+    RAG_EMBEDDING_BACKEND,
+    RAG_ONNX_MODEL_DIR,
+    RAG_ONNX_MAX_LENGTH,
+    RAG_EMBEDDING_CACHE_ENABLED,
+    RAG_EMBEDDING_CACHE_DIR,
+    RAG_QUERY_EMBEDDING_LRU_SIZE,
+    RAG_RECENCY_HALF_LIFE_DAYS,
+    RAG_FILTER_OVERFETCH,
+    RAG_HYBRID_ENABLED,
+    RAG_RRF_K,
+    RAG_LEXICAL_FAST_PATH_MAX_TOKENS,
+    RAG_INGEST_BATCH_SIZE
 )
 
+# Các backend embedding được hỗ trợ (chọn bằng RAG_EMBEDDING_BACKEND)
+EMBEDDING_BACKENDS = ("sentence-transformers", "onnx-int8", "onnx")
+
+
+def onnx_model_path(model_name: str, model_dir: str = RAG_ONNX_MODEL_DIR) -> str:
+    """Thư mục chứa model ONNX đã export cho một model embedding."""
+    return os.path.join(model_dir, model_name.replace("/", "__"))
+
+
+def export_onnx_model(
+    model_name: str = RAG_EMBEDDING_MODEL,
+    model_dir: str = RAG_ONNX_MODEL_DIR,
+    max_length: int = RAG_ONNX_MAX_LENGTH
+) -> str:
+    """Export a sentence-transformers model to ONNX (fp32 + dynamic int8).
+    
+    Needs torch/transformers/onnxruntime once at export time; inference
+    afterwards only needs onnxruntime and tokenizers.
+    
+    Args:
+        model_name: Hugging Face model name
+        model_dir: Root directory for exported models
+        max_length: Max tokens per text (same as the sentence-transformers model)
+        
+    Returns:
+        Directory containing model.onnx, model.int8.onnx and tokenizer files
+    """
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+    
+    output_dir = onnx_model_path(model_name, model_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    fp32_path = os.path.join(output_dir, "model.onnx")
+    int8_path = os.path.join(output_dir, "model.int8.onnx")
+    
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name)
+    model.eval()
+    
+    dummy = tokenizer(["Giá cổ phiếu FPT hôm nay"], return_tensors="pt")
+    axes = {0: "batch", 1: "sequence"}
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            (dummy["input_ids"], dummy["attention_mask"]),
+            fp32_path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["last_hidden_state"],
+            dynamic_axes={"input_ids": axes, "attention_mask": axes, "last_hidden_state": axes},
+            opset_version=14
+        )
+    
+    # Lượng tử hóa trọng số sang int8 (activation vẫn float, tính scale lúc chạy)
+    quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+    
+    tokenizer.save_pretrained(output_dir)
+    with open(os.path.join(output_dir, "onnx_config.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "model_name": model_name,
+            "max_length": max_length,
+            "pad_token": tokenizer.pad_token,
+            "pad_id": tokenizer.pad_token_id
+        }, f)
+    
+    print(f"Exported ONNX model to {output_dir}")
+    return output_dir
+
+
+class OnnxEmbeddingFunction(EmbeddingFunction[Documents]):
+    """Embedding function running the MiniLM encoder through ONNX Runtime.
+    
+    Same tokenizer, mean pooling and (un-normalized) output as
+    SentenceTransformerEmbeddingFunction, so vectors are compatible with
+    collections built by the PyTorch backend. With int8 weights the cosine
+    similarity to the fp32 vectors stays >= 1 - RAG_ONNX_COSINE_TOLERANCE
+    (checked by benchmarks/bench_embedding_backends.py).
+    """
+    
+    def __init__(
+        self,
+        model_name: str = RAG_EMBEDDING_MODEL,
+        model_dir: str = RAG_ONNX_MODEL_DIR,
+        quantized: bool = True
+    ):
+        """Initialize ONNX embedding function (exports the model if missing).
+        
+        Args:
+            model_name: Hugging Face model name
+            model_dir: Root directory for exported models
+            quantized: Use int8 weights instead of fp32
+        """
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+        
+        path = onnx_model_path(model_name, model_dir)
+        model_file = os.path.join(path, "model.int8.onnx" if quantized else "model.onnx")
+        if not os.path.exists(model_file):
+            export_onnx_model(model_name, model_dir)
+        
+        with open(os.path.join(path, "onnx_config.json"), "r", encoding="utf-8") as f:
+            config = json.load(f)
+        
+        self._tokenizer = Tokenizer.from_file(os.path.join(path, "tokenizer.json"))
+        self._tokenizer.enable_truncation(max_length=config["max_length"])
+        self._tokenizer.enable_padding(pad_id=config["pad_id"], pad_token=config["pad_token"])
+        
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self._session = ort.InferenceSession(
+            model_file, sess_options=options, providers=["CPUExecutionProvider"]
+        )
+    
+    def __call__(self, input: Documents) -> Embeddings:
+        encodings = self._tokenizer.encode_batch(list(input))
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        
+        hidden = self._session.run(
+            ["last_hidden_state"],
+            {"input_ids": input_ids, "attention_mask": attention_mask}
+        )[0]
+        
+        # Mean pooling theo attention mask (giống sentence-transformers)
+        mask = attention_mask[..., None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return [vector.astype(np.float32) for vector in pooled]
+
+
+def create_embedding_function(
+    backend: str = RAG_EMBEDDING_BACKEND,
+    model_name: str = RAG_EMBEDDING_MODEL
+) -> EmbeddingFunction[Documents]:
+    """Create the embedding function for a backend.
+    
+    Args:
+        backend: One of EMBEDDING_BACKENDS
+        model_name: Embedding model name
+        
+    Returns:
+        ChromaDB embedding function
+    """
+    if backend == "sentence-transformers":
+        return embedding_functions.SentenceTransformerEmbeddingFunction(model_name=model_name)
+    if backend in ("onnx-int8", "onnx"):
+        return OnnxEmbeddingFunction(model_name=model_name, quantized=backend == "onnx-int8")
+    raise ValueError(f"Unknown embedding backend '{backend}'. Choose one of: {', '.join(EMBEDDING_BACKENDS)}")
+
+
+def date_to_timestamp(date: Optional[str]) -> Optional[int]:
+    """Convert a 'YYYY-MM-DD' metadata date to a Unix timestamp (None if invalid)."""
+    if not date:
+        return None
+    try:
+        return int(datetime.strptime(str(date)[:10], "%Y-%m-%d").timestamp())
+    except ValueError:
+        return None
+
+
+def build_where(filters: Optional[Dict]) -> Optional[Dict]:
+    """Build a ChromaDB `where` clause from retrieval filters.
+    
+    Supported filters: symbol (exact), date_from / date_to ('YYYY-MM-DD',
+    matched on the numeric `timestamp` metadata). `source` is matched after
+    the search because merged duplicates store several sources in one field.
+    
+    Args:
+        filters: Filter dictionary (or None)
+        
+    Returns:
+        `where` clause for collection.query, or None
+    """
+    if not filters:
+        return None
+    
+    clauses = []
+    if filters.get("symbol"):
+        clauses.append({"symbol": filters["symbol"].upper()})
+    date_from = date_to_timestamp(filters.get("date_from"))
+    if date_from is not None:
+        clauses.append({"timestamp": {"$gte": date_from}})
+    date_to = date_to_timestamp(filters.get("date_to"))
+    if date_to is not None:
+        clauses.append({"timestamp": {"$lt": date_to + 86400}})  # Hết ngày date_to
+    
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def rank_results(
+    candidates: List[Dict],
+    top_k: int,
+    filters: Optional[Dict],
+    recency_half_life_days: Optional[float],
+    lexical_ids: Optional[List[str]] = None
+) -> List[Dict]:
+    """Fuse, filter by source and re-score candidates with time decay.
+    
+    Base score is the reciprocal-rank fusion of the vector ranking (candidates
+    with a distance, in the given order) and the BM25 ranking `lexical_ids`
+    in hybrid mode, else 1 / (1 + distance). It is multiplied by
+    0.5 ** (age_days / half_life) when recency ranking is on.
+    
+    Args:
+        candidates: Results of the vector search plus documents found by BM25 only
+        top_k: Number of results to return
+        filters: Retrieval filters (only `source` is applied here)
+        recency_half_life_days: Age at which a result's score is halved
+        lexical_ids: BM25 ranking (None when hybrid search is off)
+        
+    Returns:
+        Top results with an added `rank_score`
+    """
+    if lexical_ids is not None:
+        from data.lexical_index import reciprocal_rank_fusion
+        vector_ids = [c["id"] for c in candidates if c["distance"] is not None]
+        base_scores = reciprocal_rank_fusion([vector_ids, lexical_ids], k=RAG_RRF_K)
+    else:
+        base_scores = {c["id"]: 1 / (1 + c["distance"]) for c in candidates}
+    
+    source = (filters or {}).get("source")
+    now = time.time()
+    
+    ranked = []
+    for r in candidates:
+        meta = r["metadata"] or {}
+        if source and source.lower() not in str(meta.get("source", "")).lower():
+            continue
+        
+        decay = 1.0
+        timestamp = meta.get("timestamp") or date_to_timestamp(meta.get("date"))
+        if recency_half_life_days and timestamp is not None:
+            age_days = max(0.0, (now - timestamp) / 86400)
+            decay = 0.5 ** (age_days / recency_half_life_days)
+        ranked.append({**r, "rank_score": base_scores.get(r["id"], 0.0) * decay})
+    
+    ranked.sort(key=lambda r: r["rank_score"], reverse=True)
+    return ranked[:top_k]
+
 
 class VectorDatabase:
     """Vector database wrapper for ChromaDB."""
@@ -34,7 +296,10 @@ class VectorDatabase:
         self,
         persist_directory: str = RAG_PERSIST_DIRECTORY,
         collection_name: str = RAG_COLLECTION_NAME,
-        embedding_model: str = RAG_EMBEDDING_MODEL
+        embedding_model: str = RAG_EMBEDDING_MODEL,
+        use_embedding_cache: bool = RAG_EMBEDDING_CACHE_ENABLED,
+        embedding_backend: str = RAG_EMBEDDING_BACKEND,
+        use_hybrid: bool = RAG_HYBRID_ENABLED
     ):
         """Initialize vector database.
         
@@ -42,6 +307,9 @@ class VectorDatabase:
             persist_directory: Directory to persist database
             collection_name: Name of the collection
             embedding_model: Embedding model name
+            use_embedding_cache: Reuse embeddings stored on disk by content hash
+            embedding_backend: Embedding backend (see EMBEDDING_BACKENDS)
+            use_hybrid: Fuse BM25 keyword results with vector results
         """
         os.makedirs(persist_directory, exist_ok=True)
         
@@ -56,16 +324,25 @@ class VectorDatabase:
         )
         
         self.embedding_model = embedding_model
+        self.embedding_backend = embedding_backend
         self.embedding_fn = None  # Lazy load when needed
+        self.query_embedding_fn = None  # Model function for queries (bypasses disk cache)
+        self.use_embedding_cache = use_embedding_cache
+        self._query_embeddings = OrderedDict()  # LRU {query_text: embedding}
+        self._query_embeddings_lock = threading.Lock()
+        self._batcher = None  # Micro-batcher for concurrent queries, lazy load
+        self.persist_directory = persist_directory
         self.collection_name = collection_name
         self.collection = None  # Lazy load when needed
+        self.use_hybrid = use_hybrid
+        self.lexical_index = None  # BM25 index, loaded with the collection
     
     def _ensure_embedding_fn(self):
         """Initialize embedding function (lazy loading)."""
         if self.embedding_fn is None:
             try:
-                self.embedding_fn = embedding_functions.SentenceTransformerEmbeddingFunction(
-                    model_name=self.embedding_model
+                self.embedding_fn = create_embedding_function(
+                    self.embedding_backend, self.embedding_model
                 )
             except (ValueError, ImportError) as e:
                 error_msg = str(e)
@@ -77,6 +354,40 @@ class VectorDatabase:
                         "Please install it with: pip install sentence-transformers"
                     ) from e
                 raise
+            self.query_embedding_fn = self.embedding_fn
+            
+            # Chỉ gọi model cho text chưa từng được embedding
+            if self.use_embedding_cache:
+                from data.embedding_cache import EmbeddingCache, CachedEmbeddingFunction
+                # Vector int8 hơi khác fp32 nên mỗi backend có cache riêng
+                cache_key = self.embedding_model
+                if self.embedding_backend != "sentence-transformers":
+                    cache_key = f"{self.embedding_model}#{self.embedding_backend}"
+                cache = EmbeddingCache(cache_key, cache_dir=RAG_EMBEDDING_CACHE_DIR)
+                self.embedding_fn = CachedEmbeddingFunction(self.embedding_fn, cache)
+                print(f"Embedding cache: {len(cache)} vectors on disk")
+    
+    def partition(self, collection_name: str) -> "VectorDatabase":
+        """Create a VectorDatabase for another collection in the same database.
+        
+        The client, embedding model and query-embedding LRU are shared, so
+        many partitions cost one model in memory.
+        
+        Args:
+            collection_name: Name of the other collection
+            
+        Returns:
+            VectorDatabase bound to `collection_name` (opened lazily)
+        """
+        self._ensure_embedding_fn()
+        sibling = copy.copy(self)
+        sibling.collection_name = collection_name
+        sibling.collection = None
+        sibling.lexical_index = None
+        return sibling
+    
+    def _lexical_index_path(self) -> str:
+        return os.path.join(self.persist_directory, f"{self.collection_name}.bm25.pkl")
     
     def _ensure_collection(self):
         """Initialize collection (lazy loading)."""
@@ -86,7 +397,8 @@ class VectorDatabase:
             if self.collection_name not in existing_collections:
                 self.collection = self.client.create_collection(
                     name=self.collection_name,
-                    embedding_function=self.embedding_fn
+                    embedding_function=self.embedding_fn,
+                    metadata={"timestamp_indexed": 1}
                 )
                 print(f"Created new collection '{self.collection_name}'")
             else:
@@ -95,22 +407,77 @@ class VectorDatabase:
                     embedding_function=self.embedding_fn
                 )
                 print(f"Loaded existing collection '{self.collection_name}'")
+                if not (self.collection.metadata or {}).get("timestamp_indexed"):
+                    self._backfill_timestamps()
+            if self.use_hybrid:
+                self._ensure_lexical_index()
+    
+    def _ensure_lexical_index(self):
+        """Load the BM25 index and rebuild it if it is out of sync with the collection."""
+        from data.lexical_index import BM25Index
+        self.lexical_index = BM25Index(self._lexical_index_path())
+        
+        count = self.collection.count()
+        if len(self.lexical_index) != count:
+            start = time.perf_counter()
+            self.lexical_index.clear()
+            results = self.collection.get(include=["documents", "metadatas"])
+            self.lexical_index.add(
+                results.get("ids", []),
+                results.get("documents", []),
+                [meta or {} for meta in results.get("metadatas", [])]
+            )
+            self.lexical_index.save()
+            print(f"Rebuilt BM25 index over {count} documents in {time.perf_counter() - start:.2f}s")
+    
+    @staticmethod
+    def _with_timestamp(meta: Dict) -> Dict:
+        """Add numeric `timestamp` (from `date`) so date ranges can be filtered in ChromaDB."""
+        if "timestamp" in meta:
+            return meta
+        timestamp = date_to_timestamp(meta.get("date"))
+        return {**meta, "timestamp": timestamp} if timestamp is not None else meta
+    
+    def _backfill_timestamps(self):
+        """One-time migration: add `timestamp` to documents stored before date filtering."""
+        results = self.collection.get(include=["metadatas"])
+        ids, metas = [], []
+        for doc_id, meta in zip(results.get("ids", []), results.get("metadatas", [])):
+            meta = meta or {}
+            updated = self._with_timestamp(meta)
+            if updated is not meta:
+                ids.append(doc_id)
+                metas.append(updated)
+        if ids:
+            self.collection.update(ids=ids, metadatas=metas)
+        
+        collection_meta = {
+            k: v for k, v in (self.collection.metadata or {}).items()
+            if not k.startswith("hnsw:")
+        }
+        self.collection.modify(metadata={**collection_meta, "timestamp_indexed": 1})
+        print(f"Backfilled timestamp metadata for {len(ids)} documents")
     
     def add_documents(
         self,
         texts: List[str],
         metadatas: Optional[List[Dict]] = None,
-        ids: Optional[List[str]] = None
-    ):
+        ids: Optional[List[str]] = None,
+        embeddings: Optional[List] = None
+    ) -> List[str]:
         """Add documents to the collection.
         
         Args:
             texts: List of text documents
             metadatas: Optional list of metadata dictionaries
             ids: Optional list of document IDs
+            embeddings: Precomputed embeddings (skip the embedding model)
+            
+        Returns:
+            List of IDs of the added documents
         """
         if not texts:
-            return
+            return []
         
         self._ensure_collection()
         
@@ -118,16 +485,130 @@ class VectorDatabase:
             ids = [str(uuid.uuid4()) for _ in texts]
         if metadatas is None:
             metadatas = [{} for _ in range(len(texts))]
+        metadatas = [self._with_timestamp(meta) for meta in metadatas]
         
-        self.collection.add(documents=texts, metadatas=metadatas, ids=ids)
+        # Embedding theo batch lớn (1 lần gọi model cho nhiều chunk), ghi vào ChromaDB theo từng batch
+        for start in range(0, len(texts), RAG_INGEST_BATCH_SIZE):
+            end = start + RAG_INGEST_BATCH_SIZE
+            batch_texts = texts[start:end]
+            batch_embeddings = embeddings[start:end] if embeddings is not None else self.embedding_fn(batch_texts)
+            self.collection.add(
+                documents=batch_texts,
+                metadatas=metadatas[start:end],
+                ids=ids[start:end],
+                embeddings=batch_embeddings
+            )
+        if self.lexical_index is not None:
+            self.lexical_index.add(ids, texts, metadatas)
+            self.lexical_index.save_if_due()
         print(f"Added {len(texts)} documents to ChromaDB")
+        return ids
+    
+    def get_documents(self) -> Dict[str, Dict]:
+        """Get all stored documents without embeddings.
+        
+        Returns:
+            Dictionary {id: {"text": ..., "metadata": ...}}
+        """
+        self._ensure_collection()
+        results = self.collection.get(include=["documents", "metadatas"])
+        return {
+            doc_id: {"text": doc, "metadata": meta or {}}
+            for doc_id, doc, meta in zip(
+                results.get("ids", []),
+                results.get("documents", []),
+                results.get("metadatas", [])
+            )
+        }
+    
+    def update_metadatas(self, ids: List[str], metadatas: List[Dict]):
+        """Update metadata of existing documents (no re-embedding).
+        
+        Args:
+            ids: List of document IDs
+            metadatas: New metadata dictionaries
+        """
+        if not ids:
+            return
+        self._ensure_collection()
+        metadatas = [self._with_timestamp(meta) for meta in metadatas]
+        self.collection.update(ids=ids, metadatas=metadatas)
+        if self.lexical_index is not None:
+            self.lexical_index.update_filters(ids, metadatas)
+            self.lexical_index.save_if_due()
+    
+    def _cached_query_embedding(self, query_text: str):
+        """Get query embedding from the in-memory LRU (or None)."""
+        with self._query_embeddings_lock:
+            embedding = self._query_embeddings.get(query_text)
+            if embedding is not None:
+                self._query_embeddings.move_to_end(query_text)
+            return embedding
+    
+    def _remember_query_embedding(self, query_text: str, embedding):
+        """Store query embedding in the in-memory LRU."""
+        with self._query_embeddings_lock:
+            self._query_embeddings[query_text] = embedding
+            while len(self._query_embeddings) > RAG_QUERY_EMBEDDING_LRU_SIZE:
+                self._query_embeddings.popitem(last=False)
+    
+    def _get_batcher(self):
+        """Get micro-batcher for concurrent query embeddings (lazy initialization)."""
+        if self._batcher is None:
+            from data.embedding_batcher import EmbeddingBatcher
+            self._ensure_embedding_fn()
+            self._batcher = EmbeddingBatcher(self.query_embedding_fn)
+        return self._batcher
+    
+    def embed_query(self, query_text: str):
+        """Embed a query text, memoized in a small in-memory LRU.
+        
+        Args:
+            query_text: Query text
+            
+        Returns:
+            Query embedding vector
+        """
+        embedding = self._cached_query_embedding(query_text)
+        if embedding is None:
+            self._ensure_embedding_fn()
+            embedding = self.query_embedding_fn([query_text])[0]
+            self._remember_query_embedding(query_text, embedding)
+        return embedding
     
-    def query(self, query_text: str, top_k: int = 3) -> List[Dict]:
+    async def aembed_query(self, query_text: str):
+        """Embed a query text asynchronously.
+        
+        Concurrent callers are grouped into one model forward pass
+        by the embedding batcher.
+        
+        Args:
+            query_text: Query text
+            
+        Returns:
+            Query embedding vector
+        """
+        embedding = self._cached_query_embedding(query_text)
+        if embedding is None:
+            embedding = await self._get_batcher().embed(query_text)
+            self._remember_query_embedding(query_text, embedding)
+        return embedding
+    
+    def query(
+        self,
+        query_text: str,
+        top_k: int = 3,
+        filters: Optional[Dict] = None,
+        recency_half_life_days: Optional[float] = RAG_RECENCY_HALF_LIFE_DAYS
+    ) -> List[Dict]:
         """Query the collection.
         
         Args:
             query_text: Query text
             top_k: Number of results to return
+            filters: Metadata filters: symbol, source, date_from, date_to
+            recency_half_life_days: Age at which a result's score is halved
+                (None or 0 to rank by similarity only)
             
         Returns:
             List of result dictionaries with text, metadata, and score
@@ -136,28 +617,185 @@ class VectorDatabase:
             return []
         
         self._ensure_collection()
+        fast_results = self._lexical_fast_path(query_text, top_k, filters, recency_half_life_days)
+        if fast_results:
+            return fast_results
         
-        results = self.collection.query(query_texts=[query_text], n_results=top_k)
+        n_results = top_k * RAG_FILTER_OVERFETCH if self._needs_rerank(filters, recency_half_life_days) else top_k
+        candidates = self._vector_candidates(self.embed_query(query_text), n_results, filters)
+        return self._rank(query_text, candidates, top_k, filters, recency_half_life_days)
+    
+    async def aquery(
+        self,
+        query_text: str,
+        top_k: int = 3,
+        filters: Optional[Dict] = None,
+        recency_half_life_days: Optional[float] = RAG_RECENCY_HALF_LIFE_DAYS
+    ) -> List[Dict]:
+        """Query the collection without blocking the event loop.
+        
+        Args:
+            query_text: Query text
+            top_k: Number of results to return
+            filters: Metadata filters: symbol, source, date_from, date_to
+            recency_half_life_days: Age at which a result's score is halved
+            
+        Returns:
+            List of result dictionaries with text, metadata, and score
+        """
+        if not query_text:
+            return []
+        
+        await asyncio.to_thread(self._ensure_collection)
+        fast_results = await asyncio.to_thread(
+            self._lexical_fast_path, query_text, top_k, filters, recency_half_life_days
+        )
+        if fast_results:
+            return fast_results
+        
+        embedding = await self.aembed_query(query_text)
+        n_results = top_k * RAG_FILTER_OVERFETCH if self._needs_rerank(filters, recency_half_life_days) else top_k
+        candidates = await asyncio.to_thread(self._vector_candidates, embedding, n_results, filters)
+        return await asyncio.to_thread(
+            self._rank, query_text, candidates, top_k, filters, recency_half_life_days
+        )
+    
+    def _needs_rerank(self, filters: Optional[Dict], recency_half_life_days: Optional[float]) -> bool:
+        """Whether results are re-scored after the ANN search (so candidates are over-fetched)."""
+        return (
+            self.lexical_index is not None
+            or bool(recency_half_life_days)
+            or bool(filters and filters.get("source"))
+        )
+    
+    def _vector_candidates(self, embedding, n_results: int, filters: Optional[Dict] = None) -> List[Dict]:
+        """Run ANN search for a precomputed query embedding.
+        
+        When results are re-ranked (hybrid, recency, source filter), callers
+        ask for more candidates than `top_k`.
+        """
+        results = self.collection.query(
+            query_embeddings=[embedding],
+            n_results=n_results,
+            where=build_where(filters)
+        )
         
         if not results or not results.get("documents") or not results["documents"][0]:
             return []
         
         retrieved = []
-        for doc, meta, dist in zip(
+        for doc_id, doc, meta, dist in zip(
+            results["ids"][0],
             results["documents"][0],
             results["metadatas"][0],
             results["distances"][0]
         ):
             retrieved.append({
+                "id": doc_id,
                 "text": doc,
                 "metadata": meta,
-                "score": 1 - dist
+                "score": 1 - dist,
+                "distance": dist
             })
         return retrieved
     
+    def _lexical_hits(self, query_text: str, n_results: int, filters: Optional[Dict]) -> List[tuple]:
+        """BM25 search with the same filters as the vector search, returns (doc ID, score)."""
+        if self.lexical_index is None:
+            return []
+        filters = filters or {}
+        date_from = date_to_timestamp(filters.get("date_from"))
+        date_to = date_to_timestamp(filters.get("date_to"))
+        return self.lexical_index.search(
+            query_text,
+            top_k=n_results,
+            filters=filters,
+            date_from=date_from,
+            date_to=date_to + 86400 if date_to is not None else None
+        )
+    
+    def _lexical_search(self, query_text: str, n_results: int, filters: Optional[Dict]) -> List[str]:
+        """BM25 search with the same filters as the vector search, returns doc IDs."""
+        return [doc_id for doc_id, _ in self._lexical_hits(query_text, n_results, filters)]
+    
+    def _fetch_documents(self, ids: List[str]) -> List[Dict]:
+        """Read documents by ID (no embedding) in the result format of `query`."""
+        if not ids:
+            return []
+        results = self.collection.get(ids=ids, include=["documents", "metadatas"])
+        by_id = {
+            doc_id: {"id": doc_id, "text": doc, "metadata": meta or {}, "score": None, "distance": None}
+            for doc_id, doc, meta in zip(results["ids"], results["documents"], results["metadatas"])
+        }
+        return [by_id[doc_id] for doc_id in ids if doc_id in by_id]
+    
+    @staticmethod
+    def _is_keyword_query(query_text: str) -> bool:
+        """Query is just a ticker plus a keyword or two, e.g. "FPT Q3/2025"."""
+        from data.lexical_index import tokenize
+        return (
+            len(tokenize(query_text)) <= RAG_LEXICAL_FAST_PATH_MAX_TOKENS
+            and re.search(r"\b[A-Z]{3}\b", query_text) is not None
+        )
+    
+    def _lexical_fast_path(
+        self,
+        query_text: str,
+        top_k: int,
+        filters: Optional[Dict],
+        recency_half_life_days: Optional[float]
+    ) -> List[Dict]:
+        """Answer ticker + keyword queries from BM25 only, skipping the embedding model.
+        
+        Returns an empty list when the fast path does not apply or finds
+        fewer than `top_k` documents (the caller then runs the hybrid search).
+        """
+        if self.lexical_index is None or not self._is_keyword_query(query_text):
+            return []
+        ids = self._lexical_search(query_text, top_k * RAG_FILTER_OVERFETCH, filters)
+        if len(ids) < top_k:
+            return []
+        return self._rank(query_text, self._fetch_documents(ids), top_k, filters,
+                          recency_half_life_days, lexical_ids=ids)
+    
+    def _rank(
+        self,
+        query_text: str,
+        candidates: List[Dict],
+        top_k: int,
+        filters: Optional[Dict],
+        recency_half_life_days: Optional[float],
+        lexical_ids: Optional[List[str]] = None
+    ) -> List[Dict]:
+        """Add BM25 hits (hybrid mode) and rank candidates with `rank_results`."""
+        if not self._needs_rerank(filters, recency_half_life_days):
+            return candidates[:top_k]
+        
+        if self.lexical_index is not None and lexical_ids is None:
+            lexical_ids = self._lexical_search(query_text, top_k * RAG_FILTER_OVERFETCH, filters)
+            known = {c["id"] for c in candidates}
+            candidates = candidates + self._fetch_documents([i for i in lexical_ids if i not in known])
+        return rank_results(candidates, top_k, filters, recency_half_life_days, lexical_ids)
+    
     def clear_collection(self):
         """Delete all documents in the collection."""
         self._ensure_collection()
         self.collection.delete(where={})
+        if self.lexical_index is not None:
+            self.lexical_index.clear()
+            self.lexical_index.save()
         print("Collection cleared")
-
+    
+    def drop_collection(self):
+        """Delete the whole collection and its BM25 index file (O(1), no per-document deletes)."""
+        try:
+            self.client.delete_collection(name=self.collection_name)
+        except ValueError:
+            pass  # Collection không tồn tại
+        if self.lexical_index is not None:
+            self.lexical_index.path = None  # Không ghi lại file khi tắt process
+        if os.path.exists(self._lexical_index_path()):
+            os.remove(self._lexical_index_path())
+        self.collection = None
+        self.lexical_index = None
+        print(f"Dropped collection '{self.collection_name}'")
@@ -4,10 +4,22 @@ LLM Service - Dịch vụ gọi API Groq để xử lý ngôn ngữ tự nhiên
 Chức năng:
 - Gọi API Groq để phân loại câu hỏi
 - Format câu trả lời tự nhiên hơn
+- Trả câu trả lời theo từng đoạn (streaming) cho API mode
+- Ghi lại số token sử dụng (response.usage) vào metrics
 """
 import os
-from openai import AsyncOpenAI
+from typing import AsyncIterator, Optional
 from config.settings import GROQ_API_KEY, DEFAULT_MODEL, GROQ_BASE_URL
+from core.telemetry import record_llm_usage
+
+
+def _chunk_usage(chunk):
+    """Usage trong chunk stream: OpenAI ở chunk.usage, Groq ở chunk cuối (x_groq.usage)"""
+    usage = getattr(chunk, "usage", None)
+    if usage is None:
+        x_groq = getattr(chunk, "x_groq", None)
+        usage = x_groq.get("usage") if isinstance(x_groq, dict) else getattr(x_groq, "usage", None)
+    return usage
 
 
 class LLMService:
@@ -28,12 +40,34 @@ class LLMService:
             raise ValueError("GROQ_API_KEY không tìm thấy trong biến môi trường!")
         
         self.model_name = model_name
-        self.client = AsyncOpenAI(
-            api_key=GROQ_API_KEY,
-            base_url=GROQ_BASE_URL
-        )
+        self._client = None  # Tạo khi gọi API lần đầu (import openai chậm)
+    
+    @property
+    def client(self):
+        """OpenAI client trỏ tới Groq (khởi tạo ở lần dùng đầu tiên)"""
+        if self._client is None:
+            from openai import AsyncOpenAI
+            self._client = AsyncOpenAI(
+                api_key=GROQ_API_KEY,
+                base_url=GROQ_BASE_URL
+            )
+        return self._client
     
-    async def complete(self, prompt: str, temperature: float = 0.6, max_tokens: int = 500) -> str:
+    def _client_for(self, timeout: Optional[float]):
+        """
+        Client cho request có deadline: không retry (retry sẽ vượt quá thời gian còn lại)
+        
+        Timeout của client dài hơn 1 giây: caller (core/deadline.within_budget)
+        hủy request đúng hạn và ghi nhận quá hạn; timeout của client chỉ là
+        chốt chặn khi caller không hủy.
+        """
+        if timeout is None:
+            return self.client
+        return self.client.with_options(timeout=timeout + 1.0, max_retries=0)
+    
+    async def complete(
+        self, prompt: str, temperature: float = 0.6, max_tokens: int = 500, timeout: Optional[float] = None
+    ) -> str:
         """
         Gọi API để tạo câu trả lời từ prompt
         
@@ -41,19 +75,55 @@ class LLMService:
             prompt: Câu hỏi hoặc prompt cần xử lý
             temperature: Độ sáng tạo (0.0-1.0), cao hơn = sáng tạo hơn
             max_tokens: Số ký tự tối đa trong câu trả lời
+            timeout: Timeout của request (giây, theo deadline của câu hỏi),
+                None = mặc định của client
             
         Returns:
             Câu trả lời từ LLM (hoặc chuỗi rỗng nếu lỗi)
         """
         try:
-            response = await self.client.chat.completions.create(
+            response = await self._client_for(timeout).chat.completions.create(
                 model=self.model_name,
                 messages=[{"role": "user", "content": prompt}],
                 temperature=temperature,
                 max_tokens=max_tokens,
             )
+            record_llm_usage(self.model_name, getattr(response, "usage", None))
             return response.choices[0].message.content.strip()
         except Exception as e:
             print(f"[WARN] Gọi LLM API thất bại: {e}")
+            record_llm_usage(self.model_name, None, status="error")
             return ""
 
+    async def stream(
+        self, prompt: str, temperature: float = 0.6, max_tokens: int = 500, timeout: Optional[float] = None
+    ) -> AsyncIterator[str]:
+        """
+        Gọi API và trả câu trả lời theo từng đoạn ngay khi model sinh ra
+        
+        Args:
+            prompt: Câu hỏi hoặc prompt cần xử lý
+            temperature: Độ sáng tạo (0.0-1.0)
+            max_tokens: Số token tối đa trong câu trả lời
+            timeout: Timeout của request (giây), None = mặc định của client
+            
+        Yields:
+            Từng đoạn text (dừng sớm nếu lỗi)
+        """
+        try:
+            response = await self._client_for(timeout).chat.completions.create(
+                model=self.model_name,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=temperature,
+                max_tokens=max_tokens,
+                stream=True,
+            )
+            usage = None
+            async for chunk in response:
+                usage = _chunk_usage(chunk) or usage
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+            record_llm_usage(self.model_name, usage)
+        except Exception as e:
+            print(f"[WARN] Gọi LLM API (stream) thất bại: {e}")
+            record_llm_usage(self.model_name, None, status="error")
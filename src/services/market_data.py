@@ -0,0 +1,481 @@
+"""
+Market Data - Lấy giá / lịch sử giá từ nhiều nguồn vnstock (VCI, TCBS, ...)
+
+Chức năng:
+- Định tuyến theo sức khỏe: nguồn lỗi nhiều hoặc chậm (p50) được xếp sau,
+  nguồn đang bị ngắt (circuit breaker mở) bị bỏ qua; thống kê cũ hơn
+  MARKET_LATENCY_MAX_AGE bị bỏ → nguồn ít được dùng sẽ được thử lại
+- Hedged request: nguồn đầu chưa trả lời sau p95 latency của nó → gửi thêm
+  tới nguồn tiếp theo, lấy kết quả về trước
+- Failover: nguồn lỗi → thử ngay nguồn tiếp theo
+- Request tới nguồn luôn có timeout (MARKET_SOURCE_TIMEOUT hoặc thời gian còn
+  lại); mỗi nguồn chạy tối đa MARKET_SOURCE_MAX_IN_FLIGHT request, không hedge
+  khi thread pool đã đầy → nguồn treo không làm nghẽn các nguồn còn lại
+- Circuit breaker mỗi nguồn: MARKET_BREAKER_FAILURES lỗi liên tiếp → ngắt
+  MARKET_BREAKER_COOLDOWN giây, sau đó cho 1 request thử
+- Rate limit mỗi nguồn qua UpstreamScheduler (ưu tiên câu hỏi của người dùng,
+  chia lượt công bằng giữa các user); nguồn hết lượt → thử nguồn khác
+- Latency (p50/p95/p99) và tỉ lệ lỗi theo nguồn: stats() và metrics
+  market_data_request_duration_seconds{source,kind,status}
+
+Nguồn là object bất kỳ có `name`, `quote(symbol, timeout)` và
+`history(symbol, start, end, timeout)` → thay bằng nguồn giả khi test / load test:
+    client = MarketDataClient([SlowSource("A"), FakeSource("B")])
+
+Các hàm chạy đồng bộ (gọi từ thread của agent, như vnstock); request thua
+trong hedge vẫn chạy tiếp trong thread pool và được tính vào thống kê.
+"""
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, Dict, List, Optional
+
+from core.telemetry import MARKET_DATA_DURATION, MARKET_DATA_HEDGES, MARKET_BREAKER_TRANSITIONS
+from services.upstream_scheduler import RateLimited, get_upstream_scheduler
+from config.settings import (
+    MARKET_DATA_SOURCES,
+    MARKET_DATA_WORKERS,
+    MARKET_HEDGE_ENABLED,
+    MARKET_HEDGE_DEFAULT_DELAY,
+    MARKET_HEDGE_MIN_DELAY,
+    MARKET_HEDGE_MAX_DELAY,
+    MARKET_LATENCY_WINDOW,
+    MARKET_LATENCY_MIN_SAMPLES,
+    MARKET_LATENCY_MAX_AGE,
+    MARKET_BREAKER_FAILURES,
+    MARKET_BREAKER_COOLDOWN,
+    MARKET_SOURCE_TIMEOUT,
+    MARKET_SOURCE_MAX_IN_FLIGHT,
+)
+
+_request_timeout = threading.local()  # Timeout của request HTTP trong thread đang gọi nguồn
+
+
+def _install_requests_timeout():
+    """
+    Gán timeout cho request của `requests` khi đang gọi nguồn
+
+    vnstock không cho truyền timeout và requests mặc định chờ mãi → request
+    trong thread có `_request_timeout.value` (và không tự đặt timeout) dùng
+    giá trị đó. Thread khác không bị ảnh hưởng.
+    """
+    import requests
+    original = requests.Session.request
+    if getattr(original, "_market_data_timeout", False):
+        return
+
+    def request(self, method, url, *args, **kwargs):
+        timeout = getattr(_request_timeout, "value", None)
+        # timeout là tham số thứ 7 sau url (params, data, headers, cookies, files, auth, timeout)
+        if timeout is not None and kwargs.get("timeout") is None and len(args) < 7:
+            kwargs["timeout"] = timeout
+        return original(self, method, url, *args, **kwargs)
+
+    request._market_data_timeout = True
+    requests.Session.request = request
+
+
+class MarketDataError(Exception):
+    """Không nguồn nào trả lời được (lỗi, bị ngắt hoặc hết thời gian)"""
+
+
+class VnstockSource:
+    """1 nguồn dữ liệu của vnstock (vnstock.stock(symbol, source=...))"""
+
+    def __init__(self, source: str):
+        """
+        Args:
+            source: Tên nguồn trong vnstock ("VCI", "TCBS", "MSN", ...)
+        """
+        self.name = source
+
+    def _stock(self, symbol: str):
+        from vnstock import Vnstock  # Import chậm → chỉ khi gọi lần đầu
+        return Vnstock().stock(symbol=symbol, source=self.name)
+
+    @staticmethod
+    def _with_timeout(timeout: float, call: Callable):
+        _install_requests_timeout()
+        _request_timeout.value = timeout
+        try:
+            return call()
+        finally:
+            _request_timeout.value = None
+
+    def quote(self, symbol: str, timeout: float = MARKET_SOURCE_TIMEOUT) -> Optional[Dict]:
+        """
+        Giá hiện tại
+
+        Args:
+            symbol: Mã cổ phiếu
+            timeout: Timeout mỗi request HTTP (giây)
+
+        Returns:
+            {"price", "change", "change_percent", "volume"} hoặc None nếu không có dữ liệu
+        """
+        quote = self._with_timeout(timeout, lambda: self._stock(symbol).quote())
+        if quote is None or quote.empty:
+            return None
+        last = quote.iloc[-1]
+        return {
+            "price": float(last['close']),
+            "change": float(last['change']) if 'change' in quote.columns else 0.0,
+            "change_percent": float(last['pctChange']) if 'pctChange' in quote.columns else 0.0,
+            "volume": float(last['volume']) if 'volume' in quote.columns else None,
+        }
+
+    def history(self, symbol: str, start: str, end: str, timeout: float = MARKET_SOURCE_TIMEOUT) -> Optional[List[float]]:
+        """
+        Giá đóng cửa theo ngày
+
+        Args:
+            timeout: Timeout mỗi request HTTP (giây)
+
+        Returns:
+            Danh sách giá đóng cửa (cũ → mới) hoặc None nếu không có dữ liệu
+        """
+        hist = self._with_timeout(
+            timeout, lambda: self._stock(symbol).quote.history(start=start, end=end, interval='1D')
+        )
+        if hist is None or hist.empty:
+            return None
+        return hist['close'].astype(float).tolist()
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker của 1 nguồn
+
+    closed → (N lỗi liên tiếp) → open → (hết cooldown) → half_open: cho 1
+    request thử → thành công: closed, lỗi: open lại
+    """
+
+    def __init__(self, name: str, failures: int = MARKET_BREAKER_FAILURES, cooldown: float = MARKET_BREAKER_COOLDOWN):
+        self.name = name
+        self.failures = failures
+        self.cooldown = cooldown
+        self.state = "closed"
+        self._consecutive = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def _transition(self, state: str):
+        if state != self.state:
+            self.state = state
+            MARKET_BREAKER_TRANSITIONS.inc(source=self.name, state=state)
+            print(f"[MarketData] Nguồn {self.name}: circuit breaker → {state}")
+
+    def allow(self) -> bool:
+        """Có được gửi request tới nguồn không (half_open: chỉ 1 request thử)"""
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.cooldown:
+                self._transition("half_open")
+            if self.state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def release(self):
+        """Trả lại lượt thử của allow() khi request không được gửi (vd: hết lượt rate limit)"""
+        with self._lock:
+            self._probing = False
+
+    def record(self, ok: bool):
+        with self._lock:
+            self._probing = False
+            if ok:
+                self._consecutive = 0
+                self._transition("closed")
+                return
+            self._consecutive += 1
+            if self.state == "half_open" or self._consecutive >= self.failures:
+                self._opened_at = time.monotonic()
+                self._transition("open")
+
+
+class SourceStats:
+    """
+    Latency và lỗi của MARKET_LATENCY_WINDOW request gần nhất của 1 nguồn
+    (trong MARKET_LATENCY_MAX_AGE giây)
+    """
+
+    def __init__(self, window: int = MARKET_LATENCY_WINDOW, max_age: float = MARKET_LATENCY_MAX_AGE):
+        self._samples = deque(maxlen=window)  # (thời điểm, giây, thành công)
+        self._max_age = max_age
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.wins = 0  # Số lần là kết quả được dùng
+
+    def record(self, seconds: float, ok: bool):
+        with self._lock:
+            self._samples.append((time.monotonic(), seconds, ok))
+            self.requests += 1
+            self.errors += not ok
+
+    def _recent(self) -> List:
+        """(giây, thành công) của các mẫu còn hiệu lực (gọi khi giữ lock)"""
+        cutoff = time.monotonic() - self._max_age
+        while self._samples and self._samples[0][0] < cutoff:
+            self._samples.popleft()
+        return [(seconds, ok) for _, seconds, ok in self._samples]
+
+    def record_win(self):
+        with self._lock:
+            self.wins += 1
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Latency (giây) của các request thành công, None nếu chưa đủ mẫu"""
+        with self._lock:
+            latencies = sorted(seconds for seconds, ok in self._recent() if ok)
+        if len(latencies) < MARKET_LATENCY_MIN_SAMPLES:
+            return None
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+    def error_rate(self) -> float:
+        with self._lock:
+            samples = self._recent()
+        return sum(1 for _, ok in samples if not ok) / len(samples) if samples else 0.0
+
+    def summary(self) -> Dict:
+        with self._lock:
+            recent = self._recent()
+        latencies = sorted(seconds for seconds, ok in recent if ok)
+        recent_errors = sum(1 for _, ok in recent if not ok)
+        samples = len(recent)
+
+        def pick(q: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000, 1)
+
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "wins": self.wins,
+            "recent_error_rate": round(recent_errors / samples, 3) if samples else 0.0,
+            "p50_ms": pick(0.50),
+            "p95_ms": pick(0.95),
+            "p99_ms": pick(0.99),
+        }
+
+
+class MarketDataClient:
+    """
+    Client dữ liệu giá nhiều nguồn: định tuyến theo sức khỏe, hedge, failover
+
+    Ví dụ:
+        client = MarketDataClient([VnstockSource("VCI"), VnstockSource("TCBS")])
+        quote = client.quote("FPT", timeout=3)
+    """
+
+    def __init__(
+        self,
+        sources: List,
+        hedge: bool = MARKET_HEDGE_ENABLED,
+        workers: int = MARKET_DATA_WORKERS,
+        scheduler=None,
+    ):
+        """
+        Args:
+            sources: Các nguồn theo thứ tự ưu tiên (có name, quote, history)
+            hedge: Gửi thêm tới nguồn tiếp theo khi nguồn đầu chậm hơn p95
+            workers: Số request chạy song song tối đa
+            scheduler: UpstreamScheduler (None = dùng chung của process)
+        """
+        if not sources:
+            raise ValueError("MarketDataClient cần ít nhất 1 nguồn")
+        self.sources = list(sources)
+        self.hedge = hedge
+        self.breakers = {source.name: CircuitBreaker(source.name) for source in self.sources}
+        self.source_stats = {source.name: SourceStats() for source in self.sources}
+        self.scheduler = scheduler or get_upstream_scheduler()
+        self.workers = workers
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="market-data")
+        self._in_flight = {source.name: 0 for source in self.sources}  # Request đã gửi, chưa xong
+        self._in_flight_lock = threading.Lock()
+
+    def _ranked(self) -> List:
+        """
+        Các nguồn theo thứ tự thử: nguồn có đủ mẫu xếp theo p50 × (1 + 4 × tỉ lệ
+        lỗi gần đây), nguồn chưa đủ mẫu giữ thứ tự cấu hình (xếp trước để có mẫu)
+
+        Xếp theo p50 thay vì p95: vài request chậm bất thường không làm 1 nguồn
+        bị xếp sau mãi (đuôi chậm đã được hedge xử lý).
+        """
+        def score(item):
+            index, source = item
+            stats = self.source_stats[source.name]
+            p50 = stats.percentile(0.50)
+            if p50 is None:
+                return (0, index)
+            return (1, p50 * (1 + 4 * stats.error_rate()), index)
+
+        return [source for _, source in sorted(enumerate(self.sources), key=score)]
+
+    def _hedge_delay(self, source) -> float:
+        p95 = self.source_stats[source.name].percentile(0.95)
+        if p95 is None:
+            return MARKET_HEDGE_DEFAULT_DELAY
+        return min(MARKET_HEDGE_MAX_DELAY, max(MARKET_HEDGE_MIN_DELAY, p95))
+
+    def _saturated(self) -> bool:
+        """Thread pool đã kín (request treo chưa trả về) → không hedge thêm"""
+        with self._in_flight_lock:
+            return sum(self._in_flight.values()) >= self.workers
+
+    def _attempt(self, source, kind: str, call: Callable, call_timeout: float):
+        start = time.perf_counter()
+        ok = False
+        try:
+            result = call(source, call_timeout)
+            ok = True
+            return result
+        finally:
+            with self._in_flight_lock:
+                self._in_flight[source.name] -= 1
+            duration = time.perf_counter() - start
+            # Trả về sau timeout (nguồn không tôn trọng timeout) → người gọi đã bỏ đi, tính là lỗi
+            ok = ok and duration <= call_timeout + 1.0
+            self.source_stats[source.name].record(duration, ok)
+            self.breakers[source.name].record(ok)
+            MARKET_DATA_DURATION.observe(duration, source=source.name, kind=kind, status="ok" if ok else "error")
+
+    def _call(self, kind: str, call: Callable, timeout: Optional[float]):
+        """
+        Gọi `call(source, timeout của request HTTP)` theo thứ tự nguồn, hedge
+        khi nguồn đang chờ chậm hơn p95
+
+        Raises:
+            MarketDataError: Mọi nguồn lỗi / bị ngắt, hoặc hết `timeout`
+        """
+        candidates = iter(self._ranked())
+        expires_at = time.monotonic() + timeout if timeout is not None else None
+        pending = {}  # future → nguồn
+        errors = []
+
+        def launch(hedged: bool) -> bool:
+            for source in candidates:
+                if self._in_flight[source.name] >= MARKET_SOURCE_MAX_IN_FLIGHT:
+                    errors.append(f"{source.name}: too many requests in flight")
+                    continue
+                if not self.breakers[source.name].allow():
+                    errors.append(f"{source.name}: circuit open")
+                    continue
+                # Chỉ xếp hàng chờ lượt khi không còn request nào đang chạy;
+                # hedge / failover lúc đó chỉ gửi nếu nguồn còn lượt ngay
+                queue_timeout = 0.0 if pending else (
+                    max(0.0, expires_at - time.monotonic()) if expires_at is not None else None
+                )
+                try:
+                    self.scheduler.acquire(source.name, timeout=queue_timeout)
+                except RateLimited as e:
+                    self.breakers[source.name].release()
+                    errors.append(str(e))
+                    continue
+                if hedged:
+                    MARKET_DATA_HEDGES.inc(source=source.name, kind=kind)
+                # Request HTTP của nguồn không chạy quá thời gian còn lại (thread được giải phóng)
+                call_timeout = MARKET_SOURCE_TIMEOUT
+                if expires_at is not None:
+                    call_timeout = max(0.1, min(call_timeout, expires_at - time.monotonic()))
+                with self._in_flight_lock:
+                    self._in_flight[source.name] += 1
+                pending[self._executor.submit(self._attempt, source, kind, call, call_timeout)] = source
+                return True
+            return False
+
+        exhausted = not launch(hedged=False)
+        while pending:
+            remaining = expires_at - time.monotonic() if expires_at is not None else None
+            if remaining is not None and remaining <= 0:
+                break
+            wait_for = remaining
+            if self.hedge and not exhausted:
+                # Chờ tới p95 của nguồn gửi gần nhất rồi hedge
+                latest = list(pending.values())[-1]
+                delay = self._hedge_delay(latest)
+                # Còn ít thời gian: hedge muộn nhất ở nửa thời gian còn lại để nguồn kia kịp trả lời
+                wait_for = delay if remaining is None else min(delay, remaining / 2)
+            done, _ = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+            if not done:
+                if self.hedge and not exhausted and not self._saturated():
+                    exhausted = not launch(hedged=True)
+                continue
+            for future in done:
+                source = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    errors.append(f"{source.name}: {type(e).__name__}: {e}")
+                    if not exhausted:
+                        exhausted = not launch(hedged=False)  # Failover
+                    continue
+                self.source_stats[source.name].record_win()
+                return result
+
+        if pending:
+            errors.append(f"timeout after {timeout}s ({', '.join(s.name for s in pending.values())})")
+        raise MarketDataError("; ".join(errors) or "no market data source available")
+
+    def quote(self, symbol: str, timeout: Optional[float] = None) -> Optional[Dict]:
+        """
+        Giá hiện tại của mã
+
+        Args:
+            symbol: Mã cổ phiếu
+            timeout: Thời gian chờ tối đa (giây), None = không giới hạn
+
+        Returns:
+            {"price", "change", "change_percent", "volume", "source"} hoặc None nếu nguồn không có dữ liệu
+
+        Raises:
+            MarketDataError: Không nguồn nào trả lời được
+        """
+        def call(source, call_timeout):
+            result = source.quote(symbol, timeout=call_timeout)
+            return {**result, "source": source.name} if result is not None else None
+        return self._call("quote", call, timeout)
+
+    def history(self, symbol: str, start: str, end: str, timeout: Optional[float] = None) -> Optional[List[float]]:
+        """
+        Giá đóng cửa theo ngày từ `start` tới `end` (YYYY-MM-DD)
+
+        Returns:
+            Danh sách giá đóng cửa hoặc None nếu nguồn không có dữ liệu
+
+        Raises:
+            MarketDataError: Không nguồn nào trả lời được
+        """
+        return self._call(
+            "history", lambda source, call_timeout: source.history(symbol, start, end, timeout=call_timeout), timeout
+        )
+
+    def stats(self) -> Dict:
+        """Latency, lỗi và trạng thái circuit breaker theo nguồn"""
+        return {
+            source.name: {
+                **self.source_stats[source.name].summary(),
+                "breaker": self.breakers[source.name].state,
+                "in_flight": self._in_flight[source.name],
+            }
+            for source in self.sources
+        }
+
+
+_market_data: Optional[MarketDataClient] = None
+_market_data_lock = threading.Lock()
+
+
+def get_market_data() -> MarketDataClient:
+    """Client dùng chung của process hiện tại (nguồn theo MARKET_DATA_SOURCES)"""
+    global _market_data
+    if _market_data is None:
+        with _market_data_lock:  # Gọi từ nhiều thread của agent
+            if _market_data is None:
+                _market_data = MarketDataClient([VnstockSource(name) for name in MARKET_DATA_SOURCES])
+    return _market_data
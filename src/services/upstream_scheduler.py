@@ -0,0 +1,353 @@
+"""
+Upstream Scheduler - Giới hạn tốc độ gọi nguồn dữ liệu giá (vnstock) dùng chung
+
+Mỗi nguồn (VCI, TCBS, ...) có 1 token bucket: MARKET_RATE_LIMITS request/giây
+(mặc định MARKET_RATE_DEFAULT), tối đa MARKET_RATE_BURST request liền nhau.
+Request chưa có token phải xếp hàng:
+- Ưu tiên: câu hỏi của người dùng ("interactive") luôn được phục vụ trước
+  việc chạy nền ("batch": --batch, POST /v1/batch)
+- Công bằng: cùng mức ưu tiên, các user được phục vụ lần lượt (round robin)
+  → 1 user gửi dồn dập không làm các user khác phải chờ theo
+- Chờ quá thời gian cho phép (deadline / MARKET_QUEUE_TIMEOUT) → RateLimited,
+  MarketDataClient chuyển sang nguồn khác
+
+Người gọi (mức ưu tiên, user) nằm trong contextvar giống deadline: batch /
+orchestrator mở upstream_caller() trước khi gọi agent, asyncio.to_thread
+chuyển context sang thread của agent.
+
+Metrics: market_data_queue_depth{source,priority},
+market_data_queue_wait_seconds{source,priority},
+market_data_rate_limited_total{source,priority}.
+
+Hạn mức dùng chung cho mọi process (bot, --batch, worker shard / webhook):
+token bucket nằm trong file SQLite của shared cache (SharedTokenBucket).
+Hàng đợi ưu tiên / chia lượt nằm trong từng process; giữa các process,
+process có câu hỏi người dùng đang chờ token để lại dấu (hết hạn sau
+MARKET_RATE_INTERACTIVE_TTL giây) và request BATCH ở process khác nhường
+lượt. MARKET_RATE_SHARED=0 → mỗi process 1 bucket riêng.
+
+Ví dụ:
+    with upstream_caller(user_id="42", priority=BATCH):
+        get_upstream_scheduler().acquire("VCI", timeout=2.0)
+"""
+import os
+import time
+import sqlite3
+import threading
+import contextvars
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Tuple
+
+from core.telemetry import MARKET_QUEUE_DEPTH, MARKET_QUEUE_WAIT, MARKET_RATE_LIMITED
+from config.settings import (
+    MARKET_RATE_LIMITS,
+    MARKET_RATE_DEFAULT,
+    MARKET_RATE_BURST,
+    MARKET_QUEUE_TIMEOUT,
+    MARKET_RATE_SHARED,
+    MARKET_RATE_POLL,
+    MARKET_RATE_INTERACTIVE_TTL,
+    SHARED_CACHE_PATH,
+)
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+PRIORITIES = (INTERACTIVE, BATCH)  # Thứ tự phục vụ
+
+_current_caller: contextvars.ContextVar = contextvars.ContextVar("upstream_caller", default=None)
+
+
+class RateLimited(Exception):
+    """Không đến lượt gọi nguồn trong thời gian cho phép"""
+
+
+@contextmanager
+def upstream_caller(user_id: Optional[str] = None, priority: Optional[str] = None) -> Iterator[Tuple[str, str]]:
+    """
+    Đặt người gọi cho các request tới nguồn dữ liệu bên trong
+
+    Giá trị đã đặt ở ngoài được giữ nguyên (vd: batch đặt priority=BATCH và
+    user_id của cả batch, orchestrator bên trong chỉ điền phần còn thiếu).
+
+    Args:
+        user_id: Khóa chia lượt công bằng (thường là user ID)
+        priority: INTERACTIVE hoặc BATCH
+    """
+    outer_priority, outer_user = _current_caller.get() or (None, None)
+    token = _current_caller.set((outer_priority or priority, outer_user or user_id))
+    try:
+        yield current_caller()
+    finally:
+        _current_caller.reset(token)
+
+
+def current_caller() -> Tuple[str, str]:
+    """(mức ưu tiên, user_id) của request hiện tại; mặc định (INTERACTIVE, "")"""
+    priority, user_id = _current_caller.get() or (None, None)
+    return (priority if priority in PRIORITIES else INTERACTIVE), str(user_id or "")
+
+
+class TokenBucket:
+    """Token bucket: `rate` token/giây, tối đa `burst` token"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def take(self, priority: str = INTERACTIVE) -> float:
+        """
+        Lấy 1 token (gọi khi giữ lock của scheduler)
+
+        Returns:
+            0 nếu lấy được, ngược lại số giây tới khi có token
+        """
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def clear_interactive(self):
+        """Không còn câu hỏi người dùng chờ token (chỉ có ý nghĩa với bucket dùng chung)"""
+
+
+class SharedTokenBucket:
+    """
+    Token bucket lưu trong SQLite: mọi process dùng chung 1 hạn mức mỗi nguồn
+
+    Lỗi SQLite → dùng tạm bucket riêng của process (không chặn việc gọi nguồn).
+    """
+
+    def __init__(self, source: str, rate: float, burst: float, path: str = SHARED_CACHE_PATH):
+        """
+        Args:
+            source: Tên nguồn
+            rate: Token/giây
+            burst: Số token tối đa
+            path: File SQLite dùng chung (giống shared cache)
+        """
+        self.source = source
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.path = path
+        self._local = threading.local()  # Mỗi thread 1 connection
+        self._marked = False  # Process này đang để dấu "có câu hỏi người dùng chờ"
+        self._fallback = TokenBucket(rate, burst)
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=1, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rate_buckets ("
+                "source TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rate_interactive ("
+                "source TEXT NOT NULL, pid INTEGER NOT NULL, until REAL NOT NULL, PRIMARY KEY (source, pid))"
+            )
+            self._local.conn = conn
+        return conn
+
+    def take(self, priority: str = INTERACTIVE) -> float:
+        """
+        Lấy 1 token của hạn mức chung (gọi khi giữ lock của scheduler)
+
+        Returns:
+            0 nếu lấy được, ngược lại số giây chờ trước khi thử lại (tối đa
+            MARKET_RATE_POLL: process khác cũng lấy token)
+        """
+        try:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                wait = self._take(conn, priority, time.time())
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            print(f"[WARN] Không dùng được rate limit chung ({self.source}): {e}")
+            return self._fallback.take(priority)
+        return min(wait, MARKET_RATE_POLL)
+
+    def _take(self, conn: sqlite3.Connection, priority: str, now: float) -> float:
+        if priority == BATCH and conn.execute(
+            "SELECT 1 FROM rate_interactive WHERE source = ? AND pid != ? AND until > ? LIMIT 1",
+            (self.source, os.getpid(), now),
+        ).fetchone():
+            return MARKET_RATE_POLL  # Nhường câu hỏi người dùng ở process khác
+
+        row = conn.execute("SELECT tokens, updated FROM rate_buckets WHERE source = ?", (self.source,)).fetchone()
+        tokens = self.burst if row is None else min(self.burst, row[0] + max(0.0, now - row[1]) * self.rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / self.rate
+        conn.execute(
+            "INSERT OR REPLACE INTO rate_buckets (source, tokens, updated) VALUES (?, ?, ?)",
+            (self.source, tokens, now),
+        )
+        if wait and priority == INTERACTIVE:
+            conn.execute(
+                "INSERT OR REPLACE INTO rate_interactive (source, pid, until) VALUES (?, ?, ?)",
+                (self.source, os.getpid(), now + MARKET_RATE_INTERACTIVE_TTL),
+            )
+            self._marked = True
+        return wait
+
+    def clear_interactive(self):
+        """Xóa dấu "có câu hỏi người dùng chờ" của process này"""
+        if not self._marked:
+            return
+        self._marked = False
+        try:
+            self._connection().execute(
+                "DELETE FROM rate_interactive WHERE source = ? AND pid = ?", (self.source, os.getpid())
+            )
+        except sqlite3.Error as e:
+            print(f"[WARN] Không dùng được rate limit chung ({self.source}): {e}")
+
+
+class _Waiter:
+    __slots__ = ("priority", "user_id")
+
+    def __init__(self, priority: str, user_id: str):
+        self.priority = priority
+        self.user_id = user_id
+
+
+class UpstreamScheduler:
+    """Hàng đợi có ưu tiên + token bucket cho từng nguồn (dùng từ nhiều thread)"""
+
+    def __init__(
+        self,
+        limits: Optional[Dict[str, float]] = None,
+        default_rate: float = MARKET_RATE_DEFAULT,
+        burst: float = MARKET_RATE_BURST,
+        shared_path: Optional[str] = SHARED_CACHE_PATH if MARKET_RATE_SHARED else None,
+    ):
+        """
+        Args:
+            limits: {nguồn: request/giây} (None = MARKET_RATE_LIMITS)
+            default_rate: Giới hạn của nguồn không có trong limits (<= 0 = không giới hạn)
+            burst: Số request tối đa được gửi liền nhau
+            shared_path: File SQLite chứa hạn mức dùng chung giữa các process
+                (None = bucket riêng của process)
+        """
+        self.limits = MARKET_RATE_LIMITS if limits is None else limits
+        self.default_rate = default_rate
+        self.burst = burst
+        self.shared_path = shared_path
+        self._buckets: Dict[str, Optional[TokenBucket]] = {}
+        # nguồn → mức ưu tiên → user → các request đang chờ (user đầu tiên được phục vụ tiếp)
+        self._queues: Dict[str, Dict[str, OrderedDict]] = {}
+        self._cond = threading.Condition()
+
+    def _bucket(self, source: str) -> Optional[TokenBucket]:
+        if source not in self._buckets:
+            rate = self.limits.get(source, self.default_rate)
+            if rate <= 0:
+                self._buckets[source] = None
+            elif self.shared_path:
+                self._buckets[source] = SharedTokenBucket(source, rate, self.burst, self.shared_path)
+            else:
+                self._buckets[source] = TokenBucket(rate, self.burst)
+        return self._buckets[source]
+
+    def _head(self, queues: Dict[str, OrderedDict]) -> Optional[_Waiter]:
+        """Request được phục vụ tiếp: mức ưu tiên cao nhất, user tới lượt"""
+        for priority in PRIORITIES:
+            users = queues[priority]
+            if users:
+                return next(iter(users.values()))[0]
+        return None
+
+    def _remove(self, queues: Dict[str, OrderedDict], waiter: _Waiter, served: bool):
+        users = queues[waiter.priority]
+        waiting = users[waiter.user_id]
+        waiting.remove(waiter)
+        if not waiting:
+            del users[waiter.user_id]
+        elif served:
+            users.move_to_end(waiter.user_id)  # Round robin: user khác tới lượt
+
+    def acquire(self, source: str, timeout: Optional[float] = None) -> float:
+        """
+        Chờ tới lượt gọi nguồn `source` (người gọi lấy từ upstream_caller)
+
+        Args:
+            source: Tên nguồn
+            timeout: Thời gian chờ tối đa (giây), None = MARKET_QUEUE_TIMEOUT,
+                0 = chỉ lấy nếu có lượt ngay
+
+        Returns:
+            Số giây đã chờ
+
+        Raises:
+            RateLimited: Không tới lượt trong thời gian cho phép
+        """
+        priority, user_id = current_caller()
+        timeout = MARKET_QUEUE_TIMEOUT if timeout is None else timeout
+        start = time.monotonic()
+        with self._cond:
+            bucket = self._bucket(source)
+            if bucket is None:
+                return 0.0
+            queues = self._queues.setdefault(source, {p: OrderedDict() for p in PRIORITIES})
+            waiter = _Waiter(priority, user_id)
+            queues[priority].setdefault(user_id, deque()).append(waiter)
+            MARKET_QUEUE_DEPTH.inc(source=source, priority=priority)
+            served = False
+            try:
+                while True:
+                    retry_in = None
+                    if self._head(queues) is waiter:
+                        retry_in = bucket.take(priority)
+                        if retry_in == 0:
+                            served = True
+                            break
+                    remaining = start + timeout - time.monotonic()
+                    if remaining <= 0:
+                        MARKET_RATE_LIMITED.inc(source=source, priority=priority)
+                        raise RateLimited(f"{source}: rate limited ({priority})")
+                    # Request đầu hàng chờ tới khi có token, các request khác chờ tới lượt
+                    self._cond.wait(remaining if retry_in is None else min(retry_in, remaining))
+            finally:
+                self._remove(queues, waiter, served)
+                if priority == INTERACTIVE and not queues[INTERACTIVE]:
+                    bucket.clear_interactive()
+                MARKET_QUEUE_DEPTH.inc(-1, source=source, priority=priority)
+                self._cond.notify_all()
+        waited = time.monotonic() - start
+        MARKET_QUEUE_WAIT.observe(waited, source=source, priority=priority)
+        return waited
+
+    def stats(self) -> Dict:
+        """Số request đang chờ theo nguồn và mức ưu tiên"""
+        with self._cond:
+            return {
+                source: {priority: sum(len(waiting) for waiting in users.values()) for priority, users in queues.items()}
+                for source, queues in self._queues.items()
+            }
+
+
+_scheduler: Optional[UpstreamScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_upstream_scheduler() -> UpstreamScheduler:
+    """Scheduler dùng chung của process hiện tại"""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = UpstreamScheduler()
+    return _scheduler
@@ -1,6 +1,74 @@
 """RAG (Retrieval-Augmented Generation) tool for news retrieval."""
+import threading
 from typing import List, Dict, Optional
-from config.settings import RAG_PERSIST_DIRECTORY, RAG_COLLECTION_NAME
+from config.settings import (
+    RAG_PERSIST_DIRECTORY,
+    RAG_COLLECTION_NAME,
+    RAG_DEDUP_ENABLED,
+    RAG_TOP_K,
+    RAG_PARTITION_BY_MONTH
+)
+
+
+class RetrievalContext:
+    """Request-scoped RAG results: embed and search once, reuse everywhere.
+    
+    The search runs lazily on first access with the largest `top_k` the
+    request needs; the prompt-context builder and the news path then slice
+    the same result list.
+    """
+    
+    def __init__(
+        self,
+        rag_tool: "RAGTool",
+        query_text: str,
+        top_k: int = RAG_TOP_K,
+        filters: Optional[Dict] = None
+    ):
+        """Initialize retrieval context.
+        
+        Args:
+            rag_tool: RAG tool used for the single search
+            query_text: Query string of the current request
+            top_k: Largest number of results needed in this request
+            filters: Metadata filters (symbol, source, date_from, date_to)
+        """
+        self.rag_tool = rag_tool
+        self.query_text = query_text
+        self.top_k = top_k
+        self.filters = filters
+        self._results = None  # Lazy search on first access
+    
+    async def fetch(self) -> List[Dict]:
+        """Run the request's single search asynchronously (no-op if done)."""
+        if self._results is None:
+            self._results = await self.rag_tool.aquery(
+                self.query_text, top_k=self.top_k, filters=self.filters
+            )
+        return self._results
+    
+    def results(self, top_k: Optional[int] = None) -> List[Dict]:
+        """Get search results (searching at most once per request).
+        
+        Args:
+            top_k: Number of results to return (default: all fetched)
+            
+        Returns:
+            List of relevant news articles
+        """
+        if self._results is None:
+            self._results = self.rag_tool.query(
+                self.query_text, top_k=max(self.top_k, top_k or 0), filters=self.filters
+            )
+        return self._results[:top_k] if top_k else self._results
+    
+    def context(self, top_k: Optional[int] = None) -> str:
+        """Get formatted context text for the LLM prompt."""
+        return RAGTool.format_context(self.results(top_k))
+    
+    def context_items(self, top_k: Optional[int] = None) -> List[str]:
+        """Get context lines for the prompt builder, most relevant first."""
+        return RAGTool.context_items(self.results(top_k))
 
 
 class RAGTool:
@@ -20,6 +88,9 @@ class RAGTool:
         self.persist_directory = persist_directory
         self.collection_name = collection_name
         self._vector_db = None  # Lazy load when needed
+        self._deduplicator = None  # MinHash index of stored docs, built on first add
+        self._stored_metadata = {}  # {doc_id: metadata} for merging duplicate sources
+        self._add_lock = threading.Lock()  # Articles may be ingested from background threads
     
     def _get_vector_db(self):
         """Get vector database instance (lazy initialization)."""
@@ -28,7 +99,11 @@ class RAGTool:
         
         if self._vector_db is None:
             try:
-                from data.vector_db import VectorDatabase
+                if RAG_PARTITION_BY_MONTH:
+                    # Mỗi tháng 1 collection, tin hết hạn bị xóa theo cả tháng
+                    from data.partitioned_db import PartitionedVectorDatabase as VectorDatabase
+                else:
+                    from data.vector_db import VectorDatabase
                 self._vector_db = VectorDatabase(
                     persist_directory=self.persist_directory,
                     collection_name=self.collection_name
@@ -40,12 +115,13 @@ class RAGTool:
         
         return self._vector_db
     
-    def query(self, query_text: str, top_k: int = 3) -> List[Dict]:
+    def query(self, query_text: str, top_k: int = 3, filters: Optional[Dict] = None) -> List[Dict]:
         """Query news database.
         
         Args:
             query_text: Query string
             top_k: Number of results to return
+            filters: Metadata filters (symbol, source, date_from, date_to)
             
         Returns:
             List of relevant news articles
@@ -55,7 +131,7 @@ class RAGTool:
             return []
         
         try:
-            results = vector_db.query(query_text, top_k=top_k)
+            results = vector_db.query(query_text, top_k=top_k, filters=filters)
             if results:
                 print(f"(RAG) Found {len(results)} results for query: '{query_text}'")
             else:
@@ -65,9 +141,53 @@ class RAGTool:
             print(f"[WARN] RAG query failed: {e}")
             return []
     
+    async def aquery(self, query_text: str, top_k: int = 3, filters: Optional[Dict] = None) -> List[Dict]:
+        """Query news database without blocking the event loop.
+        
+        Query embeddings of concurrent requests are micro-batched.
+        
+        Args:
+            query_text: Query string
+            top_k: Number of results to return
+            filters: Metadata filters (symbol, source, date_from, date_to)
+            
+        Returns:
+            List of relevant news articles
+        """
+        vector_db = self._get_vector_db()
+        if not vector_db:
+            return []
+        
+        try:
+            results = await vector_db.aquery(query_text, top_k=top_k, filters=filters)
+            if results:
+                print(f"(RAG) Found {len(results)} results for query: '{query_text}'")
+            else:
+                print(f"(RAG) No results found for query: '{query_text}'")
+            return results
+        except Exception as e:
+            print(f"[WARN] RAG query failed: {e}")
+            return []
+    
+    def _get_deduplicator(self, vector_db):
+        """Get MinHash index of stored documents (built once from the collection)."""
+        if self._deduplicator is None:
+            from data.dedup import MinHashDeduplicator
+            deduplicator = MinHashDeduplicator()
+            for doc_id, doc in vector_db.get_documents().items():
+                deduplicator.add(doc_id, doc["text"])
+                self._stored_metadata[doc_id] = doc["metadata"]
+            self._deduplicator = deduplicator
+            print(f"(RAG) Built near-duplicate index over {len(deduplicator)} documents")
+        return self._deduplicator
+    
     def add_documents(self, texts: List[str], metadatas: List[Dict]):
         """Add documents to news database.
         
+        Near-duplicates (same story from several sources) are collapsed
+        before embedding: only one document is stored and its metadata
+        carries all sources.
+        
         Args:
             texts: List of article texts
             metadatas: List of metadata dictionaries
@@ -77,12 +197,69 @@ class RAGTool:
             print("[WARN] Cannot add documents: RAG not available")
             return
         
+        with self._add_lock:
+            self._add_documents(vector_db, texts, metadatas)
+    
+    def _add_documents(self, vector_db, texts: List[str], metadatas: List[Dict]):
         try:
-            vector_db.add_documents(texts, metadatas)
-            print(f"(RAG) Added {len(texts)} documents to collection")
+            # Partition hết hạn đã bị xóa → index trùng lặp còn trỏ tới bài đã xóa, dựng lại
+            if hasattr(vector_db, "drop_expired_partitions") and vector_db.drop_expired_partitions():
+                self._deduplicator = None
+                self._stored_metadata = {}
+            
+            if not RAG_DEDUP_ENABLED:
+                vector_db.add_documents(texts, metadatas)
+                print(f"(RAG) Added {len(texts)} documents to collection")
+                return
+            
+            from data.dedup import collapse_near_duplicates, merge_metadata
+            deduplicator = self._get_deduplicator(vector_db)
+            new_texts, new_metas, existing_matches = collapse_near_duplicates(
+                texts, metadatas, deduplicator
+            )
+            
+            # Bài đã có trong database: chỉ cập nhật nguồn, không embedding lại
+            if existing_matches:
+                update_ids, update_metas = [], []
+                for doc_id, dup_metas in existing_matches.items():
+                    merged = self._stored_metadata.get(doc_id, {})
+                    for meta in dup_metas:
+                        merged = merge_metadata(merged, meta)
+                    self._stored_metadata[doc_id] = merged
+                    update_ids.append(doc_id)
+                    update_metas.append(merged)
+                vector_db.update_metadatas(update_ids, update_metas)
+            
+            ids = vector_db.add_documents(new_texts, new_metas)
+            for doc_id, text, meta in zip(ids, new_texts, new_metas):
+                if doc_id is None:
+                    continue  # Tin cũ hơn thời hạn lưu trữ, không được lưu
+                deduplicator.add(doc_id, text)
+                self._stored_metadata[doc_id] = meta
+            
+            skipped = len(texts) - len(new_texts)
+            print(f"(RAG) Added {len(new_texts)} documents to collection ({skipped} near-duplicates merged)")
         except Exception as e:
             print(f"[WARN] RAG add_documents failed: {e}")
     
+    def retrieval(
+        self,
+        query_text: str,
+        top_k: int = RAG_TOP_K,
+        filters: Optional[Dict] = None
+    ) -> RetrievalContext:
+        """Create a request-scoped retrieval context.
+        
+        Args:
+            query_text: Query string
+            top_k: Largest number of results needed in this request
+            filters: Metadata filters (symbol, source, date_from, date_to)
+            
+        Returns:
+            RetrievalContext sharing one search across the request
+        """
+        return RetrievalContext(self, query_text, top_k=top_k, filters=filters)
+    
     def retrieve_context(self, query_text: str, top_k: int = 3) -> str:
         """Retrieve context text for LLM.
         
@@ -93,16 +270,77 @@ class RAGTool:
         Returns:
             Formatted context string
         """
-        results = self.query(query_text, top_k=top_k)
-        if not results:
-            return ""
+        return self.format_context(self.query(query_text, top_k=top_k))
+    
+    def add_articles(self, articles: List[Dict], symbol: str):
+        """Add crawled articles, split into overlapping chunks.
         
-        context_parts = []
-        for r in results:
+        Articles with a fetched `body` are chunked (each chunk keeps the
+        article metadata); the others are stored as one
+        `title - description` chunk. All chunks go through `add_documents`
+        in one call so they are embedded in large batches.
+        
+        Args:
+            articles: Article dictionaries from NewsAgent (title, description,
+                url, source, date, sentiment, optional body)
+            symbol: Stock symbol the articles were crawled for
+        """
+        from data.chunking import chunk_article
+        texts, metas = [], []
+        for a in articles:
+            meta = {
+                "symbol": symbol,
+                "source": a["source"],
+                "url": a["url"],
+                "date": a["date"],
+                "sentiment": a["sentiment"]
+            }
+            if a.get("duplicate_urls"):
+                meta["duplicate_urls"] = a["duplicate_urls"]
+            body = a.get("body") or a.get("description", "")
+            chunks, chunk_metas = chunk_article(a["title"], body, meta)
+            texts.extend(chunks)
+            metas.extend(chunk_metas)
+        self.add_documents(texts, metas)
+    
+    @staticmethod
+    def merge_chunks(results: List[Dict]) -> List[Dict]:
+        """Merge chunks of the same article into one result (best rank first)."""
+        from data.chunking import merge_chunk_results
+        return merge_chunk_results(results)
+    
+    @staticmethod
+    def context_items(results: List[Dict]) -> List[str]:
+        """Format search results as context lines, most relevant first.
+        
+        Neighbouring chunks of one article are merged into a single
+        snippet (overlap removed) instead of being listed separately.
+        
+        Args:
+            results: Search results from `query`
+            
+        Returns:
+            One context line per article
+        """
+        items = []
+        for r in RAGTool.merge_chunks(results or []):
             text = r.get("text", "")
             meta = r.get("metadata", {})
-            snippet = text[:800] + "..." if len(text) > 800 else text
-            context_parts.append(f"- ({meta.get('symbol', 'N/A')}) {snippet}")
+            if meta.get("parent_id"):
+                snippet = text  # Chunk đã giới hạn số từ
+            else:
+                snippet = text[:800] + "..." if len(text) > 800 else text
+            items.append(f"- ({meta.get('symbol', 'N/A')}) {snippet}")
+        return items
+    
+    @staticmethod
+    def format_context(results: List[Dict]) -> str:
+        """Format search results as context text for LLM.
         
-        return "\n".join(context_parts)
-
+        Args:
+            results: Search results from `query`
+            
+        Returns:
+            Formatted context string
+        """
+        return "\n".join(RAGTool.context_items(results))